@@ -78,6 +78,9 @@ def main():
             telegram_thread.start()
         else:
             print("Telegram bot disabled (set RUN_TELEGRAM_BOT=true to enable)")
+            # Without the bot nothing else starts the workers - web jobs still need them
+            from services.queue_service import queue_service
+            queue_service.start_configured_workers()
         
         print("Starting Flask web interface...")
         # Run Flask app in main thread (this will block)
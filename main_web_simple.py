@@ -22,6 +22,9 @@ def main():
     # Import and run the web app
     try:
         from web_app import app
+        from services.queue_service import queue_service
+        # Only the web app runs here - it starts the workers that process its jobs
+        queue_service.start_configured_workers()
         port = int(os.environ.get('PORT', 10000))
         print(f"Starting Flask app on port {port}")
         app.run(host='0.0.0.0', port=port, debug=False)
@@ -24,10 +24,85 @@ class Config:
     # Google Gemini (חובה)
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
+    GEMINI_FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "")  # מודל זול יותר כשהתקציב היומי מתקרב לסוף
+    GEMINI_FALLBACK_COST_FACTOR = float(os.getenv("GEMINI_FALLBACK_COST_FACTOR", "0.25"))  # מחיר ביחס ל-GEMINI_MODEL
+    GEMINI_MIN_INTERVAL = float(os.getenv("GEMINI_MIN_INTERVAL", "2.0"))  # מרווח מינימלי בין בקשות (לכל התהליך)
+    GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "120"))  # timeout מקסימלי לקריאה בודדת
+    GEMINI_MIN_ATTEMPT_SECONDS = float(os.getenv("GEMINI_MIN_ATTEMPT_SECONDS", "15"))  # ניסיון עם פחות זמן עד ה-deadline לא מתחיל
+    
+    # Background workers
+    WORKER_MODE = os.getenv("WORKER_MODE", "thread").lower()  # thread / async
+    NUM_WORKERS = int(os.getenv("NUM_WORKERS", "3"))
+    ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "200"))
+    CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", "4"))
+    
+    # Pipeline stages - חילוץ טקסט ב-processes, rendering ב-threads נפרדים
+    EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", "2"))
+    EXTRACT_START_METHOD = os.getenv("EXTRACT_START_METHOD", "fork")  # fork / forkserver / spawn
+    EXTRACT_TIMEOUT = int(os.getenv("EXTRACT_TIMEOUT", "120"))
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+    
+    # Autoscaling (מצב thread בלבד)
+    AUTOSCALE_ENABLED = os.getenv("AUTOSCALE_ENABLED", "true").lower() == "true"
+    WORKER_MIN = int(os.getenv("WORKER_MIN", "1"))
+    WORKER_MAX = int(os.getenv("WORKER_MAX", "8"))
+    AUTOSCALE_INTERVAL = int(os.getenv("AUTOSCALE_INTERVAL", "10"))  # שניות בין בדיקות
+    AUTOSCALE_TARGET_WAIT = float(os.getenv("AUTOSCALE_TARGET_WAIT", "30"))  # זמן המתנה יעד בתור (שניות)
+    AUTOSCALE_DEFAULT_LATENCY = float(os.getenv("AUTOSCALE_DEFAULT_LATENCY", "30"))  # הערכה לפני שיש מדידות
+    AUTOSCALE_UP_TICKS = int(os.getenv("AUTOSCALE_UP_TICKS", "2"))  # בדיקות רצופות לפני הגדלה
+    AUTOSCALE_DOWN_TICKS = int(os.getenv("AUTOSCALE_DOWN_TICKS", "6"))  # בדיקות רצופות לפני הקטנה
+    AUTOSCALE_COOLDOWN = int(os.getenv("AUTOSCALE_COOLDOWN", "60"))  # שניות מינימום בין שינוי להקטנה
+    
+    # Queue lanes - שם:משקל לפי סדר עדיפות
+    QUEUE_LANES = os.getenv("QUEUE_LANES", "interactive:2,bulk:1,speculative:0")
+    LATENCY_LANE = os.getenv("LATENCY_LANE", "interactive")  # מבחנים אינטראקטיביים ובקשות קטנות
+    THROUGHPUT_LANE = os.getenv("THROUGHPUT_LANE", "bulk")  # מבחני HTML גדולים
+    SPECULATIVE_LANE = os.getenv("SPECULATIVE_LANE", "speculative")  # יצירה מראש - משקל 0, רק slots פנויים
+    LANE_SMALL_MAX_QUESTIONS = int(os.getenv("LANE_SMALL_MAX_QUESTIONS", "10"))
+    LANE_SMALL_MAX_WORDS = int(os.getenv("LANE_SMALL_MAX_WORDS", "10000"))
+    LANE_KEEP_IDLE = int(os.getenv("LANE_KEEP_IDLE", "1"))  # slots שמסלול ה-latency לא משאיל
+    
+    # Speculative generation - יצירת הכמות המומלצת כבר אחרי החילוץ, בזמן שהמשתמש בוחר
+    SPECULATIVE_ENABLED = os.getenv("SPECULATIVE_ENABLED", "true").lower() == "true"
+    SPECULATIVE_MAX_QUESTIONS = int(os.getenv("SPECULATIVE_MAX_QUESTIONS", "20"))
+    
+    # Admission control - מספר jobs ממתינים מקסימלי לכל מסלול (0 = ללא הגבלה)
+    LANE_MAX_QUEUED = os.getenv("LANE_MAX_QUEUED", "interactive:200,bulk:100,speculative:20")
+    ADMISSION_MIN_RETRY_SECONDS = int(os.getenv("ADMISSION_MIN_RETRY_SECONDS", "30"))
+    
+    # Fair scheduling - הערכת עלות job ו-aging
+    SCHED_COST_PER_QUESTION = float(os.getenv("SCHED_COST_PER_QUESTION", "1.0"))
+    SCHED_COST_PER_1K_WORDS = float(os.getenv("SCHED_COST_PER_1K_WORDS", "1.0"))
+    SCHED_AGING_SECONDS_PER_COST = float(os.getenv("SCHED_AGING_SECONDS_PER_COST", "2.0"))  # כמה שניות המתנה "שווה" יחידת עלות
     
     # Redis
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))  # לכל pool בתהליך
+    REDIS_BLOCKING_MAX_CONNECTIONS = int(os.getenv("REDIS_BLOCKING_MAX_CONNECTIONS", "20"))  # BLPOP ו-pub/sub
+    REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # המתנה לחיבור פנוי כשה-pool מלא
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+    REDIS_BLOCKING_SOCKET_TIMEOUT = float(os.getenv("REDIS_BLOCKING_SOCKET_TIMEOUT", "15"))  # ארוך מהמתנת BLPOP / pub/sub
+    REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "3"))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+    REDIS_RETRY_ATTEMPTS = int(os.getenv("REDIS_RETRY_ATTEMPTS", "3"))
+    REDIS_RETRY_BACKOFF_BASE = float(os.getenv("REDIS_RETRY_BACKOFF_BASE", "0.1"))
+    REDIS_RETRY_BACKOFF_CAP = float(os.getenv("REDIS_RETRY_BACKOFF_CAP", "2"))
+    REDIS_MODE = os.getenv("REDIS_MODE", "standalone").lower()  # standalone / sentinel / cluster
+    REDIS_CLUSTER_NODES = os.getenv("REDIS_CLUSTER_NODES", "")  # host:port,host:port - nodes לגילוי ה-Cluster
+    REDIS_READ_FROM_REPLICAS = os.getenv("REDIS_READ_FROM_REPLICAS", "false").lower() == "true"
+    REDIS_SENTINELS = os.getenv("REDIS_SENTINELS", "")  # host:port,host:port
+    REDIS_SENTINEL_MASTER = os.getenv("REDIS_SENTINEL_MASTER", "mymaster")
+    
+    # Storage backend - redis / embedded (store בתוך התהליך, instance יחיד) / auto (embedded כש-Redis לא זמין)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "redis").lower()
+    EMBEDDED_STORE_PATH = os.getenv("EMBEDDED_STORE_PATH", "")  # קובץ SQLite לשמירת ה-store המקומי (ריק = זיכרון בלבד)
+    EMBEDDED_FLUSH_INTERVAL = float(os.getenv("EMBEDDED_FLUSH_INTERVAL", "1"))  # כל כמה שניות שינויים נכתבים לקובץ
+    
+    # קידוד הערכים השמורים (session, metadata, jobs, תוצאות) - header עם גרסה, JSON מהיר ודחיסה לערכים גדולים
+    PAYLOAD_CODEC_VERSION = int(os.getenv("PAYLOAD_CODEC_VERSION", "1"))  # 0 = JSON רגיל (בזמן rolling deploy מגרסה ישנה)
+    PAYLOAD_COMPRESS_THRESHOLD = int(os.getenv("PAYLOAD_COMPRESS_THRESHOLD", "2048"))  # bytes - ערך גדול יותר נדחס (0 = בלי דחיסה)
+    PAYLOAD_COMPRESS_LEVEL = int(os.getenv("PAYLOAD_COMPRESS_LEVEL", "1"))  # zlib 1-9 - נמוך כי זה ב-request path
     
     # הגדרות מערכת
     MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "15"))
@@ -39,11 +114,52 @@ class Config:
     RATE_LIMIT_PER_10MIN = int(os.getenv("RATE_LIMIT_PER_10MIN", "5"))
     RATE_LIMIT_PER_DAY = int(os.getenv("RATE_LIMIT_PER_DAY", "50"))
     
+    # Quotas - מכסה לפי עלות משוערת במודל (יחידות = input tokens + output tokens * משקל)
+    QUOTA_ENABLED = os.getenv("QUOTA_ENABLED", "true").lower() == "true"
+    QUOTA_UNITS_PER_HOUR = int(os.getenv("QUOTA_UNITS_PER_HOUR", "150000"))
+    QUOTA_UNITS_PER_DAY = int(os.getenv("QUOTA_UNITS_PER_DAY", "600000"))
+    QUOTA_CHARS_PER_TOKEN = float(os.getenv("QUOTA_CHARS_PER_TOKEN", "3"))  # עברית - כ-3 תווים ל-token
+    QUOTA_PROMPT_TOKENS = int(os.getenv("QUOTA_PROMPT_TOKENS", "700"))  # הוראות ה-prompt בכל קריאה
+    QUOTA_OUTPUT_TOKENS_PER_QUESTION = int(os.getenv("QUOTA_OUTPUT_TOKENS_PER_QUESTION", "250"))
+    QUOTA_OUTPUT_TOKEN_WEIGHT = float(os.getenv("QUOTA_OUTPUT_TOKEN_WEIGHT", "4"))  # output token יקר פי כמה מ-input
+    
+    # Token budget - תקציב יומי גלובלי (UTC) באותן יחידות, עם degradation לפי החלק שנוצל
+    TOKEN_BUDGET_DAILY_UNITS = int(os.getenv("TOKEN_BUDGET_DAILY_UNITS", "0"))  # 0 = ללא תקציב (רק מעקב)
+    BUDGET_CHEAP_MODEL_AT = float(os.getenv("BUDGET_CHEAP_MODEL_AT", "0.7"))  # מודל זול, בלי יצירה ספקולטיבית
+    BUDGET_CAP_QUESTIONS_AT = float(os.getenv("BUDGET_CAP_QUESTIONS_AT", "0.85"))
+    BUDGET_SLOW_ADMISSION_AT = float(os.getenv("BUDGET_SLOW_ADMISSION_AT", "0.95"))
+    BUDGET_DEGRADED_MAX_QUESTIONS = int(os.getenv("BUDGET_DEGRADED_MAX_QUESTIONS", "15"))
+    BUDGET_ADMISSION_DELAY_SECONDS = float(os.getenv("BUDGET_ADMISSION_DELAY_SECONDS", "60"))
+    BUDGET_REFRESH_SECONDS = float(os.getenv("BUDGET_REFRESH_SECONDS", "5"))
+    TOKEN_USAGE_RETENTION_DAYS = int(os.getenv("TOKEN_USAGE_RETENTION_DAYS", "35"))
+    
     # Session & Job TTLs (in seconds)
     SESSION_TTL = 900  # 15 minutes
+    SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "true").lower() == "true"  # cache בזיכרון ל-session ו-metadata
+    SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "5000"))
+    SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))  # רשת ביטחון - הקוהרנטיות מגיעה מ-invalidation
     FILE_DATA_TTL = 259200  # 72 hours
+    FILE_TEXT_COMPRESSION_LEVEL = int(os.getenv("FILE_TEXT_COMPRESSION_LEVEL", "6"))  # zlib 1-9
     JOB_TIMEOUT = 600  # 10 minutes
     
+    # Job deadlines & requeue (in seconds)
+    JOB_DEADLINE_SECONDS = int(os.getenv("JOB_DEADLINE_SECONDS", "570"))  # לפני שה-handler מפסיק לחכות
+    INTERACTIVE_JOB_DEADLINE_SECONDS = int(os.getenv("INTERACTIVE_JOB_DEADLINE_SECONDS", "170"))
+    REQUEUE_BASE_DELAY = float(os.getenv("REQUEUE_BASE_DELAY", "5"))  # 5, 10, 20... אחרי rate limit
+    JOB_MAX_REQUEUES = int(os.getenv("JOB_MAX_REQUEUES", "5"))
+    IDEMPOTENCY_WINDOW = int(os.getenv("IDEMPOTENCY_WINDOW", "30"))  # בקשה זהה בחלון הזה מצטרפת ל-job הקיים
+    DRAIN_GRACE_SECONDS = float(os.getenv("DRAIN_GRACE_SECONDS", "25"))  # המתנה ל-jobs שבעיבוד לפני כיבוי (SIGTERM)
+    
+    # Results - השאלות נשמרות כנתונים, ה-HTML נוצר לפי דרישה
+    RESULT_TTL = int(os.getenv("RESULT_TTL", "86400"))  # 24 hours
+    RESULT_HTML_CACHE_TTL = int(os.getenv("RESULT_HTML_CACHE_TTL", "3600"))
+    
+    # Progress messages - עריכות מאוחדות לפי אירועי ה-job, במסגרת מגבלות הקצב של טלגרם
+    PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "3"))  # עריכה אחת לצ'אט לכל היותר בכל מרווח
+    PROGRESS_POLL_SECONDS = float(os.getenv("PROGRESS_POLL_SECONDS", "5"))  # בדיקה גם בלי אירוע (מיקום בתור משתנה)
+    TELEGRAM_GROUP_EDIT_INTERVAL = float(os.getenv("TELEGRAM_GROUP_EDIT_INTERVAL", "3"))  # 20 הודעות לדקה בקבוצה
+    TELEGRAM_GLOBAL_EDITS_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_EDITS_PER_SECOND", "25"))  # מתחת ל-30 של ה-Bot API
+    
     # Directories
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     TEMP_DIR = os.path.join(BASE_DIR, "temp")
@@ -74,6 +190,17 @@ class Config:
         if not cls.GEMINI_API_KEY:
             errors.append("GEMINI_API_KEY is required")
         
+        if cls.WORKER_MODE not in ("thread", "async"):
+            errors.append("WORKER_MODE must be 'thread' or 'async'")
+        
+        if cls.WORKER_MIN < 1 or cls.WORKER_MAX < cls.WORKER_MIN:
+            errors.append("WORKER_MIN must be >= 1 and WORKER_MAX >= WORKER_MIN")
+        
+        lane_names = [part.split(":")[0].strip() for part in cls.QUEUE_LANES.split(",") if part.strip()]
+        for lane in (cls.LATENCY_LANE, cls.THROUGHPUT_LANE):
+            if lane not in lane_names:
+                errors.append(f"Lane '{lane}' is missing from QUEUE_LANES")
+        
         if errors:
             raise ValueError(f"Configuration errors: {', '.join(errors)}")
         
@@ -2,8 +2,8 @@
 Callback Query Handler
 טיפול בלחיצות על כפתורים inline
 """
+import io
 import time
-import os
 import html
 import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -11,11 +11,13 @@ from telegram.ext import CallbackContext
 
 from config import config
 from services.session_service import session_service
-from services.queue_service import queue_service
+from services.queue_service import queue_service, QueueFullError, TERMINAL_STATUSES
+from services.quota_service import QuotaExceededError
+from services.speculation_service import speculation_service
 from services.file_service import file_service
 from services.interactive_quiz_service import interactive_quiz_service
-from services.generator_service import generator_service
 from utils.validators import validate_question_count
+from utils.progress import update_progress_message, finish_progress_message, format_queue_full, format_quota_exceeded
 from utils.logger import logger
 
 
@@ -87,7 +89,8 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
                 query.edit_message_text("❌ שגיאה בפענוח הכפתור.")
                 return
             
-            file_data = session_service.get_file_data(chat_id)
+            # metadata בלבד - שמות הקבצים ומספרי המילים מספיקים להסרה ולכפתורים
+            file_data = session_service.get_file_meta(chat_id)
             
             if not file_data or "files" not in file_data:
                 query.edit_message_text("❌ שגיאה בהסרת הקובץ. התחל מחדש.")
@@ -108,6 +111,7 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
             
             if len(files_list) == 0:
                 # אם הסרנו את הקובץ האחרון
+                speculation_service.cancel(chat_id, reason="file_removed")
                 session_service.delete_file_data(chat_id)
                 query.edit_message_text(
                     text="✅ הקובץ הוסר.\n\n📤 העלה קובץ חדש כדי להתחיל.",
@@ -119,7 +123,6 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
             # חישוב מחדש של הסטטיסטיקות
             total_word_count = sum(f["word_count"] for f in files_list)
             total_char_count = sum(f["char_count"] for f in files_list)
-            combined_text = "\n\n".join(f["text"] for f in files_list)
             
             # עדכון file_data
             file_data = {
@@ -127,16 +130,18 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
                 "filename": " + ".join([f["filename"] for f in files_list]),
                 "mime_type": files_list[0]["mime_type"],
                 "file_size": sum(f["file_size"] for f in files_list),
-                "text": combined_text,
                 "word_count": total_word_count,
                 "char_count": total_char_count,
                 "files": files_list,
                 "num_files": len(files_list)
             }
-            session_service.save_file_data(chat_id, file_data)
+            if not session_service.save_file_data(chat_id, file_data):
+                query.edit_message_text("❌ שגיאה בהסרת הקובץ. התחל מחדש.")
+                return
             
-            # המלצה מחדש
+            # המלצה מחדש - והמאגר שנוצר מראש מוחלף במאגר לקבצים שנשארו
             recommended, reason = file_service.recommend_question_count(total_word_count)
+            speculation_service.start(chat_id, file_data, recommended)
             
             # יצירת כפתורים - כמו במקורי
             keyboard = []
@@ -182,7 +187,7 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
         
         if callback_data == "proceed_to_quiz":
             # המשך לשאלה כמה שאלות רוצים
-            file_data = session_service.get_file_data(chat_id)
+            file_data = session_service.get_file_meta(chat_id)
             if not file_data:
                 query.edit_message_text("❌ הקובץ כבר לא זמין. בבקשה התחל מחדש עם /start")
                 return
@@ -199,9 +204,11 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
             session_service.update_session_state(chat_id, "AWAITING_COUNT")
             return
         
-        # בדיקת session
-        session = session_service.get_session(chat_id)
+        # בדיקת session (יחד עם ה-metadata של הקבצים - round trip אחד)
+        session, file_meta = session_service.get_session_and_file_meta(chat_id)
         if not session:
+            # ה-session פג - ספקולציה שעוד רצה בשבילו רק תופסת slot ותקציב
+            speculation_service.cancel(chat_id, reason="session_expired")
             query.message.reply_text(
                 text="⚠️ ה-session פג. בבקשה התחל מחדש עם /start"
             )
@@ -232,8 +239,8 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
                 # חילוץ מספר השאלות המקורי
                 original_count = int(callback_data.split("_")[3])
                 
-                # קבלת file_data להכנת השאלות
-                file_data = session_service.get_file_data(chat_id)
+                # קבלת file_data (עם הטקסט) להכנת השאלות
+                file_data = session_service.load_file_texts(file_meta)
                 if not file_data:
                     query.message.reply_text("❌ הקובץ כבר לא זמין. בבקשה העלה קובץ חדש עם /start")
                     return
@@ -247,19 +254,33 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
                 # יצירת שאלות חדשות למבחן אינטראקטיבי (מקסימום 10 לחוויה טובה)
                 quiz_count = min(original_count, 10)
                 
-                # השתמש בגנרטור להכנת שאלות
+                # הוספה לתור במסלול ה-latency
+                file_info = None
                 if "files" in file_data and len(file_data["files"]) > 1:
                     # מספר קבצים
-                    questions = generator_service.generate_questions_for_interactive(
-                        files=file_data["files"], 
-                        count=quiz_count
-                    )
-                else:
-                    # קובץ בודד
-                    questions = generator_service.generate_questions_for_interactive(
-                        text=file_data["text"], 
-                        count=quiz_count
+                    file_info = {"files": file_data["files"]}
+                
+                try:
+                    job_id = queue_service.add_job(
+                        chat_id=chat_id,
+                        text=file_data["text"],
+                        question_count=quiz_count,
+                        metadata={
+                            "filename": file_data.get("filename", "מבחן"),
+                            "word_count": file_data.get("word_count", 0)
+                        },
+                        file_info=file_info,
+                        job_type="interactive",
+                        deadline_seconds=config.INTERACTIVE_JOB_DEADLINE_SECONDS
                     )
+                except QueueFullError as e:
+                    processing_msg.edit_text(format_queue_full(e.retry_after), parse_mode='Markdown')
+                    return
+                except QuotaExceededError as e:
+                    processing_msg.edit_text(format_quota_exceeded(e.affordable, e.reset_seconds), parse_mode='Markdown')
+                    return
+                
+                questions = _wait_for_interactive_questions(job_id) if job_id else None
                 
                 if not questions:
                     processing_msg.edit_text(
@@ -279,7 +300,7 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
                 
                 # שליחת השאלה הראשונה
                 _send_next_question(processing_msg, quiz_session)
-                
+            
             except (ValueError, IndexError) as e:
                 logger.error(f"Error parsing telegram quiz callback: {e}")
                 query.message.reply_text("❌ שגיאה בעיבוד הבקשה")
@@ -310,14 +331,16 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
                     if quiz_session:
                         # עדכן את אותה הודעה עם השאלה הבאה
                         _send_next_question(query.message, quiz_session)
-                
+            
             except (ValueError, IndexError) as e:
                 logger.error(f"Error processing quiz answer: {e}")
                 query.message.reply_text("❌ שגיאה בעיבוד התשובה")
                 return
         
         elif callback_data == "confirm_new_quiz":
-            # אישור - מחיקת כל הקבצים והתחלה מחדש
+            # אישור - ביטול jobs שעוד רצים, מחיקת כל הקבצים והתחלה מחדש
+            queue_service.cancel_chat_jobs(chat_id, reason="new_quiz")
+            speculation_service.cancel(chat_id, reason="new_quiz")
             session_service.delete_file_data(chat_id)
             session_service.update_session_state(chat_id, "AWAITING_DOCUMENT")
             query.message.reply_text(
@@ -335,8 +358,8 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
             )
             return
         
-        # בדיקה אם יש file data - נדרש לכל שאר הפעולות
-        file_data = session_service.get_file_data(chat_id)
+        # בדיקה אם יש file data - נדרש לכל שאר הפעולות (הטקסט נטען רק כשיוצרים מבחן)
+        file_data = file_meta
         if not file_data:
             query.message.reply_text(
                 text="❌ הקובץ כבר לא זמין. בבקשה העלה קובץ חדש עם /start"
@@ -370,6 +393,13 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
                 )
                 return
             
+            file_data = session_service.load_file_texts(file_data)
+            if not file_data:
+                query.message.reply_text(
+                    text="❌ הקובץ כבר לא זמין. בבקשה העלה קובץ חדש עם /start"
+                )
+                return
+            
             # הודעת עיבוד
             processing_msg = query.message.reply_text(
                 f"🚀 **מעבד את הבקשה...**\n\nיוצר {count} שאלות חדשות מהטקסט.\nזה יכול לקחת 10-60 שניות ⏱️",
@@ -388,13 +418,20 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
                 file_info = {"files": file_data["files"]}
                 logger.info(f"Passing {len(file_data['files'])} files info for proportional question distribution")
             
-            job_id = queue_service.add_job(
-                chat_id=chat_id,
-                text=file_data["text"],
-                question_count=count,
-                metadata=metadata,
-                file_info=file_info
-            )
+            try:
+                job_id = queue_service.add_job(
+                    chat_id=chat_id,
+                    text=file_data["text"],
+                    question_count=count,
+                    metadata=metadata,
+                    file_info=file_info
+                )
+            except QueueFullError as e:
+                processing_msg.edit_text(format_queue_full(e.retry_after), parse_mode='Markdown')
+                return
+            except QuotaExceededError as e:
+                processing_msg.edit_text(format_quota_exceeded(e.affordable, e.reset_seconds), parse_mode='Markdown')
+                return
             
             if not job_id:
                 processing_msg.edit_text("❌ אירעה שגיאה. נסה שוב.")
@@ -403,84 +440,91 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
             # עדכון state
             session_service.update_session_state(chat_id, "PROCESSING")
             
-            # Polling על סטטוס
-            max_attempts = 120  # 10 דקות
-            attempt = 0
-            
-            while attempt < max_attempts:
-                time.sleep(5)
-                attempt += 1
-                
-                job_status = queue_service.get_job_status(job_id)
-                
-                if not job_status:
-                    processing_msg.edit_text("❌ Job לא נמצא")
-                    return
-                
-                status = job_status["status"]
+            # מנוי לאירועי ה-job לפני הקריאה הראשונה, כדי לא לפספס שינוי שקורה בינתיים
+            watcher = queue_service.watch_job(job_id)
+            try:
+                # בדיקה לפני כל המתנה - job שכבר הסתיים (מאגר ספקולטיבי מוכן, בקשה חוזרת) נמסר מיד.
+                # מיקום בתור וזמן משוער מתעדכנים בכל אירוע של ה-job (העריכות עצמן מאוחדות)
+                deadline = time.time() + config.JOB_TIMEOUT
                 
-                if status == "COMPLETED":
-                    # הצלחה!
-                    output_file = job_status.get("output_file")
-                    if output_file and os.path.exists(output_file):
-                        # שליחת קובץ HTML החדש
-                        keyboard = [
-                            [
-                                InlineKeyboardButton("🔄 עוד מבחן (5)", callback_data=f"more_quiz_5"),
-                                InlineKeyboardButton("🔄 עוד מבחן (10)", callback_data=f"more_quiz_10")
-                            ],
-                            [
-                                InlineKeyboardButton("🔄 עוד מבחן (15)", callback_data=f"more_quiz_15"),
-                                InlineKeyboardButton("🔄 עוד מבחן (20)", callback_data=f"more_quiz_20")
-                            ],
-                            [
-                                InlineKeyboardButton("✏️ בחר כמות אחרת", callback_data=f"more_quiz_custom")
-                            ],
-                            [
-                                InlineKeyboardButton("🔄 התחל מבחן חדש", callback_data=f"start_new_quiz")
+                while time.time() < deadline:
+                    job_status = queue_service.get_job_status(job_id)
+                    
+                    # הודעת ההתקדמות עומדת להתחלף בהודעת סיום - עריכה מאוחדת שעוד ממתינה כבר לא תישלח
+                    if not job_status or job_status["status"] in TERMINAL_STATUSES:
+                        finish_progress_message(processing_msg)
+                    
+                    if not job_status:
+                        processing_msg.edit_text("❌ Job לא נמצא")
+                        return
+                    
+                    status = job_status["status"]
+                    
+                    if status == "COMPLETED":
+                        # הצלחה!
+                        html_content = queue_service.get_job_html(job_id)
+                        if html_content:
+                            # שליחת קובץ HTML החדש
+                            keyboard = [
+                                [
+                                    InlineKeyboardButton("🔄 עוד מבחן (5)", callback_data=f"more_quiz_5"),
+                                    InlineKeyboardButton("🔄 עוד מבחן (10)", callback_data=f"more_quiz_10")
+                                ],
+                                [
+                                    InlineKeyboardButton("🔄 עוד מבחן (15)", callback_data=f"more_quiz_15"),
+                                    InlineKeyboardButton("🔄 עוד מבחן (20)", callback_data=f"more_quiz_20")
+                                ],
+                                [
+                                    InlineKeyboardButton("✏️ בחר כמות אחרת", callback_data=f"more_quiz_custom")
+                                ],
+                                [
+                                    InlineKeyboardButton("🔄 התחל מבחן חדש", callback_data=f"start_new_quiz")
+                                ]
                             ]
-                        ]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        with open(output_file, 'rb') as f:
+                            reply_markup = InlineKeyboardMarkup(keyboard)
                             query.message.reply_document(
-                                document=f,
-                                filename=os.path.basename(output_file),
+                                document=io.BytesIO(html_content.encode("utf-8")),
+                                filename=f"quiz_{chat_id}_{job_id}.html",
                                 caption=f"✅ **מבחן נוסף מוכן!**\n\n📝 {count} שאלות\n🎯 פתח את הקובץ בדפדפן\n\n💡 רוצה עוד?",
                                 reply_markup=reply_markup
                             )
-                        # מחיקת קובץ זמני
-                        try:
-                            os.remove(output_file)
-                        except:
-                            pass
-                        processing_msg.delete()
+                            processing_msg.delete()
+                        else:
+                            processing_msg.edit_text("❌ תוצאות המבחן לא נמצאו")
+                        # עדכון state
+                        session_service.update_session_state(chat_id, "COMPLETED")
+                        return
+                    
+                    elif status == "FAILED":
+                        # כשל
+                        error = job_status.get("error", "שגיאה לא ידועה")
+                        processing_msg.edit_text(
+                            f"❌ **לא הצלחתי ליצור את המבחן**\n\n{error}\n\nנסה:\n• כמות שאלות אחרת\n• /start מחדש"
+                        )
+                        session_service.update_session_state(chat_id, "FAILED")
+                        return
+                    
+                    elif status == "CANCELLED":
+                        # הוחלף בבקשה חדשה / מבחן חדש
+                        processing_msg.edit_text("🚫 הבקשה בוטלה")
+                        return
+                    
+                    # עדיין בתור / מעבד - עדכון מיקום וזמן משוער
                     else:
-                        processing_msg.edit_text("❌ קובץ הפלט לא נמצא")
-                    # עדכון state
-                    session_service.update_session_state(chat_id, "COMPLETED")
-                    return
-                
-                elif status == "FAILED":
-                    # כשל
-                    error = job_status.get("error", "שגיאה לא ידועה")
-                    processing_msg.edit_text(
-                        f"❌ **לא הצלחתי ליצור את המבחן**\n\n{error}\n\nנסה:\n• כמות שאלות אחרת\n• /start מחדש"
-                    )
-                    session_service.update_session_state(chat_id, "FAILED")
-                    return
+                        update_progress_message(processing_msg, queue_service.get_job_eta(job_id), count)
+                    
+                    # המתנה לאירוע של ה-job (או עד PROGRESS_POLL_SECONDS - המיקום בתור משתנה גם בלי אירוע)
+                    watcher.wait(config.PROGRESS_POLL_SECONDS)
                 
-                # עדיין מעבד
-                elif status == "PROCESSING" and attempt % 6 == 0:
-                    dots = "." * ((attempt // 6) % 4)
-                    processing_msg.edit_text(
-                        f"⏳ **עדיין מעבד{dots}**\n\nיוצר שאלות עם AI. סבלנות 🙏"
-                    )
-            
-            # Timeout
-            processing_msg.edit_text(
-                "⏱️ **הזמן הקצוב פג**\n\nהעיבוד ארך זמן רב. נסה שוב עם פחות שאלות."
-            )
-            session_service.update_session_state(chat_id, "FAILED")
+                # Timeout
+                finish_progress_message(processing_msg)
+                processing_msg.edit_text(
+                    "⏱️ **הזמן הקצוב פג**\n\nהעיבוד ארך זמן רב. נסה שוב עם פחות שאלות."
+                )
+                session_service.update_session_state(chat_id, "FAILED")
+            finally:
+                watcher.close()
+                finish_progress_message(processing_msg)
             return
     
     except Exception as e:
@@ -493,6 +537,42 @@ def handle_callback_query(update: Update, context: CallbackContext) -> None:
             pass
 
 
+def _wait_for_interactive_questions(job_id: str, timeout: int = 180):
+    """
+    המתנה לסיום job אינטראקטיבי - לפי אירועי ה-job, עם בדיקה לפני כל המתנה
+    
+    Args:
+        job_id: מזהה job
+        timeout: זמן המתנה מקסימלי בשניות
+    
+    Returns:
+        רשימת Question objects או None
+    """
+    # מנוי לאירועים לפני הבדיקה הראשונה, כדי לא לפספס סיום שקורה בינתיים
+    watcher = queue_service.watch_job(job_id)
+    try:
+        deadline = time.time() + timeout
+        
+        while True:
+            job_status = queue_service.get_job_status(job_id)
+            
+            if not job_status or job_status["status"] in ("FAILED", "CANCELLED"):
+                return None
+            
+            if job_status["status"] == "COMPLETED":
+                return queue_service.get_job_questions(job_id)
+            
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            watcher.wait(min(config.PROGRESS_POLL_SECONDS, remaining))
+    finally:
+        watcher.close()
+    
+    logger.warning(f"Interactive job {job_id} timed out")
+    return None
+
+
 def _send_next_question(message, quiz_session):
     """שליחת השאלה הבאה במבחן אינטראקטיבי"""
     try:
@@ -535,7 +615,7 @@ def _send_next_question(message, quiz_session):
             text=question_text,
             reply_markup=reply_markup
         )
-        
+    
     except Exception as e:
         logger.error(f"Error sending next question: {e}")
         try:
@@ -577,7 +657,7 @@ def _show_answer_result(message, result):
         message.edit_text(
             text=result_text
         )
-        
+    
     except Exception as e:
         logger.error(f"Error showing answer result: {e}")
 
@@ -641,7 +721,7 @@ def _show_quiz_results(message, stats):
         )
         
         logger.info(f"Quiz completed - Score: {correct}/{total} ({percentage}%)")
-        
+    
     except Exception as e:
         logger.error(f"Error showing quiz results: {e}")
         message.reply_text("🎉 המבחן הסתיים! תוצאות לא זמינות בשל שגיאה טכנית.")
@@ -9,6 +9,9 @@ from telegram.ext import CallbackContext
 from config import config
 from services.session_service import session_service
 from services.file_service import file_service
+from services.queue_service import queue_service
+from services.speculation_service import speculation_service
+from services.pipeline import pipeline
 from utils.validators import validate_file_size, validate_file_type, validate_text_length
 from utils.logger import logger
 
@@ -32,6 +35,8 @@ def handle_document(update: Update, context: CallbackContext) -> None:
         # בדיקת session
         session = session_service.get_session(chat_id)
         if not session:
+            # ה-session פג - ספקולציה שעוד רצה בשבילו רק תופסת slot ותקציב
+            speculation_service.cancel(chat_id, reason="session_expired")
             update.message.reply_text("⚠️ בבקשה התחל עם /start")
             return
         
@@ -49,6 +54,10 @@ def handle_document(update: Update, context: CallbackContext) -> None:
             update.message.reply_text(error_msg)
             return
         
+        # קובץ חדש - מבחנים שעוד בתור/בעיבוד כבר לא רלוונטיים
+        queue_service.cancel_chat_jobs(chat_id, reason="new_upload")
+        speculation_service.cancel(chat_id, reason="new_upload")
+        
         # הודעת עיבוד
         processing_msg = update.message.reply_text("⏳ מוריד ומעבד את הקובץ...")
         
@@ -58,8 +67,8 @@ def handle_document(update: Update, context: CallbackContext) -> None:
             file_path = os.path.join(config.TEMP_DIR, f"{chat_id}_{document.file_name}")
             file.download(file_path)
             
-            # חילוץ טקסט
-            extraction_result = file_service.extract_text(file_path, mime_type)
+            # חילוץ טקסט (בשלב ה-extract - בתהליך נפרד)
+            extraction_result = pipeline.extract_text(file_path, mime_type)
             
             # מחיקת קובץ זמני
             if os.path.exists(file_path):
@@ -83,7 +92,8 @@ def handle_document(update: Update, context: CallbackContext) -> None:
             # בדיקה אם יש כבר קבצים שהועלו (מצב מיזוג)
             # אם ה-state הוא AWAITING_DOCUMENT זה אומר שהמשתמש התחיל מבחן חדש ורוצה להתחיל מחדש
             # אם ה-state הוא AWAITING_COUNT זה אומר שהמשתמש מוסיף קובץ נוסף לקבצים קיימים
-            existing_file_data = session_service.get_file_data(chat_id)
+            # (metadata בלבד - הטקסט של הקבצים הקיימים כבר שמור ולא נטען כאן)
+            existing_file_data = session_service.get_file_meta(chat_id)
             
             if session["state"] == "AWAITING_DOCUMENT":
                 # מצב של מבחן חדש - נקה את הכל והתחל מחדש
@@ -112,7 +122,6 @@ def handle_document(update: Update, context: CallbackContext) -> None:
             # חישוב סטטיסטיקות מצטברות
             total_word_count = sum(f["word_count"] for f in files_list)
             total_char_count = sum(f["char_count"] for f in files_list)
-            combined_text = "\n\n".join(f["text"] for f in files_list)
             
             # המלצה על מספר שאלות
             recommended, reason = file_service.recommend_question_count(total_word_count)
@@ -123,13 +132,17 @@ def handle_document(update: Update, context: CallbackContext) -> None:
                 "filename": " + ".join([f["filename"] for f in files_list]),
                 "mime_type": mime_type,
                 "file_size": sum(f["file_size"] for f in files_list),
-                "text": combined_text,
                 "word_count": total_word_count,
                 "char_count": total_char_count,
                 "files": files_list,
                 "num_files": len(files_list)
             }
-            session_service.save_file_data(chat_id, file_data)
+            if not session_service.save_file_data(chat_id, file_data):
+                processing_msg.edit_text("❌ שגיאה בשמירת הקובץ. בבקשה העלה אותו שוב.")
+                return
+            
+            # יצירה מראש של הכמות המומלצת בזמן שהמשתמש בוחר
+            speculation_service.start(chat_id, file_data, recommended)
             
             # עדכון state
             session_service.update_session_state(chat_id, "AWAITING_COUNT")
@@ -176,7 +189,7 @@ def handle_document(update: Update, context: CallbackContext) -> None:
 ❓ **רוצה להוסיף עוד קבצים או להמשיך ליצירת המבחן?**"""
             
             processing_msg.edit_text(response, parse_mode='Markdown', reply_markup=reply_markup)
-            
+        
         except Exception as e:
             logger.error(f"File processing error: {e}")
             processing_msg.edit_text("❌ אירעה שגיאה בעיבוד הקובץ. נסה קובץ אחר.")
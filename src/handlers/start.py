@@ -6,6 +6,7 @@ from telegram import Update
 from telegram.ext import CallbackContext
 
 from services.session_service import session_service
+from services.speculation_service import speculation_service
 from utils.logger import logger
 
 
@@ -22,15 +23,15 @@ def start(update: Update, context: CallbackContext) -> None:
         
         logger.info(f"User {chat_id} started bot")
         
-        # בדיקת rate limiting
-        is_allowed, error_msg = session_service.check_rate_limit(chat_id)
+        # בדיקת rate limiting (הבקשה נספרת כבר בבדיקה - אטומית)
+        is_allowed, error_msg = session_service.acquire_rate_limit(chat_id)
         if not is_allowed:
             update.message.reply_text(error_msg)
             return
         
-        # יצירת session חדשה
+        # יצירת session חדשה - מאגר ספקולטיבי מה-flow הקודם כבר לא ינוצל
+        speculation_service.cancel(chat_id, reason="session_reset")
         session_service.create_session(chat_id)
-        session_service.increment_rate_limit(chat_id)
         
         # הודעת ברוכים הבאים
         welcome_message = """🤖 **ברוכים הבאים לבוט יצירת מבחני MCQ!**
@@ -59,7 +60,7 @@ def start(update: Update, context: CallbackContext) -> None:
             welcome_message,
             parse_mode='Markdown'
         )
-        
+    
     except Exception as e:
         logger.error(f"Start handler error: {e}")
         update.message.reply_text("❌ אירעה שגיאה. נסה שוב עם /start")
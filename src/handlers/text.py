@@ -2,15 +2,18 @@
 Text Handler
 טיפול בהודעות טקסט (מספר שאלות)
 """
+import io
 import time
-import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
 
 from config import config
 from services.session_service import session_service
-from services.queue_service import queue_service
+from services.queue_service import queue_service, QueueFullError, TERMINAL_STATUSES
+from services.quota_service import QuotaExceededError
+from services.speculation_service import speculation_service
 from utils.validators import validate_question_count
+from utils.progress import update_progress_message, finish_progress_message, format_queue_full, format_quota_exceeded
 from utils.logger import logger
 
 
@@ -28,9 +31,11 @@ def handle_text(update: Update, context: CallbackContext) -> None:
         
         logger.info(f"User {chat_id} sent text: {text}")
         
-        # בדיקת session
-        session = session_service.get_session(chat_id)
+        # בדיקת session (יחד עם ה-metadata של הקבצים - round trip אחד)
+        session, file_meta = session_service.get_session_and_file_meta(chat_id)
         if not session:
+            # ה-session פג - ספקולציה שעוד רצה בשבילו רק תופסת slot ותקציב
+            speculation_service.cancel(chat_id, reason="session_expired")
             update.message.reply_text("⚠️ בבקשה התחל עם /start")
             return
         
@@ -45,8 +50,8 @@ def handle_text(update: Update, context: CallbackContext) -> None:
             update.message.reply_text(error_msg)
             return
         
-        # קבלת file data
-        file_data = session_service.get_file_data(chat_id)
+        # קבלת file data - הטקסט נטען רק עכשיו, אחרי שהבקשה עברה validation
+        file_data = session_service.load_file_texts(file_meta)
         if not file_data:
             update.message.reply_text("❌ לא נמצא קובץ. בבקשה העלה קובץ שוב.")
             session_service.update_session_state(chat_id, "START")
@@ -70,13 +75,23 @@ def handle_text(update: Update, context: CallbackContext) -> None:
             file_info = {"files": file_data["files"]}
             logger.info(f"Passing {len(file_data['files'])} files info for proportional question distribution")
         
-        job_id = queue_service.add_job(
-            chat_id=chat_id,
-            text=file_data["text"],
-            question_count=count,
-            metadata=metadata,
-            file_info=file_info
-        )
+        try:
+            # מאגר שנוצר מראש בזמן שהמשתמש בחר - אם הוא מספיק, לא צריך job חדש
+            job_id = speculation_service.claim(chat_id, count, file_data["text"], file_info=file_info)
+            if not job_id:
+                job_id = queue_service.add_job(
+                    chat_id=chat_id,
+                    text=file_data["text"],
+                    question_count=count,
+                    metadata=metadata,
+                    file_info=file_info
+                )
+        except QueueFullError as e:
+            processing_msg.edit_text(format_queue_full(e.retry_after), parse_mode='Markdown')
+            return
+        except QuotaExceededError as e:
+            processing_msg.edit_text(format_quota_exceeded(e.affordable, e.reset_seconds), parse_mode='Markdown')
+            return
         
         if not job_id:
             processing_msg.edit_text("❌ אירעה שגיאה. נסה שוב.")
@@ -85,94 +100,100 @@ def handle_text(update: Update, context: CallbackContext) -> None:
         # עדכון state
         session_service.update_session_state(chat_id, "PROCESSING")
         
-        # Polling על סטטוס
-        max_attempts = 120  # 10 דקות (120 * 5 שניות)
-        attempt = 0
-        
-        while attempt < max_attempts:
-            time.sleep(5)  # המתנה 5 שניות
-            attempt += 1
-            
-            job_status = queue_service.get_job_status(job_id)
-            
-            if not job_status:
-                processing_msg.edit_text("❌ Job לא נמצא")
-                return
+        # מנוי לאירועי ה-job לפני הקריאה הראשונה, כדי לא לפספס שינוי שקורה בינתיים
+        watcher = queue_service.watch_job(job_id)
+        try:
+            # בדיקה לפני כל המתנה - job שכבר הסתיים (מאגר ספקולטיבי מוכן, בקשה חוזרת) נמסר מיד.
+            # מיקום בתור וזמן משוער מתעדכנים בכל אירוע של ה-job (העריכות עצמן מאוחדות)
+            deadline = time.time() + config.JOB_TIMEOUT
             
-            status = job_status["status"]
-            
-            if status == "COMPLETED":
-                # הצלחה!
-                output_file = job_status.get("output_file")
-                if output_file and os.path.exists(output_file):
-                    # יצירת כפתורים למבחן נוסף
-                    keyboard = [
-                        [
-                            InlineKeyboardButton("🧠 בחן אותי בטלגרם", callback_data=f"start_telegram_quiz_{count}")
-                        ],
-                        [
-                            InlineKeyboardButton("🔄 מבחן נוסף (5 שאלות)", callback_data=f"more_quiz_5"),
-                            InlineKeyboardButton("🔄 מבחן נוסף (10 שאלות)", callback_data=f"more_quiz_10")
-                        ],
-                        [
-                            InlineKeyboardButton("🔄 מבחן נוסף (15 שאלות)", callback_data=f"more_quiz_15"),
-                            InlineKeyboardButton("🔄 מבחן נוסף (20 שאלות)", callback_data=f"more_quiz_20")
-                        ],
-                        [
-                            InlineKeyboardButton("✏️ בחר כמות אחרת", callback_data=f"more_quiz_custom")
-                        ],
-                        [
-                            InlineKeyboardButton("🆕 התחל מבחן חדש", callback_data=f"start_new_quiz")
+            while time.time() < deadline:
+                job_status = queue_service.get_job_status(job_id)
+                
+                # הודעת ההתקדמות עומדת להתחלף בהודעת סיום - עריכה מאוחדת שעוד ממתינה כבר לא תישלח
+                if not job_status or job_status["status"] in TERMINAL_STATUSES:
+                    finish_progress_message(processing_msg)
+                
+                if not job_status:
+                    processing_msg.edit_text("❌ Job לא נמצא")
+                    return
+                
+                status = job_status["status"]
+                
+                if status == "COMPLETED":
+                    # הצלחה!
+                    html_content = queue_service.get_job_html(job_id)
+                    if html_content:
+                        # יצירת כפתורים למבחן נוסף
+                        keyboard = [
+                            [
+                                InlineKeyboardButton("🧠 בחן אותי בטלגרם", callback_data=f"start_telegram_quiz_{count}")
+                            ],
+                            [
+                                InlineKeyboardButton("🔄 מבחן נוסף (5 שאלות)", callback_data=f"more_quiz_5"),
+                                InlineKeyboardButton("🔄 מבחן נוסף (10 שאלות)", callback_data=f"more_quiz_10")
+                            ],
+                            [
+                                InlineKeyboardButton("🔄 מבחן נוסף (15 שאלות)", callback_data=f"more_quiz_15"),
+                                InlineKeyboardButton("🔄 מבחן נוסף (20 שאלות)", callback_data=f"more_quiz_20")
+                            ],
+                            [
+                                InlineKeyboardButton("✏️ בחר כמות אחרת", callback_data=f"more_quiz_custom")
+                            ],
+                            [
+                                InlineKeyboardButton("🆕 התחל מבחן חדש", callback_data=f"start_new_quiz")
+                            ]
                         ]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    # שליחת קובץ HTML
-                    with open(output_file, 'rb') as f:
+                        reply_markup = InlineKeyboardMarkup(keyboard)
+                        
+                        # שליחת קובץ HTML
                         update.message.reply_document(
-                            document=f,
-                            filename=os.path.basename(output_file),
+                            document=io.BytesIO(html_content.encode("utf-8")),
+                            filename=f"quiz_{chat_id}_{job_id}.html",
                             caption=f"✅ **המבחן מוכן!**\n\n📝 {count} שאלות\n🎯 פתח את הקובץ בדפדפן\n\n💡 רוצה מבחן נוסף מאותו הקובץ?",
                             reply_markup=reply_markup
                         )
+                        
+                        processing_msg.delete()
+                        
+                        # עדכון state אבל לא למחוק file_data!
+                        session_service.update_session_state(chat_id, "COMPLETED")
+                    else:
+                        processing_msg.edit_text("❌ תוצאות המבחן לא נמצאו")
                     
-                    # מחיקת קובץ זמני
-                    try:
-                        os.remove(output_file)
-                    except:
-                        pass
-                    
-                    processing_msg.delete()
-                    
-                    # עדכון state אבל לא למחוק file_data!
-                    session_service.update_session_state(chat_id, "COMPLETED")
+                    return
+                
+                elif status == "FAILED":
+                    # כשל
+                    error = job_status.get("error", "שגיאה לא ידועה")
+                    processing_msg.edit_text(
+                        f"❌ **לא הצלחתי ליצור את המבחן**\n\n{error}\n\nנסה:\n• טקסט ארוך יותר\n• פחות שאלות\n• /start מחדש"
+                    )
+                    session_service.update_session_state(chat_id, "FAILED")
+                    return
+                
+                elif status == "CANCELLED":
+                    # הוחלף בבקשה חדשה / מבחן חדש - ה-state כבר שייך לבקשה החדשה
+                    processing_msg.edit_text("🚫 הבקשה בוטלה")
+                    return
+                
+                # עדיין בתור / מעבד - עדכון מיקום וזמן משוער
                 else:
-                    processing_msg.edit_text("❌ קובץ הפלט לא נמצא")
+                    update_progress_message(processing_msg, queue_service.get_job_eta(job_id), count)
                 
-                return
-            
-            elif status == "FAILED":
-                # כשל
-                error = job_status.get("error", "שגיאה לא ידועה")
-                processing_msg.edit_text(
-                    f"❌ **לא הצלחתי ליצור את המבחן**\n\n{error}\n\nנסה:\n• טקסט ארוך יותר\n• פחות שאלות\n• /start מחדש"
-                )
-                session_service.update_session_state(chat_id, "FAILED")
-                return
+                # המתנה לאירוע של ה-job (או עד PROGRESS_POLL_SECONDS - המיקום בתור משתנה גם בלי אירוע)
+                watcher.wait(config.PROGRESS_POLL_SECONDS)
             
-            # עדיין מעבד
-            elif status == "PROCESSING" and attempt % 6 == 0:  # כל 30 שניות
-                dots = "." * ((attempt // 6) % 4)
-                processing_msg.edit_text(
-                    f"⏳ **עדיין מעבד{dots}**\n\nיוצר שאלות עם AI. סבלנות 🙏"
-                )
-        
-        # Timeout
-        processing_msg.edit_text(
-            "⏱️ **הזמן הקצוב פג**\n\nהעיבוד ארך זמן רב.\n\nנסה:\n• קובץ קטן יותר\n• פחות שאלות\n• /start מחדש"
-        )
-        session_service.update_session_state(chat_id, "FAILED")
-        
+            # Timeout
+            finish_progress_message(processing_msg)
+            processing_msg.edit_text(
+                "⏱️ **הזמן הקצוב פג**\n\nהעיבוד ארך זמן רב.\n\nנסה:\n• קובץ קטן יותר\n• פחות שאלות\n• /start מחדש"
+            )
+            session_service.update_session_state(chat_id, "FAILED")
+        finally:
+            watcher.close()
+            finish_progress_message(processing_msg)
+    
     except Exception as e:
         logger.error(f"Text handler error: {e}")
         update.message.reply_text("❌ אירעה שגיאה. נסה שוב עם /start")
@@ -37,6 +37,8 @@ def main(run_as_thread=False):
     
     # Global updater for cleanup
     updater = None
+    # כשה-updater מוחזר ל-entry point (webhook / thread) הוא וה-workers ממשיכים לרוץ - אין cleanup כאן
+    handed_off = False
     
     try:
         # בדיקת configuration
@@ -76,8 +78,7 @@ def main(run_as_thread=False):
         dispatcher.add_handler(CallbackQueryHandler(handle_callback_query))
         
         # הפעלת background workers
-        logger.info("Starting background workers...")
-        queue_service.start_workers(num_workers=3)
+        queue_service.start_configured_workers()
         
         # Choose between webhook and polling based on environment
         if config.USE_WEBHOOK and config.WEBHOOK_URL:
@@ -103,8 +104,9 @@ def main(run_as_thread=False):
                 logger.warning("Could not import web_app to set updater")
             
             # Return the updater so main_web.py can manage it
+            handed_off = True
             return updater
-            
+        
         else:
             # התחלת polling
             logger.info("🚀 Telegram MCQ Bot is running with polling!")
@@ -117,23 +119,25 @@ def main(run_as_thread=False):
                 updater.idle()
             else:
                 logger.info("Bot running as thread, no idle()")
+                handed_off = True
                 return updater
-        
+    
     except KeyboardInterrupt:
         logger.info("Received stop signal")
     except Exception as e:
         logger.error(f"Fatal error: {e}")
         raise
     finally:
-        # Cleanup
-        try:
-            if updater:
-                logger.info("Stopping bot...")
-                updater.stop()
-            queue_service.stop_workers()
-            logger.info("Bot stopped gracefully")
-        except Exception as cleanup_error:
-            logger.error(f"Error during cleanup: {cleanup_error}")
+        # Cleanup - drain של ה-workers: jobs שלא הסתיימו חוזרים לתור
+        if not handed_off:
+            try:
+                if updater:
+                    logger.info("Stopping bot...")
+                    updater.stop()
+                queue_service.drain()
+                logger.info("Bot stopped gracefully")
+            except Exception as cleanup_error:
+                logger.error(f"Error during cleanup: {cleanup_error}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+"""
+Worker Autoscaler
+הגדלה והקטנה של מספר ה-workers לפי עומס התור
+"""
+import json
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional
+
+from config import config
+from utils.logger import logger
+
+# heartbeat של כל instance עם autoscaler פעיל (zset: instance -> זמן הבדיקה האחרונה)
+INSTANCES_KEY = "metrics:autoscaler:instances"
+
+
+@dataclass
+class ScalingDecision:
+    """החלטת scaling בודדת"""
+    timestamp: str
+    previous: int
+    target: int
+    reason: str
+    queue_length: int
+    oldest_wait_seconds: float
+    avg_latency_seconds: float
+
+
+class WorkerAutoscaler:
+    """
+    מחשב את מספר ה-workers הרצוי לפי אורך התור, גיל ה-job הוותיק ביותר
+    וזמן היצירה הממוצע, עם hysteresis למניעת קפיצות
+    
+    התור משותף לכל ה-instances, ולכן כל instance מוסיף רק את החלק שלו מה-workers
+    שחסרים לתור - לפי מספר ה-instances החיים (heartbeat ב-Redis בכל בדיקה)
+    """
+    
+    def __init__(self, stats_provider: Callable[[], Dict[str, Any]], resize: Callable[[int], None],
+                 current: int, redis_client=None):
+        """
+        Args:
+            stats_provider: פונקציה שמחזירה queue_length, oldest_wait_seconds, busy_workers, avg_latency_seconds
+            resize: פונקציה שמשנה את מספר ה-workers בפועל
+            current: מספר ה-workers ההתחלתי
+            redis_client: לפרסום מדדים (אופציונלי)
+        """
+        self.stats_provider = stats_provider
+        self.resize = resize
+        self.redis_client = redis_client
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"
+        
+        self.min_workers = config.WORKER_MIN
+        self.max_workers = max(config.WORKER_MAX, config.WORKER_MIN)
+        self.current = current
+        
+        self.up_streak = 0
+        self.down_streak = 0
+        self.last_change_time = 0.0
+        
+        self.decisions = deque(maxlen=50)
+        self.scale_up_count = 0
+        self.scale_down_count = 0
+        self.last_stats: Dict[str, Any] = {}
+        self.last_desired = current
+        
+        self.is_running = False
+        self.thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """הפעלת לולאת ה-autoscaler ב-thread נפרד"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        logger.info(f"Autoscaler started ({self.min_workers}-{self.max_workers} workers)")
+    
+    def stop(self):
+        """עצירת ה-autoscaler"""
+        self.is_running = False
+        if self.redis_client:
+            try:
+                self.redis_client.zrem(INSTANCES_KEY, self.instance_id)
+            except Exception as e:
+                logger.debug(f"Failed to remove autoscaler heartbeat: {e}")
+    
+    def _loop(self):
+        """לולאה מחזורית - בדיקה כל AUTOSCALE_INTERVAL שניות"""
+        while self.is_running:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Autoscaler error: {e}")
+            time.sleep(config.AUTOSCALE_INTERVAL)
+    
+    def desired_workers(self, stats: Dict[str, Any]) -> int:
+        """
+        חישוב מספר ה-workers הרצוי (לפני hysteresis)
+        
+        Args:
+            stats: מדדי התור הנוכחיים (instances - מספר ה-instances שחולקים את התור)
+        
+        Returns:
+            מספר workers בין הגבולות
+        """
+        queue_length = stats["queue_length"]
+        busy = stats["busy_workers"]
+        latency = stats["avg_latency_seconds"] or config.AUTOSCALE_DEFAULT_LATENCY
+        instances = max(1, stats.get("instances", 1))
+        
+        # כמה workers צריך כדי לרוקן את התור תוך זמן ההמתנה היעד - החלק של ה-instance הזה
+        backlog_workers = math.ceil(queue_length * latency / config.AUTOSCALE_TARGET_WAIT)
+        needed = busy + math.ceil(backlog_workers / instances)
+        
+        # job שממתין יותר מדי זמן - לפחות worker אחד נוסף
+        if stats["oldest_wait_seconds"] > config.AUTOSCALE_TARGET_WAIT:
+            needed = max(needed, self.current + 1)
+        
+        return max(self.min_workers, min(self.max_workers, needed))
+    
+    def tick(self) -> Optional[ScalingDecision]:
+        """
+        בדיקה אחת - מחליט אם להגדיל/להקטין
+        
+        Returns:
+            ההחלטה שהתקבלה או None אם לא היה שינוי
+        """
+        stats = dict(self.stats_provider(), instances=self._heartbeat())
+        desired = self.desired_workers(stats)
+        self.last_stats = stats
+        self.last_desired = desired
+        
+        if desired > self.current:
+            self.up_streak += 1
+            self.down_streak = 0
+        elif desired < self.current:
+            self.down_streak += 1
+            self.up_streak = 0
+        else:
+            self.up_streak = 0
+            self.down_streak = 0
+        
+        in_cooldown = time.time() - self.last_change_time < config.AUTOSCALE_COOLDOWN
+        decision = None
+        
+        if self.up_streak >= config.AUTOSCALE_UP_TICKS:
+            # הגדלה מהירה - ישר לגודל הרצוי
+            decision = self._apply(desired, "scale_up", stats)
+            self.scale_up_count += 1
+        elif self.down_streak >= config.AUTOSCALE_DOWN_TICKS and not in_cooldown:
+            # הקטנה הדרגתית - worker אחד בכל פעם
+            decision = self._apply(self.current - 1, "scale_down", stats)
+            self.scale_down_count += 1
+        
+        self._publish_metrics()
+        return decision
+    
+    def _heartbeat(self) -> int:
+        """
+        רישום ה-instance כחי וספירת ה-instances שבדקו לאחרונה
+        
+        Returns:
+            מספר ה-instances החיים (1 בלי Redis או בשגיאה)
+        """
+        if not self.redis_client:
+            return 1
+        now = time.time()
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.zadd(INSTANCES_KEY, {self.instance_id: now})
+            # instance שלא בדק שלוש פעמים ברציפות נחשב מת
+            pipe.zremrangebyscore(INSTANCES_KEY, 0, now - config.AUTOSCALE_INTERVAL * 3)
+            pipe.zcard(INSTANCES_KEY)
+            pipe.expire(INSTANCES_KEY, config.AUTOSCALE_INTERVAL * 6)
+            return max(1, pipe.execute()[2])
+        except Exception as e:
+            logger.debug(f"Autoscaler heartbeat failed: {e}")
+            return 1
+    
+    def _apply(self, target: int, reason: str, stats: Dict[str, Any]) -> ScalingDecision:
+        """ביצוע שינוי ורישום ההחלטה"""
+        decision = ScalingDecision(
+            timestamp=datetime.now().isoformat(),
+            previous=self.current,
+            target=target,
+            reason=reason,
+            queue_length=stats["queue_length"],
+            oldest_wait_seconds=round(stats["oldest_wait_seconds"], 1),
+            avg_latency_seconds=round(stats["avg_latency_seconds"], 1)
+        )
+        
+        logger.info(
+            f"Autoscaler {reason}: {self.current} -> {target} workers "
+            f"(queue={decision.queue_length}, oldest_wait={decision.oldest_wait_seconds}s, "
+            f"latency={decision.avg_latency_seconds}s)"
+        )
+        
+        self.resize(target)
+        self.current = target
+        self.last_change_time = time.time()
+        self.up_streak = 0
+        self.down_streak = 0
+        self.decisions.append(decision)
+        return decision
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """מדדי ה-autoscaler - לניטור"""
+        return {
+            "instance": self.instance_id,
+            "instances": self.last_stats.get("instances", 1),
+            "current_workers": self.current,
+            "desired_workers": self.last_desired,
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "scale_up_count": self.scale_up_count,
+            "scale_down_count": self.scale_down_count,
+            "last_stats": self.last_stats,
+            "recent_decisions": [asdict(d) for d in self.decisions][-10:]
+        }
+    
+    def _publish_metrics(self):
+        """פרסום המדדים ל-Redis כדי שה-web app יוכל להציג אותם"""
+        if not self.redis_client:
+            return
+        try:
+            self.redis_client.setex(
+                "metrics:autoscaler",
+                config.AUTOSCALE_INTERVAL * 6,
+                json.dumps(self.get_metrics())
+            )
+        except Exception as e:
+            logger.debug(f"Failed to publish autoscaler metrics: {e}")
@@ -0,0 +1,889 @@
+"""
+Embedded store
+store בתוך התהליך עם אותן פקודות Redis שהשירותים משתמשים בהן - לפריסה של instance יחיד בלי Redis
+"""
+import asyncio
+import atexit
+import json
+import math
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable, Union
+
+from utils.logger import logger
+from services.rate_limiter import SLIDING_WINDOW_SCRIPT, ADJUST_SCRIPT
+from services.scheduler import ENQUEUE_SCRIPT, POP_SCRIPT, REMOVE_SCRIPT, CLAIM_DUE_SCRIPT
+
+
+class EmbeddedStoreError(Exception):
+    """פקודה שנכשלה ב-store המקומי (סוג ערך לא מתאים, סקריפט לא מוכר)"""
+
+
+class _Hash(dict):
+    """hash: field -> value"""
+
+
+class _ZSet(dict):
+    """sorted set: member -> score"""
+    
+    def ordered(self) -> List[Tuple[str, float]]:
+        """האיברים לפי (score, member) - כמו הסדר ב-Redis"""
+        return sorted(self.items(), key=lambda item: (item[1], item[0]))
+
+
+def _member(value) -> str:
+    """member / field / פריט ברשימה - תמיד str"""
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _stored(value) -> Union[str, bytes]:
+    """ערך string לשמירה - bytes נשמרים כמו שהם, מספרים כמו ש-redis-py מקודד אותם"""
+    if isinstance(value, (str, bytes)):
+        return value
+    return _member(value)
+
+
+def _seconds(value) -> float:
+    """זמן (שניות או timedelta)"""
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+def _score(value) -> float:
+    """score / גבול טווח - כולל '-inf' / '+inf'"""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return float(value)
+
+
+def _slice(items: list, start: int, end: int) -> list:
+    """טווח עם אינדקסים כמו ב-Redis (end כולל, שליליים מהסוף)"""
+    size = len(items)
+    if start < 0:
+        start = max(size + start, 0)
+    if end < 0:
+        end = size + end
+    if start > end or start >= size:
+        return []
+    return items[start:end + 1]
+
+
+def _lua_number(value: float) -> str:
+    """tostring של מספר ב-Lua (כמו בתשובה של הסקריפט המקורי)"""
+    return "%.14g" % value
+
+
+class EmbeddedStore:
+    """
+    הנתונים של כל ה-clients בתהליך: ערכים, TTLs, ערוצי pub/sub, ושמירה אופציונלית ל-SQLite
+    
+    כל פקודה (וכל pipeline וסקריפט) רצה תחת נעילה אחת, ולכן אטומית כמו ב-Redis.
+    תפוגה היא גם עצלה (בגישה למפתח) וגם פעילה (thread רקע שמנקה מפתחות שפג תוקפם).
+    עם קובץ SQLite, מפתחות שהשתנו נכתבים בקבוצה כל EMBEDDED_FLUSH_INTERVAL שניות
+    (כמו appendfsync everysec) ונטענים מחדש בעליית התהליך, כולל זמני התפוגה.
+    """
+    
+    def __init__(self, path: str = "", flush_interval: float = 1.0):
+        """
+        Args:
+            path: קובץ SQLite לשמירה (ריק = זיכרון בלבד)
+            flush_interval: כל כמה שניות לכתוב שינויים ולנקות מפתחות שפג תוקפם
+        """
+        self.path = path
+        self.flush_interval = max(0.1, flush_interval)
+        
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)  # BLPOP ממתין לדחיפה לרשימה
+        self.data: Dict[str, Any] = {}
+        self.expires: Dict[str, float] = {}
+        self.channels: Dict[str, set] = {}
+        self._dirty: set = set()
+        
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._stopped = threading.Event()
+        if path:
+            self._open(path)
+        
+        self._thread = threading.Thread(target=self._housekeeping, name="embedded-store", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    # ==================== Keyspace ====================
+    
+    def lookup(self, key: str):
+        """הערך של מפתח (None אם לא קיים או שפג תוקפו)"""
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.remove(key)
+            return None
+        return self.data.get(key)
+    
+    def remove(self, key: str) -> bool:
+        """מחיקת מפתח"""
+        self.expires.pop(key, None)
+        if key in self.data:
+            del self.data[key]
+            self._dirty.add(key)
+            return True
+        return False
+    
+    def touched(self, key: str):
+        """אחרי שינוי - מבנה שהתרוקן נמחק (כמו ב-Redis), והמפתח יישמר בסבב הבא"""
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, (str, bytes)) and len(value) == 0:
+            self.remove(key)
+        self._dirty.add(key)
+    
+    # ==================== Persistence ====================
+    
+    @staticmethod
+    def _serialize(value) -> Tuple[str, bytes]:
+        if isinstance(value, bytes):
+            return "bytes", value
+        if isinstance(value, str):
+            return "string", value.encode("utf-8")
+        if isinstance(value, _ZSet):
+            return "zset", json.dumps(value).encode("utf-8")
+        if isinstance(value, _Hash):
+            return "hash", json.dumps(value).encode("utf-8")
+        if isinstance(value, deque):
+            return "list", json.dumps(list(value)).encode("utf-8")
+        return "set", json.dumps(sorted(value)).encode("utf-8")
+    
+    @staticmethod
+    def _deserialize(kind: str, blob: bytes):
+        if kind == "bytes":
+            return bytes(blob)
+        if kind == "string":
+            return bytes(blob).decode("utf-8")
+        loaded = json.loads(bytes(blob).decode("utf-8"))
+        if kind == "zset":
+            return _ZSet(loaded)
+        if kind == "hash":
+            return _Hash(loaded)
+        if kind == "list":
+            return deque(loaded)
+        return set(loaded)
+    
+    def _open(self, path: str):
+        """פתיחת קובץ ה-SQLite וטעינת המפתחות שעוד בתוקף"""
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, kind TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL)"
+        )
+        now = time.time()
+        with self._db:
+            self._db.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        for key, kind, blob, expires_at in self._db.execute("SELECT key, kind, value, expires_at FROM entries"):
+            self.data[key] = self._deserialize(kind, blob)
+            if expires_at is not None:
+                self.expires[key] = expires_at
+        logger.info(f"Embedded store loaded {len(self.data)} keys from {path}")
+    
+    def flush(self) -> int:
+        """
+        כתיבת המפתחות שהשתנו מאז הסבב הקודם לקובץ
+        
+        Returns:
+            מספר המפתחות שנכתבו או נמחקו
+        """
+        db = self._db
+        if db is None:
+            return 0
+        
+        with self.lock:
+            dirty, self._dirty = self._dirty, set()
+            upserts, deletes = [], []
+            for key in dirty:
+                value = self.data.get(key)
+                if value is None:
+                    deletes.append((key,))
+                else:
+                    kind, blob = self._serialize(value)
+                    upserts.append((key, kind, blob, self.expires.get(key)))
+        
+        if not dirty:
+            return 0
+        try:
+            with self._db_lock, db:
+                db.executemany("DELETE FROM entries WHERE key = ?", deletes)
+                db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", upserts)
+        except Exception as e:
+            logger.error(f"Failed to persist embedded store: {e}")
+            with self.lock:
+                self._dirty |= dirty  # ננסה שוב בסבב הבא
+            return 0
+        return len(dirty)
+    
+    def _expire_due(self):
+        """ניקוי פעיל של מפתחות שפג תוקפם (גם כאלה שאף אחד לא קורא שוב)"""
+        now = time.time()
+        with self.lock:
+            for key in [key for key, expires_at in self.expires.items() if expires_at <= now]:
+                self.remove(key)
+    
+    def _housekeeping(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self._expire_due()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Embedded store housekeeping failed: {e}")
+    
+    def close(self):
+        """עצירת ה-thread וכתיבה אחרונה לקובץ"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self.flush()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """מדדי ה-store - לניטור"""
+        with self.lock:
+            return {
+                "keys": len(self.data),
+                "expiring": len(self.expires),
+                "pending_writes": len(self._dirty),
+                "path": self.path or None
+            }
+
+
+class EmbeddedPubSub:
+    """מנוי לערוצים של ה-store המקומי (הממשק של redis-py PubSub שבשימוש)"""
+    
+    def __init__(self, client: "EmbeddedRedis", ignore_subscribe_messages: bool = False):
+        self._client = client
+        self._store = client.store
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+        self.messages: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.subscribed: set = set()
+    
+    def subscribe(self, *channels: str):
+        with self._store.lock:
+            for channel in channels:
+                self._store.channels.setdefault(channel, set()).add(self)
+                self.subscribed.add(channel)
+                if not self.ignore_subscribe_messages:
+                    self.messages.put(self._message("subscribe", channel, len(self.subscribed)))
+    
+    def unsubscribe(self, *channels: str):
+        with self._store.lock:
+            for channel in channels or list(self.subscribed):
+                subscribers = self._store.channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(self)
+                    if not subscribers:
+                        del self._store.channels[channel]
+                self.subscribed.discard(channel)
+    
+    def _message(self, kind: str, channel: str, data) -> Dict[str, Any]:
+        return {"type": kind, "pattern": None, "channel": self._client.output(channel), "data": data}
+    
+    def deliver(self, channel: str, message):
+        self.messages.put(self._message("message", channel, self._client.output(message)))
+    
+    def get_message(self, ignore_subscribe_messages: bool = False, timeout: Optional[float] = 0.0):
+        """ההודעה הבאה (None אם לא הגיעה עד ה-timeout)"""
+        try:
+            if timeout is not None and timeout <= 0:
+                return self.messages.get_nowait()
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def close(self):
+        self.unsubscribe()
+
+
+class EmbeddedPipeline:
+    """
+    pipeline - הפקודות נאספות ורצות יחד תחת הנעילה של ה-store (תמיד אטומי, כמו MULTI)
+    """
+    
+    def __init__(self, client: "EmbeddedRedis"):
+        self._client = client
+        self._commands: List[Tuple[str, tuple, dict]] = []
+    
+    def __getattr__(self, name: str):
+        if not hasattr(self._client, name):
+            raise AttributeError(name)
+        
+        def queue_command(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue_command
+    
+    def __len__(self):
+        return len(self._commands)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.reset()
+    
+    def reset(self):
+        self._commands = []
+    
+    def execute(self, raise_on_error: bool = True) -> list:
+        results = []
+        with self._client.store.lock:
+            for name, args, kwargs in self._commands:
+                try:
+                    results.append(getattr(self._client, name)(*args, **kwargs))
+                except Exception as e:
+                    results.append(e)
+        self.reset()
+        
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+
+class EmbeddedScript:
+    """סקריפט רשום - המימוש ב-Python של סקריפט ה-Lua, רץ תחת הנעילה של ה-store"""
+    
+    def __init__(self, client: "EmbeddedRedis", function: Callable):
+        self._client = client
+        self._function = function
+    
+    def __call__(self, keys: Iterable[str] = (), args: Iterable[Any] = (), client=None):
+        client = client or self._client
+        with client.store.lock:
+            return self._function(client, list(keys), [_member(arg) for arg in args])
+
+
+class EmbeddedRedis:
+    """
+    client מעל ה-store המקומי - אותן חתימות כמו redis.Redis לפקודות שבשימוש בשירותים
+    
+    decode_responses קובע רק את צורת התשובה (str או bytes), כמו ב-redis-py; כל ה-clients
+    בתהליך רואים את אותם נתונים.
+    """
+    
+    def __init__(self, store: EmbeddedStore, decode_responses: bool = True):
+        """
+        Args:
+            store: הנתונים המשותפים
+            decode_responses: האם להחזיר str (אחרת bytes)
+        """
+        self.store = store
+        self.decode_responses = decode_responses
+    
+    def output(self, value):
+        """ערך בצורה שה-client מחזיר"""
+        if value is None:
+            return None
+        if self.decode_responses:
+            return value.decode("utf-8") if isinstance(value, bytes) else value
+        return value.encode("utf-8") if isinstance(value, str) else value
+    
+    def _get_typed(self, key: str, kind, create: bool = False):
+        """הערך של מפתח מסוג מסוים (אופציונלית יוצר מבנה ריק)"""
+        value = self.store.lookup(key)
+        if value is None:
+            if not create:
+                return None
+            value = kind()
+            self.store.data[key] = value
+        elif type(value) is not kind:
+            raise EmbeddedStoreError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+    
+    def _get_string(self, key: str):
+        value = self.store.lookup(key)
+        if value is not None and not isinstance(value, (str, bytes)):
+            raise EmbeddedStoreError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+    
+    # ==================== Connection ====================
+    
+    def ping(self) -> bool:
+        return True
+    
+    def close(self):
+        pass
+    
+    def pipeline(self, transaction: bool = True) -> EmbeddedPipeline:
+        return EmbeddedPipeline(self)
+    
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> EmbeddedPubSub:
+        return EmbeddedPubSub(self, ignore_subscribe_messages=ignore_subscribe_messages)
+    
+    def register_script(self, script: str) -> EmbeddedScript:
+        """
+        Raises:
+            EmbeddedStoreError: לסקריפט אין מימוש מקומי
+        """
+        function = SCRIPTS.get(script)
+        if function is None:
+            raise EmbeddedStoreError("Lua scripts are not supported by the embedded store")
+        return EmbeddedScript(self, function)
+    
+    # ==================== Keys ====================
+    
+    def delete(self, *names: str) -> int:
+        with self.store.lock:
+            return sum(1 for name in names if self.store.lookup(name) is not None and self.store.remove(name))
+    
+    def exists(self, *names: str) -> int:
+        with self.store.lock:
+            return sum(1 for name in names if self.store.lookup(name) is not None)
+    
+    def expire(self, name: str, time_seconds) -> bool:
+        with self.store.lock:
+            if self.store.lookup(name) is None:
+                return False
+            self.store.expires[name] = time.time() + _seconds(time_seconds)
+            self.store.touched(name)
+            return True
+    
+    def ttl(self, name: str) -> int:
+        with self.store.lock:
+            if self.store.lookup(name) is None:
+                return -2
+            expires_at = self.store.expires.get(name)
+            return -1 if expires_at is None else max(0, int(math.ceil(expires_at - time.time())))
+    
+    # ==================== Strings ====================
+    
+    def get(self, name: str):
+        with self.store.lock:
+            return self.output(self._get_string(name))
+    
+    def mget(self, keys, *args) -> list:
+        names = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        names.extend(args)
+        with self.store.lock:
+            return [self.output(self._get_string(name)) for name in names]
+    
+    def set(self, name: str, value, ex=None, px=None, nx: bool = False, xx: bool = False,
+            keepttl: bool = False) -> Optional[bool]:
+        with self.store.lock:
+            exists = self.store.lookup(name) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+            expires_at = self.store.expires.get(name) if keepttl else None
+            if ex is not None:
+                expires_at = time.time() + _seconds(ex)
+            elif px is not None:
+                expires_at = time.time() + _seconds(px) / 1000
+            
+            self.store.data[name] = _stored(value)
+            if expires_at is None:
+                self.store.expires.pop(name, None)
+            else:
+                self.store.expires[name] = expires_at
+            self.store.touched(name)
+            return True
+    
+    def setex(self, name: str, time_seconds, value) -> bool:
+        return self.set(name, value, ex=time_seconds)
+    
+    # ==================== Hashes ====================
+    
+    def hget(self, name: str, key: str):
+        with self.store.lock:
+            value = self._get_typed(name, _Hash)
+            return self.output(value.get(_member(key))) if value else None
+    
+    def hgetall(self, name: str) -> dict:
+        with self.store.lock:
+            value = self._get_typed(name, _Hash) or {}
+            return {self.output(field): self.output(item) for field, item in value.items()}
+    
+    def hset(self, name: str, key: Optional[str] = None, value=None, mapping: Optional[dict] = None) -> int:
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        with self.store.lock:
+            value = self._get_typed(name, _Hash, create=True)
+            added = 0
+            for field, item in items.items():
+                field = _member(field)
+                added += field not in value
+                value[field] = _member(item)
+            self.store.touched(name)
+            return added
+    
+    def hdel(self, name: str, *keys) -> int:
+        with self.store.lock:
+            value = self._get_typed(name, _Hash)
+            if not value:
+                return 0
+            removed = 0
+            for field in keys:
+                removed += value.pop(_member(field), None) is not None
+            self.store.touched(name)
+            return removed
+    
+    def hincrby(self, name: str, key: str, amount: int = 1) -> int:
+        with self.store.lock:
+            value = self._get_typed(name, _Hash, create=True)
+            field = _member(key)
+            result = int(value.get(field, 0)) + int(amount)
+            value[field] = str(result)
+            self.store.touched(name)
+            return result
+    
+    def hincrbyfloat(self, name: str, key: str, amount: float = 1.0) -> float:
+        with self.store.lock:
+            value = self._get_typed(name, _Hash, create=True)
+            field = _member(key)
+            result = float(value.get(field, 0)) + float(amount)
+            value[field] = repr(result)
+            self.store.touched(name)
+            return result
+    
+    # ==================== Lists ====================
+    
+    def rpush(self, name: str, *values) -> int:
+        with self.store.lock:
+            value = self._get_typed(name, deque, create=True)
+            value.extend(_member(item) for item in values)
+            self.store.touched(name)
+            self.store.changed.notify_all()
+            return len(value)
+    
+    def lpush(self, name: str, *values) -> int:
+        with self.store.lock:
+            value = self._get_typed(name, deque, create=True)
+            value.extendleft(_member(item) for item in values)
+            self.store.touched(name)
+            self.store.changed.notify_all()
+            return len(value)
+    
+    def lpop(self, name: str):
+        with self.store.lock:
+            value = self._get_typed(name, deque)
+            if not value:
+                return None
+            item = value.popleft()
+            self.store.touched(name)
+            return self.output(item)
+    
+    def llen(self, name: str) -> int:
+        with self.store.lock:
+            return len(self._get_typed(name, deque) or ())
+    
+    def lindex(self, name: str, index: int):
+        with self.store.lock:
+            value = self._get_typed(name, deque) or ()
+            index = int(index)
+            if not -len(value) <= index < len(value):
+                return None
+            return self.output(value[index])
+    
+    def lrange(self, name: str, start: int, end: int) -> list:
+        with self.store.lock:
+            value = self._get_typed(name, deque) or ()
+            return [self.output(item) for item in _slice(list(value), int(start), int(end))]
+    
+    def lrem(self, name: str, count: int, value) -> int:
+        with self.store.lock:
+            items = self._get_typed(name, deque)
+            if not items:
+                return 0
+            target, count = _member(value), int(count)
+            ordered = list(items) if count >= 0 else list(reversed(items))
+            kept, removed = [], 0
+            for item in ordered:
+                if item == target and (count == 0 or removed < abs(count)):
+                    removed += 1
+                else:
+                    kept.append(item)
+            items.clear()
+            items.extend(kept if count >= 0 else reversed(kept))
+            self.store.touched(name)
+            return removed
+    
+    def blpop(self, keys, timeout: float = 0) -> Optional[Tuple[Any, Any]]:
+        """BLPOP - המתנה (עד timeout, 0 = ללא הגבלה) לפריט ברשימה הראשונה שאינה ריקה"""
+        names = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        deadline = time.time() + timeout if timeout else None
+        with self.store.lock:
+            while True:
+                for name in names:
+                    item = self.lpop(name)
+                    if item is not None:
+                        return self.output(name), item
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.store.changed.wait(remaining)
+    
+    # ==================== Sets ====================
+    
+    def sadd(self, name: str, *values) -> int:
+        with self.store.lock:
+            value = self._get_typed(name, set, create=True)
+            before = len(value)
+            value.update(_member(item) for item in values)
+            self.store.touched(name)
+            return len(value) - before
+    
+    def srem(self, name: str, *values) -> int:
+        with self.store.lock:
+            value = self._get_typed(name, set)
+            if not value:
+                return 0
+            removed = sum(1 for item in {_member(item) for item in values} if item in value)
+            value.difference_update(_member(item) for item in values)
+            self.store.touched(name)
+            return removed
+    
+    def smembers(self, name: str) -> set:
+        with self.store.lock:
+            return {self.output(item) for item in self._get_typed(name, set) or ()}
+    
+    # ==================== Sorted sets ====================
+    
+    def zadd(self, name: str, mapping: Dict[Any, float]) -> int:
+        with self.store.lock:
+            value = self._get_typed(name, _ZSet, create=True)
+            added = 0
+            for member, score in mapping.items():
+                member = _member(member)
+                added += member not in value
+                value[member] = float(score)
+            self.store.touched(name)
+            return added
+    
+    def zrem(self, name: str, *values) -> int:
+        with self.store.lock:
+            value = self._get_typed(name, _ZSet)
+            if not value:
+                return 0
+            removed = sum(1 for member in values if value.pop(_member(member), None) is not None)
+            self.store.touched(name)
+            return removed
+    
+    def zscore(self, name: str, value) -> Optional[float]:
+        with self.store.lock:
+            members = self._get_typed(name, _ZSet)
+            return members.get(_member(value)) if members else None
+    
+    def zcard(self, name: str) -> int:
+        with self.store.lock:
+            return len(self._get_typed(name, _ZSet) or ())
+    
+    def zrank(self, name: str, value) -> Optional[int]:
+        with self.store.lock:
+            members = self._get_typed(name, _ZSet)
+            member = _member(value)
+            if not members or member not in members:
+                return None
+            return [item for item, _ in members.ordered()].index(member)
+    
+    def _range_reply(self, items: List[Tuple[str, float]], withscores: bool) -> list:
+        if withscores:
+            return [(self.output(member), score) for member, score in items]
+        return [self.output(member) for member, _ in items]
+    
+    def zrange(self, name: str, start: int, end: int, withscores: bool = False) -> list:
+        with self.store.lock:
+            members = self._get_typed(name, _ZSet)
+            items = _slice(members.ordered(), int(start), int(end)) if members else []
+            return self._range_reply(items, withscores)
+    
+    def zrangebyscore(self, name: str, min, max, start: Optional[int] = None, num: Optional[int] = None,
+                      withscores: bool = False) -> list:
+        with self.store.lock:
+            members = self._get_typed(name, _ZSet)
+            low, high = _score(min), _score(max)
+            items = [item for item in (members.ordered() if members else []) if low <= item[1] <= high]
+            if start is not None and num is not None:
+                items = items[int(start):] if int(num) < 0 else items[int(start):int(start) + int(num)]
+            return self._range_reply(items, withscores)
+    
+    def zremrangebyscore(self, name: str, min, max) -> int:
+        with self.store.lock:
+            members = self._get_typed(name, _ZSet)
+            if not members:
+                return 0
+            low, high = _score(min), _score(max)
+            doomed = [member for member, score in members.items() if low <= score <= high]
+            for member in doomed:
+                del members[member]
+            self.store.touched(name)
+            return len(doomed)
+    
+    def zpopmin(self, name: str, count: int = 1) -> List[Tuple[Any, float]]:
+        with self.store.lock:
+            members = self._get_typed(name, _ZSet)
+            if not members:
+                return []
+            items = members.ordered()[:count]
+            for member, _ in items:
+                del members[member]
+            self.store.touched(name)
+            return self._range_reply(items, withscores=True)
+    
+    # ==================== Pub/Sub ====================
+    
+    def publish(self, channel: str, message) -> int:
+        with self.store.lock:
+            subscribers = list(self.store.channels.get(_member(channel), ()))
+        for subscriber in subscribers:
+            subscriber.deliver(_member(channel), _stored(message))
+        return len(subscribers)
+
+
+class _AsyncPool:
+    """תחליף ל-connection_pool של client אסינכרוני (אין חיבורים לסגור)"""
+    
+    async def disconnect(self, inuse_connections: bool = True):
+        pass
+
+
+class AsyncEmbeddedRedis:
+    """
+    client ל-asyncio מעל ה-store המקומי - כל פקודה רצה ב-thread (BLPOP חוסם)
+    """
+    
+    def __init__(self, client: EmbeddedRedis):
+        self._client = client
+        self.connection_pool = _AsyncPool()
+    
+    def __getattr__(self, name: str):
+        command = getattr(self._client, name)
+        
+        async def run(*args, **kwargs):
+            return await asyncio.to_thread(command, *args, **kwargs)
+        return run
+    
+    async def close(self):
+        pass
+
+
+# ==================== Scripts ====================
+# המימושים ב-Python של סקריפטי ה-Lua (אותם KEYS / ARGV ואותה תשובה), לפי טקסט הסקריפט
+
+def _sliding_window(r: EmbeddedRedis, keys: List[str], args: List[str]) -> list:
+    now, cost = float(args[0]), float(args[1])
+    member = f"{args[2]}:{args[1]}"
+    allowed = 1
+    result = []
+    for i, key in enumerate(keys):
+        window, limit = float(args[3 + i * 2]), float(args[4 + i * 2])
+        r.zremrangebyscore(key, "-inf", now - window)
+        entries = r.zrange(key, 0, -1, withscores=True)
+        costs = [float(entry.rsplit(":", 1)[1]) for entry, _ in entries]
+        used = sum(costs)
+        need = used + cost - limit
+        reset_at = now
+        if need > 0:
+            allowed = 0
+            freed = 0.0
+            for (_, score), entry_cost in zip(entries, costs):
+                freed += entry_cost
+                reset_at = score + window
+                if freed >= need:
+                    break
+        result.extend([_lua_number(used), _lua_number(reset_at - now)])
+    if allowed == 1:
+        for i, key in enumerate(keys):
+            r.zadd(key, {member: now})
+            r.expire(key, math.ceil(float(args[3 + i * 2])))
+    return [allowed] + result
+
+
+def _adjust(r: EmbeddedRedis, keys: List[str], args: List[str]) -> int:
+    old_member = f"{args[0]}:{args[1]}"
+    new_cost = float(args[2])
+    adjusted = 0
+    for key in keys:
+        score = r.zscore(key, old_member)
+        if score is not None:
+            r.zrem(key, old_member)
+            if new_cost > 0:
+                r.zadd(key, {f"{args[0]}:{args[2]}": score})
+            adjusted += 1
+    return adjusted
+
+
+def _enqueue(r: EmbeddedRedis, keys: List[str], args: List[str]) -> int:
+    job_id, owner = args[0], args[3]
+    limit = float(args[5])
+    if limit > 0 and r.zscore(keys[1], job_id) is None and r.zcard(keys[1]) >= limit:
+        return 0
+    r.zadd(keys[2], {job_id: float(args[1])})
+    r.zadd(keys[1], {job_id: float(args[2])})
+    if float(args[4]) > 0:
+        r.zadd(keys[4], {job_id: float(args[4])})
+    if r.zcard(keys[2]) == 1:
+        r.rpush(keys[0], owner)
+    r.rpush(keys[3], job_id)
+    return 1
+
+
+def _pop(r: EmbeddedRedis, keys: List[str], args: List[str]) -> list:
+    now, budget = float(args[0]), float(args[1])
+    expired: List[str] = []
+    for i, owner in enumerate(args[2:]):
+        if r.lindex(keys[0], 0) != owner:
+            return ["", "", "1"] + expired
+        r.lpop(keys[0])
+        user_queue = keys[3 + i]
+        while True:
+            popped = r.zpopmin(user_queue)
+            if not popped:
+                break
+            job_id = popped[0][0]
+            r.zrem(keys[1], job_id)
+            expires_at = r.zscore(keys[2], job_id)
+            r.zrem(keys[2], job_id)
+            alive = expires_at is None or expires_at > now
+            if alive or len(expired) >= budget - 1:
+                if r.zcard(user_queue) > 0:
+                    r.rpush(keys[0], owner)
+                if alive:
+                    return [owner, job_id, "0"] + expired
+                expired.append(job_id)
+                return ["", "", "0"] + expired
+            expired.append(job_id)
+    return ["", "", "1"] + expired
+
+
+def _remove(r: EmbeddedRedis, keys: List[str], args: List[str]) -> int:
+    job_id, owner = args[0], args[1]
+    removed = r.zrem(keys[2], job_id)
+    r.zrem(keys[1], job_id)
+    r.zrem(keys[3], job_id)
+    r.zrem(keys[4], job_id)
+    if removed == 1 and r.zcard(keys[2]) == 0:
+        r.lrem(keys[0], 0, owner)
+    return removed
+
+
+def _claim_due(r: EmbeddedRedis, keys: List[str], args: List[str]) -> list:
+    due = r.zrangebyscore(keys[0], "-inf", args[0], start=0, num=int(float(args[1])))
+    for job_id in due:
+        r.zrem(keys[0], job_id)
+    return due
+
+
+SCRIPTS: Dict[str, Callable] = {
+    SLIDING_WINDOW_SCRIPT: _sliding_window,
+    ADJUST_SCRIPT: _adjust,
+    ENQUEUE_SCRIPT: _enqueue,
+    POP_SCRIPT: _pop,
+    REMOVE_SCRIPT: _remove,
+    CLAIM_DUE_SCRIPT: _claim_due,
+}
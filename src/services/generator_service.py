@@ -2,15 +2,39 @@
 Generator Service
 יצירת שאלות באמצעות Google Gemini
 """
+import asyncio
 import json
 import random
+import threading
 import time
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Callable
+from dataclasses import dataclass, field
+from concurrent.futures import Executor
 import google.generativeai as genai
 
 from config import config
 from utils.logger import logger
+from services.token_budget import token_budget
+
+
+class GenerationAborted(Exception):
+    """היצירה נעצרה בנקודה בטוחה - ה-job לא נכשל בגלל תוכן"""
+
+
+class JobCancelledError(GenerationAborted):
+    """ה-job בוטל - היצירה נעצרת בנקודה הבטוחה הבאה"""
+
+
+class DeadlineExceededError(GenerationAborted):
+    """לא נשאר מספיק זמן עד ה-deadline של ה-job לניסיון נוסף"""
+
+
+class RetryLaterError(GenerationAborted):
+    """rate limit - ה-job צריך לחזור לתור בעוד delay שניות במקום לחכות ב-worker"""
+    
+    def __init__(self, delay: float):
+        super().__init__(f"retry in {delay:.0f}s")
+        self.delay = delay
 
 
 @dataclass
@@ -24,38 +48,127 @@ class Question:
     explanation: str
 
 
+@dataclass
+class GenerationContext:
+    """מצב ריצה של job אחד - ביטול, deadline ותוצאות חלקיות של קבצים שכבר הושלמו"""
+    deadline: Optional[float] = None  # epoch seconds
+    cancel_check: Optional[Callable[[], bool]] = None
+    defer_rate_limits: bool = False  # 429 -> RetryLaterError במקום sleep ב-worker
+    completed_files: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)  # אינדקס קובץ -> שאלות
+    on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None  # (event, data) - אירועי התקדמות
+    usage: Dict[str, int] = field(default_factory=lambda: {"input_tokens": 0, "output_tokens": 0, "calls": 0})  # tokens שנצרכו
+    owner: Optional[str] = None  # המשתמש - לחשבון ה-tokens
+    model: Optional[str] = None  # המודל של ה-job (None = לפי מצב התקציב)
+    
+    def remaining(self) -> Optional[float]:
+        """שניות עד ה-deadline (None אם אין deadline)"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+    
+    def has_time_for(self, seconds: float) -> bool:
+        """האם ניסיון שמתחיל בעוד seconds שניות עוד יכול להסתיים לפני ה-deadline"""
+        remaining = self.remaining()
+        return remaining is None or remaining - seconds >= config.GEMINI_MIN_ATTEMPT_SECONDS
+    
+    def checkpoint(self):
+        """נקודה בטוחה - עצירה אם ה-job בוטל או שאין זמן לניסיון נוסף"""
+        if self.cancel_check and self.cancel_check():
+            raise JobCancelledError()
+        if not self.has_time_for(0):
+            raise DeadlineExceededError()
+    
+    def report(self, event: str, **data):
+        """
+        דיווח אירוע התקדמות (plan / file_started / file_done / file_failed / retry)
+        שגיאה ב-callback לא עוצרת את היצירה
+        """
+        if not self.on_progress:
+            return
+        try:
+            self.on_progress(event, data)
+        except Exception as e:
+            logger.debug(f"Progress callback failed for {event}: {e}")
+    
+    def record_usage(self, input_tokens: int, output_tokens: int):
+        """צבירת ה-tokens של קריאה אחת למודל"""
+        self.usage["input_tokens"] += input_tokens
+        self.usage["output_tokens"] += output_tokens
+        self.usage["calls"] += 1
+    
+    def request_timeout(self) -> float:
+        """timeout לקריאה בודדת ל-API - לא יותר ממה שנשאר עד ה-deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return config.GEMINI_REQUEST_TIMEOUT
+        return max(1.0, min(config.GEMINI_REQUEST_TIMEOUT, remaining))
+
+
 class GeneratorService:
     """Service for generating MCQ questions using Gemini"""
     
+    # חיתוך טקסט ארוך מדי (Gemini context limit)
+    PROMPT_MAX_CHARS = 40000
+    
     def __init__(self):
         """Initialize Gemini API"""
         try:
             genai.configure(api_key=config.GEMINI_API_KEY)
             self.model = genai.GenerativeModel(config.GEMINI_MODEL)
+            self._models = {config.GEMINI_MODEL: self.model}  # מודלים לפי שם (המודל הזול נוצר בשימוש הראשון)
+            self._models_lock = threading.Lock()
             self.last_request_time = 0  # Track last request time for rate limiting
+            self._rate_lock = threading.Lock()  # משותף לכל ה-workers בתהליך (threads ו-asyncio)
             logger.info(f"Using Google Gemini ({config.GEMINI_MODEL})")
         except Exception as e:
             logger.error(f"Failed to initialize Gemini: {e}")
             raise
     
-    def _ensure_rate_limit(self, min_interval: float = 1.0):
+    def _reserve_request_slot(self, min_interval: Optional[float] = None) -> float:
+        """
+        שריון זמן שליחה לבקשה הבאה ל-API
+        
+        Args:
+            min_interval: מרווח מינימלי בשניות בין בקשות (ברירת מחדל מה-config)
+        
+        Returns:
+            זמן המתנה בשניות עד שמותר לשלוח את הבקשה
+        """
+        if min_interval is None:
+            min_interval = config.GEMINI_MIN_INTERVAL
+        
+        with self._rate_lock:
+            current_time = time.time()
+            send_time = max(current_time, self.last_request_time + min_interval)
+            self.last_request_time = send_time
+            return send_time - current_time
+    
+    def _ensure_rate_limit(self, min_interval: Optional[float] = None, ctx: Optional[GenerationContext] = None):
         """
         מבטיח מרווח זמן מינימלי בין בקשות לAPI
         
         Args:
             min_interval: מרווח מינימלי בשניות בין בקשות
+            ctx: הקשר ה-job (אופציונלי) - לא ממתינים אם אחרי ההמתנה כבר אין זמן
         """
-        current_time = time.time()
-        elapsed = current_time - self.last_request_time
-        
-        if elapsed < min_interval:
-            wait_time = min_interval - elapsed
+        wait_time = self._reserve_request_slot(min_interval)
+        if ctx and not ctx.has_time_for(wait_time):
+            raise DeadlineExceededError()
+        if wait_time > 0:
             logger.debug(f"Rate limiting: waiting {wait_time:.2f} seconds")
             time.sleep(wait_time)
-        
-        self.last_request_time = time.time()
     
-    def generate_questions(self, text: str, count: int, file_info: Optional[Dict[str, Any]] = None) -> Optional[List[Question]]:
+    async def _ensure_rate_limit_async(self, min_interval: Optional[float] = None, ctx: Optional[GenerationContext] = None):
+        """גרסת asyncio של _ensure_rate_limit - ממתינה בלי לחסום את ה-event loop"""
+        wait_time = self._reserve_request_slot(min_interval)
+        if ctx and not ctx.has_time_for(wait_time):
+            raise DeadlineExceededError()
+        if wait_time > 0:
+            logger.debug(f"Rate limiting: waiting {wait_time:.2f} seconds")
+            await asyncio.sleep(wait_time)
+    
+    def generate_questions(self, text: str, count: int, file_info: Optional[Dict[str, Any]] = None,
+                           ctx: Optional[GenerationContext] = None) -> Optional[List[Question]]:
         """
         יצירת שאלות אמריקאיות מטקסט
         
@@ -63,51 +176,165 @@ class GeneratorService:
             text: הטקסט המקור (יכול להיות טקסט מאוחד ממספר קבצים)
             count: מספר שאלות רצוי
             file_info: מידע על הקבצים (אופציונלי) - עבור מספר קבצים
+            ctx: הקשר ה-job - ביטול, deadline ו-requeue (אופציונלי)
         
         Returns:
             רשימת Question objects או None במקרה של כשל
+        
+        Raises:
+            GenerationAborted: ביטול, deadline, או rate limit שדורש חזרה לתור
         """
         # אם יש מספר קבצים, נקצה שאלות באופן יחסי
         if file_info and "files" in file_info and len(file_info["files"]) > 1:
-            return self._generate_questions_multi_file(file_info["files"], count)
+            return self._generate_questions_multi_file(file_info["files"], count, ctx)
         
         # אחרת, יצירה רגילה מטקסט מאוחד
-        return self._generate_questions_single(text, count)
+        filename = self._single_filename(file_info)
+        started = self._report_single_start(ctx, filename, count)
+        questions = self._generate_questions_single(text, count, ctx=ctx)
+        self._report_file_result(ctx, 0, filename, questions, started)
+        return questions
     
-    def generate_questions_for_interactive(self, text: str = None, count: int = 10, files: List[Dict[str, Any]] = None) -> Optional[List[Question]]:
+    async def generate_questions_async(self, text: str, count: int, file_info: Optional[Dict[str, Any]] = None,
+                                       executor: Optional[Executor] = None,
+                                       ctx: Optional[GenerationContext] = None) -> Optional[List[Question]]:
         """
-        יצירת שאלות למבחן אינטראקטיבי
+        גרסת asyncio של generate_questions - עבור ה-worker האסינכרוני
         
         Args:
-            text: טקסט בודד (אופציונלי)
-            count: מספר שאלות
-            files: רשימת קבצים (אופציונלי)
+            text: הטקסט המקור
+            count: מספר שאלות רצוי
+            file_info: מידע על הקבצים (אופציונלי)
+            executor: executor לשלבים עתירי CPU (parsing)
+            ctx: הקשר ה-job - ביטול, deadline ו-requeue (אופציונלי)
         
         Returns:
-            רשימת Question objects או None
+            רשימת Question objects או None במקרה של כשל
+        
+        Raises:
+            GenerationAborted: ביטול, deadline, או rate limit שדורש חזרה לתור
         """
-        try:
-            if files and len(files) > 1:
-                # מספר קבצים
-                return self._generate_questions_multi_file(files, count)
-            elif text:
-                # טקסט בודד
-                return self._generate_questions_single(text, count)
+        if file_info and "files" in file_info and len(file_info["files"]) > 1:
+            return await self._generate_questions_multi_file_async(file_info["files"], count, executor, ctx)
+        
+        filename = self._single_filename(file_info)
+        started = self._report_single_start(ctx, filename, count)
+        questions = await self._generate_questions_single_async(text, count, executor=executor, ctx=ctx)
+        self._report_file_result(ctx, 0, filename, questions, started)
+        return questions
+    
+    @staticmethod
+    def _single_filename(file_info: Optional[Dict[str, Any]]) -> Optional[str]:
+        """שם הקובץ של job עם קובץ בודד (לדיווח התקדמות)"""
+        files = (file_info or {}).get("files") or []
+        return files[0].get("filename") if files else None
+    
+    @staticmethod
+    def _report_single_start(ctx: Optional[GenerationContext], filename: Optional[str], count: int) -> float:
+        """דיווח plan ו-file_started ל-job עם טקסט בודד"""
+        if ctx:
+            ctx.report("plan", files_total=1, questions_target=count)
+            ctx.report("file_started", index=0, filename=filename, count=count)
+        return time.time()
+    
+    @staticmethod
+    def _report_file_result(ctx: Optional[GenerationContext], index: int, filename: Optional[str],
+                            questions: Optional[List[Question]], started: float):
+        """
+        דיווח סיום קובץ - file_done עם מספר השאלות והזמן, או file_failed
+        
+        Args:
+            ctx: הקשר ה-job (אופציונלי)
+            index: אינדקס הקובץ
+            filename: שם הקובץ
+            questions: השאלות שהתקבלו (None בכשל)
+            started: זמן ההתחלה (epoch seconds)
+        """
+        if not ctx:
+            return
+        seconds = round(time.time() - started, 1)
+        if questions:
+            ctx.report("file_done", index=index, filename=filename, questions=len(questions), seconds=seconds)
+        else:
+            ctx.report("file_failed", index=index, filename=filename, seconds=seconds)
+    
+    def _allocate_questions_per_file(self, files: List[Dict[str, Any]], total_count: int) -> List[Dict[str, Any]]:
+        """
+        חלוקת השאלות בין הקבצים באופן יחסי למספר המילים בכל קובץ
+        
+        Args:
+            files: רשימת קבצים עם text, word_count, filename
+            total_count: סה"כ שאלות רצויות
+        
+        Returns:
+            רשימה של {"file", "count", "percentage"}
+        """
+        # חישוב סה"כ מילים
+        total_words = sum(f["word_count"] for f in files)
+        
+        # חישוב כמות שאלות לכל קובץ באופן יחסי
+        questions_per_file = []
+        remaining_questions = total_count
+        
+        for i, file in enumerate(files):
+            if i == len(files) - 1:
+                # הקובץ האחרון מקבל את השאר (לפחות 1)
+                file_questions = max(1, remaining_questions)
             else:
-                logger.error("No text or files provided for interactive quiz")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error generating questions for interactive quiz: {e}")
+                # חישוב יחסי
+                ratio = file["word_count"] / total_words
+                file_questions = max(1, round(total_count * ratio))  # לפחות שאלה אחת
+                remaining_questions -= file_questions
+            
+            # אם נגמרו השאלות, תן לפחות 1
+            if remaining_questions < 0:
+                remaining_questions = 0
+            
+            questions_per_file.append({
+                "file": file,
+                "count": file_questions,
+                "percentage": (file["word_count"] / total_words) * 100
+            })
+            
+            logger.info(f"  {file['filename']}: {file_questions} שאלות ({file['word_count']:,} מילים, {(file['word_count']/total_words)*100:.1f}%)")
+        
+        return questions_per_file
+    
+    def _merge_file_questions(self, all_questions: List[Question], num_files: int) -> Optional[List[Question]]:
+        """
+        איחוד השאלות מכל הקבצים - ערבוב ומספור מחדש
+        
+        Args:
+            all_questions: כל השאלות שנוצרו
+            num_files: מספר הקבצים (ללוג)
+        
+        Returns:
+            רשימת שאלות מאוחדת או None אם אין שאלות
+        """
+        if not all_questions:
+            logger.error("Failed to generate any questions from any file")
             return None
+        
+        # ערבוב סדר השאלות כך שלא יהיו מקובצות לפי קובץ
+        random.shuffle(all_questions)
+        
+        # עדכון IDs לפי סדר חדש
+        for idx, q in enumerate(all_questions):
+            q.id = f"q_{idx + 1}"
+        
+        logger.info(f"Successfully generated {len(all_questions)} questions from {num_files} files")
+        return all_questions
     
-    def _generate_questions_multi_file(self, files: List[Dict[str, Any]], total_count: int) -> Optional[List[Question]]:
+    def _generate_questions_multi_file(self, files: List[Dict[str, Any]], total_count: int,
+                                       ctx: Optional[GenerationContext] = None) -> Optional[List[Question]]:
         """
         יצירת שאלות ממספר קבצים באופן יחסי לגודל כל קובץ
+        קבצים שכבר הושלמו בריצה קודמת (ctx.completed_files) לא נשלחים שוב
         
         Args:
             files: רשימת קבצים עם text, word_count, filename
             total_count: סה"כ שאלות רצויות
+            ctx: הקשר ה-job (אופציונלי)
         
         Returns:
             רשימת Question objects מאוחדת או None
@@ -115,38 +342,17 @@ class GeneratorService:
         try:
             logger.info(f"Generating {total_count} questions from {len(files)} files proportionally")
             
-            # חישוב סה"כ מילים
-            total_words = sum(f["word_count"] for f in files)
-            
-            # חישוב כמות שאלות לכל קובץ באופן יחסי
-            questions_per_file = []
-            remaining_questions = total_count
-            
-            for i, file in enumerate(files):
-                if i == len(files) - 1:
-                    # הקובץ האחרון מקבל את השאר (לפחות 1)
-                    file_questions = max(1, remaining_questions)
-                else:
-                    # חישוב יחסי
-                    ratio = file["word_count"] / total_words
-                    file_questions = max(1, round(total_count * ratio))  # לפחות שאלה אחת
-                    remaining_questions -= file_questions
-                
-                # אם נגמרו השאלות, תן לפחות 1
-                if remaining_questions < 0:
-                    remaining_questions = 0
-                
-                questions_per_file.append({
-                    "file": file,
-                    "count": file_questions,
-                    "percentage": (file["word_count"] / total_words) * 100
-                })
-                
-                logger.info(f"  {file['filename']}: {file_questions} שאלות ({file['word_count']:,} מילים, {(file['word_count']/total_words)*100:.1f}%)")
+            questions_per_file = self._allocate_questions_per_file(files, total_count)
+            if ctx:
+                ctx.report(
+                    "plan",
+                    files_total=sum(1 for item in questions_per_file if item["count"] > 0),
+                    questions_target=total_count
+                )
             
             # יצירת שאלות מכל קובץ
             all_questions = []
-            for item in questions_per_file:
+            for index, item in enumerate(questions_per_file):
                 file = item["file"]
                 count = item["count"]
                 
@@ -155,40 +361,284 @@ class GeneratorService:
                     logger.info(f"Skipping '{file['filename']}' (0 questions allocated)")
                     continue
                 
+                # קובץ שהושלם לפני שה-job חזר לתור
+                done = ctx.completed_files.get(str(index)) if ctx else None
+                if done:
+                    all_questions.extend(Question(**q) for q in done)
+                    ctx.report("file_done", index=index, filename=file["filename"], questions=len(done), seconds=0, reused=True)
+                    logger.info(f"  ✓ Reusing {len(done)} questions from '{file['filename']}'")
+                    continue
+                
                 logger.info(f"Generating {count} questions from '{file['filename']}'...")
+                if ctx:
+                    ctx.report("file_started", index=index, filename=file["filename"], count=count)
+                started = time.time()
                 
                 # יצירת שאלות לקובץ זה
                 questions = self._generate_questions_single(
                     text=file["text"],
                     count=count,
-                    file_context=file["filename"]
+                    file_context=file["filename"],
+                    ctx=ctx
                 )
+                self._report_file_result(ctx, index, file["filename"], questions, started)
                 
                 if questions:
                     all_questions.extend(questions)
+                    if ctx:
+                        ctx.completed_files[str(index)] = [q.__dict__.copy() for q in questions]
                     logger.info(f"  ✓ Got {len(questions)} questions from '{file['filename']}'")
                 else:
                     logger.warning(f"  ✗ Failed to generate questions from '{file['filename']}'")
             
-            if not all_questions:
-                logger.error("Failed to generate any questions from any file")
-                return None
+            return self._merge_file_questions(all_questions, len(files))
+        
+        except GenerationAborted:
+            raise
+        except Exception as e:
+            logger.error(f"Multi-file question generation failed: {e}")
+            return None
+    
+    async def _generate_questions_multi_file_async(self, files: List[Dict[str, Any]], total_count: int,
+                                                   executor: Optional[Executor] = None,
+                                                   ctx: Optional[GenerationContext] = None) -> Optional[List[Question]]:
+        """
+        גרסת asyncio של _generate_questions_multi_file - כל הקבצים נשלחים במקביל
+        
+        Args:
+            files: רשימת קבצים עם text, word_count, filename
+            total_count: סה"כ שאלות רצויות
+            executor: executor לשלבים עתירי CPU
+            ctx: הקשר ה-job (אופציונלי)
+        
+        Returns:
+            רשימת Question objects מאוחדת או None
+        """
+        try:
+            logger.info(f"Generating {total_count} questions from {len(files)} files proportionally (async)")
+            
+            questions_per_file = self._allocate_questions_per_file(files, total_count)
+            if ctx:
+                ctx.report(
+                    "plan",
+                    files_total=sum(1 for item in questions_per_file if item["count"] > 0),
+                    questions_target=total_count
+                )
+            
+            all_questions = []
+            pending = []
+            for index, item in enumerate(questions_per_file):
+                if item["count"] == 0:
+                    continue
+                done = ctx.completed_files.get(str(index)) if ctx else None
+                if done:
+                    all_questions.extend(Question(**q) for q in done)
+                    ctx.report("file_done", index=index, filename=item["file"]["filename"], questions=len(done), seconds=0, reused=True)
+                    logger.info(f"  ✓ Reusing {len(done)} questions from '{item['file']['filename']}'")
+                else:
+                    pending.append((index, item))
             
-            # ערבוב סדר השאלות כך שלא יהיו מקובצות לפי קובץ
-            random.shuffle(all_questions)
+            async def generate_file(index: int, item: Dict[str, Any]) -> Optional[List[Question]]:
+                filename = item["file"]["filename"]
+                if ctx:
+                    ctx.report("file_started", index=index, filename=filename, count=item["count"])
+                started = time.time()
+                questions = await self._generate_questions_single_async(
+                    text=item["file"]["text"],
+                    count=item["count"],
+                    file_context=filename,
+                    executor=executor,
+                    ctx=ctx
+                )
+                self._report_file_result(ctx, index, filename, questions, started)
+                return questions
             
-            # עדכון IDs לפי סדר חדש
-            for idx, q in enumerate(all_questions):
-                q.id = f"q_{idx + 1}"
+            # כל הקבצים רצים עד הסוף גם אם אחד מהם נעצר, כדי לשמור את מה שהושלם
+            results = await asyncio.gather(*[
+                generate_file(index, item) for index, item in pending
+            ], return_exceptions=True)
             
-            logger.info(f"Successfully generated {len(all_questions)} questions from {len(files)} files")
-            return all_questions
+            aborted: List[GenerationAborted] = []
+            for (index, item), questions in zip(pending, results):
+                if isinstance(questions, GenerationAborted):
+                    aborted.append(questions)
+                elif isinstance(questions, BaseException):
+                    logger.warning(f"  ✗ Failed to generate questions from '{item['file']['filename']}': {questions}")
+                elif questions:
+                    all_questions.extend(questions)
+                    if ctx:
+                        ctx.completed_files[str(index)] = [q.__dict__.copy() for q in questions]
+                    logger.info(f"  ✓ Got {len(questions)} questions from '{item['file']['filename']}'")
+                else:
+                    logger.warning(f"  ✗ Failed to generate questions from '{item['file']['filename']}'")
             
+            if aborted:
+                # ביטול קודם ל-deadline, ו-deadline קודם ל-requeue
+                for error_type in (JobCancelledError, DeadlineExceededError):
+                    for error in aborted:
+                        if isinstance(error, error_type):
+                            raise error
+                raise RetryLaterError(max(error.delay for error in aborted))
+            
+            return self._merge_file_questions(all_questions, len(files))
+        
+        except GenerationAborted:
+            raise
         except Exception as e:
             logger.error(f"Multi-file question generation failed: {e}")
             return None
     
-    def _generate_questions_single(self, text: str, count: int, file_context: Optional[str] = None) -> Optional[List[Question]]:
+    def _generation_config(self) -> "genai.types.GenerationConfig":
+        """הגדרות יצירה ל-Gemini"""
+        return genai.types.GenerationConfig(
+            temperature=0.3,  # פחות randomness ליציבות רבה יותר
+            max_output_tokens=8192,  # הגדלנו משמעותית למניעת קיטוע
+            top_p=0.8,  # מגביל את הדגימה לטוקנים הסבירים יותר
+            top_k=40   # מגביל מספר הטוקנים שנבחרים
+        )
+    
+    def _questions_from_response(self, response_text: str, count: int, attempt: int, max_retries: int) -> Optional[List[Question]]:
+        """
+        Parsing, validation וערבוב של תשובת Gemini (שלב עתיר CPU)
+        
+        Args:
+            response_text: התשובה מ-Gemini
+            count: מספר שאלות רצוי
+            attempt: מספר הניסיון הנוכחי (0-based)
+            max_retries: מספר ניסיונות מקסימלי
+        
+        Returns:
+            רשימת שאלות תקינה או None אם צריך לנסות שוב / נכשל
+        """
+        questions = self._parse_response(response_text, count)
+        
+        if not questions:
+            if attempt < max_retries - 1:
+                logger.warning(f"Parse failed, retrying... ({attempt + 1}/{max_retries})")
+            else:
+                logger.error("Failed to parse Gemini response after all retries")
+            return None
+        
+        # Validation
+        if not self._validate_questions(questions, count):
+            if attempt < max_retries - 1:
+                logger.warning(f"Validation failed, retrying... ({attempt + 1}/{max_retries})")
+            else:
+                logger.error("Generated questions failed validation after all retries")
+            return None
+        
+        # ערבוב אפשרויות
+        questions = self._shuffle_options(questions)
+        
+        logger.info(f"Successfully generated {len(questions)} questions")
+        return questions
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        זמן המתנה לפני ניסיון חוזר אחרי שגיאה
+        
+        Args:
+            error: השגיאה שהתקבלה
+            attempt: מספר הניסיון שנכשל (0-based)
+        
+        Returns:
+            זמן המתנה בשניות
+        """
+        # בדיקה אם זה rate limit error
+        if self._is_rate_limit_error(error):
+            # Exponential backoff for rate limit errors
+            wait_time = (2 ** attempt) * 5  # 5, 10, 20 seconds
+            logger.warning(f"Rate limit hit (attempt {attempt + 1}), waiting {wait_time} seconds before retry...")
+            return wait_time
+        
+        logger.warning(f"Attempt {attempt + 1} failed: {error}, retrying...")
+        return 2  # קצר המתנה עבור שגיאות אחרות
+    
+    @staticmethod
+    def _is_rate_limit_error(error: Exception) -> bool:
+        """האם השגיאה היא rate limit (429)"""
+        return "429" in str(error) or "Resource exhausted" in str(error)
+    
+    def _retry_wait(self, error: Exception, attempt: int, ctx: Optional[GenerationContext]) -> float:
+        """
+        זמן המתנה לפני ניסיון חוזר בתוך ה-worker, בהתחשב ב-deadline
+        
+        Args:
+            error: השגיאה שהתקבלה
+            attempt: מספר הניסיון שנכשל (0-based)
+            ctx: הקשר ה-job (אופציונלי)
+        
+        Returns:
+            זמן המתנה בשניות
+        
+        Raises:
+            RetryLaterError: rate limit כש-ctx מבקש requeue במקום המתנה
+            DeadlineExceededError: אם אחרי ההמתנה לא יישאר זמן לניסיון
+        """
+        delay = self._retry_delay(error, attempt)
+        if ctx and ctx.defer_rate_limits and self._is_rate_limit_error(error):
+            raise RetryLaterError(delay)
+        if ctx and not ctx.has_time_for(delay):
+            raise DeadlineExceededError()
+        return delay
+    
+    def _retry_reason(self, error: Exception) -> str:
+        """סיבת ניסיון חוזר לדיווח התקדמות - rate_limit / timeout / error"""
+        if self._is_rate_limit_error(error):
+            return "rate_limit"
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "deadline" in str(error).lower() or "timed out" in str(error).lower():
+            return "timeout"
+        return "error"
+    
+    @staticmethod
+    def _report_retry(ctx: Optional[GenerationContext], reason: str, attempt: int,
+                      filename: Optional[str], wait: float = 0.0):
+        """דיווח אירוע retry (ניסיון נוסף של אותו קובץ)"""
+        if ctx:
+            ctx.report("retry", reason=reason, attempt=attempt + 2, filename=filename, wait_seconds=round(wait, 1))
+    
+    def _request_options(self, ctx: Optional[GenerationContext]) -> Dict[str, Any]:
+        """request options לקריאה ל-Gemini - timeout לפי ה-deadline"""
+        timeout = ctx.request_timeout() if ctx else config.GEMINI_REQUEST_TIMEOUT
+        return {"timeout": timeout}
+    
+    def _get_model(self, ctx: Optional[GenerationContext]) -> tuple:
+        """
+        המודל לקריאה - של ה-job, או לפי מצב התקציב היומי
+        
+        Returns:
+            (שם המודל, GenerativeModel)
+        """
+        name = (ctx.model if ctx else None) or token_budget.select_model()
+        with self._models_lock:
+            model = self._models.get(name)
+            if model is None:
+                model = genai.GenerativeModel(name)
+                self._models[name] = model
+        return name, model
+    
+    @staticmethod
+    def _record_usage(ctx: Optional[GenerationContext], model_name: str, prompt: str, response) -> None:
+        """
+        רישום צריכת ה-tokens של תשובה - ב-ctx של ה-job ובחשבון הגלובלי / של המשתמש.
+        לפי usage_metadata של Gemini, ואם אין (גרסת SDK ישנה) הערכה לפי אורך ה-prompt והתשובה
+        """
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        if not input_tokens:
+            input_tokens = int(len(prompt) / config.QUOTA_CHARS_PER_TOKEN)
+        if not output_tokens:
+            try:
+                output_tokens = int(len(response.text) / config.QUOTA_CHARS_PER_TOKEN)
+            except Exception:
+                output_tokens = 0
+        if ctx:
+            ctx.record_usage(input_tokens, output_tokens)
+        token_budget.record(model_name, input_tokens, output_tokens, owner=ctx.owner if ctx else None)
+    
+    def _generate_questions_single(self, text: str, count: int, file_context: Optional[str] = None,
+                                   ctx: Optional[GenerationContext] = None) -> Optional[List[Question]]:
         """
         יצירת שאלות מטקסט בודד
         
@@ -196,6 +646,7 @@ class GeneratorService:
             text: הטקסט המקור
             count: מספר שאלות רצוי
             file_context: שם הקובץ (אופציונלי)
+            ctx: הקשר ה-job - נבדק לפני כל ניסיון, וקובע את ה-timeout של הקריאה
         
         Returns:
             רשימת Question objects או None במקרה של כשל
@@ -203,6 +654,8 @@ class GeneratorService:
         max_retries = 3
         
         for attempt in range(max_retries):
+            if ctx:
+                ctx.checkpoint()
             try:
                 # בניית prompt
                 prompt = self._build_prompt(text, count, file_context)
@@ -210,56 +663,93 @@ class GeneratorService:
                 logger.info(f"Generating {count} questions with Gemini (attempt {attempt + 1}/{max_retries})...")
                 
                 # מניעת חריגה מגבולות rate limiting
-                self._ensure_rate_limit(2.0)  # 2 שניות בין בקשות
+                self._ensure_rate_limit(ctx=ctx)
                 
                 # קריאה ל-Gemini
-                response = self.model.generate_content(
+                model_name, model = self._get_model(ctx)
+                response = model.generate_content(
                     prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.3,  # פחות randomness ליציבות רבה יותר
-                        max_output_tokens=8192,  # הגדלנו משמעותית למניעת קיטוע
-                        top_p=0.8,  # מגביל את הדגימה לטוקנים הסבירים יותר
-                        top_k=40   # מגביל מספר הטוקנים שנבחרים
-                    )
+                    generation_config=self._generation_config(),
+                    request_options=self._request_options(ctx)
                 )
+                self._record_usage(ctx, model_name, prompt, response)
                 
-                # Parsing התשובה
-                questions = self._parse_response(response.text, count)
-                
-                if not questions:
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Parse failed, retrying... ({attempt + 1}/{max_retries})")
-                        continue
-                    logger.error("Failed to parse Gemini response after all retries")
-                    return None
+                questions = self._questions_from_response(response.text, count, attempt, max_retries)
+                if questions:
+                    return questions
+                if attempt < max_retries - 1:
+                    self._report_retry(ctx, "invalid_response", attempt, file_context)
+                    continue
+                return None
+            
+            except GenerationAborted:
+                raise
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    wait = self._retry_wait(e, attempt, ctx)
+                    self._report_retry(ctx, self._retry_reason(e), attempt, file_context, wait)
+                    time.sleep(wait)
+                    continue
+                logger.error(f"Question generation failed after all retries: {e}")
+                return None
+        
+        return None
+    
+    async def _generate_questions_single_async(self, text: str, count: int, file_context: Optional[str] = None,
+                                               executor: Optional[Executor] = None,
+                                               ctx: Optional[GenerationContext] = None) -> Optional[List[Question]]:
+        """
+        גרסת asyncio של _generate_questions_single
+        הקריאה ל-Gemini אסינכרונית, וה-parsing רץ ב-executor
+        
+        Args:
+            text: הטקסט המקור
+            count: מספר שאלות רצוי
+            file_context: שם הקובץ (אופציונלי)
+            executor: executor לשלבים עתירי CPU
+            ctx: הקשר ה-job - נבדק לפני כל ניסיון, וקובע את ה-timeout של הקריאה
+        
+        Returns:
+            רשימת Question objects או None במקרה של כשל
+        """
+        max_retries = 3
+        loop = asyncio.get_running_loop()
+        
+        for attempt in range(max_retries):
+            if ctx:
+                ctx.checkpoint()
+            try:
+                prompt = self._build_prompt(text, count, file_context)
                 
-                # Validation
-                if not self._validate_questions(questions, count):
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Validation failed, retrying... ({attempt + 1}/{max_retries})")
-                        continue
-                    logger.error("Generated questions failed validation after all retries")
-                    return None
+                logger.info(f"Generating {count} questions with Gemini (async, attempt {attempt + 1}/{max_retries})...")
                 
-                # ערבוב אפשרויות
-                questions = self._shuffle_options(questions)
+                await self._ensure_rate_limit_async(ctx=ctx)
                 
-                logger.info(f"Successfully generated {len(questions)} questions")
-                return questions
+                model_name, model = self._get_model(ctx)
+                response = await model.generate_content_async(
+                    prompt,
+                    generation_config=self._generation_config(),
+                    request_options=self._request_options(ctx)
+                )
+                self._record_usage(ctx, model_name, prompt, response)
                 
+                questions = await loop.run_in_executor(
+                    executor, self._questions_from_response, response.text, count, attempt, max_retries
+                )
+                if questions:
+                    return questions
+                if attempt < max_retries - 1:
+                    self._report_retry(ctx, "invalid_response", attempt, file_context)
+                    continue
+                return None
+            
+            except GenerationAborted:
+                raise
             except Exception as e:
-                # בדיקה אם זה rate limit error
-                if "429" in str(e) or "Resource exhausted" in str(e):
-                    # Exponential backoff for rate limit errors
-                    if attempt < max_retries - 1:
-                        wait_time = (2 ** attempt) * 5  # 5, 10, 20 seconds
-                        logger.warning(f"Rate limit hit (attempt {attempt + 1}), waiting {wait_time} seconds before retry...")
-                        time.sleep(wait_time)
-                        continue
-                
                 if attempt < max_retries - 1:
-                    logger.warning(f"Attempt {attempt + 1} failed: {e}, retrying...")
-                    time.sleep(2)  # קצר המתנה עבור שגיאות אחרות
+                    wait = self._retry_wait(e, attempt, ctx)
+                    self._report_retry(ctx, self._retry_reason(e), attempt, file_context, wait)
+                    await asyncio.sleep(wait)
                     continue
                 logger.error(f"Question generation failed after all retries: {e}")
                 return None
@@ -278,8 +768,7 @@ class GeneratorService:
         Returns:
             Prompt string
         """
-        # חיתוך טקסט ארוך מדי (Gemini context limit)
-        max_chars = 40000
+        max_chars = self.PROMPT_MAX_CHARS
         if len(text) > max_chars:
             text = text[:max_chars] + "..."
             logger.warning(f"Text truncated to {max_chars} characters")
@@ -482,7 +971,7 @@ class GeneratorService:
             
             logger.info(f"Successfully parsed {len(questions)} valid questions out of {len(data.get('questions', []))} total")
             return questions
-            
+        
         except json.JSONDecodeError as e:
             logger.error(f"JSON parsing failed after all attempts: {e}")
             logger.error(f"Error location: line {e.lineno if hasattr(e, 'lineno') else 'unknown'}, column {e.colno if hasattr(e, 'colno') else 'unknown'}")
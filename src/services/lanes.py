@@ -0,0 +1,176 @@
+"""
+Queue Lanes
+חלוקת התור למסלולים (lanes) עם קיבולת שמורה לכל מסלול
+"""
+import threading
+from typing import Dict, List, Optional
+
+from config import config
+
+
+def select_lane(job_type: str, question_count: int, word_count: int) -> str:
+    """
+    בחירת מסלול ל-job חדש
+    
+    Args:
+        job_type: סוג ה-job (html / interactive)
+        question_count: מספר שאלות
+        word_count: מספר מילים בטקסט
+    
+    Returns:
+        שם המסלול
+    """
+    if job_type == "interactive":
+        return config.LATENCY_LANE
+    
+    if job_type == "speculative":
+        return config.SPECULATIVE_LANE
+    
+    if question_count <= config.LANE_SMALL_MAX_QUESTIONS and word_count <= config.LANE_SMALL_MAX_WORDS:
+        return config.LATENCY_LANE
+    
+    return config.THROUGHPUT_LANE
+
+
+class LaneCapacity:
+    """
+    ניהול slots בין המסלולים
+    
+    כל מסלול מקבל חלק שמור מהקיבולת לפי המשקל שלו. מסלול שהחלק שלו מלא יכול
+    לשאול slots פנויים של מסלולים אחרים, אבל מסלול ה-latency תמיד שומר
+    slot פנוי אחד (LANE_KEEP_IDLE) כדי ש-job קטן לא יחכה ל-job גדול.
+    
+    מסלול עם משקל 0 (למשל יצירה ספקולטיבית) לא מקבל קיבולת שמורה - הוא רץ רק
+    על slots פנויים, ותמיד משאיר לפחות slot פנוי אחד לעבודה אמיתית.
+    """
+    
+    def __init__(self, lanes: Dict[str, int], total: int):
+        """
+        Args:
+            lanes: שם מסלול -> משקל, לפי סדר עדיפות
+            total: קיבולת כוללת (workers או jobs במקביל)
+        """
+        self.lanes = list(lanes.keys())
+        self.weights = dict(lanes)
+        self.in_flight: Dict[str, int] = {lane: 0 for lane in self.lanes}
+        self.reserved: Dict[str, int] = {}
+        self.total = 0
+        self._lock = threading.Lock()
+        self.set_total(total)
+    
+    def set_total(self, total: int):
+        """
+        עדכון הקיבולת הכוללת (למשל אחרי autoscaling) וחישוב מחדש של החלקים השמורים
+        
+        Args:
+            total: קיבולת כוללת
+        """
+        with self._lock:
+            self.total = total
+            weight_sum = sum(self.weights.values()) or 1
+            weighted = [lane for lane in self.lanes if self.weights[lane] > 0]
+            
+            reserved = {}
+            for lane in self.lanes:
+                share = total * self.weights[lane] // weight_sum
+                # כל מסלול עם משקל מקבל לפחות slot אחד אם יש מספיק קיבולת
+                if self.weights[lane] > 0 and total >= len(weighted):
+                    share = max(1, share)
+                reserved[lane] = share
+            
+            # השארית הולכת למסלולים לפי סדר העדיפות
+            leftover = total - sum(reserved.values())
+            for lane in weighted:
+                if leftover <= 0:
+                    break
+                reserved[lane] += 1
+                leftover -= 1
+            
+            # אם חילקנו יותר מדי (total קטן), מורידים מהמסלולים האחרונים
+            for lane in reversed(self.lanes):
+                while leftover < 0 and reserved[lane] > 0:
+                    reserved[lane] -= 1
+                    leftover += 1
+            
+            self.reserved = reserved
+    
+    def _keep_idle(self, lane: str) -> int:
+        """כמה slots פנויים המסלול שומר לעצמו ולא משאיל"""
+        weighted = sum(1 for other in self.lanes if self.weights[other] > 0)
+        if lane != config.LATENCY_LANE or self.total <= weighted:
+            return 0
+        return config.LANE_KEEP_IDLE
+    
+    def pollable_lanes(self) -> List[str]:
+        """
+        המסלולים שמהם מותר למשוך job עכשיו, לפי סדר עדיפות
+        
+        Returns:
+            רשימת שמות מסלולים (ריקה אם אין slot פנוי)
+        """
+        with self._lock:
+            free_total = self.total - sum(self.in_flight.values())
+            if free_total <= 0:
+                return []
+            
+            result = []
+            for lane in self.lanes:
+                if self.in_flight[lane] < self.reserved[lane]:
+                    result.append(lane)
+                    continue
+                
+                # השאלה - רק מ-slots שהמסלולים האחרים לא שומרים לעצמם
+                kept = sum(
+                    min(self._keep_idle(other), max(0, self.reserved[other] - self.in_flight[other]))
+                    for other in self.lanes if other != lane
+                )
+                # מסלול בלי משקל משאיר תמיד slot פנוי אחד
+                if self.weights[lane] == 0:
+                    kept += 1
+                if free_total - kept > 0:
+                    result.append(lane)
+            
+            return result
+    
+    def acquire(self, lane: str):
+        """תפיסת slot עבור job מהמסלול"""
+        with self._lock:
+            self.in_flight[lane] += 1
+    
+    def release(self, lane: str):
+        """שחרור slot בסיום job"""
+        with self._lock:
+            self.in_flight[lane] = max(0, self.in_flight[lane] - 1)
+    
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """מצב נוכחי לכל מסלול - לניטור"""
+        with self._lock:
+            return {
+                lane: {"reserved": self.reserved[lane], "in_flight": self.in_flight[lane]}
+                for lane in self.lanes
+            }
+
+
+def parse_lanes(spec: str) -> Dict[str, int]:
+    """
+    פענוח הגדרת המסלולים מה-config
+    
+    Args:
+        spec: מחרוזת בפורמט "interactive:2,bulk:1"
+    
+    Returns:
+        שם מסלול -> משקל, לפי סדר ההגדרה
+    """
+    lanes = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition(":")
+        lanes[name.strip()] = int(weight) if weight else 1
+    return lanes
+
+
+def get_lane_names(spec: Optional[str] = None) -> List[str]:
+    """שמות כל המסלולים לפי סדר עדיפות"""
+    return list(parse_lanes(spec or config.QUEUE_LANES).keys())
@@ -0,0 +1,239 @@
+"""
+Local cache
+cache קטן בזיכרון התהליך לערכים קטנים ב-Redis, שנשאר קוהרנטי דרך client-side caching של Redis
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Callable, Iterable
+
+from utils.logger import logger
+from services.redis_factory import redis_factory
+
+# הערוץ שאליו Redis שולח הודעות invalidation (CLIENT TRACKING ... REDIRECT)
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+
+class InvalidatingCache:
+    """
+    LRU חסום בזיכרון התהליך עם invalidation מ-Redis
+    
+    thread רקע מחזיק שני חיבורים ייעודיים: אחד מנוי ל-__redis__:invalidate, והשני מפעיל
+    CLIENT TRACKING במצב BCAST לתחיליות של המפתחות עם הפניה למנוי. כל כתיבה, מחיקה
+    או תפוגה של מפתח עם התחילית - מכל תהליך - שולחת את שם המפתח והרשומה נזרקת.
+    TTL קצר הוא רשת ביטחון בלבד.
+    
+    כשהמנוי לא מחובר אין לנו דרך לדעת על שינויים, ולכן הקריאות עוברות ישר ל-Redis
+    בלי cache; בכל חיבור מחדש ה-cache מתרוקן.
+    """
+    
+    def __init__(self, prefixes: Iterable[str], max_entries: int, ttl: float, ping_interval: float = 5.0):
+        """
+        Args:
+            prefixes: תחיליות המפתחות שנשמרים ב-cache
+            max_entries: מספר רשומות מקסימלי (LRU)
+            ttl: זמן חיים מקסימלי של רשומה בשניות (גם בלי invalidation)
+            ping_interval: כל כמה שניות לוודא שחיבור ה-tracking עדיין חי
+        """
+        self.prefixes = tuple(prefixes)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ping_interval = ping_interval
+        
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (raw value, expires_at)
+        self._lock = threading.Lock()
+        self._epoch = 0  # עולה בכל invalidation - ערך שנקרא לפניה לא נשמר
+        self._active = False
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    @property
+    def active(self) -> bool:
+        """האם ה-cache פעיל (המנוי להודעות invalidation מחובר)"""
+        return self._active
+    
+    def _ensure_listener(self):
+        """הפעלת thread ה-invalidation בשימוש הראשון"""
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stopped = False
+                    self._thread = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+                    self._thread.start()
+    
+    # ==================== Reads / Writes ====================
+    
+    def _lookup(self, key: str, now: float) -> tuple:
+        """(found, raw value) - רשומה שפג תוקפה נזרקת"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[1] <= now:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[0]
+    
+    def _store(self, key: str, value: Optional[str], now: float):
+        self._entries[key] = (value, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def get_many(self, keys: List[str], loader: Callable[[List[str]], List[Optional[str]]]) -> List[Optional[str]]:
+        """
+        קריאת ערכים - מה שחסר ב-cache נטען בקריאה אחת ל-loader
+        
+        Args:
+            keys: מפתחות Redis
+            loader: פונקציה שמקבלת רשימת מפתחות ומחזירה את הערכים (כמו mget)
+        
+        Returns:
+            הערכים הגולמיים לפי הסדר (None למפתח שלא קיים)
+        """
+        self._ensure_listener()
+        if not self._active:
+            return loader(keys)
+        
+        now = time.time()
+        values: Dict[str, Optional[str]] = {}
+        with self._lock:
+            for key in keys:
+                found, value = self._lookup(key, now)
+                if found:
+                    values[key] = value
+            missing = [key for key in keys if key not in values]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            epoch = self._epoch
+        
+        if missing:
+            loaded = loader(missing)
+            with self._lock:
+                # invalidation שהגיעה בזמן הקריאה - הערך שנקרא אולי כבר ישן
+                store = self._active and self._epoch == epoch
+                for key, value in zip(missing, loaded):
+                    values[key] = value
+                    if store:
+                        self._store(key, value, now)
+        
+        return [values[key] for key in keys]
+    
+    def get(self, key: str, loader: Callable[[str], Optional[str]]) -> Optional[str]:
+        """
+        קריאת ערך אחד
+        
+        Args:
+            key: מפתח Redis
+            loader: פונקציה שמקבלת מפתח ומחזירה את הערך (כמו get)
+        
+        Returns:
+            הערך הגולמי או None
+        """
+        return self.get_many([key], lambda keys: [loader(keys[0])])[0]
+    
+    def invalidate(self, *keys: str):
+        """
+        זריקת רשומות - אחרי כתיבה מהתהליך הזה, בלי לחכות להודעה מ-Redis
+        (הערך החדש לא נשמר ישירות: כתיבה מתהליך אחר באותו רגע הייתה משאירה ערך ישן)
+        """
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+    
+    def clear(self):
+        """ריקון ה-cache"""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+    
+    # ==================== Invalidation listener ====================
+    
+    def _handle_message(self, message):
+        """הודעת pub/sub מהמנוי - רשימת מפתחות שהשתנו, או None אחרי FLUSHDB"""
+        if not isinstance(message, list) or len(message) < 3 or message[0] != "message":
+            return
+        keys = message[2]
+        self.invalidations += 1
+        if keys is None:
+            self.clear()
+        else:
+            self.invalidate(*keys)
+    
+    def _start_tracking(self, subscriber, tracker):
+        """
+        מנוי לערוץ ה-invalidation והפעלת ה-tracking עם הפניה אליו
+        
+        Args:
+            subscriber: החיבור שמקבל את ההודעות
+            tracker: החיבור שה-tracking קשור אליו
+        """
+        subscriber.connect()
+        subscriber.send_command("CLIENT", "ID")
+        subscriber_id = subscriber.read_response()
+        subscriber.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+        subscriber.read_response()
+        
+        args = ["CLIENT", "TRACKING", "ON", "REDIRECT", subscriber_id, "BCAST"]
+        for prefix in self.prefixes:
+            args.extend(["PREFIX", prefix])
+        tracker.connect()
+        tracker.send_command(*args)
+        tracker.read_response()
+    
+    def _listen(self):
+        """לולאת ה-thread: חיבור, קבלת invalidations, וחיבור מחדש עם backoff"""
+        backoff = 1.0
+        while not self._stopped:
+            subscriber = redis_factory.connection("blocking")
+            tracker = redis_factory.connection("blocking")
+            try:
+                self._start_tracking(subscriber, tracker)
+                self.clear()
+                self._active = True
+                backoff = 1.0
+                logger.info(f"Local cache active for {', '.join(self.prefixes)}")
+                
+                next_ping = time.time() + self.ping_interval
+                while not self._stopped:
+                    if subscriber.can_read(timeout=1.0):
+                        self._handle_message(subscriber.read_response())
+                    elif time.time() >= next_ping:
+                        # ה-tracking קשור לחיבור שהפעיל אותו - אם הוא נפל, הודעות כבר לא מגיעות
+                        tracker.send_command("PING")
+                        tracker.read_response()
+                        next_ping = time.time() + self.ping_interval
+            except Exception as e:
+                logger.warning(f"Local cache invalidation lost, bypassing cache: {e}")
+            finally:
+                self._active = False
+                self.clear()
+                for connection in (subscriber, tracker):
+                    try:
+                        connection.disconnect()
+                    except Exception:
+                        pass
+            
+            if not self._stopped:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+    
+    def stop(self):
+        """עצירת ה-listener (ה-cache עובר לקריאה ישירה)"""
+        self._stopped = True
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """מדדי ה-cache - לניטור"""
+        with self._lock:
+            return {
+                "active": self._active,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,200 @@
+"""
+Processing Pipeline
+שלבי העיבוד - חילוץ טקסט, יצירת שאלות ו-rendering - כל אחד עם תור ו-pool משלו
+"""
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Any, Optional
+
+from config import config
+from utils.logger import logger
+
+
+def _extract_in_worker(file_path: str, mime_type: str) -> Optional[Dict[str, Any]]:
+    """חילוץ טקסט בתהליך של שלב ה-extract (פונקציה ברמת המודול כדי שתעבור pickle)"""
+    from services.file_service import FileService
+    return FileService.extract_text(file_path, mime_type)
+
+
+class PipelineStage:
+    """
+    שלב בודד ב-pipeline - executor עם מדדי backlog
+    
+    pending כולל גם משימות שממתינות בתור של ה-executor וגם כאלה שרצות,
+    כך ש-backlog = pending - workers הוא מה שמחכה ל-worker פנוי.
+    """
+    
+    def __init__(self, name: str, workers: int, executor_factory: Callable[[], Executor]):
+        """
+        Args:
+            name: שם השלב
+            workers: מספר ה-workers (threads / processes)
+            executor_factory: יוצר את ה-executor בשימוש הראשון
+        """
+        self.name = name
+        self.workers = workers
+        self._executor_factory = executor_factory
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.pending = 0
+        self.durations = deque(maxlen=50)
+    
+    def _get_executor(self) -> Executor:
+        """ה-executor של השלב (נוצר בפעם הראשונה שצריך אותו)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._executor_factory()
+            return self._executor
+    
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        שליחת משימה לשלב
+        
+        Args:
+            fn: הפונקציה להרצה
+            *args: הארגומנטים
+        
+        Returns:
+            Future של התוצאה
+        """
+        submitted_at = time.time()
+        with self._lock:
+            self.submitted += 1
+            self.pending += 1
+        
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+                self.failed += 1
+            raise
+        
+        future.add_done_callback(lambda f: self._on_done(f, submitted_at))
+        return future
+    
+    def _on_done(self, future: Future, submitted_at: float):
+        """עדכון המדדים בסיום משימה"""
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self.durations.append(time.time() - submitted_at)
+    
+    def reset(self):
+        """החלפת executor שנשבר (למשל תהליך שקרס) באחד חדש"""
+        with self._lock:
+            broken, self._executor = self._executor, None
+        if broken:
+            broken.shutdown(wait=False)
+    
+    def shutdown(self, wait: bool = False):
+        """סגירת ה-executor של השלב"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """מדדי השלב - לניטור"""
+        with self._lock:
+            durations = list(self.durations)
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "backlog": max(0, self.pending - self.workers),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_seconds": round(sum(durations) / len(durations), 2) if durations else 0.0
+            }
+
+
+class Pipeline:
+    """
+    שלבי ה-pipeline של התהליך:
+    extract - חילוץ טקסט ב-processes (PDF parsing לא מתחרה ב-GIL עם ה-handlers)
+    generate - תור ה-jobs ב-Redis וה-workers של QueueService (I/O מול Gemini)
+    render - יצירת ה-HTML ושמירתו ב-threads נפרדים, כך ש-slot של יצירה משתחרר מיד
+    """
+    
+    def __init__(self):
+        """יצירת השלבים - ה-pools עצמם נפתחים רק בשימוש הראשון"""
+        self.extract = PipelineStage(
+            "extract",
+            config.EXTRACT_PROCESSES,
+            lambda: ProcessPoolExecutor(
+                max_workers=config.EXTRACT_PROCESSES,
+                mp_context=multiprocessing.get_context(config.EXTRACT_START_METHOD)
+            )
+        )
+        self.render = PipelineStage(
+            "render",
+            config.RENDER_WORKERS,
+            lambda: ThreadPoolExecutor(max_workers=config.RENDER_WORKERS, thread_name_prefix="render-worker")
+        )
+    
+    def extract_text(self, file_path: str, mime_type: str) -> Optional[Dict[str, Any]]:
+        """
+        חילוץ טקסט בשלב ה-extract (חוסם עד שהתוצאה מוכנה)
+        
+        Args:
+            file_path: נתיב לקובץ
+            mime_type: MIME type של הקובץ
+        
+        Returns:
+            Dictionary עם text, word_count, char_count או None במקרה של שגיאה
+        """
+        try:
+            future = self.extract.submit(_extract_in_worker, file_path, mime_type)
+            return future.result(timeout=config.EXTRACT_TIMEOUT)
+        except FutureTimeoutError:
+            logger.error(f"Text extraction timed out after {config.EXTRACT_TIMEOUT}s: {file_path}")
+            return None
+        except BrokenProcessPool as e:
+            # תהליך חילוץ קרס - פותחים pool חדש ומחלצים הפעם בתהליך הנוכחי
+            logger.error(f"Extraction process pool broken, extracting inline: {e}")
+            self.extract.reset()
+            return _extract_in_worker(file_path, mime_type)
+        except Exception as e:
+            logger.error(f"Failed to extract text: {e}")
+            return None
+    
+    def submit_render(self, fn: Callable, *args) -> Future:
+        """
+        שליחת rendering ושמירה של job לשלב ה-render
+        
+        Args:
+            fn: הפונקציה שמייצרת ושומרת את הפלט
+            *args: הארגומנטים
+        
+        Returns:
+            Future של הפעולה
+        """
+        return self.render.submit(fn, *args)
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """מדדי שלבי ה-extract וה-render בתהליך הנוכחי"""
+        return {
+            "extract": self.extract.snapshot(),
+            "render": self.render.snapshot()
+        }
+    
+    def shutdown(self):
+        """סגירת ה-pools"""
+        self.extract.shutdown()
+        self.render.shutdown()
+
+
+# Global instance
+pipeline = Pipeline()
@@ -2,17 +2,118 @@
 Queue Service
 ניהול תור עבודות רקע ב-Redis
 """
-import redis
+import asyncio
+import hashlib
 import json
+import os
+import queue
+import socket
 import time
 import threading
-from typing import Optional, Dict, Any
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 
 from config import config
 from utils.logger import logger
-from services.generator_service import generator_service
-from services.html_renderer import html_renderer
+from services.generator_service import (
+    generator_service, GenerationContext, JobCancelledError, DeadlineExceededError, RetryLaterError
+)
+from services.result_store import ResultStore
+from services.quota_service import QuotaService, QuotaExceededError
+from services.token_budget import token_budget
+from services.redis_factory import redis_factory
+from services.pipeline import pipeline
+from services.autoscaler import WorkerAutoscaler
+from services.lanes import LaneCapacity, parse_lanes, select_lane
+from services.scheduler import FairScheduler, estimate_job_cost
+from utils.keys import tagged
+from utils import codec
+from utils.progress import new_progress, apply_progress_event
+from utils.lifecycle import lifecycle
+
+# סטטוסים סופיים - job שהגיע אליהם כבר לא רץ ולא ממתין
+TERMINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED")
+
+# מדדי המסלולים של כל instance עם workers (hash: instance -> slots וזמני עיבוד), מתפרסמים בכל סבב של ה-dispatcher
+LANE_METRICS_KEY = "metrics:lanes:instances"
+LANE_METRICS_STALE_SECONDS = 30  # instance שלא פרסם זמן רב יותר נחשב מת
+
+
+class QueueFullError(Exception):
+    """המערכת עמוסה - ה-job נדחה לפני שנכנס לתור"""
+    
+    def __init__(self, lane: str, retry_after: float):
+        super().__init__(f"lane '{lane}' is full, retry in {retry_after:.0f}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+def job_events_channel(job_id: str) -> str:
+    """ערוץ ה-pub/sub של אירועי job (שינוי סטטוס / התקדמות)"""
+    return f"job_events:{job_id}"
+
+
+class JobWatcher:
+    """
+    מנוי לאירועים של job - ה-handler מתעורר מיד כשה-job משתנה במקום לחכות למחזור ה-polling
+    
+    אם ה-pub/sub לא זמין ההמתנה פשוט נמשכת עד ה-timeout (כמו polling רגיל).
+    """
+    
+    def __init__(self, redis_client, job_id: str):
+        """
+        Args:
+            redis_client: Redis client
+            job_id: מזהה job
+        """
+        self.job_id = job_id
+        try:
+            self._pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(job_events_channel(job_id))
+        except Exception as e:
+            logger.warning(f"Job events unavailable for {job_id}, polling instead: {e}")
+            self._pubsub = None
+    
+    def wait(self, timeout: float) -> bool:
+        """
+        המתנה לאירוע הבא של ה-job
+        
+        Args:
+            timeout: זמן המתנה מקסימלי (שניות)
+        
+        Returns:
+            True אם הגיע אירוע (אירועים שהצטברו נצרכים יחד)
+        """
+        deadline = time.time() + timeout
+        if self._pubsub is None:
+            time.sleep(timeout)
+            return False
+        
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                if self._pubsub.get_message(timeout=remaining):
+                    while self._pubsub.get_message(timeout=0.0):
+                        pass
+                    return True
+        except Exception as e:
+            logger.debug(f"Job events wait failed for {self.job_id}: {e}")
+            time.sleep(max(0.0, deadline - time.time()))
+            return False
+    
+    def close(self):
+        """סגירת המנוי"""
+        if self._pubsub is not None:
+            try:
+                self._pubsub.close()
+            except Exception:
+                pass
+            self._pubsub = None
 
 
 class QueueService:
@@ -21,11 +122,11 @@ class QueueService:
     def __init__(self):
         """Initialize Redis connection for queue"""
         try:
-            self.redis_client = redis.Redis(
-                host=config.REDIS_HOST,
-                port=config.REDIS_PORT,
-                decode_responses=True
-            )
+            self.redis_client = redis_factory.client()
+            # BLPOP ו-pub/sub מחזיקים חיבור לאורך זמן - pool נפרד מה-request path
+            self.blocking_client = redis_factory.client("blocking")
+            # job data וההתקדמות נשמרים בקידוד של ה-codec - נקראים בלי decode
+            self.binary_client = redis_factory.client("binary")
             self.redis_client.ping()
             logger.info("Queue service initialized")
         except Exception as e:
@@ -34,56 +135,456 @@ class QueueService:
         
         self.workers = []
         self.is_running = False
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}"
+        
+        # Thread workers לפי מזהה - workers עם מזהה >= target_workers יוצאים
+        self.worker_threads: Dict[int, threading.Thread] = {}
+        self.target_workers = 0
+        self._workers_lock = threading.Lock()
+        self.autoscaler: Optional[WorkerAutoscaler] = None
+        
+        # מסלולי התור - ה-dispatcher מושך jobs רק כשיש slot פנוי למסלול
+        self.lanes = parse_lanes(config.QUEUE_LANES)
+        self.lane_max_queued = parse_lanes(config.LANE_MAX_QUEUED)
+        self.lane_capacity = LaneCapacity(self.lanes, 0)
+        self.scheduler = FairScheduler(self.redis_client)
+        self.results = ResultStore(self.binary_client)
+        self.quotas = QuotaService(self.redis_client)
+        self.local_jobs: "queue.Queue[tuple]" = queue.Queue()
+        self._slot_freed = threading.Event()
+        self._next_promotion = 0.0
+        self._next_metrics_publish = 0.0
+        
+        # jobs שבעיבוד בתהליך הזה (כולל שלב ה-render) - עבור drain
+        self.active_jobs: Dict[str, GenerationContext] = {}
+        self._handed_off: set = set()
+        self._active_lock = threading.Lock()
+        self.draining = False
+        
+        # זמני עיבוד אחרונים (שניות) - עבור autoscaling
+        self.recent_latencies = deque(maxlen=50)
+        
+        # זמני עיבוד של jobs שהושלמו לפי מסלול - עבור הערכת זמן המתנה (ETA)
+        self.lane_service_times: Dict[str, deque] = {lane: deque(maxlen=20) for lane in self.lanes}
+        
+        # executor ל-parsing של תשובות Gemini במצב async (ה-rendering רץ בשלב ה-render של ה-pipeline)
+        self.cpu_executor: Optional[ThreadPoolExecutor] = None
+        self.async_loop: Optional[asyncio.AbstractEventLoop] = None
     
     # ==================== Job Management ====================
     
-    def add_job(self, chat_id: int, text: str, question_count: int, metadata: Dict[str, Any], file_info: Optional[Dict[str, Any]] = None) -> str:
+    def add_job(self, chat_id: int, text: str, question_count: int, metadata: Dict[str, Any], file_info: Optional[Dict[str, Any]] = None,
+                job_type: str = "html", owner: Optional[str] = None, supersede: bool = True,
+                deadline_seconds: Optional[int] = None) -> str:
         """
         הוספת job לתור
         
         Args:
-            chat_id: Telegram chat ID
+            chat_id: Telegram chat ID ("web" ל-jobs מה-web app, שמזוהים לפי owner)
             text: הטקסט המקור
             question_count: מספר שאלות
             metadata: מידע נוסף
             file_info: מידע על הקבצים (אופציונלי) - עבור מספר קבצים
+            job_type: html (קובץ מבחן), interactive (שאלות למבחן בטלגרם) או speculative (יצירה מראש)
+            owner: מזהה המשתמש לתזמון הוגן (ברירת מחדל tg:<chat_id>, ל-web: web:<session_id>)
+            supersede: ביטול ה-jobs הקודמים של אותו משתמש שעדיין לא הסתיימו
+            deadline_seconds: זמן מקסימלי עד שה-job חייב להסתיים (ברירת מחדל JOB_DEADLINE_SECONDS)
         
         Returns:
-            job_id
+            job_id (של job קיים אם זו בקשה כפולה שעדיין בעבודה)
+        
+        Raises:
+            QueueFullError: המסלול מלא או שה-job לא יספיק להתחיל לפני ה-deadline שלו
+            QuotaExceededError: הבקשה חורגת ממכסת העלות של המשתמש
         """
+        job_id = self._new_job_id(chat_id)
+        owner = owner or f"tg:{chat_id}"
+        idempotency_key = None
+        quota = None
         try:
-            job_id = f"job_{chat_id}_{int(time.time())}"
+            
+            # התקציב היומי קרוב לסוף - פחות שאלות לכל job במקום לדחות בקשות
+            requested_count = question_count
+            question_count = token_budget.cap_questions(question_count)
+            if question_count < requested_count:
+                logger.info(f"Token budget caps {owner} request from {requested_count} to {question_count} questions")
+            
+            # בקשה זהה (לחיצה כפולה / שליחה חוזרת) מצטרפת ל-job הקיים במקום קריאה נוספת למודל
+            idempotency_key = self._idempotency_key(owner, job_type, question_count, text)
+            existing_job_id = self._claim_idempotency_key(idempotency_key, job_id)
+            if existing_job_id:
+                logger.info(f"Duplicate submission from {owner} attached to {existing_job_id}")
+                return existing_job_id
+            
+            word_count = metadata.get("word_count") or len(text.split())
+            lane = select_lane(job_type, question_count, word_count)
+            cost = estimate_job_cost(word_count, question_count)
+            deadline_seconds = deadline_seconds or config.JOB_DEADLINE_SECONDS
+            
+            # בקרת כניסה - דחייה מוקדמת לפני שמבטלים jobs קודמים או כותבים משהו
+            try:
+                self.check_admission(lane, deadline_seconds)
+            except QueueFullError:
+                self._release_idempotency_key(idempotency_key, job_id)
+                raise
+            
+            # מכסת העלות של המשתמש - נתפסת לפי הערכה ומתוקנת בסיום לפי השימוש בפועל.
+            # יצירה ספקולטיבית לא נספרת - המשתמש משלם עליה רק כשהוא מאמץ אותה
+            if job_type != "speculative":
+                try:
+                    quota = self.quotas.reserve(owner, job_id, self._job_texts(text, file_info), question_count)
+                except QuotaExceededError:
+                    self._release_idempotency_key(idempotency_key, job_id)
+                    raise
+            
+            # בקשה חדשה מחליפה את הקודמות - אף אחד לא יקרא את התוצאות שלהן
+            if supersede:
+                self.cancel_owner_jobs(owner, reason="superseded")
             
             job_data = {
                 "job_id": job_id,
                 "chat_id": str(chat_id),
                 "text": text,
                 "question_count": question_count,
+                "requested_count": requested_count,
                 "metadata": metadata,
                 "file_info": file_info,
+                "job_type": job_type,
+                "lane": lane,
+                "owner": owner,
+                "estimated_cost": round(cost, 2),
+                "quota": quota,
+                "deadline": time.time() + deadline_seconds,
+                "requeues": 0,
+                "idempotency_key": idempotency_key,
                 "status": "PENDING",
                 "created_at": datetime.now().isoformat(),
                 "updated_at": datetime.now().isoformat()
             }
             
-            # שמירת job data
-            job_key = f"job:{job_id}"
-            self.redis_client.setex(
-                job_key,
-                config.JOB_TIMEOUT,
-                json.dumps(job_data)
-            )
+            admission_delay = token_budget.admission_delay(deadline_seconds) if job_type != "speculative" else 0
+            if admission_delay:
+                job_data["retry_at"] = time.time() + admission_delay
             
-            # הוספה לתור
-            self.redis_client.rpush("job_queue", job_id)
+            # שמירת job data ורישום ב-jobs הפעילים של המשתמש
+            job_key = self._job_key(job_id)
+            pipe = self.redis_client.pipeline()
+            pipe.setex(job_key, config.JOB_TIMEOUT, codec.dumps(job_data))
+            pipe.sadd(self._owner_jobs_key(owner), job_id)
+            pipe.expire(self._owner_jobs_key(owner), config.JOB_TIMEOUT)
+            pipe.execute()
             
-            logger.info(f"Added job {job_id} to queue")
-            return job_id
+            # התקציב היומי כמעט נוצל - ה-job מתקבל אבל נכנס לתור באיחור, כדי שהצריכה תתפזר
+            if admission_delay:
+                self.scheduler.schedule(job_id, job_data["retry_at"])
+                logger.info(f"Added job {job_id} with budget admission delay {admission_delay:.0f}s (lane={lane}, owner={owner})")
+                return job_id
             
+            # הוספה לתור של המשתמש במסלול - הסקריפט בודק שוב את הקיבולת באופן אטומי
+            max_queued = self.lane_max_queued.get(lane, 0)
+            if not self.scheduler.enqueue(lane, owner, job_id, cost, expires_at=job_data["deadline"], max_queued=max_queued):
+                self._abandon_submission(job_id, owner, idempotency_key, quota)
+                raise QueueFullError(lane, self._drain_estimate(lane, 1))
+            
+            logger.info(f"Added job {job_id} to queue (lane={lane}, owner={owner}, cost={cost:.1f})")
+            return job_id
+        
+        except QueueFullError as e:
+            logger.warning(f"Job rejected by admission control: {e}")
+            raise
+        except QuotaExceededError as e:
+            logger.warning(f"Job rejected by quota: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to add job: {e}")
+            if idempotency_key:
+                self._abandon_submission(job_id, owner, idempotency_key, quota)
             return ""
     
+    def _abandon_submission(self, job_id: str, owner: str, idempotency_key: str, quota: Optional[Dict[str, Any]]):
+        """
+        ביטול הגשה שלא נכנסה לתור - מחיקת מה שכבר נכתב, שחרור מפתח ה-idempotency והחזרת המכסה
+        
+        Args:
+            job_id: מזהה ה-job שלא נכנס לתור
+            owner: המשתמש שהגיש אותו
+            idempotency_key: מפתח ה-idempotency שנתפס עבורו
+            quota: רשומת התפיסה מ-QuotaService.reserve (None אם לא נתפסה)
+        """
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.delete(self._job_key(job_id))
+            pipe.srem(self._owner_jobs_key(owner), job_id)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to clean up rejected job {job_id}: {e}")
+        
+        self._release_idempotency_key(idempotency_key, job_id)
+        if quota:
+            self.quotas.settle(job_id, quota, None)
+    
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        """רשומת ה-job - כל המפתחות של job (ביטול, התקדמות, תוצאה) חולקים את ה-tag שלו"""
+        return f"job:{tagged(job_id)}"
+    
+    @staticmethod
+    def _job_texts(text: str, file_info: Optional[Dict[str, Any]]) -> List[str]:
+        """הטקסטים שיישלחו למודל - קריאה לכל קובץ, או קריאה אחת לטקסט המאוחד"""
+        files = (file_info or {}).get("files") or []
+        if len(files) > 1:
+            return [file.get("text", "") for file in files]
+        return [text]
+    
+    @staticmethod
+    def _new_job_id(chat_id: int) -> str:
+        """מזהה job ייחודי - גם לשתי בקשות מאותו צ'אט באותה שנייה"""
+        return f"job_{chat_id}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    
+    @staticmethod
+    def _idempotency_key(owner: str, job_type: str, question_count: int, text: str) -> str:
+        """
+        מפתח idempotency - אותו משתמש, אותו מסמך, אותה כמות ואותו סוג job
+        
+        Args:
+            owner: מזהה המשתמש
+            job_type: סוג ה-job
+            question_count: מספר שאלות
+            text: הטקסט המקור
+        
+        Returns:
+            מפתח Redis
+        """
+        document_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        digest = hashlib.sha256(f"{owner}|{job_type}|{question_count}|{document_hash}".encode("utf-8")).hexdigest()
+        return f"idem:{digest[:32]}"
+    
+    def _claim_idempotency_key(self, idempotency_key: str, job_id: str) -> Optional[str]:
+        """
+        שריון מפתח ה-idempotency ל-job חדש לחלון של IDEMPOTENCY_WINDOW שניות
+        
+        Args:
+            idempotency_key: מפתח ה-idempotency
+            job_id: מזהה ה-job החדש
+        
+        Returns:
+            מזהה ה-job הקיים אם יש job זהה שעדיין בעבודה, אחרת None
+        """
+        if self.redis_client.set(idempotency_key, job_id, nx=True, ex=config.IDEMPOTENCY_WINDOW):
+            return None
+        
+        existing_job_id = self.redis_client.get(idempotency_key)
+        existing = self.get_job_status(existing_job_id) if existing_job_id else None
+        if existing and existing["status"] not in TERMINAL_STATUSES:
+            return existing_job_id
+        
+        # ה-job הקודם כבר הסתיים - בקשה חוזרת היא בקשה חדשה
+        self.redis_client.set(idempotency_key, job_id, ex=config.IDEMPOTENCY_WINDOW)
+        return None
+    
+    # ==================== Speculative Jobs ====================
+    
+    @staticmethod
+    def _adopted_key(job_id: str) -> str:
+        return f"job_adopted:{tagged(job_id)}"
+    
+    def _adoption(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """האימוץ של job ספקולטיבי - {"count", "quota"} (None אם לא אומץ)"""
+        try:
+            adoption = codec.loads(self.binary_client.get(self._adopted_key(job_id)))
+        except Exception as e:
+            logger.debug(f"Failed to read adoption for {job_id}: {e}")
+            return None
+        if isinstance(adoption, int):
+            # רשומה מלפני שהמכסה נשמרה עם האימוץ - רק מספר השאלות
+            return {"count": adoption, "quota": None}
+        return adoption
+    
+    def _adopted_count(self, job_id: str) -> Optional[int]:
+        """מספר השאלות שהמשתמש ביקש מ-job ספקולטיבי שאומץ (None אם לא אומץ)"""
+        adoption = self._adoption(job_id)
+        return adoption["count"] if adoption else None
+    
+    def adopt_job(self, job_id: str, count: int, owner: str, quota: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        שימוש ב-job ספקולטיבי כדי לשרת בקשה אמיתית של count שאלות
+        
+        האימוץ נרשם במפתח נפרד (כדי לא לדרוס את רשומת ה-job שה-worker מעדכן), והתוצאה
+        מצטמצמת ל-count שאלות כשהיא נקראת (_narrow_adopted) - כך לא משנה אם ה-job הסתיים
+        לפני האימוץ, אחריו או באמצע השמירה.
+        job שעוד לא התחיל לא מאומץ - עדיף job חדש בגודל המדויק במסלול הרגיל.
+        
+        תפיסת המכסה של המשתמש נשמרת עם האימוץ ועוברת ל-job["quota"] כשה-job מסתיים, כך
+        שהיא מתוקנת לפי החלק של המשתמש מה-tokens בפועל (או מוחזרת אם ה-job נכשל או בוטל).
+        
+        Args:
+            job_id: מזהה ה-job הספקולטיבי
+            count: מספר השאלות שהמשתמש ביקש
+            owner: המשתמש שמאמץ את ה-job (כדי שביטול ה-jobs שלו יכלול גם אותו)
+            quota: רשומת התפיסה של המשתמש מ-QuotaService.reserve (אופציונלי)
+        
+        Returns:
+            True אם ה-job משרת את הבקשה (וה-handler יכול לעקוב אחריו)
+        """
+        try:
+            job = self.get_job_status(job_id)
+            if not job or job.get("question_count", 0) < count:
+                return False
+            
+            # המשתמש משלם על החלק שלו מהמאגר
+            quota = dict(quota, share=count / job["question_count"]) if quota else None
+            
+            if job["status"] == "PROCESSING":
+                # ה-job עובר למשתמש - ביטול הספקולציה הבאה לא יפגע בו, ביטול ה-jobs של המשתמש כן.
+                # האימוץ נשמר במפתח נפרד: ה-worker מעדכן את רשומת ה-job ועלול לדרוס שינוי בה
+                pipe = self.redis_client.pipeline()
+                pipe.srem(self._owner_jobs_key(job["owner"]), job_id)
+                pipe.sadd(self._owner_jobs_key(owner), job_id)
+                pipe.expire(self._owner_jobs_key(owner), config.JOB_TIMEOUT)
+                pipe.setex(self._adopted_key(job_id), self._adoption_ttl(), codec.dumps({"count": count, "quota": quota}))
+                pipe.execute()
+                job = self.get_job_status(job_id)
+                if not job or job["status"] != "COMPLETED":
+                    return bool(job) and job["status"] == "PROCESSING"
+            
+            if job["status"] == "COMPLETED":
+                questions = self.results.get_questions(job_id)
+                if not questions or len(questions) < count:
+                    return False
+                self.redis_client.setex(self._adopted_key(job_id), self._adoption_ttl(), codec.dumps({"count": count, "quota": quota}))
+                if quota:
+                    # התוצאה כבר קיימת - התפיסה מתוקנת מיד (תיקון חוזר של אותה תפיסה לא משנה דבר)
+                    job["quota"] = quota
+                    self._settle_quota(job)
+                return True
+            
+            return False
+        except Exception as e:
+            logger.error(f"Failed to adopt speculative job {job_id}: {e}")
+            return False
+    
+    @staticmethod
+    def _adoption_ttl() -> int:
+        """רשומת האימוץ חיה כל עוד התוצאה יכולה להיקרא - הצמצום שלה קורה בקריאה"""
+        return max(config.JOB_TIMEOUT, config.RESULT_TTL)
+    
+    def _narrow_adopted(self, job_id: str):
+        """
+        צמצום התוצאה של מאגר ספקולטיבי שאומץ לכמות שהמשתמש ביקש, לפני שהיא נמסרת
+        
+        הצמצום קורה בקריאה ולא בסיום ה-job: האימוץ יכול להירשם בכל רגע עד שה-job
+        מסומן COMPLETED, ובדיקה אחת בסיום הייתה מפספסת אימוץ שנחת באמצע השמירה.
+        
+        Args:
+            job_id: מזהה job
+        """
+        count = self._adopted_count(job_id)
+        if not count:
+            return
+        
+        questions = self.results.get_questions(job_id)
+        if questions and len(questions) > count:
+            logger.info(f"Narrowing adopted job {job_id} from {len(questions)} to {count} questions")
+            self.results.narrow(job_id, count)
+    
+    def _release_idempotency_key(self, idempotency_key: str, job_id: str):
+        """שחרור מפתח ה-idempotency של job שנדחה (רק אם הוא עדיין שלו)"""
+        try:
+            if self.redis_client.get(idempotency_key) == job_id:
+                self.redis_client.delete(idempotency_key)
+        except Exception as e:
+            logger.debug(f"Failed to release idempotency key: {e}")
+    
+    # ==================== Admission Control ====================
+    
+    def _lane_metrics(self, lane: str) -> Tuple[float, int]:
+        """
+        זמן העיבוד הממוצע ומספר ה-slots של מסלול בכל ה-instances החיים
+        
+        ה-slots מסתכמים, וזמן העיבוד הוא ממוצע משוקלל לפי מספר הדגימות של כל instance.
+        
+        Args:
+            lane: שם המסלול
+        
+        Returns:
+            (service_time_seconds, slots)
+        """
+        now = time.time()
+        slots, samples, total_time = 0, 0, 0.0
+        stale = []
+        for instance, metrics_json in self.redis_client.hgetall(LANE_METRICS_KEY).items():
+            published = json.loads(metrics_json)
+            if now - published.get("published_at", 0) > LANE_METRICS_STALE_SECONDS:
+                stale.append(instance)
+                continue
+            lane_metrics = published.get("lanes", {}).get(lane, {})
+            slots += lane_metrics.get("slots") or 0
+            if lane_metrics.get("service_time_seconds"):
+                count = lane_metrics.get("samples") or 1
+                samples += count
+                total_time += lane_metrics["service_time_seconds"] * count
+        if stale:
+            self.redis_client.hdel(LANE_METRICS_KEY, *stale)
+        
+        service_time = total_time / samples if samples else config.AUTOSCALE_DEFAULT_LATENCY
+        return service_time, max(1, slots)
+    
+    def _drain_estimate(self, lane: str, excess_jobs: int) -> float:
+        """
+        זמן משוער עד שהמסלול יעבד excess_jobs jobs נוספים
+        
+        Args:
+            lane: שם המסלול
+            excess_jobs: מספר ה-jobs שצריכים לצאת מהתור
+        
+        Returns:
+            שניות (לפחות ADMISSION_MIN_RETRY_SECONDS)
+        """
+        service_time, slots = self._lane_metrics(lane)
+        return max(config.ADMISSION_MIN_RETRY_SECONDS, excess_jobs * service_time / slots)
+    
+    def check_admission(self, lane: str, deadline_seconds: float):
+        """
+        בקרת כניסה למסלול - דחייה מוקדמת כשהתור מלא, או כשה-job לא יספיק
+        להסתיים לפני ה-deadline שלו לפי זמן ההמתנה המשוער
+        
+        Args:
+            lane: שם המסלול
+            deadline_seconds: הזמן שיש ל-job עד ה-deadline
+        
+        Raises:
+            QueueFullError: עם זמן משוער עד שכדאי לנסות שוב
+        """
+        pipe = self.redis_client.pipeline()
+        pipe.zcard(FairScheduler.enqueued_key(lane))
+        pipe.llen(FairScheduler.owners_key(lane))
+        queued, active_owners = pipe.execute()
+        
+        max_queued = self.lane_max_queued.get(lane, 0)
+        if max_queued and queued >= max_queued:
+            raise QueueFullError(lane, self._drain_estimate(lane, queued - max_queued + 1))
+        
+        # בסבב ההוגן job חדש ממתין בערך ל-job אחד מכל משתמש פעיל, לא לכל התור
+        service_time, slots = self._lane_metrics(lane)
+        expected_finish = active_owners * service_time / slots + service_time
+        if expected_finish > deadline_seconds:
+            excess_jobs = (expected_finish - deadline_seconds) * slots / service_time
+            raise QueueFullError(lane, self._drain_estimate(lane, max(1, int(excess_jobs + 0.999))))
+    
+    def _expire_queued_jobs(self, job_ids: List[str]):
+        """
+        סימון jobs שפג תוקפם בזמן ההמתנה בתור (ה-dispatcher כבר הוציא אותם מהתור בלי לתפוס slot)
+        
+        Args:
+            job_ids: מזהי ה-jobs
+        """
+        for job_id in job_ids:
+            job = self.get_job_status(job_id)
+            if not job or job["status"] in TERMINAL_STATUSES:
+                continue
+            logger.warning(f"Job {job_id} expired while waiting in queue")
+            self.update_job_status(job_id, "FAILED", error="הבקשה המתינה בתור זמן רב מדי. נסה שוב בעוד כמה דקות")
+    
     def get_job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
         """
         קבלת status של job
@@ -95,25 +596,22 @@ class QueueService:
             Job data או None
         """
         try:
-            job_key = f"job:{job_id}"
-            job_json = self.redis_client.get(job_key)
-            
-            if job_json:
-                return json.loads(job_json)
-            return None
+            job_key = self._job_key(job_id)
+            return codec.loads(self.binary_client.get(job_key))
         except Exception as e:
             logger.error(f"Failed to get job status: {e}")
             return None
     
-    def update_job_status(self, job_id: str, status: str, output_file: str = None, error: str = None) -> bool:
+    def update_job_status(self, job_id: str, status: str, error: str = None,
+                          result_count: Optional[int] = None) -> bool:
         """
         עדכון status של job
         
         Args:
             job_id: מזהה job
-            status: סטטוס חדש (PROCESSING, COMPLETED, FAILED)
-            output_file: נתיב לקובץ פלט (אופציונלי)
+            status: סטטוס חדש (PROCESSING, COMPLETED, FAILED, CANCELLED)
             error: הודעת שגיאה (אופציונלי)
+            result_count: מספר השאלות שנשמרו ב-ResultStore (אופציונלי)
         
         Returns:
             True if successful
@@ -123,147 +621,1102 @@ class QueueService:
             if not job:
                 return False
             
+            # המכסה מתוקנת כאן אם ה-job לא רץ, או שהוא רץ בתהליך הזה (ה-tokens שלו ב-ctx).
+            # job שרץ בתהליך אחר מתקן אותה בעצמו כשה-worker נעצר
+            if status in TERMINAL_STATUSES:
+                with self._active_lock:
+                    ctx = self.active_jobs.get(job_id)
+                if ctx is not None or job["status"] == "PENDING":
+                    self._settle_quota(job, ctx, status)
+            
             job["status"] = status
             job["updated_at"] = datetime.now().isoformat()
             
-            if output_file:
-                job["output_file"] = output_file
-            
             if error:
                 job["error"] = error
             
-            job_key = f"job:{job_id}"
-            self.redis_client.setex(
-                job_key,
-                config.JOB_TIMEOUT,
-                json.dumps(job)
-            )
+            if result_count is not None:
+                job["result_count"] = result_count
             
+            self._save_job(job_id, job)
             return True
         except Exception as e:
             logger.error(f"Failed to update job status: {e}")
             return False
     
-    # ==================== Background Workers ====================
+    def get_job_questions(self, job_id: str) -> Optional[List[Any]]:
+        """
+        השאלות של job שהושלם, מה-ResultStore המשותף
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            רשימת Question או None אם אין תוצאה
+        """
+        self._narrow_adopted(job_id)
+        return self.results.get_questions(job_id)
     
-    def start_workers(self, num_workers: int = 3):
+    def get_job_html(self, job_id: str) -> Optional[str]:
         """
-        הפעלת workers לעיבוד רקע
+        ה-HTML של job שהושלם - נוצר לפי דרישה מהשאלות השמורות (עם cache)
         
         Args:
-            num_workers: מספר workers במקביל
+            job_id: מזהה job
+        
+        Returns:
+            תוכן HTML או None אם אין תוצאה
         """
-        if self.is_running:
-            logger.warning("Workers already running")
-            return
+        try:
+            self._narrow_adopted(job_id)
+            return self.results.render_html(job_id)
+        except Exception as e:
+            logger.error(f"Failed to render HTML for {job_id}: {e}")
+            return None
+    
+    def _save_job(self, job_id: str, job: Dict[str, Any]):
+        """
+        שמירת job data (ושחרור מה-jobs הפעילים של המשתמש בסטטוס סופי)
         
-        self.is_running = True
+        Args:
+            job_id: מזהה job
+            job: Job data
+        """
+        pipe = self.redis_client.pipeline()
+        pipe.setex(self._job_key(job_id), config.JOB_TIMEOUT, codec.dumps(job))
+        if job["status"] in TERMINAL_STATUSES and job.get("owner"):
+            pipe.srem(self._owner_jobs_key(job["owner"]), job_id)
+        pipe.publish(job_events_channel(job_id), job["status"])
+        pipe.execute()
+    
+    @staticmethod
+    def _job_usage(job: Dict[str, Any], run_usage: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """ה-tokens שה-job צרך - מריצות קודמות (לפני requeue) ועוד הריצה הנוכחית"""
+        usage = dict(job.get("token_usage") or {"input_tokens": 0, "output_tokens": 0, "calls": 0})
+        for name, value in (run_usage or {}).items():
+            usage[name] = usage.get(name, 0) + value
+        return usage
+    
+    def _settle_quota(self, job: Dict[str, Any], ctx: Optional[GenerationContext] = None,
+                      status: Optional[str] = None):
+        """
+        תיקון מכסת העלות של job שהסתיים לפי ה-tokens שנצרכו בפועל (פעם אחת לכל job)
         
-        for i in range(num_workers):
-            worker_thread = threading.Thread(
-                target=self._worker_loop,
-                args=(i,),
-                daemon=True
-            )
-            worker_thread.start()
-            self.workers.append(worker_thread)
+        מעדכן את job במקום - הקורא שומר אותו.
         
-        logger.info(f"Started {num_workers} background workers")
+        Args:
+            job: Job data
+            ctx: הקשר היצירה אם ה-job רץ בתהליך הזה
+            status: הסטטוס הסופי (ברירת מחדל - הסטטוס שכבר ב-job)
+        """
+        job["token_usage"] = self._job_usage(job, ctx.usage if ctx else None)
+        quota = job.get("quota")
+        if quota is None and job.get("job_type") == "speculative":
+            # מאגר ספקולטיבי שמשתמש אימץ - התפיסה של המשתמש עוברת ל-job
+            adoption = self._adoption(job["job_id"])
+            quota = job["quota"] = adoption.get("quota") if adoption else None
+        if not quota or quota.get("settled"):
+            return
+        usage = job["token_usage"]
+        if "share" in quota:
+            # מי שאימץ מאגר משלם על החלק שקיבל ממנו, ולא משלם כלום אם לא קיבל תוצאה
+            if (status or job["status"]) == "COMPLETED":
+                usage = {name: int(value * quota["share"]) for name, value in usage.items()}
+            else:
+                usage = None
+        self.quotas.settle(job["job_id"], quota, usage)
+        quota["settled"] = True
     
-    def stop_workers(self):
-        """עצירת workers"""
-        self.is_running = False
-        logger.info("Stopping workers...")
+    def _settle_stopped_job(self, job_id: str, ctx: GenerationContext):
+        """תיקון המכסה של job שבוטל בזמן שרץ כאן - אחרי שה-worker נעצר"""
+        try:
+            job = self.get_job_status(job_id)
+            if job and job["status"] in TERMINAL_STATUSES and not (job.get("quota") or {}).get("settled"):
+                self._settle_quota(job, ctx)
+                self._save_job(job_id, job)
+        except Exception as e:
+            logger.error(f"Failed to settle quota for {job_id}: {e}")
     
-    def _worker_loop(self, worker_id: int):
+    def watch_job(self, job_id: str) -> JobWatcher:
         """
-        לולאת worker - מעבד jobs מהתור
+        מנוי לאירועי job (יש לסגור עם close)
         
         Args:
-            worker_id: מזהה worker
+            job_id: מזהה job
+        
+        Returns:
+            JobWatcher
         """
-        logger.info(f"Worker {worker_id} started")
+        return JobWatcher(self.blocking_client, job_id)
+    
+    # ==================== Cancellation ====================
+    
+    @staticmethod
+    def _owner_jobs_key(owner: str) -> str:
+        """ה-jobs שעדיין לא הסתיימו של משתמש"""
+        return f"owner_jobs:{tagged(owner)}"
+    
+    def is_cancelled(self, job_id: str) -> bool:
+        """
+        בדיקת ה-cancellation token של job
         
-        while self.is_running:
-            try:
-                # משיכת job מהתור (עם timeout)
-                result = self.redis_client.blpop("job_queue", timeout=5)
-                
-                if not result:
-                    continue
-                
-                _, job_id = result
-                logger.info(f"Worker {worker_id} processing {job_id}")
-                
-                # עיבוד ה-job
-                self._process_job(job_id)
-                
-            except Exception as e:
-                logger.error(f"Worker {worker_id} error: {e}")
-                time.sleep(1)
+        Args:
+            job_id: מזהה job
         
-        logger.info(f"Worker {worker_id} stopped")
+        Returns:
+            True אם ה-job בוטל
+        """
+        try:
+            return bool(self.redis_client.exists(f"job_cancel:{tagged(job_id)}"))
+        except Exception as e:
+            logger.error(f"Failed to check cancellation for {job_id}: {e}")
+            return False
     
-    def _process_job(self, job_id: str):
+    def cancel_job(self, job_id: str, reason: str = "cancelled") -> bool:
         """
-        עיבוד job בודד
+        ביטול job - job ממתין יוצא מהתור, job בעיבוד נעצר בנקודה הבטוחה הבאה
         
         Args:
             job_id: מזהה job
+            reason: סיבת הביטול
+        
+        Returns:
+            True אם ה-job בוטל
         """
         try:
-            # קבלת job data
             job = self.get_job_status(job_id)
-            if not job:
-                logger.error(f"Job {job_id} not found")
-                return
-            
-            chat_id = job["chat_id"]
-            text = job["text"]
-            question_count = job["question_count"]
-            metadata = job.get("metadata", {})
-            file_info = job.get("file_info")
-            
-            # עדכון סטטוס ל-PROCESSING
-            self.update_job_status(job_id, "PROCESSING")
-            
-            # יצירת שאלות עם Gemini
-            logger.info(f"Generating {question_count} questions for {job_id}")
-            
-            try:
-                questions = generator_service.generate_questions(text, question_count, file_info)
-            except Exception as e:
-                error_msg = str(e)
-                if "429" in error_msg or "Resource exhausted" in error_msg:
-                    logger.error(f"Rate limit exceeded for {job_id}: {e}")
-                    self.update_job_status(job_id, "FAILED", error="השירות עמוס כרגע. אנא נסה שוב בעוד כמה דקות")
-                else:
-                    logger.error(f"Unexpected error for {job_id}: {e}")
-                    self.update_job_status(job_id, "FAILED", error="שגיאה ביצירת שאלות. אנא נסה שוב")
-                return
-            
-            if not questions:
-                self.update_job_status(job_id, "FAILED", error="כשל ביצירת שאלות. אנא נסה שוב")
-                return
-            
-            # יצירת HTML
-            logger.info(f"Rendering HTML for {job_id}")
-            html_content = html_renderer.render_quiz(questions, metadata)
-            
-            # שמירת HTML לקובץ
-            output_file = html_renderer.save_quiz(html_content, chat_id, job_id)
+            if not job or job["status"] in TERMINAL_STATUSES:
+                return False
             
-            if not output_file:
-                self.update_job_status(job_id, "FAILED", error="Failed to save HTML file")
-                return
+            self.redis_client.setex(f"job_cancel:{tagged(job_id)}", config.JOB_TIMEOUT, reason)
             
-            # עדכון סטטוס ל-COMPLETED
-            self.update_job_status(job_id, "COMPLETED", output_file=output_file)
-            logger.info(f"Job {job_id} completed successfully")
+            if job["status"] == "PENDING" and job.get("owner"):
+                self.scheduler.remove(job["lane"], job["owner"], job_id)
             
+            self.update_job_status(job_id, "CANCELLED", error=reason)
+            logger.info(f"Cancelled job {job_id} ({reason}, was {job['status']})")
+            return True
         except Exception as e:
-            logger.error(f"Failed to process job {job_id}: {e}")
-            self.update_job_status(job_id, "FAILED", error=str(e))
+            logger.error(f"Failed to cancel job {job_id}: {e}")
+            return False
+    
+    def cancel_owner_jobs(self, owner: str, reason: str = "cancelled") -> int:
+        """
+        ביטול כל ה-jobs הפעילים של משתמש
+        
+        Args:
+            owner: מזהה המשתמש (tg:<chat_id> / web:<session_id>)
+            reason: סיבת הביטול
+        
+        Returns:
+            מספר ה-jobs שבוטלו
+        """
+        try:
+            job_ids = self.redis_client.smembers(self._owner_jobs_key(owner))
+        except Exception as e:
+            logger.error(f"Failed to list jobs for {owner}: {e}")
+            return 0
+        
+        cancelled = 0
+        for job_id in job_ids:
+            if self.cancel_job(job_id, reason):
+                cancelled += 1
+            else:
+                self.redis_client.srem(self._owner_jobs_key(owner), job_id)
+        return cancelled
+    
+    def cancel_chat_jobs(self, chat_id: int, reason: str = "cancelled") -> int:
+        """ביטול כל ה-jobs הפעילים של צ'אט בטלגרם"""
+        return self.cancel_owner_jobs(f"tg:{chat_id}", reason)
+    
+    # ==================== Background Workers ====================
+    
+    def start_configured_workers(self):
+        """
+        הפעלת ה-workers לפי WORKER_MODE - threads, או worker אסינכרוני אחד
+        
+        נקרא גם מה-web app כשהבוט לא רץ (RUN_TELEGRAM_BOT=false), כדי שה-jobs של ה-web יעובדו.
+        """
+        logger.info(f"Starting background workers (mode={config.WORKER_MODE})...")
+        if config.WORKER_MODE == "async":
+            self.start_async_workers(max_in_flight=config.ASYNC_MAX_IN_FLIGHT)
+        else:
+            self.start_workers(num_workers=config.NUM_WORKERS)
+    
+    def start_workers(self, num_workers: int = config.NUM_WORKERS):
+        """
+        הפעלת workers לעיבוד רקע
+        
+        Args:
+            num_workers: מספר workers במקביל (התחלתי, אם autoscaling פעיל)
+        """
+        if self.is_running:
+            logger.warning("Workers already running")
+            return
+        
+        self.is_running = True
+        
+        if config.AUTOSCALE_ENABLED:
+            num_workers = max(config.WORKER_MIN, min(config.WORKER_MAX, num_workers))
+        
+        self.resize_workers(num_workers)
+        
+        dispatcher_thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        dispatcher_thread.start()
+        logger.info(f"Started {num_workers} background workers (lanes: {self.lane_capacity.snapshot()})")
+        
+        if config.AUTOSCALE_ENABLED:
+            self.autoscaler = WorkerAutoscaler(
+                stats_provider=self.get_queue_stats,
+                resize=self.resize_workers,
+                current=num_workers,
+                redis_client=self.redis_client
+            )
+            self.autoscaler.start()
+    
+    def resize_workers(self, target: int):
+        """
+        שינוי מספר ה-thread workers
+        workers עודפים מסיימים את ה-job הנוכחי ויוצאים
+        
+        Args:
+            target: מספר ה-workers הרצוי
+        """
+        with self._workers_lock:
+            self.target_workers = target
+            self.lane_capacity.set_total(target)
+            self._slot_freed.set()
+            
+            for worker_id in range(target):
+                worker_thread = self.worker_threads.get(worker_id)
+                if worker_thread and worker_thread.is_alive():
+                    continue
+                
+                worker_thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(worker_id,),
+                    daemon=True
+                )
+                worker_thread.start()
+                self.worker_threads[worker_id] = worker_thread
+            
+            self.workers = list(self.worker_threads.values())
+        
+        self._publish_lane_metrics()
+    
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """
+        מדדי עומס של התור
+        
+        Returns:
+            queue_length, oldest_wait_seconds, busy_workers, avg_latency_seconds ופירוט לפי מסלול
+        """
+        scheduled = self.scheduler.stats(list(self.lanes))
+        capacity = self.lane_capacity.snapshot()
+        lanes_stats = {}
+        queue_length = 0
+        oldest_wait = 0.0
+        
+        for lane in self.lanes:
+            queue_length += scheduled[lane]["queued"]
+            oldest_wait = max(oldest_wait, scheduled[lane]["oldest_wait_seconds"])
+            lanes_stats[lane] = {**scheduled[lane], **capacity[lane], "max_queued": self.lane_max_queued.get(lane, 0)}
+        
+        latencies = list(self.recent_latencies)
+        avg_latency = sum(latencies) / len(latencies) if latencies else 0.0
+        
+        return {
+            "queue_length": queue_length,
+            "oldest_wait_seconds": oldest_wait,
+            "busy_workers": sum(lane["in_flight"] for lane in capacity.values()),
+            "avg_latency_seconds": avg_latency,
+            "lanes": lanes_stats
+        }
+    
+    # ==================== Queue Position & ETA ====================
+    
+    def _record_service_time(self, lane: str, seconds: float):
+        """
+        רישום זמן העיבוד של job שהושלם ועדכון ההערכה המשותפת
+        
+        Args:
+            lane: שם המסלול
+            seconds: זמן העיבוד
+        """
+        self.lane_service_times.setdefault(lane, deque(maxlen=20)).append(seconds)
+        self._publish_lane_metrics()
+    
+    def _publish_lane_metrics(self):
+        """
+        פרסום זמן העיבוד הממוצע וה-slots של כל מסלול ב-instance הזה - גם תהליך ה-web מחשב ETA מהם.
+        כל instance כותב לשדה משלו, וה-ETA מסכם את כל ה-instances החיים
+        """
+        try:
+            reserved = self.lane_capacity.snapshot()
+            lanes = {}
+            for lane in self.lanes:
+                times = list(self.lane_service_times.get(lane, []))
+                lanes[lane] = {
+                    "service_time_seconds": round(sum(times) / len(times), 1) if times else None,
+                    "samples": len(times),
+                    "slots": reserved[lane]["reserved"]
+                }
+            pipe = self.redis_client.pipeline()
+            pipe.hset(LANE_METRICS_KEY, self.instance_id, json.dumps({"published_at": time.time(), "lanes": lanes}))
+            pipe.expire(LANE_METRICS_KEY, LANE_METRICS_STALE_SECONDS * 10)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Failed to publish lane metrics: {e}")
+    
+    def _withdraw_lane_metrics(self):
+        """הסרת המדדים של ה-instance הזה (עצירת ה-workers) - ה-slots שלו כבר לא משרתים את התור"""
+        try:
+            self.redis_client.hdel(LANE_METRICS_KEY, self.instance_id)
+        except Exception as e:
+            logger.debug(f"Failed to withdraw lane metrics: {e}")
+    
+    def get_job_eta(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        מיקום ה-job בתור והערכת זמן התחלה וסיום
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            status, lane, position, jobs_ahead, estimated_start_seconds, estimated_finish_seconds, progress, error
+            או None אם ה-job לא נמצא
+        """
+        try:
+            job = self.get_job_status(job_id)
+            if not job:
+                return None
+            
+            lane = job.get("lane")
+            service_time, slots = self._lane_metrics(lane)
+            now = time.time()
+            
+            eta = {
+                "job_id": job_id,
+                "status": job["status"],
+                "lane": lane,
+                "position": None,
+                "jobs_ahead": None,
+                "estimated_start_seconds": 0,
+                "estimated_finish_seconds": 0,
+                "progress": None,
+                "error": job.get("error")
+            }
+            
+            if job["status"] == "PENDING":
+                start_in = 0.0
+                if job.get("retry_at") and job["retry_at"] > now:
+                    # ממתין לניסיון חוזר אחרי rate limit
+                    start_in = job["retry_at"] - now
+                else:
+                    ahead = self.scheduler.jobs_ahead(lane, job.get("owner", ""), job_id)
+                    if ahead is not None:
+                        eta["jobs_ahead"] = ahead
+                        eta["position"] = ahead + 1
+                        start_in = ahead * service_time / slots
+                eta["estimated_start_seconds"] = round(start_in)
+                eta["estimated_finish_seconds"] = round(start_in + service_time)
+            
+            elif job["status"] == "PROCESSING":
+                elapsed = now - job.get("started_at", now)
+                eta["estimated_finish_seconds"] = round(max(0.0, service_time - elapsed))
+                eta["progress"] = self.get_job_progress(job_id)
+            
+            return eta
+        except Exception as e:
+            logger.error(f"Failed to estimate ETA for {job_id}: {e}")
+            return None
+    
+    def start_async_workers(self, max_in_flight: Optional[int] = None):
+        """
+        הפעלת worker אסינכרוני - event loop בודד עם הרבה jobs במקביל
+        
+        Args:
+            max_in_flight: מספר jobs מקסימלי שמעובדים במקביל בתהליך
+        """
+        if self.is_running:
+            logger.warning("Workers already running")
+            return
+        
+        max_in_flight = max_in_flight or config.ASYNC_MAX_IN_FLIGHT
+        self.is_running = True
+        self.lane_capacity.set_total(max_in_flight)
+        self._publish_lane_metrics()
+        self.cpu_executor = ThreadPoolExecutor(
+            max_workers=config.CPU_EXECUTOR_WORKERS,
+            thread_name_prefix="cpu-worker"
+        )
+        
+        engine_thread = threading.Thread(
+            target=self._run_async_engine,
+            args=(max_in_flight,),
+            daemon=True
+        )
+        engine_thread.start()
+        self.workers.append(engine_thread)
+        
+        logger.info(f"Started async worker engine (max {max_in_flight} jobs in flight)")
+    
+    def drain(self, grace_seconds: Optional[float] = None) -> int:
+        """
+        drain לפני כיבוי: הפסקת משיכת jobs חדשים, המתנה ל-jobs שבעיבוד עד grace_seconds,
+        והחזרת מה שלא הסתיים לתור (עם הקבצים שכבר הושלמו) כדי ש-instance אחר ימשיך
+        
+        Args:
+            grace_seconds: זמן המתנה מקסימלי ל-jobs שבעיבוד (ברירת מחדל DRAIN_GRACE_SECONDS)
+        
+        Returns:
+            מספר ה-jobs שחזרו לתור
+        """
+        if self.draining:
+            return 0
+        
+        grace = config.DRAIN_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        self.draining = True
+        lifecycle.mark_draining()
+        if self.autoscaler:
+            self.autoscaler.stop()
+        self._slot_freed.set()
+        logger.info(f"Draining: {len(self.active_jobs)} jobs in flight, grace {grace:.0f}s")
+        
+        # jobs שה-dispatcher כבר משך אבל worker עוד לא התחיל - חוזרים לתור מיד
+        requeued = self._return_local_jobs()
+        
+        drain_deadline = time.time() + grace
+        while self.active_jobs and time.time() < drain_deadline:
+            time.sleep(0.5)
+        requeued += self._return_local_jobs()
+        
+        # מה שלא הסתיים בזמן עובר ל-instance אחר; ה-worker המקומי נעצר בנקודה הבטוחה הבאה
+        with self._active_lock:
+            unfinished = dict(self.active_jobs)
+            self._handed_off.update(unfinished)
+        for job_id, ctx in unfinished.items():
+            if self._requeue_now(job_id, ctx.completed_files, ctx.usage):
+                requeued += 1
+        
+        logger.info(f"Drain complete: {requeued} jobs returned to the queue")
+        self.stop_workers()
+        return requeued
+    
+    def _return_local_jobs(self) -> int:
+        """
+        החזרת jobs מהתור המקומי (נמשכו מ-Redis אבל לא התחילו) לתור המשותף
+        
+        Returns:
+            מספר ה-jobs שחזרו
+        """
+        returned = 0
+        while True:
+            try:
+                lane, job_id = self.local_jobs.get_nowait()
+            except queue.Empty:
+                return returned
+            self.lane_capacity.release(lane)
+            if self._requeue_now(job_id):
+                returned += 1
+    
+    def _requeue_now(self, job_id: str, completed_files: Optional[Dict[str, Any]] = None,
+                     usage: Optional[Dict[str, int]] = None) -> bool:
+        """
+        החזרת job לתור ההוגן מיד (drain) - שומר על הוותק, ה-deadline והקבצים שהושלמו
+        
+        Args:
+            job_id: מזהה job
+            completed_files: תוצאות חלקיות לפי אינדקס קובץ (אופציונלי)
+            usage: ה-tokens שהריצה המקומית כבר צרכה (אופציונלי)
+        
+        Returns:
+            True אם ה-job חזר לתור
+        """
+        try:
+            job = self.get_job_status(job_id)
+            if not job or job["status"] in TERMINAL_STATUSES:
+                return False
+            
+            job["status"] = "PENDING"
+            job.pop("retry_at", None)
+            if completed_files:
+                job["partial_files"] = completed_files
+            if usage:
+                job["token_usage"] = self._job_usage(job, usage)
+            job["handoffs"] = job.get("handoffs", 0) + 1
+            job["updated_at"] = datetime.now().isoformat()
+            self._save_job(job_id, job)
+            
+            since = datetime.fromisoformat(job["created_at"]).timestamp()
+            self.scheduler.enqueue(
+                job["lane"], job["owner"], job_id, job.get("estimated_cost", 0),
+                since=since, expires_at=job.get("deadline")
+            )
+            logger.info(f"Job {job_id} returned to the queue")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to requeue {job_id}: {e}")
+            return False
+    
+    def stop_workers(self):
+        """עצירת workers"""
+        self.is_running = False
+        self._withdraw_lane_metrics()
+        if self.autoscaler:
+            self.autoscaler.stop()
+        if self.cpu_executor:
+            self.cpu_executor.shutdown(wait=False)
+        pipeline.shutdown()
+        logger.info("Stopping workers...")
+    
+    def _dispatcher_housekeeping(self):
+        """עבודות מחזוריות של ה-dispatcher - החזרת jobs מושהים ופרסום מדדי ה-pipeline והמסלולים"""
+        self._promote_delayed_jobs()
+        
+        now = time.time()
+        if now >= self._next_metrics_publish:
+            self._next_metrics_publish = now + 5
+            self._publish_pipeline_metrics()
+            # גם heartbeat - instance חי מפרסם לפני שהמדדים שלו נחשבים ישנים
+            self._publish_lane_metrics()
+    
+    def _promote_delayed_jobs(self) -> int:
+        """
+        החזרת jobs מושהים שהגיע זמנם לתור ההוגן (לכל היותר פעם בשנייה)
+        
+        Returns:
+            מספר ה-jobs שחזרו לתור
+        """
+        now = time.time()
+        if now < self._next_promotion:
+            return 0
+        self._next_promotion = now + 1
+        
+        promoted = 0
+        for job_id in self.scheduler.claim_due():
+            job = self.get_job_status(job_id)
+            if not job or job["status"] in TERMINAL_STATUSES:
+                continue
+            since = datetime.fromisoformat(job["created_at"]).timestamp()
+            self.scheduler.enqueue(
+                job["lane"], job["owner"], job_id, job.get("estimated_cost", 0),
+                since=since, expires_at=job.get("deadline")
+            )
+            promoted += 1
+        
+        if promoted:
+            logger.info(f"Requeued {promoted} delayed jobs")
+        return promoted
+    
+    def _dispatch_loop(self):
+        """
+        לולאת ה-dispatcher - מושך job מהמסלולים שיש להם slot פנוי ומעביר ל-worker פנוי
+        """
+        logger.info("Dispatcher started")
+        
+        while self.is_running and not self.draining:
+            try:
+                self._dispatcher_housekeeping()
+                self._slot_freed.clear()
+                lanes = self.lane_capacity.pollable_lanes()
+                if not lanes:
+                    self._slot_freed.wait(timeout=1)
+                    continue
+                
+                # BLPOP על ה-tokens בודק את המפתחות לפי הסדר - מסלול ה-latency קודם
+                # timeout קצר כי רשימת המסלולים המותרים משתנה כשמשתחרר slot
+                result = self.blocking_client.blpop([FairScheduler.ready_key(lane) for lane in lanes], timeout=2)
+                
+                if not result:
+                    continue
+                
+                # ה-token רק מעיר את ה-dispatcher - ה-job עצמו נבחר לפי הסבב ההוגן
+                lane = FairScheduler.lane_from_ready_key(result[0])
+                popped, expired = self.scheduler.pop(lane)
+                if expired:
+                    self._expire_queued_jobs(expired)
+                if not popped:
+                    continue
+                
+                owner, job_id = popped
+                self.lane_capacity.acquire(lane)
+                self.local_jobs.put((lane, job_id))
+            
+            except Exception as e:
+                logger.error(f"Dispatcher error: {e}")
+                time.sleep(1)
+        
+        logger.info("Dispatcher stopped")
+    
+    def _worker_loop(self, worker_id: int):
+        """
+        לולאת worker - מעבד jobs שה-dispatcher העביר
+        
+        Args:
+            worker_id: מזהה worker
+        """
+        logger.info(f"Worker {worker_id} started")
+        
+        # worker עודף (אחרי scale down) יוצא בסיבוב הבא
+        while self.is_running and worker_id < self.target_workers:
+            try:
+                lane, job_id = self.local_jobs.get(timeout=1)
+            except queue.Empty:
+                continue
+            
+            logger.info(f"Worker {worker_id} processing {job_id} (lane={lane})")
+            
+            # עיבוד ה-job - רק jobs שרצו בפועל נכנסים להערכת הזמן של ה-autoscaler
+            started = time.time()
+            ran = False
+            try:
+                ran = self._process_job(job_id)
+            except Exception as e:
+                logger.error(f"Worker {worker_id} error: {e}")
+            finally:
+                if ran:
+                    self.recent_latencies.append(time.time() - started)
+                self.lane_capacity.release(lane)
+                self._slot_freed.set()
+        
+        logger.info(f"Worker {worker_id} stopped")
+    
+    def _run_async_engine(self, max_in_flight: int):
+        """הרצת ה-event loop של ה-worker האסינכרוני (ב-thread נפרד)"""
+        self.async_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.async_loop)
+        try:
+            self.async_loop.run_until_complete(self._async_dispatcher(max_in_flight))
+        except Exception as e:
+            logger.error(f"Async worker engine crashed: {e}")
+        finally:
+            self.async_loop.close()
+            logger.info("Async worker engine stopped")
+    
+    async def _async_dispatcher(self, max_in_flight: int):
+        """
+        משיכת jobs מהמסלולים כל עוד יש להם slot פנוי, והרצת כל job כ-task
+        
+        Args:
+            max_in_flight: מספר jobs מקסימלי במקביל
+        """
+        client = redis_factory.async_client("blocking")
+        slot_freed = asyncio.Event()
+        tasks = set()
+        
+        def on_done(task: asyncio.Task, lane: str):
+            tasks.discard(task)
+            self.lane_capacity.release(lane)
+            slot_freed.set()
+        
+        try:
+            while self.is_running and not self.draining:
+                try:
+                    await asyncio.to_thread(self._dispatcher_housekeeping)
+                except Exception as e:
+                    logger.error(f"Dispatcher housekeeping failed: {e}")
+                
+                slot_freed.clear()
+                lanes = self.lane_capacity.pollable_lanes()
+                if not lanes:
+                    try:
+                        await asyncio.wait_for(slot_freed.wait(), timeout=1)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                try:
+                    result = await client.blpop([FairScheduler.ready_key(lane) for lane in lanes], timeout=2)
+                    if not result:
+                        continue
+                    
+                    lane = FairScheduler.lane_from_ready_key(result[0])
+                    popped, expired = await asyncio.to_thread(self.scheduler.pop, lane)
+                    if expired:
+                        await asyncio.to_thread(self._expire_queued_jobs, expired)
+                except Exception as e:
+                    logger.error(f"Async dispatcher error: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                
+                if not popped:
+                    continue
+                
+                owner, job_id = popped
+                self.lane_capacity.acquire(lane)
+                logger.info(f"Async worker processing {job_id} (lane={lane}, owner={owner}, {len(tasks) + 1}/{max_in_flight} in flight)")
+                
+                task = asyncio.create_task(self._timed_job_async(job_id))
+                tasks.add(task)
+                task.add_done_callback(lambda t, lane=lane: on_done(t, lane))
+            
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            await redis_factory.close_async_client(client)
+    
+    async def _timed_job_async(self, job_id: str):
+        """עיבוד job ב-event loop עם מדידת זמן (רק jobs שרצו בפועל)"""
+        started = time.time()
+        if await self._process_job_async(job_id):
+            self.recent_latencies.append(time.time() - started)
+    
+    def _process_job(self, job_id: str):
+        """
+        עיבוד job בודד
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            True אם ה-job רץ בפועל (לא דולג, בוטל לפני שהתחיל או לא נמצא)
+        """
+        rendering = False
+        job = None
+        try:
+            job = self._start_job(job_id)
+            if not job:
+                return False
+            
+            ctx = self._job_context(job_id, job)
+            try:
+                questions = generator_service.generate_questions(
+                    job["text"], job["question_count"], job.get("file_info"), ctx=ctx
+                )
+            except JobCancelledError:
+                logger.info(f"Job {job_id} stopped after cancellation")
+                self._settle_stopped_job(job_id, ctx)
+                return True
+            except DeadlineExceededError:
+                self._fail_deadline(job_id)
+                return True
+            except RetryLaterError as e:
+                self._requeue_later(job_id, ctx, e)
+                return True
+            except Exception as e:
+                self._fail_generation(job_id, e)
+                return True
+            
+            # rendering ושמירה בשלב הבא - ה-slot של היצירה משתחרר מיד
+            pipeline.submit_render(self._render_stage, job_id, job, questions)
+            rendering = True
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to process job {job_id}: {e}")
+            self.update_job_status(job_id, "FAILED", error=str(e))
+            return job is not None
+        finally:
+            if not rendering:
+                self._release_active(job_id)
+    
+    async def _process_job_async(self, job_id: str):
+        """
+        עיבוד job בודד ב-event loop
+        קריאות Redis קצרות רצות ב-thread, rendering בשלב ה-render של ה-pipeline
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            True אם ה-job רץ בפועל (לא דולג, בוטל לפני שהתחיל או לא נמצא)
+        """
+        rendering = False
+        job = None
+        try:
+            job = await asyncio.to_thread(self._start_job, job_id)
+            if not job:
+                return False
+            
+            ctx = self._job_context(job_id, job)
+            try:
+                questions = await generator_service.generate_questions_async(
+                    job["text"], job["question_count"], job.get("file_info"),
+                    executor=self.cpu_executor, ctx=ctx
+                )
+            except JobCancelledError:
+                logger.info(f"Job {job_id} stopped after cancellation")
+                await asyncio.to_thread(self._settle_stopped_job, job_id, ctx)
+                return True
+            except DeadlineExceededError:
+                await asyncio.to_thread(self._fail_deadline, job_id)
+                return True
+            except RetryLaterError as e:
+                await asyncio.to_thread(self._requeue_later, job_id, ctx, e)
+                return True
+            except Exception as e:
+                await asyncio.to_thread(self._fail_generation, job_id, e)
+                return True
+            
+            pipeline.submit_render(self._render_stage, job_id, job, questions)
+            rendering = True
+            return True
+        
+        except Exception as e:
+            logger.error(f"Failed to process job {job_id}: {e}")
+            await asyncio.to_thread(self.update_job_status, job_id, "FAILED", str(e))
+            return job is not None
+        finally:
+            if not rendering:
+                self._release_active(job_id)
+    
+    def _start_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        טעינת job וסימון כ-PROCESSING
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            Job data או None אם לא נמצא
+        """
+        # קבלת job data
+        job = self.get_job_status(job_id)
+        if not job:
+            logger.error(f"Job {job_id} not found")
+            return None
+        
+        # job שבוטל בין השליפה מהתור לתחילת העיבוד
+        if job["status"] == "CANCELLED" or self.is_cancelled(job_id):
+            logger.info(f"Skipping cancelled job {job_id}")
+            return None
+        
+        # התהליך ב-drain - ה-job חוזר לתור ל-instance אחר
+        if self.draining:
+            self._requeue_now(job_id)
+            return None
+        
+        # job שחיכה בתור עד שעבר ה-deadline שלו - אין טעם להתחיל
+        if job.get("deadline") and time.time() + config.GEMINI_MIN_ATTEMPT_SECONDS > job["deadline"]:
+            self._fail_deadline(job_id)
+            return None
+        
+        # עדכון סטטוס ל-PROCESSING - המודל נקבע בריצה הראשונה ונשמר גם אחרי requeue
+        job["status"] = "PROCESSING"
+        job.setdefault("model", token_budget.select_model())
+        job["started_at"] = time.time()
+        job["updated_at"] = datetime.now().isoformat()
+        self._save_job(job_id, job)
+        
+        # יצירת שאלות עם Gemini
+        logger.info(f"Generating {job['question_count']} questions for {job_id}")
+        return job
+    
+    def _job_context(self, job_id: str, job: Dict[str, Any]) -> GenerationContext:
+        """
+        הקשר היצירה של job - deadline, בדיקת ביטול, ותוצאות של קבצים שהושלמו לפני requeue
+        
+        Args:
+            job_id: מזהה job
+            job: Job data
+        
+        Returns:
+            GenerationContext
+        """
+        ctx = GenerationContext(
+            deadline=job.get("deadline"),
+            cancel_check=lambda: job_id in self._handed_off or self.is_cancelled(job_id),
+            defer_rate_limits=True,
+            completed_files=job.get("partial_files") or {},
+            on_progress=self._progress_reporter(job_id),
+            owner=job.get("owner"),
+            model=job.get("model")
+        )
+        with self._active_lock:
+            self.active_jobs[job_id] = ctx
+        return ctx
+    
+    def _release_active(self, job_id: str):
+        """הסרת job מה-jobs הפעילים של התהליך (סיום, כשל או העברה)"""
+        with self._active_lock:
+            self.active_jobs.pop(job_id, None)
+            self._handed_off.discard(job_id)
+    
+    def _progress_reporter(self, job_id: str):
+        """
+        callback לאירועי ההתקדמות של ה-generator - מצב ההתקדמות נשמר ב-job_progress:{job_id}
+        (מפתח נפרד, כדי שעדכון התקדמות לא ידרוס שינוי סטטוס כמו ביטול)
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            פונקציה (event, data)
+        """
+        progress = new_progress()
+        lock = threading.Lock()
+        
+        def report(event: str, data: Dict[str, Any]):
+            with lock:
+                apply_progress_event(progress, event, data)
+                snapshot = codec.dumps(progress)
+            pipe = self.redis_client.pipeline()
+            pipe.setex(f"job_progress:{tagged(job_id)}", config.JOB_TIMEOUT, snapshot)
+            pipe.publish(job_events_channel(job_id), event)
+            pipe.execute()
+        
+        return report
+    
+    def get_job_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        מצב ההתקדמות של job (קבצים שהושלמו, שאלות שהתקבלו, זמנים וניסיונות חוזרים)
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            מצב ההתקדמות או None אם עוד אין
+        """
+        try:
+            return codec.loads(self.binary_client.get(f"job_progress:{tagged(job_id)}"))
+        except Exception as e:
+            logger.debug(f"Failed to get progress for {job_id}: {e}")
+            return None
+    
+    def _requeue_later(self, job_id: str, ctx: GenerationContext, error: RetryLaterError):
+        """
+        השהיית job אחרי rate limit - ה-worker משתחרר ל-jobs אחרים וה-job חוזר לתור כשמגיע זמנו
+        
+        Args:
+            job_id: מזהה job
+            ctx: הקשר היצירה (עם הקבצים שכבר הושלמו)
+            error: שגיאת ה-rate limit עם זמן ההמתנה המוצע
+        """
+        job = self.get_job_status(job_id)
+        if not job or job["status"] in TERMINAL_STATUSES:
+            return
+        
+        requeues = job.get("requeues", 0)
+        delay = max(error.delay, config.REQUEUE_BASE_DELAY * (2 ** requeues))
+        run_at = time.time() + delay
+        
+        if requeues >= config.JOB_MAX_REQUEUES or not ctx.has_time_for(delay):
+            logger.error(f"Rate limit exceeded for {job_id}, giving up after {requeues} requeues")
+            self.update_job_status(job_id, "FAILED", error="השירות עמוס כרגע. אנא נסה שוב בעוד כמה דקות")
+            return
+        
+        job["status"] = "PENDING"
+        job["requeues"] = requeues + 1
+        job["retry_at"] = run_at
+        job["partial_files"] = ctx.completed_files
+        job["token_usage"] = self._job_usage(job, ctx.usage)
+        job["updated_at"] = datetime.now().isoformat()
+        self._save_job(job_id, job)
+        self.scheduler.schedule(job_id, run_at)
+        
+        logger.warning(f"Rate limit for {job_id}, requeued in {delay:.0f}s (requeue {requeues + 1}/{config.JOB_MAX_REQUEUES})")
+    
+    def _fail_deadline(self, job_id: str):
+        """סימון job ככושל כשלא נשאר זמן לסיים אותו לפני ה-deadline"""
+        logger.error(f"Job {job_id} abandoned - deadline exceeded")
+        self.update_job_status(job_id, "FAILED", error="הזמן הקצוב ליצירת המבחן עבר. נסה שוב עם פחות שאלות")
+    
+    def _fail_generation(self, job_id: str, error: Exception):
+        """
+        סימון job ככושל אחרי שגיאה ביצירת השאלות
+        
+        Args:
+            job_id: מזהה job
+            error: השגיאה שהתקבלה
+        """
+        error_msg = str(error)
+        if "429" in error_msg or "Resource exhausted" in error_msg:
+            logger.error(f"Rate limit exceeded for {job_id}: {error}")
+            self.update_job_status(job_id, "FAILED", error="השירות עמוס כרגע. אנא נסה שוב בעוד כמה דקות")
+        else:
+            logger.error(f"Unexpected error for {job_id}: {error}")
+            self.update_job_status(job_id, "FAILED", error="שגיאה ביצירת שאלות. אנא נסה שוב")
+    
+    def _render_stage(self, job_id: str, job: Dict[str, Any], questions: Optional[List[Any]]):
+        """
+        שלב ה-render של ה-pipeline - רץ ב-pool נפרד מה-workers של היצירה
+        
+        Args:
+            job_id: מזהה job
+            job: Job data
+            questions: השאלות שנוצרו
+        """
+        try:
+            self._complete_job(job_id, job, questions)
+        except Exception as e:
+            logger.error(f"Failed to render job {job_id}: {e}")
+            self.update_job_status(job_id, "FAILED", error="שגיאה ביצירת קובץ המבחן. אנא נסה שוב")
+        finally:
+            self._release_active(job_id)
+    
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        """
+        מדדי backlog לכל שלב ב-pipeline וזיהוי צוואר הבקבוק
+        
+        Returns:
+            stages (extract / generate / render) ו-bottleneck
+        """
+        queue_stats = self.get_queue_stats()
+        stages = pipeline.snapshot()
+        stages["generate"] = {
+            "workers": self.lane_capacity.total,
+            "pending": queue_stats["queue_length"] + queue_stats["busy_workers"],
+            "backlog": queue_stats["queue_length"],
+            "avg_seconds": round(queue_stats["avg_latency_seconds"], 2)
+        }
+        
+        # צוואר הבקבוק - השלב עם הכי הרבה עבודה ממתינה ביחס ל-workers שלו
+        bottleneck = max(stages, key=lambda name: stages[name]["backlog"] / max(1, stages[name]["workers"]))
+        return {
+            "stages": stages,
+            "bottleneck": bottleneck if stages[bottleneck]["backlog"] > 0 else None
+        }
+    
+    def _publish_pipeline_metrics(self):
+        """פרסום מדדי ה-pipeline ל-Redis עבור /metrics"""
+        try:
+            self.redis_client.setex("metrics:pipeline", 60, json.dumps(self.get_pipeline_stats()))
+        except Exception as e:
+            logger.debug(f"Failed to publish pipeline metrics: {e}")
+    
+    def _complete_job(self, job_id: str, job: Dict[str, Any], questions: Optional[List[Any]]):
+        """
+        שמירת השאלות כנתונים ב-ResultStore וסימון ה-job כ-COMPLETED
+        
+        ה-HTML לא נשמר כקובץ מקומי - הוא נוצר לפי דרישה מהשאלות השמורות,
+        כך שכל node יכול למסור את התוצאה.
+        
+        Args:
+            job_id: מזהה job
+            job: Job data
+            questions: השאלות שנוצרו
+        """
+        if self.is_cancelled(job_id):
+            logger.info(f"Job {job_id} cancelled before completion")
+            with self._active_lock:
+                ctx = self.active_jobs.get(job_id)
+            if ctx is not None:
+                self._settle_stopped_job(job_id, ctx)
+            return
+        
+        if job_id in self._handed_off:
+            logger.info(f"Job {job_id} was handed off during drain, dropping local result")
+            return
+        
+        if not questions:
+            self.update_job_status(job_id, "FAILED", error="כשל ביצירת שאלות. אנא נסה שוב")
+            return
+        
+        # מאגר ספקולטיבי נשמר במלואו גם אם אומץ - הצמצום לבקשה של המשתמש קורה בקריאה (_narrow_adopted)
+        if not self.results.save_questions(job_id, questions, job.get("metadata", {})):
+            self.update_job_status(job_id, "FAILED", error="Failed to save quiz results")
+            return
+        
+        # מבחן HTML - ה-rendering הראשון קורה כאן כדי שה-cache יהיה חם כשה-handler יבקש אותו
+        if job.get("job_type") == "html":
+            logger.info(f"Rendering HTML for {job_id}")
+            self.results.render_html(job_id)
+        
+        # עדכון סטטוס ל-COMPLETED
+        self.update_job_status(job_id, "COMPLETED", result_count=len(questions))
+        self._record_service_time(job["lane"], time.time() - job["started_at"])
+        logger.info(f"Job {job_id} completed successfully")
 
 
 # Global instance
@@ -0,0 +1,149 @@
+"""
+Quota Service
+מכסה למשתמש לפי העלות המשוערת של הבקשה במודל - נתפסת בכניסה לתור ומתוקנת לפי השימוש בפועל
+"""
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import config
+from utils.logger import logger
+from services.generator_service import GeneratorService
+from services.rate_limiter import SlidingWindowLimiter
+from services.token_budget import cost_units
+
+
+class QuotaExceededError(Exception):
+    """הבקשה חורגת ממכסת העלות של המשתמש - ה-job נדחה לפני שנכנס לתור"""
+    
+    def __init__(self, requested: int, affordable: int, reset_seconds: float):
+        super().__init__(f"quota exceeded for {requested} questions, {affordable} affordable, reset in {reset_seconds:.0f}s")
+        self.requested = requested
+        self.affordable = affordable
+        self.reset_seconds = reset_seconds
+
+
+class QuotaService:
+    """
+    מכסת עלות למשתמש בחלונות נגללים (שעה ויום)
+    
+    בקשה של 50 שאלות מספר של 200 עמודים ובקשה של 5 שאלות מפסקה אחת עולות במודל
+    סדרי גודל שונים, ולכן המכסה נמדדת ביחידות עלות: input tokens (לפי אורך הטקסט שנשלח)
+    ועוד output tokens צפויים לפי מספר השאלות, במשקל QUOTA_OUTPUT_TOKEN_WEIGHT.
+    העלות המשוערת נתפסת כשה-job נכנס לתור (מזהה השימוש = job_id), ובסיום מתוקנת
+    לפי ה-tokens שנצרכו בפועל - job שבוטל לפני שרץ מקבל החזר מלא.
+    """
+    
+    def __init__(self, redis_client):
+        """
+        Args:
+            redis_client: Redis client (decode_responses=True)
+        """
+        self.limiter = SlidingWindowLimiter(redis_client, prefix="quota_window")
+    
+    @staticmethod
+    def windows() -> List[Tuple[str, int, float]]:
+        """חלונות המכסה (שם, שניות, יחידות)"""
+        return [
+            ("hour", 3600, config.QUOTA_UNITS_PER_HOUR),
+            ("day", 86400, config.QUOTA_UNITS_PER_DAY)
+        ]
+    
+    @staticmethod
+    def units(input_tokens: float, output_tokens: float) -> int:
+        """יחידות העלות של מספר tokens"""
+        return int(round(cost_units(input_tokens, output_tokens)))
+    
+    @staticmethod
+    def estimate(texts: List[str], question_count: int) -> Dict[str, int]:
+        """
+        הערכת העלות של job לפני שהוא רץ
+        
+        Args:
+            texts: הטקסטים שיישלחו למודל (קריאה אחת לכל טקסט)
+            question_count: מספר השאלות
+        
+        Returns:
+            {"input_tokens", "output_tokens", "units"}
+        """
+        # כל קובץ נשלח בקריאה נפרדת, חתוך כמו ב-prompt ועם ההוראות הקבועות
+        input_tokens = sum(
+            min(len(text), GeneratorService.PROMPT_MAX_CHARS) / config.QUOTA_CHARS_PER_TOKEN + config.QUOTA_PROMPT_TOKENS
+            for text in texts
+        )
+        output_tokens = question_count * config.QUOTA_OUTPUT_TOKENS_PER_QUESTION
+        return {
+            "input_tokens": int(input_tokens),
+            "output_tokens": output_tokens,
+            "units": QuotaService.units(input_tokens, output_tokens)
+        }
+    
+    @staticmethod
+    def _affordable_questions(remaining: float, input_tokens: int, question_count: int) -> int:
+        """
+        כמה שאלות מאותם קבצים עדיין נכנסות במכסה שנשארה
+        
+        Returns:
+            מספר שאלות (0 אם פחות מ-MIN_QUESTIONS)
+        """
+        per_question = QuotaService.units(0, config.QUOTA_OUTPUT_TOKENS_PER_QUESTION)
+        affordable = int((remaining - input_tokens) // per_question)
+        affordable = min(affordable, question_count - 1)
+        return affordable if affordable >= config.MIN_QUESTIONS else 0
+    
+    def reserve(self, subject: str, job_id: str, texts: List[str], question_count: int) -> Optional[Dict[str, Any]]:
+        """
+        תפיסת העלות המשוערת של job מהמכסה של המשתמש
+        
+        Args:
+            subject: מזהה המשתמש (owner של ה-job)
+            job_id: מזהה ה-job (מזהה השימוש בחלונות)
+            texts: הטקסטים שיישלחו למודל
+            question_count: מספר השאלות
+        
+        Returns:
+            רשומת התפיסה {"subject", "units"} לשמירה ב-job, או None אם המכסה לא פעילה
+        
+        Raises:
+            QuotaExceededError: הבקשה לא נכנסת במכסה - עם מה שעדיין אפשר ומתי המכסה מתחדשת
+        """
+        if not config.QUOTA_ENABLED:
+            return None
+        
+        estimate = self.estimate(texts, question_count)
+        try:
+            result = self.limiter.acquire(subject, self.windows(), estimate["units"], entry_id=job_id)
+        except Exception as e:
+            logger.error(f"Quota check failed for {subject}: {e}")
+            return None  # במקרה של שגיאה, נאפשר
+        
+        if not result["allowed"]:
+            windows = result["windows"].values()
+            remaining = min(window["remaining"] for window in windows)
+            reset_seconds = max(window["reset_seconds"] for window in windows)
+            affordable = self._affordable_questions(remaining, estimate["input_tokens"], question_count)
+            logger.info(f"Quota exceeded for {subject}: {estimate['units']} units requested, {remaining:.0f} left")
+            raise QuotaExceededError(question_count, affordable, reset_seconds)
+        
+        return {"subject": subject, "units": estimate["units"]}
+    
+    def settle(self, job_id: str, reservation: Dict[str, Any], usage: Optional[Dict[str, int]]) -> bool:
+        """
+        תיקון התפיסה לפי ה-tokens שנצרכו בפועל
+        
+        Args:
+            job_id: מזהה ה-job
+            reservation: רשומת התפיסה מ-reserve
+            usage: {"input_tokens", "output_tokens"} שנצרכו (None / ריק = החזר מלא)
+        
+        Returns:
+            True אם התפיסה עודכנה
+        """
+        actual = self.units(usage.get("input_tokens", 0), usage.get("output_tokens", 0)) if usage else 0
+        try:
+            adjusted = self.limiter.adjust(
+                reservation["subject"], self.windows(), job_id, reservation["units"], actual
+            )
+            logger.info(f"Quota for {job_id} settled: estimated {reservation['units']}, actual {actual}")
+            return adjusted
+        except Exception as e:
+            logger.error(f"Failed to settle quota for {job_id}: {e}")
+            return False
@@ -0,0 +1,151 @@
+"""
+Rate Limiter
+הגבלת קצב עם חלונות נגללים - בדיקה וצריכה של כל החלונות בקריאה אטומית אחת ל-Redis
+"""
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+
+from utils.keys import tagged
+
+# בדיקה וצריכה של כמה חלונות נגללים יחד. לכל חלון zset של שימושים (member = <id>:<cost>, score = זמן).
+# ARGV: now, cost, id, ואז לכל חלון (KEYS[i]) זוג window_seconds, limit.
+# השימוש נרשם רק אם הוא נכנס בכל החלונות. מחזיר {allowed, used_1, reset_1, used_2, reset_2, ...}
+# כאשר reset הוא מספר השניות עד שיתפנה בחלון מספיק מקום לבקשה (0 אם כבר יש)
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local member = ARGV[3] .. ':' .. ARGV[2]
+local allowed = 1
+local result = {}
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[2 + i * 2])
+    local limit = tonumber(ARGV[3 + i * 2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local entries = redis.call('ZRANGE', key, 0, -1, 'WITHSCORES')
+    local used = 0
+    for j = 1, #entries, 2 do
+        used = used + tonumber(string.match(entries[j], ':([^:]+)$'))
+    end
+    local need = used + cost - limit
+    local reset_at = now
+    if need > 0 then
+        allowed = 0
+        local freed = 0
+        for j = 1, #entries, 2 do
+            freed = freed + tonumber(string.match(entries[j], ':([^:]+)$'))
+            reset_at = tonumber(entries[j + 1]) + window
+            if freed >= need then
+                break
+            end
+        end
+    end
+    table.insert(result, tostring(used))
+    table.insert(result, tostring(reset_at - now))
+end
+if allowed == 1 then
+    for i, key in ipairs(KEYS) do
+        redis.call('ZADD', key, now, member)
+        redis.call('EXPIRE', key, math.ceil(tonumber(ARGV[2 + i * 2])))
+    end
+end
+return {allowed, unpack(result)}
+"""
+
+# תיקון העלות של שימוש שכבר נרשם (למשל לפי השימוש בפועל) - באותו זמן שבו נרשם.
+# ARGV: id, old_cost, new_cost. עלות 0 מסירה את השימוש. מחזיר את מספר החלונות שעודכנו
+ADJUST_SCRIPT = """
+local old_member = ARGV[1] .. ':' .. ARGV[2]
+local new_cost = tonumber(ARGV[3])
+local adjusted = 0
+for _, key in ipairs(KEYS) do
+    local score = redis.call('ZSCORE', key, old_member)
+    if score then
+        redis.call('ZREM', key, old_member)
+        if new_cost > 0 then
+            redis.call('ZADD', key, score, ARGV[1] .. ':' .. ARGV[3])
+        end
+        adjusted = adjusted + 1
+    end
+end
+return adjusted
+"""
+
+
+class SlidingWindowLimiter:
+    """
+    מגביל קצב מעל Redis עם חלונות נגללים (sliding log)
+    
+    בניגוד למונים עם TTL, החלון זז עם הזמן - אין רגע שבו כל המכסה מתאפסת בבת אחת,
+    והבדיקה והצריכה אטומיות, כך ששתי בקשות במקביל לא יכולות לעבור שתיהן על המכסה האחרונה.
+    """
+    
+    def __init__(self, redis_client, prefix: str = "rate_window"):
+        """
+        Args:
+            redis_client: Redis client (decode_responses=True)
+            prefix: תחילית המפתחות
+        """
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self._acquire = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+        self._adjust = redis_client.register_script(ADJUST_SCRIPT)
+    
+    def _key(self, subject: str, window_name: str) -> str:
+        # כל החלונות של נבדק באותו slot - הסקריפט ניגש לכולם יחד
+        return f"{self.prefix}:{tagged(subject)}:{window_name}"
+    
+    def acquire(self, subject: str, windows: List[Tuple[str, int, float]], cost: float = 1.0,
+                entry_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        צריכת cost מכל החלונות - רק אם הבקשה נכנסת בכולם
+        
+        Args:
+            subject: מזהה הנבדק (למשל chat_id)
+            windows: רשימת (שם, אורך החלון בשניות, מכסה)
+            cost: כמה מהמכסה הבקשה צורכת
+            entry_id: מזהה השימוש (לתיקון העלות אחר כך ב-adjust) - ברירת מחדל מזהה אקראי
+        
+        Returns:
+            {"allowed": bool, "entry_id": str, "windows": {שם: {"limit", "used", "remaining", "reset_seconds"}}}
+            (used כולל את הבקשה הנוכחית אם היא אושרה)
+        """
+        entry_id = entry_id or uuid.uuid4().hex
+        args = [time.time(), cost, entry_id]
+        for _, seconds, limit in windows:
+            args.extend([seconds, limit])
+        
+        reply = self._acquire(keys=[self._key(subject, name) for name, _, _ in windows], args=args)
+        allowed = int(reply[0]) == 1
+        
+        usage = {}
+        for i, (name, _, limit) in enumerate(windows):
+            used = float(reply[1 + i * 2]) + (cost if allowed else 0)
+            usage[name] = {
+                "limit": limit,
+                "used": used,
+                "remaining": max(0.0, limit - used),
+                "reset_seconds": float(reply[2 + i * 2])
+            }
+        return {"allowed": allowed, "entry_id": entry_id, "windows": usage}
+    
+    def adjust(self, subject: str, windows: List[Tuple[str, int, float]], entry_id: str,
+               old_cost: float, new_cost: float) -> bool:
+        """
+        תיקון העלות של שימוש שאושר - השימוש נשאר באותו מקום בחלון, רק העלות משתנה
+        
+        Args:
+            subject: מזהה הנבדק
+            windows: אותם חלונות שנשלחו ל-acquire
+            entry_id: מזהה השימוש שהחזיר acquire
+            old_cost: העלות שנרשמה (בדיוק כפי שנשלחה ל-acquire)
+            new_cost: העלות המתוקנת (0 = החזר מלא)
+        
+        Returns:
+            True אם השימוש נמצא (בחלון אחד לפחות - שימוש ישן כבר יצא מהחלונות הקצרים)
+        """
+        reply = self._adjust(
+            keys=[self._key(subject, name) for name, _, _ in windows],
+            args=[entry_id, old_cost, new_cost]
+        )
+        return int(reply) > 0
@@ -0,0 +1,387 @@
+"""
+Redis client factory
+pool חיבורים משותף לכל השירותים - עם timeouts, reconnect עם backoff ומדדי שימוש
+"""
+import threading
+from typing import Optional, Dict, Any, List, Tuple, Union
+
+import redis
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster, ClusterNode as AsyncClusterNode
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.asyncio.sentinel import Sentinel as AsyncSentinel
+from redis.backoff import ExponentialBackoff
+from redis.cluster import RedisCluster, ClusterNode
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from redis.retry import Retry
+from redis.sentinel import Sentinel, SentinelConnectionPool
+
+from config import config
+from utils.logger import logger
+from services.embedded_store import EmbeddedStore, EmbeddedRedis, AsyncEmbeddedRedis
+
+# שגיאות שאחריהן מתחברים מחדש ומנסים שוב
+RETRY_ON_ERRORS = [RedisConnectionError, RedisTimeoutError]
+
+# סוגי ה-pools:
+# request - פעולות קצרות של handlers, web ו-workers (decode_responses)
+# binary - ערכים בינאריים (טקסט דחוס של מסמכים)
+# blocking - BLPOP של ה-dispatcher ו-pub/sub, שמחזיקים חיבור לאורך זמן ולא צריכים לחסום את ה-request path
+POOL_KINDS = ("request", "binary", "blocking")
+
+# backends: redis, embedded (store בתוך התהליך), auto (embedded אם Redis לא עונה בעלייה)
+STORAGE_BACKENDS = ("redis", "embedded", "auto")
+
+# טופולוגיות Redis: שרת יחיד, master שמתגלה דרך Sentinel, או Redis Cluster
+REDIS_MODES = ("standalone", "sentinel", "cluster")
+
+
+def _parse_nodes(value: str) -> List[Tuple[str, int]]:
+    """"host:port,host:port" -> [(host, port)]"""
+    nodes = []
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            host, _, port = item.rpartition(":")
+            nodes.append((host, int(port)) if host else (item, 6379))
+    return nodes
+
+
+class RedisClientFactory:
+    """
+    יצירת Redis clients מעל pools משותפים לתהליך
+    
+    כל סוג חיבור מקבל BlockingConnectionPool משלו: כשה-pool מלא בקשה ממתינה עד
+    REDIS_POOL_TIMEOUT לחיבור פנוי במקום לפתוח חיבורים ללא הגבלה. ה-pools נוצרים
+    בשימוש הראשון, כך ש-import של שירות לא פותח חיבור.
+    
+    REDIS_MODE קובע את הטופולוגיה: ב-sentinel ה-master מתגלה דרך ה-Sentinels ומתחלף
+    אוטומטית ב-failover; ב-cluster ה-client מנתב כל פקודה ל-shard לפי ה-slot של המפתח
+    (עם pool לכל node). פקודות על כמה מפתחות חייבות להיות באותו slot - ראו utils.keys.tagged.
+    
+    עם STORAGE_BACKEND=embedded (או auto כש-Redis לא זמין) כל ה-clients הם EmbeddedRedis
+    מעל store אחד בתוך התהליך - אותן פקודות ואותם TTLs, בלי רשת. מתאים ל-instance יחיד
+    (למשל web_app_render שמריץ גם את הבוט); תהליכים נפרדים לא רואים את אותם נתונים.
+    """
+    
+    def __init__(self):
+        self._pools: Dict[str, redis.ConnectionPool] = {}
+        self._clients: Dict[str, Union[redis.Redis, RedisCluster, EmbeddedRedis]] = {}
+        self._lock = threading.Lock()
+        self._backend: Optional[str] = None
+        self._store: Optional[EmbeddedStore] = None
+        self._sentinel: Optional[Sentinel] = None
+    
+    # ==================== Backend ====================
+    
+    def _redis_reachable(self) -> bool:
+        """בדיקת חיבור חד-פעמית ל-Redis (ל-STORAGE_BACKEND=auto)"""
+        try:
+            return bool(self._redis_client("request").ping())
+        except Exception as e:
+            logger.warning(f"{self.describe('redis')} unreachable ({e}) - using the embedded store")
+            with self._lock:
+                self._clients.clear()
+            return False
+    
+    @property
+    def backend(self) -> str:
+        """redis / embedded - נקבע פעם אחת לכל התהליך"""
+        if self._backend is None:
+            backend = config.STORAGE_BACKEND
+            if backend not in STORAGE_BACKENDS:
+                raise ValueError(f"Unknown storage backend: {backend}")
+            if config.REDIS_MODE not in REDIS_MODES:
+                raise ValueError(f"Unknown Redis mode: {config.REDIS_MODE}")
+            if backend == "auto":
+                backend = "redis" if self._redis_reachable() else "embedded"
+            with self._lock:
+                if self._backend is None:
+                    self._backend = backend
+                    logger.info(f"Storage backend: {self.describe()}")
+        return self._backend
+    
+    @property
+    def embedded(self) -> bool:
+        """האם הנתונים נשמרים ב-store בתוך התהליך"""
+        return self.backend == "embedded"
+    
+    @property
+    def tracking_available(self) -> bool:
+        """
+        האם אפשר client-side caching עם CLIENT TRACKING - דורש חיבור ייעודי לשרת שמחזיק
+        את כל המפתחות (לא ב-store המקומי ולא ב-Cluster, שבו ה-tracking הוא לכל node)
+        """
+        return self.backend == "redis" and config.REDIS_MODE != "cluster"
+    
+    def describe(self, backend: Optional[str] = None) -> str:
+        """תיאור ה-backend ללוגים"""
+        backend = backend or self._backend
+        if backend == "embedded":
+            return f"embedded store ({config.EMBEDDED_STORE_PATH or 'memory only'})"
+        if config.REDIS_MODE == "cluster":
+            return f"Redis Cluster via {config.REDIS_CLUSTER_NODES}"
+        if config.REDIS_MODE == "sentinel":
+            return f"Redis master '{config.REDIS_SENTINEL_MASTER}' via Sentinel {config.REDIS_SENTINELS}"
+        return f"Redis at {config.REDIS_HOST}:{config.REDIS_PORT}"
+    
+    def _embedded_client(self, kind: str) -> EmbeddedRedis:
+        """client מעל ה-store המקומי (ה-store נוצר בפעם הראשונה)"""
+        if kind not in POOL_KINDS:
+            raise ValueError(f"Unknown Redis pool kind: {kind}")
+        
+        with self._lock:
+            if self._store is None:
+                self._store = EmbeddedStore(config.EMBEDDED_STORE_PATH, config.EMBEDDED_FLUSH_INTERVAL)
+            client = self._clients.get(kind)
+            if client is None:
+                client = EmbeddedRedis(self._store, decode_responses=kind != "binary")
+                self._clients[kind] = client
+            return client
+    
+    # ==================== Redis ====================
+    
+    @staticmethod
+    def _retry(retry_cls=Retry):
+        """מדיניות reconnect - backoff מעריכי עם תקרה"""
+        return retry_cls(
+            ExponentialBackoff(cap=config.REDIS_RETRY_BACKOFF_CAP, base=config.REDIS_RETRY_BACKOFF_BASE),
+            config.REDIS_RETRY_ATTEMPTS
+        )
+    
+    @staticmethod
+    def _pool_kwargs(kind: str) -> Dict[str, Any]:
+        """הגדרות החיבור לפי סוג ה-pool"""
+        blocking = kind == "blocking"
+        return {
+            "host": config.REDIS_HOST,
+            "port": config.REDIS_PORT,
+            "decode_responses": kind != "binary",
+            "max_connections": config.REDIS_BLOCKING_MAX_CONNECTIONS if blocking else config.REDIS_MAX_CONNECTIONS,
+            "timeout": config.REDIS_POOL_TIMEOUT,
+            # BLPOP ו-pub/sub ממתינים בצד השרת - ה-socket timeout שלהם חייב להיות ארוך מההמתנה
+            "socket_timeout": config.REDIS_BLOCKING_SOCKET_TIMEOUT if blocking else config.REDIS_SOCKET_TIMEOUT,
+            "socket_connect_timeout": config.REDIS_CONNECT_TIMEOUT,
+            "socket_keepalive": True,
+            "health_check_interval": config.REDIS_HEALTH_CHECK_INTERVAL,
+            "retry_on_error": RETRY_ON_ERRORS
+        }
+    
+    def _topology_kwargs(self, kind: str) -> Dict[str, Any]:
+        """
+        הגדרות החיבור ל-Sentinel / Cluster - בלי כתובת (היא מתגלה) ובלי timeout של ה-pool,
+        כי שם ה-pools הם ConnectionPool רגילים (של ה-master או של כל node)
+        """
+        kwargs = self._pool_kwargs(kind)
+        for name in ("host", "port", "timeout"):
+            kwargs.pop(name)
+        return kwargs
+    
+    def _get_sentinel(self) -> Sentinel:
+        """ה-Sentinel של התהליך (נוצר בפעם הראשונה)"""
+        with self._lock:
+            if self._sentinel is None:
+                self._sentinel = Sentinel(
+                    _parse_nodes(config.REDIS_SENTINELS),
+                    socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT
+                )
+            return self._sentinel
+    
+    def _get_pool(self, kind: str) -> redis.ConnectionPool:
+        """ה-pool של סוג החיבור (נוצר בפעם הראשונה)"""
+        if kind not in POOL_KINDS:
+            raise ValueError(f"Unknown Redis pool kind: {kind}")
+        
+        sentinel = self._get_sentinel() if config.REDIS_MODE == "sentinel" else None
+        with self._lock:
+            pool = self._pools.get(kind)
+            if pool is None:
+                if sentinel is not None:
+                    # חיבורים ל-master הנוכחי - אחרי failover ה-pool מתחבר ל-master החדש
+                    pool = SentinelConnectionPool(
+                        config.REDIS_SENTINEL_MASTER, sentinel, retry=self._retry(), **self._topology_kwargs(kind)
+                    )
+                else:
+                    pool = redis.BlockingConnectionPool(retry=self._retry(), **self._pool_kwargs(kind))
+                self._pools[kind] = pool
+            return pool
+    
+    def _cluster_client(self, kind: str) -> RedisCluster:
+        """Redis Cluster client - מגלה את ה-shards מ-REDIS_CLUSTER_NODES ומחזיק pool לכל node"""
+        if kind not in POOL_KINDS:
+            raise ValueError(f"Unknown Redis pool kind: {kind}")
+        
+        with self._lock:
+            client = self._clients.get(kind)
+            if client is None:
+                client = RedisCluster(
+                    startup_nodes=[ClusterNode(host, port) for host, port in _parse_nodes(config.REDIS_CLUSTER_NODES)],
+                    read_from_replicas=config.REDIS_READ_FROM_REPLICAS,
+                    retry=self._retry(),
+                    **self._topology_kwargs(kind)
+                )
+                self._clients[kind] = client
+            return client
+    
+    def _redis_client(self, kind: str) -> Union[redis.Redis, RedisCluster]:
+        """Redis client לפי REDIS_MODE (אותו client לכל הקריאות מאותו סוג)"""
+        if config.REDIS_MODE == "cluster":
+            return self._cluster_client(kind)
+        
+        pool = self._get_pool(kind)
+        with self._lock:
+            client = self._clients.get(kind)
+            if client is None:
+                client = redis.Redis(connection_pool=pool)
+                self._clients[kind] = client
+            return client
+    
+    def client(self, kind: str = "request") -> Union[redis.Redis, RedisCluster]:
+        """
+        Redis client מעל ה-pool המשותף
+        
+        Args:
+            kind: request / binary / blocking
+        
+        Returns:
+            Redis client (אותו client לכל הקריאות מאותו סוג)
+        """
+        if self.embedded:
+            return self._embedded_client(kind)
+        return self._redis_client(kind)
+    
+    def async_client(self, kind: str = "blocking"):
+        """
+        Redis client ל-asyncio - pool חדש, כי pool של asyncio שייך ל-event loop שיצר אותו
+        
+        הקורא אחראי לסגור את ה-client (close_async_client).
+        
+        Args:
+            kind: request / binary / blocking
+        
+        Returns:
+            asyncio Redis client
+        """
+        if self.embedded:
+            return AsyncEmbeddedRedis(self._embedded_client(kind))
+        
+        if config.REDIS_MODE == "cluster":
+            return AsyncRedisCluster(
+                startup_nodes=[AsyncClusterNode(host, port) for host, port in _parse_nodes(config.REDIS_CLUSTER_NODES)],
+                read_from_replicas=config.REDIS_READ_FROM_REPLICAS,
+                retry=self._retry(AsyncRetry),
+                **self._topology_kwargs(kind)
+            )
+        
+        if config.REDIS_MODE == "sentinel":
+            sentinel = AsyncSentinel(
+                _parse_nodes(config.REDIS_SENTINELS),
+                socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT
+            )
+            return sentinel.master_for(
+                config.REDIS_SENTINEL_MASTER, retry=self._retry(AsyncRetry), **self._topology_kwargs(kind)
+            )
+        
+        pool = aioredis.BlockingConnectionPool(retry=self._retry(AsyncRetry), **self._pool_kwargs(kind))
+        return aioredis.Redis(connection_pool=pool)
+    
+    @staticmethod
+    async def close_async_client(client):
+        """סגירת client מ-async_client וה-pool שלו (ב-Cluster ה-client סוגר את ה-pool של כל node)"""
+        await client.close()
+        pool = getattr(client, "connection_pool", None)
+        if pool is not None:
+            await pool.disconnect()
+    
+    def connection(self, kind: str = "blocking") -> redis.Connection:
+        """
+        חיבור ייעודי מחוץ ל-pool - לחיבורים שמחזיקים מצב בשרת לאורך כל חייהם
+        (למשל מנוי להודעות invalidation), ולכן אסור שיחזרו ל-pool
+        
+        הקורא אחראי לסגור את החיבור (disconnect).
+        
+        Args:
+            kind: request / binary / blocking
+        
+        Returns:
+            Redis connection (עוד לא מחובר) - ב-Sentinel, ל-master הנוכחי
+        
+        Raises:
+            RuntimeError: ב-store המקומי וב-Cluster אין שרת אחד להתחבר אליו
+        """
+        if not self.tracking_available:
+            raise RuntimeError(f"Dedicated connections are not available with {self.describe()}")
+        
+        kwargs = self._pool_kwargs(kind)
+        kwargs.pop("max_connections")
+        kwargs.pop("timeout")
+        if config.REDIS_MODE == "sentinel":
+            kwargs["host"], kwargs["port"] = self._get_sentinel().discover_master(config.REDIS_SENTINEL_MASTER)
+        # health check שולח PING באמצע subscribe - החיבור מנוטר על ידי הקורא
+        kwargs["health_check_interval"] = 0
+        return redis.Connection(retry=self._retry(), **kwargs)
+    
+    @staticmethod
+    def _pool_usage(pool: redis.ConnectionPool) -> Dict[str, int]:
+        """חיבורים שנוצרו / פנויים / בשימוש ב-pool"""
+        if isinstance(pool, redis.BlockingConnectionPool):
+            created = len(pool._connections)
+            idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+        else:
+            idle = len(pool._available_connections)
+            created = idle + len(pool._in_use_connections)
+        return {
+            "max": pool.max_connections,
+            "created": created,
+            "idle": idle,
+            "in_use": created - idle
+        }
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """מדדי השימוש ב-pools של התהליך (או של ה-store המקומי) - לניטור"""
+        with self._lock:
+            pools = dict(self._pools)
+            clients = dict(self._clients)
+            store = self._store
+        if store is not None:
+            return {"embedded": store.snapshot()}
+        
+        # ב-Cluster יש pool לכל node - לפי סוג החיבור וה-node
+        for kind, client in clients.items():
+            if isinstance(client, RedisCluster):
+                for node in client.get_nodes():
+                    if node.redis_connection is not None:
+                        pools[f"{kind}@{node.name}"] = node.redis_connection.connection_pool
+        
+        usage = {}
+        for kind, pool in pools.items():
+            try:
+                usage[kind] = self._pool_usage(pool)
+            except Exception as e:
+                logger.debug(f"Failed to read Redis pool usage ({kind}): {e}")
+        return usage
+    
+    def close(self):
+        """סגירה לפני יציאה - ה-store המקומי כותב לקובץ את מה שעוד לא נשמר"""
+        with self._lock:
+            store = self._store
+            pools = list(self._pools.values())
+            clusters = [client for client in self._clients.values() if isinstance(client, RedisCluster)]
+        if store is not None:
+            store.close()
+        for pool in pools:
+            try:
+                pool.disconnect()
+            except Exception as e:
+                logger.debug(f"Failed to close Redis pool: {e}")
+        for client in clusters:
+            try:
+                client.close()
+            except Exception as e:
+                logger.debug(f"Failed to close Redis Cluster client: {e}")
+
+
+# Instance גלובלי
+redis_factory = RedisClientFactory()
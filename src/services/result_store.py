@@ -0,0 +1,175 @@
+"""
+Result Store
+שמירת השאלות של job שהושלם במאגר המשותף, ו-rendering של HTML לפי דרישה עם cache
+"""
+import random
+from dataclasses import fields
+from typing import List, Dict, Any, Optional, Tuple
+
+from config import config
+from utils.logger import logger
+from utils.keys import tagged
+from utils import codec
+from services.generator_service import Question
+from services.html_renderer import html_renderer
+
+# סדר השדות בשורה של שאלה - נשמר ברשומה כדי שאפשר יהיה להוסיף שדות בעתיד
+QUESTION_FIELDS = [f.name for f in fields(Question)]
+
+
+class ResultStore:
+    """
+    תוצאות jobs ב-Redis
+    
+    השאלות נשמרות ב-codec (שורה לכל שאלה לפי QUESTION_FIELDS) יחד עם ה-metadata
+    שנדרש ל-rendering. ה-HTML נוצר מהשאלות בפעם הראשונה שמבקשים אותו ונשמר ב-cache קצר,
+    כך שכל node יכול למסור, לייצר מחדש או להשתמש שוב בשאלות.
+    """
+    
+    def __init__(self, redis_client):
+        """
+        Args:
+            redis_client: Redis client בינארי (בלי decode_responses)
+        """
+        self.redis_client = redis_client
+    
+    @staticmethod
+    def _result_key(job_id: str) -> str:
+        return f"job_result:{tagged(job_id)}"
+    
+    @staticmethod
+    def _html_key(job_id: str) -> str:
+        return f"job_html:{tagged(job_id)}"
+    
+    def save_questions(self, job_id: str, questions: List[Question], metadata: Dict[str, Any]) -> bool:
+        """
+        שמירת השאלות של job
+        
+        Args:
+            job_id: מזהה job
+            questions: השאלות שנוצרו
+            metadata: metadata ל-rendering (שם קובץ, מספר מילים...)
+        
+        Returns:
+            True if successful
+        """
+        try:
+            record = {
+                "v": 1,
+                "fields": QUESTION_FIELDS,
+                "rows": [[getattr(q, name) for name in QUESTION_FIELDS] for q in questions],
+                "metadata": metadata
+            }
+            self.redis_client.setex(
+                self._result_key(job_id),
+                config.RESULT_TTL,
+                codec.dumps(record)
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save result for {job_id}: {e}")
+            return False
+    
+    def load(self, job_id: str) -> Optional[Tuple[List[Question], Dict[str, Any]]]:
+        """
+        טעינת השאלות וה-metadata של job
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            (questions, metadata) או None אם אין תוצאה
+        """
+        try:
+            record = codec.loads(self.redis_client.get(self._result_key(job_id)))
+            if not record:
+                return None
+            
+            names = record["fields"]
+            questions = [Question(**dict(zip(names, row))) for row in record["rows"]]
+            return questions, record.get("metadata", {})
+        except Exception as e:
+            logger.error(f"Failed to load result for {job_id}: {e}")
+            return None
+    
+    def get_questions(self, job_id: str) -> Optional[List[Question]]:
+        """השאלות של job (בלי metadata)"""
+        result = self.load(job_id)
+        return result[0] if result else None
+    
+    @staticmethod
+    def sample_questions(questions: List[Question], count: int) -> List[Question]:
+        """
+        בחירה אקראית של count שאלות מתוך מאגר (בסדר המקורי, עם מספור מחדש)
+        
+        Args:
+            questions: מאגר השאלות
+            count: מספר השאלות הרצוי
+        
+        Returns:
+            רשימת שאלות באורך count (או כל המאגר אם הוא קטן יותר)
+        """
+        if len(questions) <= count:
+            return questions
+        
+        chosen = sorted(random.sample(range(len(questions)), count))
+        sampled = [questions[i] for i in chosen]
+        for idx, q in enumerate(sampled):
+            q.id = f"q_{idx + 1}"
+        return sampled
+    
+    def narrow(self, job_id: str, count: int) -> bool:
+        """
+        צמצום התוצאה השמורה של job ל-count שאלות (למשל מאגר ספקולטיבי שמשרת בקשה קטנה יותר)
+        
+        Args:
+            job_id: מזהה job
+            count: מספר השאלות הרצוי
+        
+        Returns:
+            True אם יש תוצאה עם לפחות count שאלות והיא צומצמה
+        """
+        result = self.load(job_id)
+        if not result or len(result[0]) < count:
+            return False
+        
+        questions, metadata = result
+        if not self.save_questions(job_id, self.sample_questions(questions, count), metadata):
+            return False
+        
+        try:
+            self.redis_client.delete(self._html_key(job_id))
+        except Exception as e:
+            logger.warning(f"HTML cache invalidation failed for {job_id}: {e}")
+        return True
+    
+    def render_html(self, job_id: str) -> Optional[str]:
+        """
+        ה-HTML של המבחן - מה-cache, או rendering מהשאלות השמורות
+        
+        Args:
+            job_id: מזהה job
+        
+        Returns:
+            תוכן HTML או None אם אין תוצאה
+        """
+        try:
+            cached = codec.loads(self.redis_client.get(self._html_key(job_id)))
+            if cached:
+                return cached
+        except Exception as e:
+            logger.warning(f"HTML cache read failed for {job_id}: {e}")
+        
+        result = self.load(job_id)
+        if not result:
+            return None
+        
+        questions, metadata = result
+        html_content = html_renderer.render_quiz(questions, metadata)
+        
+        try:
+            self.redis_client.setex(self._html_key(job_id), config.RESULT_HTML_CACHE_TTL, codec.dumps(html_content))
+        except Exception as e:
+            logger.warning(f"HTML cache write failed for {job_id}: {e}")
+        
+        return html_content
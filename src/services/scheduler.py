@@ -0,0 +1,341 @@
+"""
+Fair Scheduler
+תזמון הוגן של jobs - round-robin בין משתמשים ו-shortest-job-first בתוך משתמש
+"""
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import config
+from utils.keys import SCHEDULER_TAG
+
+# הוספת job: תור המשתמש (zset לפי עלות), אינדקס זמני הכניסה, זמן התפוגה, סבב המשתמשים, ו-token להערת ה-dispatcher.
+# מסלול שהגיע ל-ARGV[6] jobs ממתינים (0 = ללא הגבלה) דוחה את ה-job ומחזיר 0
+ENQUEUE_SCRIPT = """
+local limit = tonumber(ARGV[6])
+if limit > 0 and redis.call('ZSCORE', KEYS[2], ARGV[1]) == false and redis.call('ZCARD', KEYS[2]) >= limit then
+    return 0
+end
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+if tonumber(ARGV[5]) > 0 then
+    redis.call('ZADD', KEYS[5], ARGV[5], ARGV[1])
+end
+if redis.call('ZCARD', KEYS[3]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[4])
+end
+redis.call('RPUSH', KEYS[4], ARGV[1])
+return 1
+"""
+
+# שליפת ה-job הבא: המשתמש הבא בסבב, ה-job הזול ביותר שלו, והחזרת המשתמש לסוף הסבב אם נשארו לו jobs.
+# הסקריפט עובר רק על חלון המשתמשים שבראש הסבב (ARGV[3..]), שהתורים שלהם מוצהרים ב-KEYS[4..] - כל
+# מפתח שהסקריפט נוגע בו מוצהר, כנדרש ב-Redis Cluster. אם ראש הסבב השתנה מאז שהחלון נקרא הסקריפט עוצר.
+# jobs שזמן התפוגה שלהם עבר מדולגים בתוך הסקריפט (עד ARGV[2] בשליפה) ומוחזרים אחרי ה-job שנבחר:
+# {owner, job_id, more, expired...} - more = '1' אם כדאי לקרוא חלון נוסף ולהמשיך
+POP_SCRIPT = """
+local now = tonumber(ARGV[1])
+local budget = tonumber(ARGV[2])
+local expired = {}
+for i = 3, #ARGV do
+    local owner = ARGV[i]
+    if redis.call('LINDEX', KEYS[1], 0) ~= owner then
+        return {'', '', '1', unpack(expired)}
+    end
+    redis.call('LPOP', KEYS[1])
+    local user_queue = KEYS[i + 1]
+    while true do
+        local popped = redis.call('ZPOPMIN', user_queue)
+        local job_id = popped[1]
+        if not job_id then
+            break
+        end
+        redis.call('ZREM', KEYS[2], job_id)
+        local expires_at = tonumber(redis.call('ZSCORE', KEYS[3], job_id))
+        redis.call('ZREM', KEYS[3], job_id)
+        local alive = not expires_at or expires_at > now
+        if alive or #expired >= budget - 1 then
+            if redis.call('ZCARD', user_queue) > 0 then
+                redis.call('RPUSH', KEYS[1], owner)
+            end
+            if alive then
+                return {owner, job_id, '0', unpack(expired)}
+            end
+            table.insert(expired, job_id)
+            return {'', '', '0', unpack(expired)}
+        end
+        table.insert(expired, job_id)
+    end
+end
+return {'', '', '1', unpack(expired)}
+"""
+
+# מספר המשתמשים מראש הסבב שקריאה אחת של POP_SCRIPT עוברת עליהם (והתורים שלהם מוצהרים בה)
+POP_OWNER_WINDOW = 16
+
+# הסרת job שעדיין ממתין (ביטול): מהתור של המשתמש ומהאינדקס, והוצאת המשתמש מהסבב אם התור שלו התרוקן.
+# ה-token שנשאר ב-ready רק יעיר את ה-dispatcher לשליפה ריקה
+REMOVE_SCRIPT = """
+local removed = redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+redis.call('ZREM', KEYS[5], ARGV[1])
+if removed == 1 and redis.call('ZCARD', KEYS[3]) == 0 then
+    redis.call('LREM', KEYS[1], 0, ARGV[2])
+end
+return removed
+"""
+
+# שליפת jobs מושהים שהגיע זמנם - כל job נתבע פעם אחת גם כשכמה dispatchers רצים
+CLAIM_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job_id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job_id)
+end
+return due
+"""
+
+
+def estimate_job_cost(word_count: int, question_count: int) -> float:
+    """
+    הערכת עלות job (ביחידות שרירותיות) לפי גודל הטקסט ומספר השאלות
+    
+    Args:
+        word_count: מספר מילים בטקסט
+        question_count: מספר שאלות
+    
+    Returns:
+        עלות משוערת
+    """
+    return question_count * config.SCHED_COST_PER_QUESTION + word_count / 1000 * config.SCHED_COST_PER_1K_WORDS
+
+
+class FairScheduler:
+    """
+    תור הוגן לכל מסלול, מעל Redis
+    
+    לכל מסלול יש סבב של משתמשים פעילים, ולכל משתמש zset של jobs.
+    הציון של job הוא זמן הכניסה + עלות * SCHED_AGING_SECONDS_PER_COST, כך ש-job קטן
+    עוקף job גדול שנכנס לאחרונה, אבל job גדול ותיק לא מורעב לנצח.
+    
+    כל המפתחות של התור חולקים את SCHEDULER_TAG (אותו slot ב-Redis Cluster), והסקריפטים
+    מקבלים ב-KEYS כל מפתח שהם נוגעים בו - גם את התורים של המשתמשים.
+    """
+    
+    def __init__(self, redis_client):
+        """
+        Args:
+            redis_client: Redis client (decode_responses=True)
+        """
+        self.redis_client = redis_client
+        self._enqueue = redis_client.register_script(ENQUEUE_SCRIPT)
+        self._pop = redis_client.register_script(POP_SCRIPT)
+        self._remove = redis_client.register_script(REMOVE_SCRIPT)
+        self._claim_due = redis_client.register_script(CLAIM_DUE_SCRIPT)
+    
+    # ==================== Keys ====================
+    
+    @staticmethod
+    def ready_key(lane: str) -> str:
+        """רשימת ה-tokens שה-dispatcher ממתין עליה (BLPOP)"""
+        return f"{SCHEDULER_TAG}:{lane}:ready"
+    
+    @staticmethod
+    def lane_from_ready_key(key: str) -> str:
+        """שם המסלול מתוך מפתח ה-ready"""
+        return key.split(":")[1]
+    
+    @staticmethod
+    def owners_key(lane: str) -> str:
+        """סבב המשתמשים הפעילים במסלול"""
+        return f"{SCHEDULER_TAG}:{lane}:owners"
+    
+    @staticmethod
+    def enqueued_key(lane: str) -> str:
+        """zset של כל ה-jobs הממתינים במסלול לפי זמן כניסה"""
+        return f"{SCHEDULER_TAG}:{lane}:enqueued"
+    
+    @staticmethod
+    def expires_key(lane: str) -> str:
+        """zset של זמן התפוגה (deadline) של כל job ממתין במסלול"""
+        return f"{SCHEDULER_TAG}:{lane}:expires"
+    
+    @staticmethod
+    def user_queue_prefix(lane: str) -> str:
+        """תחילית התור של משתמש במסלול"""
+        return f"{SCHEDULER_TAG}:{lane}:q:"
+    
+    @staticmethod
+    def delayed_key() -> str:
+        """zset של jobs שמחכים לניסיון חוזר לפי זמן ההרצה"""
+        return f"{SCHEDULER_TAG}:delayed"
+    
+    # ==================== Operations ====================
+    
+    def enqueue(self, lane: str, owner: str, job_id: str, cost: float, since: Optional[float] = None,
+                expires_at: Optional[float] = None, max_queued: int = 0) -> bool:
+        """
+        הוספת job לתור של המשתמש במסלול
+        
+        Args:
+            lane: שם המסלול
+            owner: מזהה המשתמש (tg:<chat_id> / web:<session_id>)
+            job_id: מזהה job
+            cost: עלות משוערת
+            since: זמן הכניסה המקורי (job שחוזר לתור שומר על הוותק שלו)
+            expires_at: אחרי הזמן הזה ה-job מדולג בשליפה (epoch seconds, אופציונלי)
+            max_queued: מספר jobs ממתינים מקסימלי במסלול (0 = ללא הגבלה)
+        
+        Returns:
+            True אם ה-job נכנס לתור, False אם המסלול מלא
+        """
+        now = since or time.time()
+        score = now + cost * config.SCHED_AGING_SECONDS_PER_COST
+        added = self._enqueue(
+            keys=[
+                self.owners_key(lane),
+                self.enqueued_key(lane),
+                self.user_queue_prefix(lane) + owner,
+                self.ready_key(lane),
+                self.expires_key(lane)
+            ],
+            args=[job_id, score, now, owner, expires_at or 0, max_queued]
+        )
+        return bool(added)
+    
+    def pop(self, lane: str, max_expired: int = 100) -> Tuple[Optional[Tuple[str, str]], List[str]]:
+        """
+        שליפת ה-job הבא במסלול לפי הסבב ההוגן, תוך דילוג על jobs שפג תוקפם
+        
+        Args:
+            lane: שם המסלול
+            max_expired: מספר jobs פגי תוקף מקסימלי שמדולגים בשליפה אחת
+        
+        Returns:
+            ((owner, job_id) או None אם אין job חי, מזהי ה-jobs פגי התוקף שהוסרו מהתור)
+        """
+        budget = max(1, max_expired)
+        expired: List[str] = []
+        prefix = self.user_queue_prefix(lane)
+        while len(expired) < budget:
+            # חלון מראש הסבב - התורים של המשתמשים בו מוצהרים כמפתחות של הסקריפט
+            owners = self.redis_client.lrange(self.owners_key(lane), 0, POP_OWNER_WINDOW - 1)
+            if not owners:
+                break
+            result = self._pop(
+                keys=[self.owners_key(lane), self.enqueued_key(lane), self.expires_key(lane)] + [prefix + owner for owner in owners],
+                args=[time.time(), budget - len(expired)] + owners
+            )
+            owner, job_id, more = result[0], result[1], result[2]
+            expired.extend(result[3:])
+            if job_id:
+                return (owner, job_id), expired
+            if more != "1":
+                break
+        return None, expired
+    
+    def remove(self, lane: str, owner: str, job_id: str) -> bool:
+        """
+        הסרת job מהתור לפני שנשלף
+        
+        Args:
+            lane: שם המסלול
+            owner: מזהה המשתמש
+            job_id: מזהה job
+        
+        Returns:
+            True אם ה-job עדיין המתין והוסר
+        """
+        removed = self._remove(
+            keys=[
+                self.owners_key(lane),
+                self.enqueued_key(lane),
+                self.user_queue_prefix(lane) + owner,
+                self.delayed_key(),
+                self.expires_key(lane)
+            ],
+            args=[job_id, owner]
+        )
+        return bool(removed)
+    
+    def jobs_ahead(self, lane: str, owner: str, job_id: str) -> Optional[int]:
+        """
+        מספר ה-jobs שיישלפו מהמסלול לפני job ממתין (הערכה לפי הסבב ההוגן)
+        
+        Args:
+            lane: שם המסלול
+            owner: מזהה המשתמש
+            job_id: מזהה job
+        
+        Returns:
+            מספר jobs לפניו, או None אם ה-job כבר לא בתור
+        """
+        # הערכה בלבד - נקראת בלי סקריפט (התורים של כל המשתמשים לא ידועים מראש כמפתחות)
+        prefix = self.user_queue_prefix(lane)
+        others = [other for other in self.redis_client.lrange(self.owners_key(lane), 0, -1) if other != owner]
+        pipe = self.redis_client.pipeline()
+        pipe.zrank(prefix + owner, job_id)
+        for other in others:
+            pipe.zcard(prefix + other)
+        results = pipe.execute()
+        
+        rank = results[0]
+        if rank is None:
+            return None
+        # עד rank+1 jobs מכל משתמש אחר בסבב נשלפים לפניו
+        return rank + sum(min(queued, rank + 1) for queued in results[1:])
+    
+    def schedule(self, job_id: str, run_at: float) -> bool:
+        """
+        השהיית job עד run_at - ה-worker לא מחכה, ה-job חוזר לתור כשמגיע זמנו
+        
+        Args:
+            job_id: מזהה job
+            run_at: זמן ההרצה (epoch seconds)
+        
+        Returns:
+            True if successful
+        """
+        self.redis_client.zadd(self.delayed_key(), {job_id: run_at})
+        return True
+    
+    def claim_due(self, limit: int = 50) -> List[str]:
+        """
+        שליפת ה-jobs המושהים שהגיע זמנם
+        
+        Args:
+            limit: מספר jobs מקסימלי בסבב
+        
+        Returns:
+            מזהי ה-jobs (כבר הוסרו מה-zset)
+        """
+        return self._claim_due(keys=[self.delayed_key()], args=[time.time(), limit]) or []
+    
+    def stats(self, lanes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        מדדי המתנה לכל מסלול
+        
+        Args:
+            lanes: שמות המסלולים
+        
+        Returns:
+            מסלול -> queued, oldest_wait_seconds, active_owners
+        """
+        pipe = self.redis_client.pipeline()
+        for lane in lanes:
+            pipe.zcard(self.enqueued_key(lane))
+            pipe.zrange(self.enqueued_key(lane), 0, 0, withscores=True)
+            pipe.llen(self.owners_key(lane))
+        results = pipe.execute()
+        
+        now = time.time()
+        stats = {}
+        for i, lane in enumerate(lanes):
+            queued, oldest, owners = results[3 * i], results[3 * i + 1], results[3 * i + 2]
+            oldest_wait = now - oldest[0][1] if oldest else 0.0
+            stats[lane] = {
+                "queued": queued,
+                "oldest_wait_seconds": round(max(0.0, oldest_wait), 1),
+                "active_owners": owners
+            }
+        return stats
+
@@ -2,14 +2,18 @@
 Session Service
 ניהול sessions של משתמשים ב-Redis
 """
-import redis
-import json
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 
 from config import config
 from utils.logger import logger
+from services.text_store import TextStore
+from utils.keys import tagged
+from utils import codec
+from services.redis_factory import redis_factory
+from services.rate_limiter import SlidingWindowLimiter
+from services.local_cache import InvalidatingCache
 
 
 class SessionService:
@@ -20,18 +24,60 @@ class SessionService:
     def __init__(self):
         """Initialize Redis connection"""
         try:
-            self.redis_client = redis.Redis(
-                host=config.REDIS_HOST,
-                port=config.REDIS_PORT,
-                decode_responses=True
-            )
+            self.redis_client = redis_factory.client()
             # Test connection
             self.redis_client.ping()
-            logger.info(f"Connected to Redis at {config.REDIS_HOST}:{config.REDIS_PORT}")
+            
+            # הערכים נשמרים בקידוד של ה-codec וגופי הטקסט דחוסים (בינארי) - client בלי decode
+            self.binary_client = redis_factory.client("binary")
+            self.text_store = TextStore(self.binary_client)
+            self.rate_limiter = SlidingWindowLimiter(self.redis_client)
+            
+            # session ו-metadata נקראים בכל update - cache בתהליך עם invalidation מ-Redis
+            # (ב-store המקומי הקריאה כבר בזיכרון, וב-Cluster אין tracking אחד לכל המפתחות)
+            self.cache = None
+            if config.SESSION_CACHE_ENABLED and redis_factory.tracking_available:
+                self.cache = InvalidatingCache(
+                    ("session:", "file_data:"), config.SESSION_CACHE_MAX_ENTRIES, config.SESSION_CACHE_TTL
+                )
+            logger.info(f"Connected to {redis_factory.describe()}")
         except Exception as e:
             logger.error(f"Failed to connect to Redis: {e}")
             raise
     
+    # ==================== Keys ====================
+    
+    @staticmethod
+    def _session_key(chat_id: int) -> str:
+        """מפתח ה-session - עם ה-hash tag של הצ'אט, באותו slot כמו ה-metadata של הקבצים"""
+        return f"session:{tagged(chat_id)}"
+    
+    @staticmethod
+    def _file_key(chat_id: int) -> str:
+        """מפתח ה-metadata של הקבצים של הצ'אט"""
+        return f"file_data:{tagged(chat_id)}"
+    
+    # ==================== Cached Reads ====================
+    
+    def _read(self, keys: List[str]) -> List[Optional[bytes]]:
+        """
+        קריאת ערכים גולמיים - דרך ה-cache של התהליך אם הוא פעיל
+        
+        Args:
+            keys: מפתחות Redis
+        
+        Returns:
+            הערכים המקודדים לפי הסדר (None למפתח שלא קיים)
+        """
+        if self.cache is None:
+            return self.binary_client.mget(keys)
+        return self.cache.get_many(keys, self.binary_client.mget)
+    
+    def _written(self, *keys: str):
+        """הכתיבה מהתהליך הזה מוחקת את הערך הישן מה-cache מיד"""
+        if self.cache is not None:
+            self.cache.invalidate(*keys)
+    
     # ==================== Session Management ====================
     
     def create_session(self, chat_id: int) -> bool:
@@ -45,7 +91,7 @@ class SessionService:
             True if successful
         """
         try:
-            session_key = f"session:{chat_id}"
+            session_key = self._session_key(chat_id)
             session_data = {
                 "chat_id": str(chat_id),
                 "state": "START",
@@ -56,8 +102,9 @@ class SessionService:
             self.redis_client.setex(
                 session_key,
                 config.SESSION_TTL,
-                json.dumps(session_data)
+                codec.dumps(session_data)
             )
+            self._written(session_key)
             
             logger.info(f"Created session for chat_id={chat_id}")
             return True
@@ -76,12 +123,9 @@ class SessionService:
             Session data או None אם לא קיים
         """
         try:
-            session_key = f"session:{chat_id}"
-            session_json = self.redis_client.get(session_key)
-            
-            if session_json:
-                return json.loads(session_json)
-            return None
+            session_key = self._session_key(chat_id)
+            session_raw, = self._read([session_key])
+            return codec.loads(session_raw)
         except Exception as e:
             logger.error(f"Failed to get session: {e}")
             return None
@@ -103,14 +147,15 @@ class SessionService:
                 return False
             
             session["state"] = state
-            session_key = f"session:{chat_id}"
+            session_key = self._session_key(chat_id)
             
             # שמירה עם TTL מחודש
             self.redis_client.setex(
                 session_key,
                 config.SESSION_TTL,
-                json.dumps(session)
+                codec.dumps(session)
             )
+            self._written(session_key)
             
             return True
         except Exception as e:
@@ -120,8 +165,9 @@ class SessionService:
     def delete_session(self, chat_id: int) -> bool:
         """מחיקת session"""
         try:
-            session_key = f"session:{chat_id}"
+            session_key = self._session_key(chat_id)
             self.redis_client.delete(session_key)
+            self._written(session_key)
             return True
         except Exception as e:
             logger.error(f"Failed to delete session: {e}")
@@ -129,9 +175,9 @@ class SessionService:
     
     # ==================== Rate Limiting ====================
     
-    def check_rate_limit(self, chat_id: int) -> tuple[bool, str]:
+    def acquire_rate_limit(self, chat_id: int) -> tuple[bool, str]:
         """
-        בדיקת rate limiting
+        בדיקה וצריכה של מכסת הבקשות (10 דקות ויומית) - קריאה אטומית אחת
         
         Args:
             chat_id: Telegram chat ID
@@ -140,79 +186,70 @@ class SessionService:
             (is_allowed, error_message)
         """
         try:
-            # Short-term limit (10 minutes)
-            short_key = f"rate_limit:{chat_id}:short"
-            short_count = self.redis_client.get(short_key)
-            
-            if short_count and int(short_count) >= config.RATE_LIMIT_PER_10MIN:
-                ttl = self.redis_client.ttl(short_key)
-                minutes = ttl // 60
-                return False, f"⏳ חרגת מהמכסה ({config.RATE_LIMIT_PER_10MIN} בקשות / 10 דקות). נסה שוב בעוד {minutes + 1} דקות."
+            result = self.rate_limiter.acquire(str(chat_id), [
+                ("short", 600, config.RATE_LIMIT_PER_10MIN),
+                ("long", 86400, config.RATE_LIMIT_PER_DAY)
+            ])
+            if result["allowed"]:
+                return True, ""
             
-            # Long-term limit (24 hours)
-            long_key = f"rate_limit:{chat_id}:long"
-            long_count = self.redis_client.get(long_key)
-            
-            if long_count and int(long_count) >= config.RATE_LIMIT_PER_DAY:
-                ttl = self.redis_client.ttl(long_key)
-                hours = ttl // 3600
+            short, long = result["windows"]["short"], result["windows"]["long"]
+            if long["reset_seconds"] > short["reset_seconds"]:
+                hours = int(long["reset_seconds"]) // 3600
                 return False, f"⏳ חרגת מהמכסה היומית ({config.RATE_LIMIT_PER_DAY} בקשות / יום). נסה שוב בעוד {hours + 1} שעות."
             
-            return True, ""
+            minutes = int(short["reset_seconds"]) // 60
+            return False, f"⏳ חרגת מהמכסה ({config.RATE_LIMIT_PER_10MIN} בקשות / 10 דקות). נסה שוב בעוד {minutes + 1} דקות."
         except Exception as e:
             logger.error(f"Rate limit check failed: {e}")
             return True, ""  # במקרה של שגיאה, נאפשר
     
-    def increment_rate_limit(self, chat_id: int) -> bool:
-        """
-        הגדלת מונה rate limiting
-        
-        Args:
-            chat_id: Telegram chat ID
-        
-        Returns:
-            True if successful
-        """
-        try:
-            # Short-term counter
-            short_key = f"rate_limit:{chat_id}:short"
-            pipe = self.redis_client.pipeline()
-            pipe.incr(short_key)
-            pipe.expire(short_key, 600)  # 10 minutes
-            
-            # Long-term counter
-            long_key = f"rate_limit:{chat_id}:long"
-            pipe.incr(long_key)
-            pipe.expire(long_key, 86400)  # 24 hours
-            
-            pipe.execute()
-            return True
-        except Exception as e:
-            logger.error(f"Failed to increment rate limit: {e}")
-            return False
-    
     # ==================== File Data Storage ====================
     
     def save_file_data(self, chat_id: int, file_data: Dict[str, Any]) -> bool:
         """
         שמירת metadata של קובץ שהועלה
         
+        הטקסט של כל קובץ נשמר בנפרד ב-TextStore (דחוס, פעם אחת לכל תוכן) והרשומה
+        שומרת רק את ה-hash שלו. הטקסט המאוחד לא נשמר - load_file_texts מרכיב אותו.
+        
         Args:
             chat_id: Telegram chat ID
-            file_data: מטא-דאטה של הקובץ
+            file_data: מטא-דאטה של הקובץ - כל קובץ ב-files עם text, או text_hash של טקסט שכבר שמור
         
         Returns:
             True if successful
         """
         try:
-            file_key = f"file_data:{chat_id}"
+            file_key = self._file_key(chat_id)
             file_data["uploaded_at"] = datetime.now().isoformat()
             
+            files = file_data.get("files") or []
+            new_digests = self.text_store.put_many([f["text"] for f in files if "text" in f])
+            kept = self.text_store.touch_many([f["text_hash"] for f in files if "text" not in f])
+            if new_digests is None or kept is None:
+                return False
+            if not all(kept):
+                logger.warning(f"Text of a kept file expired for chat_id={chat_id}")
+                return False
+            
+            digests = iter(new_digests)
+            record = {key: value for key, value in file_data.items() if key not in ("text", "files")}
+            record["v"] = 2
+            record["files"] = [
+                dict(
+                    {key: value for key, value in f.items() if key != "text"},
+                    text_hash=next(digests) if "text" in f else f["text_hash"]
+                )
+                for f in files
+            ]
+            
             self.redis_client.setex(
                 file_key,
                 config.FILE_DATA_TTL,  # 72 hours
-                json.dumps(file_data)
+                codec.dumps(record)
             )
+            self._written(file_key)
             
             logger.info(f"Saved file data for chat_id={chat_id}")
             return True
@@ -220,32 +257,86 @@ class SessionService:
             logger.error(f"Failed to save file data: {e}")
             return False
     
-    def get_file_data(self, chat_id: int) -> Optional[Dict[str, Any]]:
+    def get_file_meta(self, chat_id: int) -> Optional[Dict[str, Any]]:
         """
-        קבלת file data
+        קבלת ה-metadata של הקבצים בלבד (שמות, מספרי מילים, hashes) - בלי לטעון טקסט
         
         Args:
             chat_id: Telegram chat ID
         
         Returns:
-            File data או None
+            File metadata או None
         """
         try:
-            file_key = f"file_data:{chat_id}"
-            file_json = self.redis_client.get(file_key)
-            
-            if file_json:
-                return json.loads(file_json)
+            file_raw, = self._read([self._file_key(chat_id)])
+            return codec.loads(file_raw)
+        except Exception as e:
+            logger.error(f"Failed to get file metadata: {e}")
             return None
+    
+    def get_session_and_file_meta(self, chat_id: int) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        ה-session וה-metadata של הקבצים ב-MGET אחד (מספיק ל-state machine ולכפתורים)
+        
+        Args:
+            chat_id: Telegram chat ID
+        
+        Returns:
+            (session, file metadata) - כל אחד יכול להיות None
+        """
+        try:
+            session_raw, file_raw = self._read([self._session_key(chat_id), self._file_key(chat_id)])
+            return codec.loads(session_raw), codec.loads(file_raw)
         except Exception as e:
-            logger.error(f"Failed to get file data: {e}")
+            logger.error(f"Failed to get session and file metadata: {e}")
+            return None, None
+    
+    def load_file_texts(self, file_meta: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        השלמת הטקסט של כל קובץ והטקסט המאוחד ל-metadata (טעינה עצלה, MGET אחד)
+        
+        Args:
+            file_meta: התוצאה של get_file_meta (או file data שחלק מהקבצים בו כבר עם text)
+        
+        Returns:
+            File data מלא או None אם הטקסט כבר לא זמין
+        """
+        if not file_meta:
             return None
+        
+        files = file_meta.get("files")
+        if not files:
+            # רשומה בפורמט הישן בלי רשימת קבצים - הטקסט שמור בתוכה
+            return file_meta if "text" in file_meta else None
+        
+        missing = [f for f in files if "text" not in f]
+        texts = self.text_store.get_many([f["text_hash"] for f in missing])
+        if texts is None:
+            return None
+        
+        for f, text in zip(missing, texts):
+            f["text"] = text
+        file_meta["text"] = "\n\n".join(f["text"] for f in files)
+        return file_meta
+    
+    def get_file_data(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """
+        קבלת file data (עם הטקסט של כל קובץ והטקסט המאוחד)
+        
+        Args:
+            chat_id: Telegram chat ID
+        
+        Returns:
+            File data או None (גם אם הטקסט כבר פג תוקף)
+        """
+        return self.load_file_texts(self.get_file_meta(chat_id))
     
     def delete_file_data(self, chat_id: int) -> bool:
         """מחיקת file data"""
         try:
-            file_key = f"file_data:{chat_id}"
+            file_key = self._file_key(chat_id)
             self.redis_client.delete(file_key)
+            self._written(file_key)
             return True
         except Exception as e:
             logger.error(f"Failed to delete file data: {e}")
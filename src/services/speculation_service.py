@@ -0,0 +1,186 @@
+"""
+Speculation Service
+יצירה מראש של מאגר שאלות בכמות המומלצת, בזמן שהמשתמש עוד בוחר כמה שאלות הוא רוצה
+"""
+import hashlib
+from typing import Optional, Dict, Any
+
+from config import config
+from utils.logger import logger
+from utils.keys import tagged
+from utils import codec
+from services.lanes import parse_lanes
+from services.queue_service import queue_service, QueueFullError
+from services.session_service import session_service
+from services.token_budget import token_budget
+
+
+class SpeculationService:
+    """
+    Speculative generation לפי המלצת מספר השאלות
+    
+    אחרי החילוץ נשלח job במסלול ה-speculative (משקל 0 - רץ רק כשיש slot פנוי ואף פעם
+    לא מעכב עבודה אמיתית). כשהמשתמש שולח מספר שאלות שקטן או שווה למאגר, ה-handler
+    מאמץ את ה-job ומקבל דגימה ממנו במקום לחכות ליצירה חדשה. כל שינוי בקבצים, /start
+    חדש או session שפג מבטלים את הספקולציה, והרשומה לא חיה יותר מה-session.
+    """
+    
+    def __init__(self, redis_client):
+        """
+        Args:
+            redis_client: Redis client בינארי (בלי decode_responses)
+        """
+        self.redis_client = redis_client
+    
+    @staticmethod
+    def _key(chat_id: int) -> str:
+        return f"spec:{tagged(chat_id)}"
+    
+    @staticmethod
+    def _owner(chat_id: int) -> str:
+        return f"spec:{chat_id}"
+    
+    @staticmethod
+    def _text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    @property
+    def enabled(self) -> bool:
+        """האם ספקולציה פעילה (מופעלת בהגדרות, המסלול שלה קיים והתקציב היומי לא בלחץ)"""
+        return (
+            config.SPECULATIVE_ENABLED
+            and config.SPECULATIVE_LANE in parse_lanes(config.QUEUE_LANES)
+            and token_budget.allows_speculation()
+        )
+    
+    def start(self, chat_id: int, file_data: Dict[str, Any], recommended: int) -> Optional[str]:
+        """
+        התחלת יצירה מראש עבור הקבצים הנוכחיים של הצ'אט (מבטלת ספקולציה קודמת)
+        
+        Args:
+            chat_id: Telegram chat ID
+            file_data: נתוני הקבצים מה-session (מספיק metadata - הטקסט נטען לפי הצורך)
+            recommended: מספר השאלות המומלץ
+        
+        Returns:
+            job_id של ה-job הספקולטיבי או None אם לא נשלח
+        """
+        if not self.enabled:
+            return None
+        
+        self.cancel(chat_id, reason="speculation_replaced")
+        
+        count = min(recommended, config.SPECULATIVE_MAX_QUESTIONS)
+        if count < config.MIN_QUESTIONS:
+            return None
+        
+        file_data = session_service.load_file_texts(file_data)
+        if not file_data:
+            return None
+        
+        file_info = None
+        if len(file_data.get("files", [])) > 1:
+            file_info = {"files": file_data["files"]}
+        
+        metadata = {
+            "filename": file_data.get("filename", "מבחן"),
+            "word_count": file_data.get("word_count", 0)
+        }
+        
+        try:
+            job_id = queue_service.add_job(
+                chat_id=chat_id,
+                text=file_data["text"],
+                question_count=count,
+                metadata=metadata,
+                file_info=file_info,
+                job_type="speculative",
+                owner=self._owner(chat_id)
+            )
+        except QueueFullError:
+            # המסלול מלא - פשוט לא מנחשים הפעם
+            logger.debug(f"Speculation skipped for {chat_id}: lane full")
+            return None
+        
+        if not job_id:
+            return None
+        
+        try:
+            record = {"job_id": job_id, "question_count": count, "text_hash": self._text_hash(file_data["text"])}
+            # המאגר שייך ל-flow הנוכחי - לא חי יותר מה-session
+            self.redis_client.setex(self._key(chat_id), config.SESSION_TTL, codec.dumps(record))
+            logger.info(f"Started speculative job {job_id} for {chat_id} ({count} questions)")
+        except Exception as e:
+            logger.error(f"Failed to save speculation for {chat_id}: {e}")
+        
+        return job_id
+    
+    def cancel(self, chat_id: int, reason: str = "speculation_cancelled") -> int:
+        """
+        ביטול הספקולציה של הצ'אט (הקבצים השתנו או שמתחילים מבחן חדש)
+        
+        Args:
+            chat_id: Telegram chat ID
+            reason: סיבת הביטול
+        
+        Returns:
+            מספר ה-jobs שבוטלו
+        """
+        try:
+            self.redis_client.delete(self._key(chat_id))
+        except Exception as e:
+            logger.error(f"Failed to clear speculation for {chat_id}: {e}")
+        return queue_service.cancel_owner_jobs(self._owner(chat_id), reason)
+    
+    def claim(self, chat_id: int, count: int, text: str, file_info: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """
+        שימוש במאגר הספקולטיבי לבקשה של המשתמש
+        
+        Args:
+            chat_id: Telegram chat ID
+            count: מספר השאלות שהמשתמש ביקש
+            text: הטקסט של הקבצים הנוכחיים (לוודא שהמאגר נוצר מאותו תוכן)
+            file_info: מידע על הקבצים (אופציונלי) - המכסה מתומחרת לפי קובץ, כמו ב-add_job
+        
+        Returns:
+            job_id שמשרת את הבקשה, או None אם צריך job רגיל
+        
+        Raises:
+            QuotaExceededError: הבקשה חורגת ממכסת העלות של המשתמש
+        """
+        try:
+            record = codec.loads(self.redis_client.get(self._key(chat_id)))
+            if not record:
+                return None
+        except Exception as e:
+            logger.error(f"Failed to read speculation for {chat_id}: {e}")
+            return None
+        
+        if record["text_hash"] != self._text_hash(text) or count > record["question_count"]:
+            # הבקשה לא מתאימה למאגר - ה-job הספקולטיבי רק יתחרה ב-job האמיתי
+            self.cancel(chat_id, reason="speculation_miss")
+            return None
+        
+        job_id = record["job_id"]
+        owner = f"tg:{chat_id}"
+        
+        # היצירה מראש לא נספרה במכסה - המשתמש משלם על מה שהוא מקבל מהמאגר
+        quota = queue_service.quotas.reserve(owner, job_id, queue_service._job_texts(text, file_info), count)
+        if not queue_service.adopt_job(job_id, count, owner=owner, quota=quota):
+            if quota:
+                queue_service.quotas.settle(job_id, quota, None)
+            self.cancel(chat_id, reason="speculation_not_started")
+            return None
+        
+        # המאגר נוצל - אסור שבקשה הבאה תדגום ממנו שוב
+        try:
+            self.redis_client.delete(self._key(chat_id))
+        except Exception as e:
+            logger.error(f"Failed to clear speculation for {chat_id}: {e}")
+        
+        logger.info(f"Speculative job {job_id} serves {count} questions for {chat_id}")
+        return job_id
+
+
+# Instance גלובלי
+speculation_service = SpeculationService(queue_service.binary_client)
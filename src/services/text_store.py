@@ -0,0 +1,110 @@
+"""
+Text Store
+שמירת הטקסט שחולץ מקבצים - פעם אחת לכל תוכן (לפי hash), דחוס
+"""
+import hashlib
+import zlib
+from typing import List, Optional
+
+from config import config
+from utils.logger import logger
+
+
+class TextStore:
+    """
+    גופי טקסט של מסמכים ב-Redis, לפי sha256 של התוכן
+    
+    אותו קובץ שהועלה שוב (או על ידי משתמש אחר) נשמר פעם אחת. הגופים משותפים, ולכן
+    לא נמחקים ישירות - כל שמירה מאריכה את ה-TTL שלהם, כך שהם חיים לפחות כמו
+    רשומת ה-metadata האחרונה שמפנה אליהם.
+    """
+    
+    def __init__(self, redis_client, ttl: int = config.FILE_DATA_TTL):
+        """
+        Args:
+            redis_client: Redis client בינארי (בלי decode_responses)
+            ttl: זמן חיים של גוף טקסט בשניות
+        """
+        self.redis_client = redis_client
+        self.ttl = ttl
+    
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """מזהה התוכן של טקסט"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _key(digest: str) -> str:
+        return f"doc_text:{digest}"
+    
+    def touch_many(self, digests: List[str]) -> Optional[List[bool]]:
+        """
+        הארכת ה-TTL של גופי טקסט קיימים
+        
+        Args:
+            digests: רשימת hashes
+        
+        Returns:
+            לכל hash - האם הגוף קיים, או None במקרה של שגיאה
+        """
+        if not digests:
+            return []
+        
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for digest in digests:
+                pipe.expire(self._key(digest), self.ttl)
+            return [bool(found) for found in pipe.execute()]
+        except Exception as e:
+            logger.error(f"Failed to refresh document text: {e}")
+            return None
+    
+    def put_many(self, texts: List[str]) -> Optional[List[str]]:
+        """
+        שמירת גופי טקסט (גוף שכבר קיים רק מקבל TTL חדש)
+        
+        Args:
+            texts: הטקסטים
+        
+        Returns:
+            רשימת ה-hashes (לפי הסדר) או None במקרה של שגיאה
+        """
+        try:
+            digests = [self.text_hash(text) for text in texts]
+            existing = self.touch_many(digests)
+            if existing is None:
+                return None
+            
+            pipe = self.redis_client.pipeline(transaction=False)
+            for digest, text, found in zip(digests, texts, existing):
+                if not found:
+                    blob = zlib.compress(text.encode("utf-8"), config.FILE_TEXT_COMPRESSION_LEVEL)
+                    pipe.set(self._key(digest), blob, ex=self.ttl)
+            pipe.execute()
+            return digests
+        except Exception as e:
+            logger.error(f"Failed to store document text: {e}")
+            return None
+    
+    def get_many(self, digests: List[str]) -> Optional[List[str]]:
+        """
+        טעינת גופי טקסט ב-MGET אחד
+        
+        Args:
+            digests: רשימת hashes
+        
+        Returns:
+            הטקסטים לפי הסדר, או None אם אחד מהם חסר (פג תוקף) או במקרה של שגיאה
+        """
+        if not digests:
+            return []
+        
+        try:
+            blobs = self.redis_client.mget([self._key(digest) for digest in digests])
+            if any(blob is None for blob in blobs):
+                logger.warning("Document text expired or missing")
+                return None
+            return [zlib.decompress(blob).decode("utf-8") for blob in blobs]
+        except Exception as e:
+            logger.error(f"Failed to load document text: {e}")
+            return None
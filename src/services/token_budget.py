@@ -0,0 +1,233 @@
+"""
+Token Budget
+מעקב אחרי צריכת ה-tokens של המודל (גלובלי, למשתמש ולמודל) ותקציב יומי עם degradation הדרגתי
+"""
+import threading
+import time
+from typing import Optional, Dict, Any
+
+from config import config
+from utils.logger import logger
+from utils.keys import tagged
+from services.redis_factory import redis_factory
+
+# שלבי ה-degradation לפי החלק שנוצל מהתקציב היומי
+STAGE_NORMAL = 0
+STAGE_CHEAP_MODEL = 1  # מודל זול יותר (ובלי יצירה ספקולטיבית)
+STAGE_CAP_QUESTIONS = 2  # תקרה למספר השאלות ב-job
+STAGE_SLOW_ADMISSION = 3  # jobs חדשים נכנסים לתור באיחור
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "calls")
+
+
+def cost_units(input_tokens: float, output_tokens: float) -> float:
+    """יחידות העלות של מספר tokens (output token שווה QUOTA_OUTPUT_TOKEN_WEIGHT יחידות)"""
+    return input_tokens + output_tokens * config.QUOTA_OUTPUT_TOKEN_WEIGHT
+
+
+def model_cost_factor(model: str) -> float:
+    """מחיר המודל ביחס למודל הראשי"""
+    if config.GEMINI_FALLBACK_MODEL and model == config.GEMINI_FALLBACK_MODEL:
+        return config.GEMINI_FALLBACK_COST_FACTOR
+    return 1.0
+
+
+class TokenBudget:
+    """
+    חשבון ה-tokens של כל התהליכים ב-Redis, לפי יום (UTC)
+    
+    כל קריאה למודל נרשמת ב-hash יומי גלובלי (כולל פילוח לפי מודל) וב-hash יומי של
+    המשתמש; ה-job עצמו שומר את הצריכה שלו ב-token_usage. כשהצריכה היומית מתקרבת
+    ל-TOKEN_BUDGET_DAILY_UNITS המערכת לא נעצרת אלא יורדת בשלבים: מודל זול יותר,
+    תקרה למספר השאלות, ולבסוף כניסה איטית יותר לתור.
+    """
+    
+    def __init__(self, redis_client):
+        """
+        Args:
+            redis_client: Redis client (decode_responses=True)
+        """
+        self.redis_client = redis_client
+        # הצריכה היומית נקראת מ-Redis לכל היותר פעם ב-BUDGET_REFRESH_SECONDS
+        self._spent = 0.0
+        self._spent_day = ""
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _day() -> str:
+        return time.strftime("%Y%m%d", time.gmtime())
+    
+    @staticmethod
+    def _global_key(day: str) -> str:
+        return f"token_usage:{day}"
+    
+    @staticmethod
+    def _owner_key(day: str, owner: str) -> str:
+        return f"token_usage:{day}:owner:{tagged(owner)}"
+    
+    @property
+    def enabled(self) -> bool:
+        """האם מוגדר תקציב יומי (החשבון נרשם בכל מקרה)"""
+        return config.TOKEN_BUDGET_DAILY_UNITS > 0
+    
+    # ==================== Accounting ====================
+    
+    def record(self, model: str, input_tokens: int, output_tokens: int, owner: Optional[str] = None):
+        """
+        רישום קריאה אחת למודל - שגיאה ברישום לא עוצרת את היצירה
+        
+        Args:
+            model: שם המודל
+            input_tokens: tokens ב-prompt
+            output_tokens: tokens בתשובה
+            owner: המשתמש שה-job שלו (אופציונלי)
+        """
+        day = self._day()
+        units = cost_units(input_tokens, output_tokens) * model_cost_factor(model)
+        ttl = config.TOKEN_USAGE_RETENTION_DAYS * 86400
+        
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            keys = [self._global_key(day)] + ([self._owner_key(day, owner)] if owner else [])
+            for key in keys:
+                pipe.hincrby(key, "input_tokens", input_tokens)
+                pipe.hincrby(key, "output_tokens", output_tokens)
+                pipe.hincrby(key, "calls", 1)
+                pipe.hincrbyfloat(key, "units", units)
+                pipe.expire(key, ttl)
+            pipe.hincrby(self._global_key(day), f"model:{model}:input_tokens", input_tokens)
+            pipe.hincrby(self._global_key(day), f"model:{model}:output_tokens", output_tokens)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to record token usage: {e}")
+        
+        with self._lock:
+            if self._spent_day == day:
+                self._spent += units
+    
+    def usage(self, owner: Optional[str] = None, day: Optional[str] = None) -> Dict[str, Any]:
+        """
+        הצריכה של יום (גלובלית או של משתמש)
+        
+        Args:
+            owner: מזהה משתמש (None = כל המערכת)
+            day: YYYYMMDD ב-UTC (ברירת מחדל היום)
+        
+        Returns:
+            input_tokens, output_tokens, calls, units (ולצריכה הגלובלית גם models)
+        """
+        day = day or self._day()
+        key = self._owner_key(day, owner) if owner else self._global_key(day)
+        try:
+            raw = self.redis_client.hgetall(key) or {}
+        except Exception as e:
+            logger.error(f"Failed to read token usage: {e}")
+            raw = {}
+        
+        usage = {name: int(raw.get(name, 0)) for name in USAGE_FIELDS}
+        usage["units"] = round(float(raw.get("units", 0)), 1)
+        
+        models: Dict[str, Dict[str, int]] = {}
+        for field_name, value in raw.items():
+            if field_name.startswith("model:"):
+                model, _, counter = field_name[len("model:"):].rpartition(":")
+                models.setdefault(model, {})[counter] = int(value)
+        if models:
+            usage["models"] = models
+        return usage
+    
+    # ==================== Governor ====================
+    
+    def spent_units(self) -> float:
+        """היחידות שנוצלו היום (עם cache קצר בתהליך)"""
+        day = self._day()
+        now = time.time()
+        with self._lock:
+            if self._spent_day == day and now - self._refreshed_at < config.BUDGET_REFRESH_SECONDS:
+                return self._spent
+        
+        try:
+            spent = float(self.redis_client.hget(self._global_key(day), "units") or 0)
+        except Exception as e:
+            logger.debug(f"Failed to read token budget: {e}")
+            with self._lock:
+                return self._spent if self._spent_day == day else 0.0
+        
+        with self._lock:
+            self._spent, self._spent_day, self._refreshed_at = spent, day, now
+        return spent
+    
+    def fraction(self) -> float:
+        """החלק שנוצל מהתקציב היומי (0 כשאין תקציב)"""
+        if not self.enabled:
+            return 0.0
+        return self.spent_units() / config.TOKEN_BUDGET_DAILY_UNITS
+    
+    def stage(self) -> int:
+        """שלב ה-degradation הנוכחי"""
+        fraction = self.fraction()
+        if fraction >= config.BUDGET_SLOW_ADMISSION_AT:
+            return STAGE_SLOW_ADMISSION
+        if fraction >= config.BUDGET_CAP_QUESTIONS_AT:
+            return STAGE_CAP_QUESTIONS
+        if fraction >= config.BUDGET_CHEAP_MODEL_AT:
+            return STAGE_CHEAP_MODEL
+        return STAGE_NORMAL
+    
+    def select_model(self) -> str:
+        """המודל ל-job חדש - המודל הזול מהשלב הראשון (אם הוגדר)"""
+        if config.GEMINI_FALLBACK_MODEL and self.stage() >= STAGE_CHEAP_MODEL:
+            return config.GEMINI_FALLBACK_MODEL
+        return config.GEMINI_MODEL
+    
+    def allows_speculation(self) -> bool:
+        """יצירה מראש שאולי לא תנוצל - רק כשהתקציב לא בלחץ"""
+        return self.stage() == STAGE_NORMAL
+    
+    def cap_questions(self, question_count: int) -> int:
+        """
+        מספר השאלות ל-job חדש אחרי תקרת ה-degradation
+        
+        Args:
+            question_count: מספר השאלות שהתבקש
+        
+        Returns:
+            מספר השאלות שייווצרו
+        """
+        if self.stage() >= STAGE_CAP_QUESTIONS:
+            return min(question_count, max(config.MIN_QUESTIONS, config.BUDGET_DEGRADED_MAX_QUESTIONS))
+        return question_count
+    
+    def admission_delay(self, deadline_seconds: float) -> float:
+        """
+        השהיית הכניסה לתור של job חדש - מתארכת ככל שהצריכה עוברת את הסף, ואף פעם
+        לא יותר מחצי מהזמן של ה-job עד ה-deadline (הבקשה לא נדחית בגלל התקציב)
+        
+        Args:
+            deadline_seconds: הזמן שיש ל-job עד ה-deadline
+        
+        Returns:
+            שניות (0 מחוץ לשלב האחרון)
+        """
+        fraction = self.fraction()
+        threshold = config.BUDGET_SLOW_ADMISSION_AT
+        if not self.enabled or fraction < threshold:
+            return 0.0
+        overshoot = (fraction - threshold) / max(0.01, 1.0 - threshold)
+        return min(config.BUDGET_ADMISSION_DELAY_SECONDS * (1 + overshoot), deadline_seconds / 2)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """מצב התקציב - לניטור"""
+        return {
+            "budget_units": config.TOKEN_BUDGET_DAILY_UNITS,
+            "spent_units": round(self.spent_units(), 1),
+            "fraction": round(self.fraction(), 3),
+            "stage": self.stage(),
+            "model": self.select_model(),
+            "usage": self.usage()
+        }
+
+
+# Instance גלובלי
+token_budget = TokenBudget(redis_factory.client())
@@ -0,0 +1,203 @@
+"""
+Payload codec
+קידוד אחיד של כל הערכים השמורים (session, metadata של קבצים, jobs, תוצאות, web sessions)
+עם header בינארי עם גרסה, JSON מהיר ודחיסה לערכים גדולים
+"""
+import json
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from config import config
+
+try:
+    import orjson
+except ImportError:  # אופציונלי - בלעדיו הגוף נכתב עם json של הספרייה הסטנדרטית, באותו פורמט
+    orjson = None
+
+# בית ראשון של ערך מקודד: 0xC1 אף פעם לא מופיע ב-UTF-8 תקין, ו-JSON מתחיל תמיד בתו ASCII,
+# כך שערך JSON ישן (מלפני ה-codec) מזוהה לפי הבית הראשון בלבד
+MAGIC = 0xC1
+VERSION = 1
+HEADER_SIZE = 3  # magic, version, flags
+
+FLAG_COMPRESSED = 0x01  # הגוף דחוס ב-zlib
+
+
+class CodecError(ValueError):
+    """ערך שאי אפשר לפענח - header לא תקין או גרסה חדשה יותר מהקוד הזה"""
+
+
+def _encode_json(value: Any) -> bytes:
+    """JSON קומפקטי ב-UTF-8 (orjson כשהוא מותקן)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # למשל מספר שלם גדול מ-64 ביט - json הרגיל יודע לכתוב אותו
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _decode_json(body) -> Any:
+    """פענוח JSON מ-bytes או str"""
+    if orjson is not None:
+        try:
+            return orjson.loads(body)
+        except ValueError:
+            pass  # ערך ישן עם NaN / Infinity שרק json הרגיל מקבל
+    return json.loads(body)
+
+
+def dumps(value: Any) -> bytes:
+    """
+    קידוד ערך לשמירה ב-Redis
+    
+    Args:
+        value: ערך שאפשר לייצג ב-JSON
+    
+    Returns:
+        header (magic, גרסה, flags) ואחריו גוף ה-JSON - דחוס אם הוא מעל
+        PAYLOAD_COMPRESS_THRESHOLD והדחיסה באמת מקטינה אותו.
+        עם PAYLOAD_CODEC_VERSION=0 נכתב JSON רגיל, שגם קוד ישן יודע לקרוא.
+    """
+    body = _encode_json(value)
+    if config.PAYLOAD_CODEC_VERSION == 0:
+        return body
+    
+    flags = 0
+    threshold = config.PAYLOAD_COMPRESS_THRESHOLD
+    if threshold > 0 and len(body) >= threshold:
+        compressed = zlib.compress(body, config.PAYLOAD_COMPRESS_LEVEL)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_COMPRESSED
+    
+    return bytes((MAGIC, VERSION, flags)) + body
+
+
+def loads(data) -> Any:
+    """
+    פענוח ערך שמור - גם ערכי JSON ישנים שנכתבו לפני ה-codec
+    
+    Args:
+        data: bytes מ-client בינארי, str (JSON ישן מ-client עם decode) או None
+    
+    Returns:
+        הערך המפוענח (None כשאין ערך)
+    
+    Raises:
+        CodecError: header לא תקין או גרסה לא מוכרת
+    """
+    if data is None:
+        return None
+    if isinstance(data, str) or not data or data[0] != MAGIC:
+        return _decode_json(data)
+    
+    if len(data) < HEADER_SIZE:
+        raise CodecError("truncated payload header")
+    version, flags = data[1], data[2]
+    if version > VERSION:
+        raise CodecError(f"payload version {version} is newer than supported version {VERSION}")
+    
+    body = memoryview(data)[HEADER_SIZE:]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    return _decode_json(bytes(body))
+
+
+# ==================== Benchmark ====================
+
+def _sample_payloads() -> Dict[str, Any]:
+    """ערכים לדוגמה בגדלים של המערכת - טקסט עברי, metadata, job ו-web session עם HTML"""
+    paragraph = (
+        "המערכת החיסונית מגינה על הגוף מפני גורמי מחלה. תאי הדם הלבנים מזהים חלבונים זרים "
+        "ומייצרים נוגדנים, ולאחר ההחלמה נשארים תאי זיכרון שמאפשרים תגובה מהירה יותר בחשיפה הבאה. "
+    )
+    text = paragraph * 200
+    questions = [
+        {
+            "id": f"q_{i + 1}",
+            "question": f"מה התפקיד של תאי הזיכרון בשאלה {i + 1}?",
+            "options": ["תגובה מהירה בחשיפה חוזרת", "ייצור תאי דם אדומים", "פירוק חלבונים", "הובלת חמצן"],
+            "correct_index": i % 4,
+            "explanation": "תאי הזיכרון נשארים אחרי ההחלמה ומזהים את הגורם במהירות."
+        }
+        for i in range(30)
+    ]
+    html = "<!DOCTYPE html><html dir=\"rtl\" lang=\"he\"><body>" + "".join(
+        f"<div class=\"question\"><h3>{q['question']}</h3>"
+        + "".join(f"<label><input type=\"radio\" name=\"{q['id']}\">{option}</label>" for option in q["options"])
+        + f"<p class=\"explanation\">{q['explanation']}</p></div>"
+        for q in questions
+    ) + "</body></html>"
+    
+    return {
+        "session": {
+            "chat_id": "123456789",
+            "state": "WAITING_FOR_COUNT",
+            "created_at": "2026-01-01T10:00:00",
+            "expires_at": "2026-01-01T10:15:00"
+        },
+        "file_meta": {
+            "v": 2,
+            "files": [
+                {"name": f"פרק_{i}.pdf", "word_count": 4200, "text_hash": "ab" * 32}
+                for i in range(5)
+            ]
+        },
+        "job": {
+            "job_id": "job_123456789_1700000000",
+            "chat_id": 123456789,
+            "status": "pending",
+            "question_count": 30,
+            "file_info": {"files": [{"name": "פרק_1.pdf", "text": text, "word_count": 4200}]}
+        },
+        "web_session": {"questions": questions, "html": html, "created_at": "2026-01-01T10:00:00"}
+    }
+
+
+def _time_per_call(func, arg, rounds: int) -> float:
+    """זמן ממוצע לקריאה במיקרו-שניות"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def benchmark(rounds: int = 200, payloads: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    השוואה בין json של הספרייה הסטנדרטית (כמו שנשמר לפני ה-codec) ל-codec
+    
+    Args:
+        rounds: מספר חזרות לכל מדידה
+        payloads: ערכים למדידה (ברירת מחדל - ערכים לדוגמה)
+    
+    Returns:
+        שורה לכל ערך: גודל וזמני קידוד / פענוח (מיקרו-שניות) לכל שיטה
+    """
+    results = []
+    for name, value in (payloads or _sample_payloads()).items():
+        legacy = json.dumps(value)
+        encoded = dumps(value)
+        results.append({
+            "payload": name,
+            "json_bytes": len(legacy.encode("utf-8")),
+            "codec_bytes": len(encoded),
+            "compressed": len(encoded) > 2 and encoded[0] == MAGIC and bool(encoded[2] & FLAG_COMPRESSED),
+            "json_encode_us": round(_time_per_call(json.dumps, value, rounds), 1),
+            "codec_encode_us": round(_time_per_call(dumps, value, rounds), 1),
+            "json_decode_us": round(_time_per_call(json.loads, legacy, rounds), 1),
+            "codec_decode_us": round(_time_per_call(loads, encoded, rounds), 1)
+        })
+    return results
+
+
+if __name__ == "__main__":
+    # הרצה מתוך src: python -m utils.codec
+    print(f"encoder: {'orjson' if orjson is not None else 'json'}, "
+          f"compress threshold: {config.PAYLOAD_COMPRESS_THRESHOLD} bytes, level {config.PAYLOAD_COMPRESS_LEVEL}")
+    columns = ["payload", "json_bytes", "codec_bytes", "compressed",
+               "json_encode_us", "codec_encode_us", "json_decode_us", "codec_decode_us"]
+    print("  ".join(f"{column:>15}" for column in columns))
+    for row in benchmark():
+        print("  ".join(f"{str(row[column]):>15}" for column in columns))
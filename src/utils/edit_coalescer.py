@@ -0,0 +1,221 @@
+"""
+Edit coalescer
+עריכות של הודעות התקדמות בטלגרם דרך thread אחד - עריכה אחת לכל צ'אט בכל מרווח,
+רק כשהטקסט השתנה, ובמסגרת מגבלות הקצב של ה-Bot API
+"""
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from config import config
+from utils.logger import logger
+
+
+class _PendingEdit:
+    """העריכה האחרונה שהתבקשה להודעה (עריכות קודמות שלא נשלחו פשוט נדרסות)"""
+    
+    def __init__(self, message, text: str, parse_mode: Optional[str]):
+        self.message = message
+        self.text = text
+        self.parse_mode = parse_mode
+
+
+class EditCoalescer:
+    """
+    מאחד עדכוני התקדמות לפני שהם נשלחים לטלגרם
+    
+    ה-handlers מגישים את הטקסט העדכני בכל אירוע של ה-job, וה-coalescer שולח לכל הודעה
+    רק את האחרון: לכל היותר עריכה אחת לצ'אט בכל PROGRESS_EDIT_INTERVAL (בקבוצות לפחות
+    TELEGRAM_GROUP_EDIT_INTERVAL), בלי עריכות שלא משנות את הטקסט, ובתוך תקציב גלובלי
+    של TELEGRAM_GLOBAL_EDITS_PER_SECOND. RetryAfter מטלגרם משהה את הצ'אט לזמן שהתבקש.
+    """
+    
+    def __init__(self, chat_interval: float, group_interval: float, global_rate: float):
+        """
+        Args:
+            chat_interval: מרווח מינימלי בין עריכות באותו צ'אט (שניות)
+            group_interval: מרווח מינימלי בין עריכות בקבוצה (שניות)
+            global_rate: עריכות בשנייה לכל התהליך
+        """
+        # טלגרם מגביל לכ-1 הודעה לשנייה בצ'אט פרטי ו-20 לדקה בקבוצה
+        self.chat_interval = max(1.0, chat_interval)
+        self.group_interval = max(self.chat_interval, group_interval)
+        self.global_rate = max(1.0, global_rate)
+        
+        self._pending: Dict[Tuple[int, int], _PendingEdit] = {}
+        self._last_text: Dict[Tuple[int, int], str] = {}
+        self._next_edit_at: Dict[int, float] = {}
+        self._sending: Optional[Tuple[int, int]] = None
+        self._tokens = self.global_rate
+        self._tokens_at = time.time()
+        
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        
+        self.sent = 0
+        self.skipped = 0
+        self.throttled = 0
+    
+    @staticmethod
+    def _key(message) -> Tuple[int, int]:
+        return message.chat_id, message.message_id
+    
+    def _interval(self, chat_id: int) -> float:
+        """מרווח העריכות של הצ'אט (chat_id שלילי = קבוצה / ערוץ)"""
+        return self.group_interval if chat_id < 0 else self.chat_interval
+    
+    def _ensure_thread(self):
+        """הפעלת thread השליחה בשימוש הראשון"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="edit-coalescer", daemon=True)
+            self._thread.start()
+    
+    def submit(self, message, text: str, parse_mode: Optional[str] = "Markdown") -> bool:
+        """
+        בקשה לעדכן הודעה לטקסט חדש (לא חוסם - השליחה עצמה ב-thread של ה-coalescer)
+        
+        Args:
+            message: הודעת טלגרם לעריכה
+            text: הטקסט העדכני
+            parse_mode: parse mode של ההודעה
+        
+        Returns:
+            True אם העריכה ממתינה לשליחה (False אם הטקסט כבר מוצג)
+        """
+        key = self._key(message)
+        with self._cond:
+            if self._last_text.get(key) == text:
+                self._pending.pop(key, None)
+                self.skipped += 1
+                return False
+            
+            if key in self._pending:
+                self.skipped += 1
+            self._pending[key] = _PendingEdit(message, text, parse_mode)
+            self._ensure_thread()
+            self._cond.notify()
+            return True
+    
+    def close(self, message):
+        """
+        סיום עדכוני ההתקדמות של הודעה - לפני עריכה סופית או מחיקה שלה
+        
+        מבטל עריכה ממתינה ומחכה לעריכה שכבר בדרך, כך שעדכון התקדמות מאוחר
+        לא ידרוס את הודעת הסיום.
+        
+        Args:
+            message: הודעת טלגרם
+        """
+        key = self._key(message)
+        with self._cond:
+            self._pending.pop(key, None)
+            while self._sending == key:
+                self._cond.wait()
+            # עריכה שנכשלה ב-flood control חוזרת לתור - גם היא כבר לא רלוונטית
+            self._pending.pop(key, None)
+            self._last_text.pop(key, None)
+            # המרווח של הצ'אט כבר לא רלוונטי אם עבר ואין לו עוד הודעות ממתינות
+            if self._next_edit_at.get(key[0], 0.0) <= time.time() and not any(k[0] == key[0] for k in self._pending):
+                self._next_edit_at.pop(key[0], None)
+    
+    def _take_token(self, now: float) -> float:
+        """
+        תקציב העריכות הגלובלי (token bucket)
+        
+        Returns:
+            0 אם נלקח token, אחרת כמה שניות לחכות
+        """
+        self._tokens = min(self.global_rate, self._tokens + (now - self._tokens_at) * self.global_rate)
+        self._tokens_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.global_rate
+    
+    def _next_due(self, now: float) -> Tuple[Optional[Tuple[int, int]], float]:
+        """
+        העריכה הבאה שמותר לשלוח
+        
+        Returns:
+            (key, 0) אם יש עריכה מוכנה, אחרת (None, זמן המתנה) - None בזמן ההמתנה = אין עריכות
+        """
+        wait = None
+        for key in self._pending:
+            ready_at = self._next_edit_at.get(key[0], 0.0)
+            if ready_at <= now:
+                return key, 0.0
+            wait = ready_at - now if wait is None else min(wait, ready_at - now)
+        return None, wait
+    
+    def _run(self):
+        """לולאת השליחה"""
+        while True:
+            with self._cond:
+                key, wait = self._next_due(time.time())
+                if key is None:
+                    self._cond.wait(wait)
+                    continue
+                
+                token_wait = self._take_token(time.time())
+                if token_wait:
+                    self.throttled += 1
+                    self._cond.wait(token_wait)
+                    continue
+                
+                edit = self._pending.pop(key)
+                self._sending = key
+                self._next_edit_at[key[0]] = time.time() + self._interval(key[0])
+            
+            delivered = self._send(key, edit)
+            
+            with self._cond:
+                self._sending = None
+                if delivered:
+                    self._last_text[key] = edit.text
+                self._cond.notify_all()
+    
+    def _send(self, key: Tuple[int, int], edit: _PendingEdit) -> bool:
+        """
+        עריכת ההודעה בטלגרם
+        
+        Returns:
+            True אם הטקסט מוצג עכשיו בהודעה
+        """
+        try:
+            edit.message.edit_text(edit.text, parse_mode=edit.parse_mode)
+            self.sent += 1
+            return True
+        except Exception as e:
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after:
+                # flood control - מחזירים את העריכה לתור ומשהים לפי מה שטלגרם ביקש
+                self.throttled += 1
+                with self._cond:
+                    self._next_edit_at[key[0]] = time.time() + retry_after
+                    self._pending.setdefault(key, edit)
+                logger.warning(f"Telegram flood control on chat {key[0]}, retry in {retry_after}s")
+                return False
+            
+            if "not modified" in str(e).lower():
+                return True
+            
+            logger.debug(f"Progress edit skipped: {e}")
+            return False
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """מדדי ה-coalescer - לניטור"""
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "sent": self.sent,
+                "skipped": self.skipped,
+                "throttled": self.throttled
+            }
+
+
+# Instance גלובלי
+edit_coalescer = EditCoalescer(
+    config.PROGRESS_EDIT_INTERVAL,
+    config.TELEGRAM_GROUP_EDIT_INTERVAL,
+    config.TELEGRAM_GLOBAL_EDITS_PER_SECOND
+)
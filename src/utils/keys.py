@@ -0,0 +1,29 @@
+"""
+Key layout
+hash tags של מפתחות Redis - המפתחות של צ'אט אחד נמצאים באותו slot ב-Redis Cluster
+"""
+
+# תחיליות של owner (tg:<chat_id> / spec:<chat_id> / web:<session_id>) - ה-tag הוא הצ'אט עצמו
+OWNER_PREFIXES = ("tg", "spec", "web")
+
+# tag משותף לכל מפתחות התור ההוגן - הסקריפטים וה-BLPOP ניגשים לכמה מסלולים יחד
+SCHEDULER_TAG = "{sched}"
+
+
+def tagged(subject) -> str:
+    """
+    מזהה לשימוש בתוך מפתח, עם ה-hash tag של הצ'אט: ב-Cluster כל המפתחות עם אותו tag
+    נמצאים באותו slot, ולכן פקודות על כמה מפתחות של אותו צ'אט (MGET, סקריפטים)
+    נשארות על shard אחד
+    
+    Args:
+        subject: chat_id, session_id, owner או job_id
+    
+    Returns:
+        "{subject}", ול-owner "tg:{chat_id}" - אותו tag כמו הצ'אט, בלי להתנגש עם owner מסוג אחר
+    """
+    subject = str(subject)
+    prefix, _, rest = subject.partition(":")
+    if rest and prefix in OWNER_PREFIXES:
+        return f"{prefix}:{{{rest}}}"
+    return "{" + subject + "}"
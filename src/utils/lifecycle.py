@@ -0,0 +1,79 @@
+"""
+Process lifecycle
+מצב התהליך (running / draining) ו-SIGTERM שמפעיל drain לפני יציאה
+"""
+import os
+import signal
+import threading
+import time
+from typing import Callable, Optional
+
+from utils.logger import logger
+
+
+class Lifecycle:
+    """
+    מצב התהליך הנוכחי - משותף ל-workers ול-health endpoints
+    
+    בזמן drain ה-health מחזיר "draining" (503) כדי שה-load balancer יעביר
+    תנועה ל-instances אחרים עוד לפני שהתהליך יוצא.
+    """
+    
+    def __init__(self):
+        self.draining = False
+        self.drain_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def mark_draining(self) -> bool:
+        """
+        מעבר למצב drain
+        
+        Returns:
+            True אם זו הפעם הראשונה (False אם כבר במצב drain)
+        """
+        with self._lock:
+            if self.draining:
+                return False
+            self.draining = True
+            self.drain_started_at = time.time()
+            return True
+    
+    @property
+    def status(self) -> str:
+        """running / draining"""
+        return "draining" if self.draining else "running"
+
+
+def install_drain_handler(drain: Callable[[], int]):
+    """
+    רישום SIGTERM (למשל בפריסה ב-Render) - drain ב-thread נפרד ואז יציאה מהתהליך
+    
+    ה-handler עצמו לא חוסם, כך שהשרת ממשיך לענות (ול-health לדווח draining) בזמן ה-drain.
+    
+    Args:
+        drain: פונקציית ה-drain (מחזירה את מספר ה-jobs שחזרו לתור)
+    """
+    def run_drain():
+        try:
+            requeued = drain()
+            logger.info(f"Drain finished, {requeued} jobs returned to the queue - exiting")
+        except Exception as e:
+            logger.error(f"Drain failed: {e}")
+        finally:
+            os._exit(0)
+    
+    def handle_sigterm(signum, frame):
+        if not lifecycle.mark_draining():
+            return
+        logger.info("Received SIGTERM - draining before shutdown")
+        threading.Thread(target=run_drain, name="drain", daemon=True).start()
+    
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        # signal.signal עובד רק מה-main thread
+        logger.warning("SIGTERM drain handler not installed (not in main thread)")
+
+
+# Instance גלובלי
+lifecycle = Lifecycle()
@@ -0,0 +1,264 @@
+"""
+Progress formatting
+ניסוח הודעות ההתקדמות שהמשתמש רואה בזמן שה-job ממתין או מעובד
+"""
+import time
+from typing import Dict, Any, Optional, List
+
+from utils.edit_coalescer import edit_coalescer
+
+# סיבות ניסיון חוזר כפי שהמשתמש רואה אותן
+RETRY_REASONS = {
+    "rate_limit": "עומס בשירות ה-AI",
+    "timeout": "תשובה איטית מה-AI",
+    "invalid_response": "תשובה לא תקינה מה-AI",
+    "error": "שגיאה זמנית"
+}
+
+
+def new_progress() -> Dict[str, Any]:
+    """מצב התקדמות ריק של job"""
+    return {
+        "files_total": 0,
+        "files_done": 0,
+        "files_failed": 0,
+        "questions_target": 0,
+        "questions_accepted": 0,
+        "current_files": [],
+        "file_timings": [],
+        "retries": 0,
+        "last_retry": None,
+        "updated_at": time.time()
+    }
+
+
+def apply_progress_event(progress: Dict[str, Any], event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    עדכון מצב ההתקדמות לפי אירוע מה-generator (GenerationContext.report)
+    
+    Args:
+        progress: מצב ההתקדמות (מתעדכן במקום)
+        event: plan / file_started / file_done / file_failed / retry
+        data: נתוני האירוע
+    
+    Returns:
+        מצב ההתקדמות המעודכן
+    """
+    now = time.time()
+    
+    if event == "plan":
+        progress["files_total"] = data.get("files_total", 0)
+        progress["questions_target"] = data.get("questions_target", 0)
+    
+    elif event == "file_started":
+        progress["current_files"].append({
+            "index": data.get("index"),
+            "filename": data.get("filename"),
+            "count": data.get("count"),
+            "started_at": now
+        })
+    
+    elif event in ("file_done", "file_failed"):
+        index = data.get("index")
+        progress["current_files"] = [f for f in progress["current_files"] if f["index"] != index]
+        if event == "file_done":
+            progress["files_done"] += 1
+            progress["questions_accepted"] += data.get("questions", 0)
+        else:
+            progress["files_failed"] += 1
+        progress["file_timings"].append({
+            "filename": data.get("filename"),
+            "questions": data.get("questions", 0),
+            "seconds": data.get("seconds", 0),
+            "reused": data.get("reused", False),
+            "failed": event == "file_failed"
+        })
+    
+    elif event == "retry":
+        progress["retries"] += 1
+        progress["last_retry"] = {
+            "reason": data.get("reason"),
+            "attempt": data.get("attempt"),
+            "filename": data.get("filename"),
+            "at": now
+        }
+    
+    progress["updated_at"] = now
+    return progress
+
+
+def format_elapsed(seconds: float) -> str:
+    """משך זמן מדויק בפורמט m:ss"""
+    seconds = max(0, int(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def _escape_markdown(text: str) -> str:
+    """escape לתווים מיוחדים של Markdown בטלגרם (בשמות קבצים)"""
+    for char in ("_", "*", "`", "["):
+        text = text.replace(char, f"\\{char}")
+    return text
+
+
+def format_progress_lines(progress: Optional[Dict[str, Any]], markdown: bool = False) -> List[str]:
+    """
+    שורות ההתקדמות של job בעיבוד - קבצים, שאלות שהתקבלו, הקובץ הנוכחי וניסיונות חוזרים
+    
+    Args:
+        progress: מצב ההתקדמות מה-job (או None)
+        markdown: escape לשמות הקבצים (הודעות טלגרם עם parse_mode Markdown)
+    
+    Returns:
+        רשימת שורות (ריקה אם אין מידע)
+    """
+    if not progress or not progress.get("files_total"):
+        return []
+    
+    lines = []
+    if progress["files_total"] > 1:
+        lines.append(f"📂 קבצים: {progress['files_done']}/{progress['files_total']} הושלמו")
+    if progress.get("questions_target"):
+        lines.append(f"✅ שאלות שהתקבלו: {progress['questions_accepted']}/{progress['questions_target']}")
+    
+    for timing in progress.get("file_timings", [])[-3:]:
+        if timing.get("reused"):
+            continue
+        mark = "✗" if timing.get("failed") else "✓"
+        name = timing.get("filename") or "הטקסט"
+        name = _escape_markdown(name) if markdown else name
+        lines.append(f"  {mark} {name} - {format_elapsed(timing['seconds'])}")
+    
+    now = time.time()
+    for current in progress.get("current_files", []):
+        name = current.get("filename") or "הטקסט"
+        name = _escape_markdown(name) if markdown else name
+        lines.append(f"📄 עכשיו: {name} ({format_elapsed(now - current['started_at'])})")
+    
+    last_retry = progress.get("last_retry")
+    if last_retry and progress.get("current_files"):
+        reason = RETRY_REASONS.get(last_retry.get("reason"), RETRY_REASONS["error"])
+        lines.append(f"🔁 ניסיון {last_retry.get('attempt')}: {reason}")
+    
+    return lines
+
+
+def format_duration(seconds: float) -> str:
+    """
+    ניסוח משך זמן מעוגל (כדי שההודעה לא תשתנה בכל בדיקה)
+    
+    Args:
+        seconds: משך בשניות
+    
+    Returns:
+        טקסט כמו "כ-30 שניות" או "כ-3 דקות"
+    """
+    if seconds < 60:
+        return f"כ-{max(10, int(round(seconds / 10.0)) * 10)} שניות"
+    if seconds < 5400:
+        return f"כ-{int(round(seconds / 60.0))} דקות"
+    return f"כ-{int(round(seconds / 3600.0))} שעות"
+
+
+def format_job_progress(eta: Optional[Dict[str, Any]], count: int) -> Optional[str]:
+    """
+    הודעת התקדמות לפי מיקום בתור והערכת הזמן
+    
+    Args:
+        eta: התוצאה של queue_service.get_job_eta
+        count: מספר השאלות שהתבקשו
+    
+    Returns:
+        טקסט ההודעה או None אם אין מידע
+    """
+    if not eta:
+        return None
+    
+    if eta["status"] == "PENDING":
+        lines = [f"🕐 **בתור** - {count} שאלות"]
+        if eta.get("position"):
+            lines.append(f"📍 מקום בתור: {eta['position']}")
+        if eta["estimated_start_seconds"] > 0:
+            lines.append(f"▶️ התחלה משוערת: בעוד {format_duration(eta['estimated_start_seconds'])}")
+        lines.append(f"✅ סיום משוער: בעוד {format_duration(eta['estimated_finish_seconds'])}")
+        lines.append("\nאין צורך לשלוח שוב - הבקשה שמורה 🙏")
+        return "\n".join(lines)
+    
+    if eta["status"] == "PROCESSING":
+        lines = [f"⏳ **מעבד** - יוצר {count} שאלות עם AI", ""]
+        lines.extend(format_progress_lines(eta.get("progress"), markdown=True))
+        if eta["estimated_finish_seconds"] > 0:
+            lines.append(f"⏱ סיום משוער: בעוד {format_duration(eta['estimated_finish_seconds'])}")
+        else:
+            lines.append("כמעט מוכן, סבלנות 🙏")
+        return "\n".join(lines)
+    
+    return None
+
+
+def format_queue_full(retry_after: float) -> str:
+    """
+    הודעה למשתמש כשהבקשה נדחתה כי המערכת עמוסה
+    
+    Args:
+        retry_after: זמן משוער עד שכדאי לנסות שוב (שניות)
+    
+    Returns:
+        טקסט ההודעה
+    """
+    return (
+        "⏳ **המערכת עמוסה כרגע**\n\n"
+        f"הבקשה לא נכנסה לתור. נסה שוב בעוד {format_duration(retry_after)} 🙏\n"
+        "הקובץ שלך שמור - אין צורך להעלות אותו מחדש"
+    )
+
+
+def format_quota_exceeded(affordable: int, reset_seconds: float) -> str:
+    """
+    הודעה למשתמש כשהבקשה חורגת ממכסת העלות שלו
+    
+    Args:
+        affordable: כמה שאלות מאותם קבצים עדיין נכנסות במכסה (0 = אף כמות סבירה)
+        reset_seconds: זמן עד שהמכסה תתחדש מספיק לבקשה המלאה (שניות)
+    
+    Returns:
+        טקסט ההודעה
+    """
+    if affordable:
+        return (
+            "💳 **הבקשה גדולה מהמכסה שנשארה לך**\n\n"
+            f"כרגע אפשר ליצור עד {affordable} שאלות מהקבצים האלה - בחר מספר קטן יותר,\n"
+            f"או נסה שוב בעוד {format_duration(reset_seconds)} לכמות המלאה 🙏"
+        )
+    return (
+        "💳 **ניצלת את המכסה שלך**\n\n"
+        f"המכסה תתחדש בעוד {format_duration(reset_seconds)} 🙏\n"
+        "הקובץ שלך שמור - אין צורך להעלות אותו מחדש"
+    )
+
+
+def update_progress_message(message, eta: Optional[Dict[str, Any]], count: int) -> Optional[str]:
+    """
+    עדכון הודעת ההתקדמות בטלגרם - דרך ה-coalescer, שמאחד עריכות ומדלג על טקסט שלא השתנה
+    
+    Args:
+        message: הודעת ה-processing בטלגרם
+        eta: התוצאה של queue_service.get_job_eta
+        count: מספר השאלות שהתבקשו
+    
+    Returns:
+        הטקסט שהוגש (או None אם אין מידע)
+    """
+    text = format_job_progress(eta, count)
+    if text:
+        edit_coalescer.submit(message, text, parse_mode='Markdown')
+    return text
+
+
+def finish_progress_message(message):
+    """
+    סיום עדכוני ההתקדמות - לפני עריכת ההודעה להודעת סיום או מחיקתה
+    
+    Args:
+        message: הודעת ה-processing בטלגרם
+    """
+    edit_coalescer.close(message)
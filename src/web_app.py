@@ -9,7 +9,6 @@ from datetime import datetime
 from typing import List, Optional
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
 from werkzeug.utils import secure_filename
-import redis
 import json
 
 # Add src to Python path if needed
@@ -20,9 +19,15 @@ if current_dir not in sys.path:
 # Import existing services
 from config import config
 from services.file_service import FileService
-from services.generator_service import GeneratorService, Question
-from services.html_renderer import HTMLRenderer
+from services.redis_factory import redis_factory
+from services.pipeline import pipeline
+from services.queue_service import queue_service, QueueFullError
+from services.quota_service import QuotaExceededError
 from utils.logger import logger
+from utils.lifecycle import lifecycle
+from utils.keys import tagged
+from utils import codec
+from utils.progress import format_progress_lines, format_queue_full, format_quota_exceeded
 
 # Global telegram updater for webhook processing
 telegram_updater = None
@@ -144,18 +149,22 @@ app.config['MAX_CONTENT_LENGTH'] = config.MAX_FILE_SIZE_BYTES
 
 # Initialize services
 file_service = FileService()
-generator_service = GeneratorService()
-html_renderer = HTMLRenderer()
 
 # Redis for session management
 try:
-    redis_client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+    # ה-web sessions נשמרים בקידוד של ה-codec - client בלי decode
+    redis_client = redis_factory.client("binary")
     redis_client.ping()
     logger.info("Connected to Redis for web sessions")
 except Exception as e:
     logger.warning(f"Redis not available for web app: {e}")
     redis_client = None
 
+# Queue service - web jobs share the scheduler, quotas and admission control with the bot
+if not redis_client:
+    queue_service = None
+    logger.warning("Queue service not available - Redis required")
+
 def allowed_file(filename):
     """Check if file type is allowed"""
     if '.' not in filename:
@@ -165,14 +174,14 @@ def allowed_file(filename):
 
 def get_session_key(session_id: str) -> str:
     """Get Redis key for session"""
-    return f"web_session:{session_id}"
+    return f"web_session:{tagged(session_id)}"
 
 def save_session_data(session_id: str, data: dict) -> bool:
     """Save data to session"""
     if not redis_client:
         return False
     try:
-        redis_client.setex(get_session_key(session_id), 3600, json.dumps(data))
+        redis_client.setex(get_session_key(session_id), 3600, codec.dumps(data))
         return True
     except Exception as e:
         logger.error(f"Failed to save session data: {e}")
@@ -183,8 +192,7 @@ def get_session_data(session_id: str) -> Optional[dict]:
     if not redis_client:
         return None
     try:
-        data = redis_client.get(get_session_key(session_id))
-        return json.loads(data) if data else None
+        return codec.loads(redis_client.get(get_session_key(session_id)))
     except Exception as e:
         logger.error(f"Failed to get session data: {e}")
         return None
@@ -298,7 +306,7 @@ def upload_files():
                 }
                 mime_type = mime_type_map.get(ext, 'text/plain')
                 
-                text_result = file_service.extract_text(file_path, mime_type)
+                text_result = pipeline.extract_text(file_path, mime_type)
                 if text_result and text_result.get('text'):
                     text = text_result['text']
                     word_count = text_result.get('word_count', len(text.split()))
@@ -397,7 +405,7 @@ def select_questions():
 
 @app.route('/generate')
 def generate_quiz():
-    """Generate quiz and show progress"""
+    """Queue the quiz generation and show a page that follows the job"""
     session_id = session.get('session_id')
     if not session_id:
         flash('סשן פג תוקף, אנא התחל מחדש', 'error')
@@ -417,57 +425,56 @@ def generate_quiz():
         flash('נתונים חסרים, אנא התחל מחדש', 'error')
         return redirect(url_for('index'))
     
-    try:
-        logger.info(f"Web: Generating {question_count} questions from {len(files)} files")
-        
-        # Generate questions
-        if len(files) == 1:
-            # Single file
-            questions = generator_service._generate_questions_single(
-                text=files[0]['text'],
-                count=question_count,
-                file_context=files[0]['filename']
+    if not queue_service:
+        flash('שירות התור לא זמין כרגע, נסה שוב מאוחר יותר', 'error')
+        return redirect(url_for('select_questions'))
+    
+    metadata = {
+        'filename': ', '.join([f['filename'] for f in files]),
+        'word_count': sum(f.get('word_count', 0) for f in files)
+    }
+    
+    # רענון הדף לא יוצר job נוסף - ה-job של אותה בקשה ממשיך להיות מוצג
+    job_id = session_data.get('job_id') if session_data.get('job_question_count') == question_count else None
+    job = queue_service.get_job_status(job_id) if job_id else None
+    
+    if not job or job['status'] in ('FAILED', 'CANCELLED'):
+        try:
+            # ה-job עובר דרך התור המשותף - תזמון הוגן, מכסה, בקרת כניסה ובקשות כפולות כמו בטלגרם
+            logger.info(f"Web: Queueing {question_count} questions from {len(files)} files")
+            job_id = queue_service.add_job(
+                chat_id="web",
+                text="\n\n".join(f['text'] for f in files),
+                question_count=question_count,
+                metadata=metadata,
+                file_info={'files': files} if len(files) > 1 else None,
+                job_type="html",
+                owner=f"web:{session_id}"
             )
-        else:
-            # Multiple files
-            questions = generator_service._generate_questions_multi_file(files, question_count)
-        
-        if not questions:
-            flash('שגיאה ביצירת השאלות, אנא נסה שוב', 'error')
+        except QueueFullError as e:
+            flash(format_queue_full(e.retry_after).replace('**', ''), 'error')
+            return redirect(url_for('select_questions'))
+        except QuotaExceededError as e:
+            flash(format_quota_exceeded(e.affordable, e.reset_seconds).replace('**', ''), 'error')
             return redirect(url_for('select_questions'))
         
-        # Generate HTML
-        metadata = {
-            'filename': ', '.join([f['filename'] for f in files]),
-            'total_words': sum(f.get('word_count', 0) for f in files),
-            'question_count': len(questions)
-        }
-        html_content = html_renderer.render_quiz(questions, metadata)
-        
-        # Save quiz to session
-        quiz_data = {
-            'questions': [q.__dict__ for q in questions],
-            'html': html_content,
-            'generated_at': datetime.now().isoformat()
-        }
+        if not job_id:
+            flash('שגיאה ביצירת המבחן, אנא נסה שוב', 'error')
+            return redirect(url_for('select_questions'))
         
-        session_data['quiz'] = quiz_data
-        if not save_session_data(session_id, session_data):
-            flash('שגיאה בשמירת המבחן. אנא נסה שוב.', 'error')
-            return redirect(url_for('index'))
+        session_data['job_id'] = job_id
+        session_data['job_question_count'] = question_count
+        save_session_data(session_id, session_data)
         
-        # Clean up uploaded files
+        # The text is already in the job - the uploaded files are no longer needed
         for file in files:
-            if os.path.exists(file['path']):
+            if file.get('path') and os.path.exists(file['path']):
                 os.remove(file['path'])
-        
-        logger.info(f"Web: Successfully generated {len(questions)} questions")
-        return redirect(url_for('show_quiz'))
-        
-    except Exception as e:
-        logger.error(f"Error generating quiz: {e}")
-        flash('שגיאה ביצירת המבחן, אנא נסה שוב', 'error')
-        return redirect(url_for('select_questions'))
+    
+    return render_template('generating.html',
+                         job_id=job_id,
+                         question_count=question_count,
+                         filename=metadata['filename'])
 
 @app.route('/quiz')
 def show_quiz():
@@ -480,16 +487,51 @@ def show_quiz():
     # Get session data (no fallback to Flask session)
     session_data = get_session_data(session_id)
     
-    if not session_data or 'quiz' not in session_data:
+    if not session_data or not session_data.get('job_id') or not queue_service:
         flash('המבחן לא נמצא או פג תוקפו. אנא צור מבחן חדש.', 'error')
         return redirect(url_for('index'))
     
-    quiz_data = session_data.get('quiz', {})
-    if not quiz_data:
+    html_content = queue_service.get_job_html(session_data['job_id'])
+    if not html_content:
         flash('לא נמצא מבחן, אנא צור מבחן חדש', 'error')
         return redirect(url_for('index'))
     
-    return render_template('quiz.html', html_content=quiz_data['html'])
+    return render_template('quiz.html', html_content=html_content)
+
+def get_session_job(job_id: str) -> Optional[dict]:
+    """Job of the current web session - jobs of other users are not exposed"""
+    session_id = session.get('session_id')
+    if not queue_service or not session_id:
+        return None
+    job = queue_service.get_job_status(job_id)
+    if not job or job.get('owner') != f"web:{session_id}":
+        return None
+    return job
+
+@app.route('/job/<job_id>/status')
+def job_status(job_id):
+    """Queue position, ETA and progress for a background job"""
+    if not queue_service:
+        return jsonify({'status': 'error', 'error': 'Queue service not available'}), 503
+    
+    eta = queue_service.get_job_eta(job_id) if get_session_job(job_id) else None
+    if not eta:
+        return jsonify({'status': 'error', 'error': 'Job not found'}), 404
+    
+    eta['message'] = '\n'.join(format_progress_lines(eta.get('progress')))
+    return jsonify(eta), 200
+
+@app.route('/job/<job_id>/quiz')
+def job_quiz(job_id):
+    """Quiz HTML for a completed job, rendered on demand from the stored questions"""
+    if not queue_service:
+        return jsonify({'status': 'error', 'error': 'Queue service not available'}), 503
+    
+    html_content = queue_service.get_job_html(job_id) if get_session_job(job_id) else None
+    if not html_content:
+        return jsonify({'status': 'error', 'error': 'Quiz result not found'}), 404
+    
+    return html_content, 200, {'Content-Type': 'text/html; charset=utf-8'}
 
 @app.route('/debug-filesystem')
 def debug_filesystem():
@@ -577,6 +619,15 @@ def debug_path_alias():
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
+    if lifecycle.draining:
+        # ה-instance בכיבוי - ה-load balancer צריך להעביר תנועה ל-instances אחרים
+        return jsonify({
+            'status': 'draining',
+            'service': 'telegram-mcq-bot-web',
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'drain_started_at': lifecycle.drain_started_at
+        }), 503
+    
     try:
         # Check template system
         template_status = os.path.exists(app.template_folder) if app.template_folder else False
@@ -630,6 +681,27 @@ def health_check():
             'error': str(e)
         }), 500
 
+@app.route('/metrics')
+def metrics():
+    """Queue and worker metrics for monitoring"""
+    metrics_data = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'autoscaler': None,
+        'pipeline': None
+    }
+    
+    try:
+        if redis_client:
+            autoscaler_json = redis_client.get("metrics:autoscaler")
+            metrics_data['autoscaler'] = json.loads(autoscaler_json) if autoscaler_json else None
+            pipeline_json = redis_client.get("metrics:pipeline")
+            metrics_data['pipeline'] = json.loads(pipeline_json) if pipeline_json else None
+    except Exception as e:
+        logger.error(f"Failed to read metrics: {e}")
+        metrics_data['error'] = str(e)
+    
+    return jsonify(metrics_data), 200
+
 @app.errorhandler(413)
 def too_large(e):
     """Handle file too large error"""
@@ -706,5 +778,8 @@ def webhook():
         return 'Error', 500
 
 if __name__ == '__main__':
+    # Without the bot nothing else starts the workers - web jobs still need them
+    if not config.RUN_TELEGRAM_BOT and queue_service:
+        queue_service.start_configured_workers()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Test fixtures
+השירותים נבדקים מול ה-embedded store (המימוש בפייתון של סקריפטי ה-Lua) וגם מול Redis
+שמריץ את סקריפטי ה-Lua עצמם: TEST_REDIS_URL, redis-server מקומי (אם מותקן), או
+fakeredis עם lupa (requirements-dev.txt) - כך שאותן בדיקות משוות את שני המימושים
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+# השירותים מייבאים את config בזמן הטעינה - ההגדרות נקבעות לפני כל import מ-src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+os.environ["STORAGE_BACKEND"] = "embedded"
+os.environ["EMBEDDED_STORE_PATH"] = ""
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token")
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import pytest
+
+from services.embedded_store import EmbeddedStore, EmbeddedRedis
+
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL", "")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def redis_server():
+    """
+    Redis אמיתי לבדיקות - TEST_REDIS_URL, או redis-server זמני על port פנוי
+    
+    Returns:
+        URL של השרת, או None אם אין שרת זמין
+    """
+    if TEST_REDIS_URL:
+        yield TEST_REDIS_URL
+        return
+    
+    binary = shutil.which("redis-server")
+    if not binary:
+        yield None
+        return
+    
+    import redis
+    port = _free_port()
+    process = subprocess.Popen(
+        [binary, "--port", str(port), "--bind", "127.0.0.1", "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"redis://127.0.0.1:{port}/0"
+    try:
+        for _ in range(50):
+            try:
+                redis.Redis.from_url(url).ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def lua_clients(redis_server):
+    """
+    זוג clients (decode, בינארי) על Redis ריק שמריץ את סקריפטי ה-Lua
+    
+    Args:
+        redis_server: URL משרת הבדיקות, או None כדי להשתמש ב-fakeredis
+    
+    Returns:
+        (redis_client, binary_client), או None אם אין Redis עם Lua זמין
+    """
+    if redis_server:
+        import redis
+        client = redis.Redis.from_url(redis_server, decode_responses=True)
+        client.flushdb()
+        return client, redis.Redis.from_url(redis_server)
+    
+    try:
+        import fakeredis
+        import lupa  # noqa: F401 - בלעדיו fakeredis לא מריץ סקריפטים
+    except ImportError:
+        return None
+    server = fakeredis.FakeServer()
+    return fakeredis.FakeRedis(server=server, decode_responses=True), fakeredis.FakeRedis(server=server)
+
+
+@pytest.fixture(params=["embedded", "redis"])
+def backend(request, redis_server):
+    """
+    זוג clients (decode, בינארי) על store ריק
+    
+    Returns:
+        (redis_client, binary_client)
+    """
+    if request.param == "embedded":
+        store = EmbeddedStore()
+        yield EmbeddedRedis(store, decode_responses=True), EmbeddedRedis(store, decode_responses=False)
+        store.close()
+        return
+    
+    clients = lua_clients(redis_server)
+    if clients is None:
+        pytest.skip("No Redis with Lua: set TEST_REDIS_URL, install redis-server or requirements-dev.txt")
+    yield clients
+    clients[0].flushdb()
+
+
+@pytest.fixture
+def redis_client(backend):
+    """client עם decode_responses=True"""
+    return backend[0]
+
+
+@pytest.fixture
+def binary_client(backend):
+    """client בינארי (בלי decode_responses)"""
+    return backend[1]
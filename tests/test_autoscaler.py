@@ -0,0 +1,60 @@
+"""
+בדיקות ל-WorkerAutoscaler - החלק של כל instance מהתור המשותף
+"""
+import time
+
+import pytest
+
+from services.autoscaler import WorkerAutoscaler, INSTANCES_KEY
+
+
+@pytest.fixture(autouse=True)
+def autoscale_config(monkeypatch):
+    monkeypatch.setattr("config.config.WORKER_MIN", 1)
+    monkeypatch.setattr("config.config.WORKER_MAX", 50)
+    monkeypatch.setattr("config.config.AUTOSCALE_TARGET_WAIT", 30)
+    monkeypatch.setattr("config.config.AUTOSCALE_INTERVAL", 10)
+
+
+def autoscaler(redis_client=None, current=1):
+    return WorkerAutoscaler(lambda: {}, lambda target: None, current, redis_client)
+
+
+def stats(queue_length, instances=1, busy=2):
+    return {
+        "queue_length": queue_length,
+        "busy_workers": busy,
+        "avg_latency_seconds": 30,
+        "oldest_wait_seconds": 0,
+        "instances": instances
+    }
+
+
+def test_backlog_is_split_between_instances():
+    scaler = autoscaler()
+    
+    assert scaler.desired_workers(stats(12)) == 14
+    assert scaler.desired_workers(stats(12, instances=3)) == 6
+    # החלק של כל instance מעוגל למעלה - התור לא נשאר בלי worker
+    assert scaler.desired_workers(stats(1, instances=3)) == 3
+
+
+def test_heartbeat_counts_live_instances(redis_client):
+    first, second = autoscaler(redis_client), autoscaler(redis_client)
+    second.instance_id = "other-host:1"
+    
+    assert first._heartbeat() == 1
+    assert second._heartbeat() == 2
+    
+    second.stop()
+    assert first._heartbeat() == 1
+
+
+def test_stale_instance_is_not_counted(redis_client):
+    redis_client.zadd(INSTANCES_KEY, {"dead-host:1": time.time() - 300})
+    
+    assert autoscaler(redis_client)._heartbeat() == 1
+
+
+def test_heartbeat_without_redis_counts_one():
+    assert autoscaler()._heartbeat() == 1
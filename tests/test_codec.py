@@ -0,0 +1,77 @@
+"""
+בדיקות ל-codec - header עם גרסה, דחיסה וקריאה של ערכי JSON ישנים
+"""
+import json
+import zlib
+
+import pytest
+
+from utils import codec
+
+VALUE = {"chat_id": "123", "state": "WAITING_FOR_COUNT", "questions": [{"question": "מה התפקיד של התא?"}]}
+
+
+@pytest.fixture(autouse=True)
+def codec_config(monkeypatch):
+    monkeypatch.setattr("config.config.PAYLOAD_CODEC_VERSION", 1)
+    monkeypatch.setattr("config.config.PAYLOAD_COMPRESS_THRESHOLD", 1024)
+    monkeypatch.setattr("config.config.PAYLOAD_COMPRESS_LEVEL", 6)
+
+
+def test_small_value_round_trip():
+    encoded = codec.dumps(VALUE)
+    
+    assert encoded[:3] == bytes((codec.MAGIC, codec.VERSION, 0))
+    assert codec.loads(encoded) == VALUE
+
+
+def test_large_value_is_compressed():
+    value = {"text": "המערכת החיסונית מגינה על הגוף. " * 200}
+    
+    encoded = codec.dumps(value)
+    
+    assert encoded[2] & codec.FLAG_COMPRESSED
+    assert len(encoded) < len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+    assert codec.loads(encoded) == value
+
+
+def test_incompressible_value_is_stored_plain(monkeypatch):
+    monkeypatch.setattr("config.config.PAYLOAD_COMPRESS_THRESHOLD", 1)
+    
+    encoded = codec.dumps([1])
+    
+    assert encoded[2] == 0
+    assert codec.loads(encoded) == [1]
+
+
+def test_reads_legacy_json():
+    legacy = json.dumps(VALUE)
+    
+    assert codec.loads(legacy) == VALUE
+    assert codec.loads(legacy.encode("utf-8")) == VALUE
+    assert codec.loads(None) is None
+
+
+def test_version_zero_writes_plain_json(monkeypatch):
+    monkeypatch.setattr("config.config.PAYLOAD_CODEC_VERSION", 0)
+    
+    encoded = codec.dumps(VALUE)
+    
+    assert json.loads(encoded) == VALUE
+
+
+def test_rejects_newer_or_truncated_payloads():
+    newer = bytes((codec.MAGIC, codec.VERSION + 1, 0)) + b"{}"
+    
+    with pytest.raises(codec.CodecError):
+        codec.loads(newer)
+    with pytest.raises(codec.CodecError):
+        codec.loads(bytes((codec.MAGIC, codec.VERSION)))
+
+
+def test_compressed_body_is_plain_zlib():
+    value = {"text": "א" * 5000}
+    
+    encoded = codec.dumps(value)
+    
+    assert json.loads(zlib.decompress(encoded[codec.HEADER_SIZE:])) == value
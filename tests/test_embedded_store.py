@@ -0,0 +1,102 @@
+"""
+בדיקות ל-EmbeddedStore - פקודות, תפוגה ושמירה ל-SQLite
+"""
+import time
+
+import pytest
+
+from services.embedded_store import EmbeddedStore, EmbeddedRedis, EmbeddedStoreError
+
+
+@pytest.fixture
+def store():
+    store = EmbeddedStore()
+    yield store
+    store.close()
+
+
+def test_decode_responses_per_client(store):
+    text = EmbeddedRedis(store, decode_responses=True)
+    binary = EmbeddedRedis(store, decode_responses=False)
+    
+    text.set("greeting", "שלום")
+    binary.set("blob", b"\xc1\x01\x00{}")
+    
+    assert text.get("greeting") == "שלום"
+    assert binary.get("greeting") == "שלום".encode("utf-8")
+    assert binary.get("blob") == b"\xc1\x01\x00{}"
+
+
+def test_set_nx_and_expiry(store):
+    client = EmbeddedRedis(store, decode_responses=True)
+    
+    assert client.set("lock", "a", nx=True, ex=60)
+    assert not client.set("lock", "b", nx=True, ex=60)
+    assert client.get("lock") == "a"
+    assert 0 < client.ttl("lock") <= 60
+    
+    client.set("short", "x", px=1)
+    time.sleep(0.01)
+    assert client.get("short") is None
+    assert client.exists("short") == 0
+
+
+def test_pipeline_is_applied_in_order(store):
+    client = EmbeddedRedis(store, decode_responses=True)
+    
+    pipe = client.pipeline()
+    pipe.zadd("board", {"a": 2, "b": 1})
+    pipe.zrange("board", 0, -1)
+    pipe.zpopmin("board")
+    pipe.zcard("board")
+    results = pipe.execute()
+    
+    assert results[1] == ["b", "a"]
+    assert results[2] == [("b", 1.0)]
+    assert results[3] == 1
+
+
+def test_empty_structure_is_removed(store):
+    client = EmbeddedRedis(store, decode_responses=True)
+    
+    client.sadd("members", "x")
+    client.srem("members", "x")
+    
+    assert client.exists("members") == 0
+
+
+def test_unknown_script_is_rejected(store):
+    client = EmbeddedRedis(store, decode_responses=True)
+    
+    with pytest.raises(EmbeddedStoreError):
+        client.register_script("return 1")
+
+
+def test_sqlite_reload_keeps_values_and_ttl(tmp_path):
+    path = str(tmp_path / "store.db")
+    store = EmbeddedStore(path, flush_interval=60)
+    client = EmbeddedRedis(store, decode_responses=True)
+    binary = EmbeddedRedis(store, decode_responses=False)
+    
+    client.setex("session", 300, "active")
+    binary.set("payload", b"\xc1\x01\x00[]")
+    client.zadd("queue", {"job_1": 10.0})
+    client.hset("stats", mapping={"done": 3})
+    client.rpush("ready", "job_1", "job_2")
+    client.set("gone", "x", px=1)
+    time.sleep(0.01)
+    store.close()
+    
+    reopened = EmbeddedStore(path, flush_interval=60)
+    client = EmbeddedRedis(reopened, decode_responses=True)
+    binary = EmbeddedRedis(reopened, decode_responses=False)
+    try:
+        assert client.get("session") == "active"
+        assert 0 < client.ttl("session") <= 300
+        assert binary.get("payload") == b"\xc1\x01\x00[]"
+        assert client.zscore("queue", "job_1") == 10.0
+        assert client.hgetall("stats") == {"done": "3"}
+        assert client.lrange("ready", 0, -1) == ["job_1", "job_2"]
+        assert client.get("gone") is None
+    finally:
+        reopened.close()
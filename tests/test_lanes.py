@@ -0,0 +1,85 @@
+"""
+בדיקות ל-LaneCapacity - קיבולת שמורה, השאלת slots ומסלול בלי משקל
+"""
+import pytest
+
+from services.lanes import LaneCapacity, parse_lanes, select_lane
+
+
+@pytest.fixture(autouse=True)
+def lane_config(monkeypatch):
+    monkeypatch.setattr("config.config.LATENCY_LANE", "interactive")
+    monkeypatch.setattr("config.config.THROUGHPUT_LANE", "bulk")
+    monkeypatch.setattr("config.config.SPECULATIVE_LANE", "speculative")
+    monkeypatch.setattr("config.config.LANE_KEEP_IDLE", 1)
+
+
+def capacity(total: int) -> LaneCapacity:
+    return LaneCapacity(parse_lanes("interactive:2,bulk:1,speculative:0"), total)
+
+
+def test_parse_lanes_keeps_priority_order():
+    assert parse_lanes("interactive:2, bulk:1,speculative:0,extra") == {
+        "interactive": 2, "bulk": 1, "speculative": 0, "extra": 1
+    }
+
+
+def test_select_lane_by_job_size(monkeypatch):
+    monkeypatch.setattr("config.config.LANE_SMALL_MAX_QUESTIONS", 10)
+    monkeypatch.setattr("config.config.LANE_SMALL_MAX_WORDS", 5000)
+    
+    assert select_lane("interactive", 50, 100000) == "interactive"
+    assert select_lane("speculative", 5, 100) == "speculative"
+    assert select_lane("html", 5, 1000) == "interactive"
+    assert select_lane("html", 30, 1000) == "bulk"
+
+
+def test_reserved_shares_follow_weights():
+    lanes = capacity(6)
+    
+    assert {lane: slots["reserved"] for lane, slots in lanes.snapshot().items()} == {
+        "interactive": 4, "bulk": 2, "speculative": 0
+    }
+
+
+def test_bulk_borrows_but_leaves_latency_slot_idle():
+    lanes = capacity(3)
+    
+    lanes.acquire("bulk")
+    assert "bulk" in lanes.pollable_lanes()
+    
+    lanes.acquire("bulk")
+    # השאלה נוספת הייתה תופסת את ה-slot שמסלול ה-latency שומר פנוי
+    assert lanes.pollable_lanes() == ["interactive"]
+
+
+def test_interactive_borrows_idle_bulk_slot():
+    lanes = capacity(3)
+    
+    lanes.acquire("interactive")
+    lanes.acquire("interactive")
+    
+    assert "interactive" in lanes.pollable_lanes()
+    lanes.acquire("interactive")
+    assert lanes.pollable_lanes() == []
+
+
+def test_weightless_lane_always_leaves_a_free_slot():
+    lanes = capacity(3)
+    
+    assert "speculative" in lanes.pollable_lanes()
+    lanes.acquire("speculative")
+    assert "speculative" not in lanes.pollable_lanes()
+    
+    lanes.release("speculative")
+    lanes.acquire("bulk")
+    lanes.acquire("interactive")
+    assert "speculative" not in lanes.pollable_lanes()
+
+
+def test_set_total_recomputes_shares():
+    lanes = capacity(0)
+    assert lanes.pollable_lanes() == []
+    
+    lanes.set_total(3)
+    assert lanes.pollable_lanes()[:2] == ["interactive", "bulk"]
@@ -0,0 +1,123 @@
+"""
+בדיקות ל-QueueService - הגשה idempotent, מזהי job, דיווח על jobs שרצו ומדדי המסלולים
+"""
+import itertools
+import json
+import time
+from collections import deque
+
+import pytest
+
+from services.generator_service import generator_service
+from services.queue_service import queue_service, LANE_METRICS_KEY
+
+TEXT = "תאי הזיכרון נשארים אחרי ההחלמה ומזהים את הגורם במהירות. " * 20
+_chat_ids = itertools.count(int(time.time()) * 1000)
+
+
+@pytest.fixture
+def chat_id():
+    """צ'אט חדש לכל בדיקה - השירות גלובלי והמפתחות שלו חיים בין הבדיקות"""
+    return next(_chat_ids)
+
+
+def submit(chat_id, question_count=5, text=TEXT):
+    return queue_service.add_job(chat_id, text, question_count, {"filename": "פרק 1"})
+
+
+def quota_used(chat_id):
+    """יחידות המכסה שרשומות למשתמש בחלון השעה"""
+    limiter = queue_service.quotas.limiter
+    members = limiter.redis_client.zrange(limiter._key(f"tg:{chat_id}", "hour"), 0, -1)
+    return sum(float(member.rsplit(":", 1)[1]) for member in members)
+
+
+def test_duplicate_submission_returns_existing_job(chat_id, monkeypatch):
+    monkeypatch.setattr("config.config.QUOTA_ENABLED", True)
+    job_id = submit(chat_id)
+    
+    assert job_id
+    assert submit(chat_id) == job_id
+    job = queue_service.get_job_status(job_id)
+    assert job["status"] == "PENDING"
+    # הבקשה הכפולה לא נספרת שוב במכסה
+    assert quota_used(chat_id) == job["quota"]["units"]
+
+
+def test_different_request_gets_new_job(chat_id):
+    first = submit(chat_id)
+    
+    second = submit(chat_id, question_count=6)
+    
+    assert second and second != first
+    # בקשה חדשה מאותו משתמש מחליפה את הקודמת
+    assert queue_service.get_job_status(first)["status"] == "CANCELLED"
+
+
+def test_finished_job_does_not_absorb_resubmission(chat_id):
+    first = submit(chat_id)
+    queue_service.update_job_status(first, "FAILED", error="boom")
+    
+    second = submit(chat_id)
+    
+    assert second and second != first
+
+
+def test_failed_submission_returns_reservation(chat_id, monkeypatch):
+    monkeypatch.setattr("config.config.QUOTA_ENABLED", True)
+    
+    def cancel_owner_jobs(owner, reason=None):
+        raise ConnectionError("redis unavailable")
+    
+    monkeypatch.setattr(queue_service, "cancel_owner_jobs", cancel_owner_jobs)
+    assert submit(chat_id) == ""
+    assert quota_used(chat_id) == 0
+    
+    # ההגשה החוזרת לא נצמדת ל-job שלא נכנס לתור
+    monkeypatch.undo()
+    job_id = submit(chat_id)
+    assert job_id
+    assert queue_service.get_job_status(job_id)["status"] == "PENDING"
+
+
+def test_job_ids_do_not_collide_within_a_second(chat_id):
+    job_ids = {queue_service._new_job_id(chat_id) for _ in range(200)}
+    
+    assert len(job_ids) == 200
+
+
+def test_process_job_reports_whether_job_ran(chat_id, monkeypatch):
+    # רק job שרץ בפועל נספר בזמני העיבוד של ה-autoscaler
+    assert queue_service._process_job("job_missing") is False
+    
+    cancelled = submit(chat_id)
+    queue_service.cancel_job(cancelled)
+    assert queue_service._process_job(cancelled) is False
+    
+    def generate(text, question_count, file_info=None, ctx=None):
+        raise RuntimeError("model error")
+    
+    monkeypatch.setattr(generator_service, "generate_questions", generate)
+    failed = submit(chat_id, question_count=7)
+    assert queue_service._process_job(failed) is True
+    assert queue_service.get_job_status(failed)["status"] == "FAILED"
+
+
+def test_lane_metrics_are_combined_across_instances(monkeypatch):
+    redis_client = queue_service.redis_client
+    redis_client.delete(LANE_METRICS_KEY)
+    monkeypatch.setattr(queue_service, "instance_id", "host-a:1")
+    monkeypatch.setattr(queue_service.lane_capacity, "reserved", {"interactive": 2, "bulk": 1, "speculative": 0})
+    monkeypatch.setattr(queue_service, "lane_service_times", {"bulk": deque([10.0, 30.0])})
+    queue_service._publish_lane_metrics()
+    
+    other = {"published_at": time.time(), "lanes": {"bulk": {"service_time_seconds": 50.0, "samples": 2, "slots": 3}}}
+    dead = {"published_at": time.time() - 600, "lanes": {"bulk": {"service_time_seconds": 500.0, "samples": 9, "slots": 9}}}
+    redis_client.hset(LANE_METRICS_KEY, mapping={"host-b:1": json.dumps(other), "host-c:1": json.dumps(dead)})
+    
+    # ה-slots מסתכמים וזמן העיבוד משוקלל לפי הדגימות; instance שלא פרסם מזמן לא נספר
+    assert queue_service._lane_metrics("bulk") == (35.0, 4)
+    assert set(redis_client.hgetall(LANE_METRICS_KEY)) == {"host-a:1", "host-b:1"}
+    
+    queue_service._withdraw_lane_metrics()
+    assert queue_service._lane_metrics("bulk") == (50.0, 3)
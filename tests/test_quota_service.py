@@ -0,0 +1,83 @@
+"""
+בדיקות ל-QuotaService - תפיסה לפי עלות משוערת ותיקון לפי השימוש בפועל
+"""
+import pytest
+
+from services.quota_service import QuotaService, QuotaExceededError
+
+TEXT = "א" * 300  # 100 input tokens + 700 של ה-prompt
+
+
+@pytest.fixture(autouse=True)
+def quota_config(monkeypatch):
+    monkeypatch.setattr("config.config.QUOTA_ENABLED", True)
+    monkeypatch.setattr("config.config.QUOTA_UNITS_PER_HOUR", 10000)
+    monkeypatch.setattr("config.config.QUOTA_UNITS_PER_DAY", 100000)
+    monkeypatch.setattr("config.config.QUOTA_CHARS_PER_TOKEN", 3.0)
+    monkeypatch.setattr("config.config.QUOTA_PROMPT_TOKENS", 700)
+    monkeypatch.setattr("config.config.QUOTA_OUTPUT_TOKENS_PER_QUESTION", 250)
+    monkeypatch.setattr("config.config.QUOTA_OUTPUT_TOKEN_WEIGHT", 4.0)
+    monkeypatch.setattr("config.config.MIN_QUESTIONS", 3)
+
+
+@pytest.fixture
+def quotas(redis_client):
+    return QuotaService(redis_client)
+
+
+def used_units(quotas, subject, window="hour"):
+    """סכום העלויות שרשומות בחלון של המשתמש"""
+    key = quotas.limiter._key(subject, window)
+    members = quotas.limiter.redis_client.zrange(key, 0, -1)
+    return sum(float(member.rsplit(":", 1)[1]) for member in members)
+
+
+def test_estimate_weights_output_tokens():
+    assert QuotaService.estimate([TEXT], 5) == {"input_tokens": 800, "output_tokens": 1250, "units": 5800}
+    # כל קובץ נשלח בקריאה נפרדת עם ההוראות הקבועות
+    assert QuotaService.estimate([TEXT, TEXT], 5)["input_tokens"] == 1600
+
+
+def test_reserve_records_estimate(quotas):
+    reservation = quotas.reserve("tg:1", "job_a", [TEXT], 5)
+    
+    assert reservation == {"subject": "tg:1", "units": 5800}
+    assert used_units(quotas, "tg:1") == 5800
+    assert used_units(quotas, "tg:1", "day") == 5800
+
+
+def test_exceeded_quota_reports_affordable_questions(quotas):
+    quotas.reserve("tg:1", "job_a", [TEXT], 5)
+    
+    with pytest.raises(QuotaExceededError) as error:
+        quotas.reserve("tg:1", "job_b", [TEXT], 5)
+    
+    assert error.value.requested == 5
+    assert error.value.affordable == 3
+    assert 0 < error.value.reset_seconds <= 3600
+    assert used_units(quotas, "tg:1") == 5800
+
+
+def test_settle_charges_actual_usage(quotas):
+    reservation = quotas.reserve("tg:1", "job_a", [TEXT], 5)
+    
+    assert quotas.settle("job_a", reservation, {"input_tokens": 500, "output_tokens": 500})
+    
+    assert used_units(quotas, "tg:1") == 2500
+    assert quotas.reserve("tg:1", "job_b", [TEXT], 5)
+
+
+def test_settle_without_usage_refunds(quotas):
+    reservation = quotas.reserve("tg:1", "job_a", [TEXT], 5)
+    
+    assert quotas.settle("job_a", reservation, None)
+    assert not quotas.settle("job_a", reservation, None)
+    
+    assert used_units(quotas, "tg:1") == 0
+
+
+def test_disabled_quota_reserves_nothing(quotas, monkeypatch):
+    monkeypatch.setattr("config.config.QUOTA_ENABLED", False)
+    
+    assert quotas.reserve("tg:1", "job_a", [TEXT], 5) is None
+    assert used_units(quotas, "tg:1") == 0
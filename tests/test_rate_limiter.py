@@ -0,0 +1,72 @@
+"""
+בדיקות ל-SlidingWindowLimiter - שימושים עם עלות, דחייה ותיקון עלות
+"""
+import pytest
+
+from services.rate_limiter import SlidingWindowLimiter
+
+WINDOWS = [("minute", 60, 5), ("hour", 3600, 8)]
+
+
+@pytest.fixture
+def limiter(redis_client):
+    return SlidingWindowLimiter(redis_client, prefix="test_window")
+
+
+def window_costs(redis_client, limiter, subject, window="minute"):
+    """entry_id -> העלות שנרשמה בחלון, מתוך ה-members (<id>:<cost>)"""
+    members = redis_client.zrange(limiter._key(subject, window), 0, -1)
+    return {member.rsplit(":", 1)[0]: float(member.rsplit(":", 1)[1]) for member in members}
+
+
+def test_members_carry_their_cost(limiter, redis_client):
+    first = limiter.acquire("tg:1", WINDOWS, cost=3, entry_id="job_a")
+    second = limiter.acquire("tg:1", WINDOWS, cost=2, entry_id="job_b")
+    
+    assert first["allowed"] and second["allowed"]
+    assert second["windows"]["minute"]["used"] == 5
+    assert second["windows"]["hour"]["remaining"] == 3
+    assert window_costs(redis_client, limiter, "tg:1") == {"job_a": 3, "job_b": 2}
+    assert window_costs(redis_client, limiter, "tg:1", "hour") == {"job_a": 3, "job_b": 2}
+
+
+def test_denied_request_is_not_recorded(limiter, redis_client):
+    limiter.acquire("tg:1", WINDOWS, cost=4, entry_id="job_a")
+    
+    result = limiter.acquire("tg:1", WINDOWS, cost=2, entry_id="job_b")
+    
+    assert not result["allowed"]
+    assert result["windows"]["minute"]["used"] == 4
+    assert 0 < result["windows"]["minute"]["reset_seconds"] <= 60
+    assert result["windows"]["hour"]["reset_seconds"] == 0
+    assert window_costs(redis_client, limiter, "tg:1") == {"job_a": 4}
+
+
+def test_subjects_are_independent(limiter):
+    limiter.acquire("tg:1", WINDOWS, cost=5)
+    
+    assert limiter.acquire("tg:2", WINDOWS, cost=5)["allowed"]
+    assert not limiter.acquire("tg:1", WINDOWS, cost=1)["allowed"]
+
+
+def test_adjust_rewrites_cost_in_place(limiter, redis_client):
+    limiter.acquire("tg:1", WINDOWS, cost=4, entry_id="job_a")
+    score = redis_client.zscore(limiter._key("tg:1", "minute"), "job_a:4")
+    assert score is not None
+
+    assert limiter.adjust("tg:1", WINDOWS, "job_a", 4, 1)
+    
+    assert window_costs(redis_client, limiter, "tg:1") == {"job_a": 1}
+    assert redis_client.zscore(limiter._key("tg:1", "minute"), "job_a:1") == score
+    assert limiter.acquire("tg:1", WINDOWS, cost=4)["allowed"]
+
+
+def test_refund_frees_the_window_once(limiter, redis_client):
+    limiter.acquire("tg:1", WINDOWS, cost=5, entry_id="job_a")
+    
+    assert limiter.adjust("tg:1", WINDOWS, "job_a", 5, 0)
+    # תיקון חוזר של אותה תפיסה לא מוצא את השימוש הישן ולא משנה דבר
+    assert not limiter.adjust("tg:1", WINDOWS, "job_a", 5, 0)
+    
+    assert window_costs(redis_client, limiter, "tg:1") == {}
+    assert limiter.acquire("tg:1", WINDOWS, cost=5)["allowed"]
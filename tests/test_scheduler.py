@@ -0,0 +1,130 @@
+"""
+בדיקות ל-FairScheduler - סבב הוגן בין משתמשים ו-shortest-job-first בתוך משתמש
+"""
+import time
+
+import pytest
+
+from services.scheduler import FairScheduler, POP_OWNER_WINDOW
+
+LANE = "bulk"
+
+
+@pytest.fixture
+def scheduler(redis_client):
+    return FairScheduler(redis_client)
+
+
+def drain(scheduler, lane=LANE):
+    """כל ה-jobs החיים במסלול לפי סדר השליפה"""
+    popped = []
+    while True:
+        item, _ = scheduler.pop(lane)
+        if item is None:
+            return popped
+        popped.append(item)
+
+
+def test_round_robin_between_owners(scheduler):
+    for i, job_id in enumerate(["a1", "a2", "a3"]):
+        scheduler.enqueue(LANE, "tg:1", job_id, cost=1, since=1000 + i)
+    scheduler.enqueue(LANE, "tg:2", "b1", cost=1, since=1010)
+    
+    assert drain(scheduler) == [("tg:1", "a1"), ("tg:2", "b1"), ("tg:1", "a2"), ("tg:1", "a3")]
+
+
+def test_cheap_job_overtakes_recent_expensive_job(scheduler, monkeypatch):
+    monkeypatch.setattr("config.config.SCHED_AGING_SECONDS_PER_COST", 2.0)
+    scheduler.enqueue(LANE, "tg:1", "big", cost=10, since=1000)
+    scheduler.enqueue(LANE, "tg:1", "small", cost=1, since=1001)
+    # job גדול ותיק מספיק כבר לא נעקף
+    scheduler.enqueue(LANE, "tg:1", "late", cost=1, since=1030)
+    
+    assert [job_id for _, job_id in drain(scheduler)] == ["small", "big", "late"]
+
+
+def test_jobs_ahead_and_remove(scheduler):
+    scheduler.enqueue(LANE, "tg:1", "a1", cost=1, since=1000)
+    scheduler.enqueue(LANE, "tg:1", "a2", cost=1, since=1001)
+    scheduler.enqueue(LANE, "tg:2", "b1", cost=1, since=1002)
+    
+    # הערכה: המקום בתור של המשתמש ועד אותו מספר+1 מכל משתמש אחר בסבב
+    assert scheduler.jobs_ahead(LANE, "tg:1", "a1") == 1
+    assert scheduler.jobs_ahead(LANE, "tg:1", "a2") == 2
+    assert scheduler.jobs_ahead(LANE, "tg:2", "b1") == 1
+    
+    assert scheduler.remove(LANE, "tg:2", "b1")
+    assert not scheduler.remove(LANE, "tg:2", "b1")
+    assert scheduler.jobs_ahead(LANE, "tg:2", "b1") is None
+    assert drain(scheduler) == [("tg:1", "a1"), ("tg:1", "a2")]
+
+
+def test_claim_due_returns_each_job_once(scheduler):
+    scheduler.schedule("due", time.time() - 1)
+    scheduler.schedule("later", time.time() + 60)
+    
+    assert scheduler.claim_due() == ["due"]
+    assert scheduler.claim_due() == []
+
+
+def test_bounded_lane_rejects_new_jobs(scheduler):
+    assert scheduler.enqueue(LANE, "tg:1", "a1", cost=1, max_queued=2)
+    assert scheduler.enqueue(LANE, "tg:2", "b1", cost=1, max_queued=2)
+    assert not scheduler.enqueue(LANE, "tg:3", "c1", cost=1, max_queued=2)
+    # job שכבר בתור (requeue) לא נספר פעמיים
+    assert scheduler.enqueue(LANE, "tg:1", "a1", cost=1, max_queued=2)
+
+
+def test_pop_skips_expired_jobs(scheduler, redis_client):
+    past = time.time() - 60
+    for i in range(3):
+        scheduler.enqueue(LANE, "tg:1", f"old{i}", cost=1, since=1000 + i, expires_at=past)
+    scheduler.enqueue(LANE, "tg:1", "live", cost=1, since=1010, expires_at=time.time() + 60)
+    
+    item, expired = scheduler.pop(LANE)
+    
+    assert item == ("tg:1", "live")
+    assert expired == ["old0", "old1", "old2"]
+    assert redis_client.zcard(scheduler.enqueued_key(LANE)) == 0
+    assert redis_client.zcard(scheduler.expires_key(LANE)) == 0
+
+
+def test_pop_stops_at_expiry_budget(scheduler):
+    past = time.time() - 60
+    for i in range(3):
+        scheduler.enqueue(LANE, "tg:1", f"old{i}", cost=1, since=1000 + i, expires_at=past)
+    scheduler.enqueue(LANE, "tg:1", "live", cost=1, since=1010)
+    
+    # שליפה אחת מדלגת על max_expired jobs לכל היותר - המשתמש נשאר בסבב
+    assert scheduler.pop(LANE, max_expired=2) == (None, ["old0", "old1"])
+    assert scheduler.pop(LANE, max_expired=2) == (("tg:1", "live"), ["old2"])
+    assert scheduler.pop(LANE, max_expired=2) == (None, [])
+
+
+def test_pop_continues_past_owner_window(scheduler):
+    past = time.time() - 60
+    owners = POP_OWNER_WINDOW + 3
+    for i in range(owners):
+        scheduler.enqueue(LANE, f"tg:{i}", f"old{i}", cost=1, since=1000 + i, expires_at=past)
+    scheduler.enqueue(LANE, "tg:last", "live", cost=1, since=1100)
+    
+    item, expired = scheduler.pop(LANE)
+    
+    assert item == ("tg:last", "live")
+    assert expired == [f"old{i}" for i in range(owners)]
+
+
+def test_pop_rereads_changed_owner_window(scheduler, redis_client, monkeypatch):
+    scheduler.enqueue(LANE, "tg:1", "a1", cost=1, since=1000)
+    scheduler.enqueue(LANE, "tg:2", "b1", cost=1, since=1001)
+    lrange = redis_client.lrange
+    snapshots = [["tg:2", "tg:1"]]
+    
+    def stale_lrange(name, start, end):
+        # החלון נקרא לפני ש-dispatcher אחר שינה את ראש הסבב
+        return snapshots.pop() if snapshots else lrange(name, start, end)
+    
+    monkeypatch.setattr(redis_client, "lrange", stale_lrange)
+    
+    assert scheduler.pop(LANE) == (("tg:1", "a1"), [])
+    assert scheduler.pop(LANE) == (("tg:2", "b1"), [])
@@ -0,0 +1,99 @@
+"""
+בדיקות התאמה - אותו רצף פעולות מול ה-embedded store ומול סקריפטי ה-Lua מחזיר אותן תוצאות
+"""
+import random
+import time
+
+import pytest
+
+from conftest import lua_clients
+from services.embedded_store import EmbeddedStore, EmbeddedRedis
+from services.rate_limiter import SlidingWindowLimiter
+from services.scheduler import FairScheduler
+
+LANES = ["interactive", "bulk"]
+OWNERS = [f"tg:{i}" for i in range(20)]
+WINDOWS = [("minute", 60, 12), ("hour", 3600, 30)]
+
+
+@pytest.fixture
+def backends(redis_server):
+    """ה-clients של שני המימושים - embedded ו-Lua"""
+    lua = lua_clients(redis_server)
+    if lua is None:
+        pytest.skip("No Redis with Lua: set TEST_REDIS_URL, install redis-server or requirements-dev.txt")
+    store = EmbeddedStore()
+    yield EmbeddedRedis(store, decode_responses=True), lua[0]
+    store.close()
+    lua[0].flushdb()
+
+
+def scheduler_trace(redis_client, seed):
+    """רצף אקראי (קבוע לפי seed) של פעולות תור והתוצאות שלהן"""
+    rng = random.Random(seed)
+    scheduler = FairScheduler(redis_client)
+    now = time.time()
+    queued = []
+    trace = []
+    for step in range(400):
+        lane = rng.choice(LANES)
+        action = rng.random()
+        if action < 0.5:
+            owner, job_id = rng.choice(OWNERS), f"job{step}"
+            # תפוגה רחוקה מהרגע הנוכחי בשני הכיוונים - התוצאה לא תלויה בזמן הריצה
+            expires_at = rng.choice([0, now - 600, now + 600])
+            added = scheduler.enqueue(lane, owner, job_id, cost=rng.randint(1, 9), since=1000 + step,
+                                      expires_at=expires_at, max_queued=rng.choice([0, 25]))
+            if added:
+                queued.append((lane, owner, job_id))
+            trace.append(("enqueue", added))
+        elif action < 0.8:
+            trace.append(("pop", scheduler.pop(lane, max_expired=rng.randint(1, 5))))
+        elif action < 0.9 and queued:
+            lane, owner, job_id = rng.choice(queued)
+            trace.append(("jobs_ahead", scheduler.jobs_ahead(lane, owner, job_id)))
+        elif queued:
+            lane, owner, job_id = queued.pop(rng.randrange(len(queued)))
+            trace.append(("remove", scheduler.remove(lane, owner, job_id)))
+    trace.append(("stats", {lane: {k: v for k, v in stats.items() if k != "oldest_wait_seconds"}
+                            for lane, stats in scheduler.stats(LANES).items()}))
+    return trace
+
+
+def limiter_trace(redis_client, seed):
+    """רצף אקראי (קבוע לפי seed) של תפיסות ותיקוני עלות"""
+    rng = random.Random(seed)
+    limiter = SlidingWindowLimiter(redis_client, prefix="parity_window")
+    granted = []
+    trace = []
+    for step in range(200):
+        subject = rng.choice(OWNERS[:3])
+        if rng.random() < 0.7 or not granted:
+            cost = rng.choice([0.5, 1, 2, 3, 5])
+            result = limiter.acquire(subject, WINDOWS, cost=cost, entry_id=f"use{step}")
+            if result["allowed"]:
+                granted.append((subject, f"use{step}", cost))
+            trace.append(("acquire", result["allowed"],
+                          {name: (window["used"], window["remaining"]) for name, window in result["windows"].items()}))
+        else:
+            subject, entry_id, cost = rng.choice(granted)
+            new_cost = rng.choice([0, cost / 2, cost * 2])
+            trace.append(("adjust", limiter.adjust(subject, WINDOWS, entry_id, cost, new_cost)))
+            granted.remove((subject, entry_id, cost))
+            if new_cost:
+                granted.append((subject, entry_id, new_cost))
+    return trace
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_scheduler_scripts_match(backends, seed):
+    embedded, lua = backends
+    
+    assert scheduler_trace(embedded, seed) == scheduler_trace(lua, seed)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rate_limiter_scripts_match(backends, seed):
+    embedded, lua = backends
+    
+    assert limiter_trace(embedded, seed) == limiter_trace(lua, seed)
@@ -0,0 +1,143 @@
+"""
+בדיקות ל-SpeculationService - אימוץ מאגר שבעיבוד ותיקון המכסה של המשתמש בסיום
+"""
+import itertools
+import time
+
+import pytest
+
+from utils import codec
+from services.generator_service import generator_service, Question
+from services.queue_service import queue_service
+from services.speculation_service import speculation_service
+
+TEXT = "תאי הזיכרון נשארים אחרי ההחלמה ומזהים את הגורם במהירות. " * 20
+POOL_SIZE = 10
+_chat_ids = itertools.count(int(time.time()) * 1000 + 500)
+
+
+@pytest.fixture(autouse=True)
+def quota_config(monkeypatch):
+    monkeypatch.setattr("config.config.QUOTA_ENABLED", True)
+    monkeypatch.setattr("config.config.QUOTA_OUTPUT_TOKEN_WEIGHT", 4.0)
+
+
+@pytest.fixture
+def chat_id():
+    """צ'אט חדש לכל בדיקה - השירותים גלובליים והמפתחות שלהם חיים בין הבדיקות"""
+    return next(_chat_ids)
+
+
+@pytest.fixture
+def pool(chat_id):
+    """job ספקולטיבי ממתין ורשומת הספקולציה של הצ'אט"""
+    job_id = queue_service.add_job(
+        chat_id, TEXT, POOL_SIZE, {"filename": "פרק 1"},
+        job_type="speculative", owner=speculation_service._owner(chat_id)
+    )
+    assert job_id
+    record = {"job_id": job_id, "question_count": POOL_SIZE, "text_hash": speculation_service._text_hash(TEXT)}
+    speculation_service.redis_client.setex(speculation_service._key(chat_id), 600, codec.dumps(record))
+    return job_id
+
+
+def quota_used(chat_id):
+    """יחידות המכסה שרשומות למשתמש בחלון השעה"""
+    limiter = queue_service.quotas.limiter
+    members = limiter.redis_client.zrange(limiter._key(f"tg:{chat_id}", "hour"), 0, -1)
+    return sum(float(member.rsplit(":", 1)[1]) for member in members)
+
+
+def test_pending_pool_is_not_adopted(chat_id, pool):
+    assert speculation_service.claim(chat_id, 5, TEXT) is None
+    
+    assert quota_used(chat_id) == 0
+    assert queue_service.get_job_status(pool)["status"] == "CANCELLED"
+
+
+def test_failed_adopted_job_refunds_user(chat_id, pool, monkeypatch):
+    claimed = []
+    
+    def generate(text, question_count, file_info=None, ctx=None):
+        # המשתמש שולח מספר שאלות בזמן שהמאגר עוד נוצר
+        ctx.record_usage(2000, 3000)
+        claimed.append(speculation_service.claim(chat_id, 5, TEXT))
+        claimed.append(quota_used(chat_id))
+        raise RuntimeError("model error")
+    
+    monkeypatch.setattr(generator_service, "generate_questions", generate)
+    
+    assert queue_service._process_job(pool)
+    
+    assert claimed[0] == pool
+    assert claimed[1] > 0
+    job = queue_service.get_job_status(pool)
+    assert job["status"] == "FAILED"
+    assert job["quota"]["settled"]
+    assert quota_used(chat_id) == 0
+
+
+def test_completed_adopted_job_charges_users_share(chat_id, pool):
+    job = queue_service._start_job(pool)
+    ctx = queue_service._job_context(pool, job)
+    try:
+        assert speculation_service.claim(chat_id, 5, TEXT) == pool
+        ctx.record_usage(2000, 3000)
+        
+        assert queue_service.update_job_status(pool, "COMPLETED", result_count=POOL_SIZE)
+    finally:
+        queue_service._release_active(pool)
+    
+    # חצי מהמאגר - חצי מה-tokens: 1000 input ועוד 1500 output במשקל 4
+    assert quota_used(chat_id) == 7000
+    # הרשומה נוצלה - בקשה נוספת לא דוגמת מאותו מאגר
+    assert speculation_service.claim(chat_id, 5, TEXT) is None
+
+
+def test_adoption_during_completion_is_narrowed_on_read(chat_id, pool, monkeypatch):
+    questions = [
+        Question(f"q_{i + 1}", f"pool-question-{i + 1}.", ["א", "ב", "ג", "ד"], 0, "easy", "")
+        for i in range(POOL_SIZE)
+    ]
+    save_questions = queue_service.results.save_questions
+    claimed = []
+    
+    def save_then_adopt(job_id, saved, metadata):
+        # האימוץ נוחת אחרי שה-worker כבר התחיל לסיים ולפני שה-job מסומן COMPLETED
+        ok = save_questions(job_id, saved, metadata)
+        claimed.append(speculation_service.claim(chat_id, 5, TEXT))
+        return ok
+    
+    monkeypatch.setattr(queue_service.results, "save_questions", save_then_adopt)
+    job = queue_service._start_job(pool)
+    try:
+        queue_service._complete_job(pool, job, questions)
+    finally:
+        queue_service._release_active(pool)
+    
+    assert claimed == [pool]
+    assert queue_service.get_job_status(pool)["status"] == "COMPLETED"
+    assert len(queue_service.get_job_questions(pool)) == 5
+    html_content = queue_service.get_job_html(pool)
+    assert sum(f"pool-question-{i + 1}." in html_content for i in range(POOL_SIZE)) == 5
+
+
+def test_claim_prices_files_like_add_job(chat_id, pool):
+    files = [{"filename": "פרק 1", "text": TEXT[:len(TEXT) // 2]}, {"filename": "פרק 2", "text": TEXT[len(TEXT) // 2:]}]
+    per_file = queue_service.quotas.estimate([file["text"] for file in files], 5)["units"]
+    assert per_file != queue_service.quotas.estimate([TEXT], 5)["units"]
+    
+    queue_service._start_job(pool)
+    try:
+        assert speculation_service.claim(chat_id, 5, TEXT, file_info={"files": files}) == pool
+    finally:
+        queue_service._release_active(pool)
+    
+    assert quota_used(chat_id) == per_file
+
+
+def test_cancel_clears_pool(chat_id, pool):
+    assert speculation_service.cancel(chat_id, reason="session_reset") == 1
+    
+    assert queue_service.get_job_status(pool)["status"] == "CANCELLED"
+    assert speculation_service.claim(chat_id, 5, TEXT) is None
@@ -0,0 +1,55 @@
+"""
+בדיקות ל-TextStore - גוף טקסט אחד לכל תוכן, דחוס
+"""
+import zlib
+
+import pytest
+
+from services.text_store import TextStore
+
+CHAPTER = "המערכת החיסונית מגינה על הגוף מפני גורמי מחלה. " * 100
+
+
+@pytest.fixture
+def store(binary_client):
+    return TextStore(binary_client, ttl=600)
+
+
+def test_round_trip(store):
+    digests = store.put_many([CHAPTER, "פרק קצר"])
+    
+    assert digests == [TextStore.text_hash(CHAPTER), TextStore.text_hash("פרק קצר")]
+    assert store.get_many(digests) == [CHAPTER, "פרק קצר"]
+
+
+def test_same_text_is_stored_once(store, binary_client):
+    digest, = store.put_many([CHAPTER])
+    # סימון הגוף השמור - שמירה חוזרת של אותו תוכן לא כותבת אותו מחדש
+    binary_client.set(TextStore._key(digest), zlib.compress("גוף קיים".encode("utf-8")), ex=600)
+    
+    assert store.put_many([CHAPTER, CHAPTER]) == [digest, digest]
+    assert store.get_many([digest]) == ["גוף קיים"]
+
+
+def test_body_is_compressed(store, binary_client):
+    digest, = store.put_many([CHAPTER])
+    
+    blob = binary_client.get(TextStore._key(digest))
+    
+    assert len(blob) < len(CHAPTER.encode("utf-8")) / 4
+
+
+def test_put_refreshes_ttl(store, binary_client):
+    digest, = store.put_many([CHAPTER])
+    binary_client.expire(TextStore._key(digest), 5)
+    
+    store.put_many([CHAPTER])
+    
+    assert binary_client.ttl(TextStore._key(digest)) > 5
+
+
+def test_missing_body_fails_the_whole_read(store):
+    digest, = store.put_many([CHAPTER])
+    
+    assert store.get_many([digest, TextStore.text_hash("לא נשמר")]) is None
+    assert store.touch_many([digest, TextStore.text_hash("לא נשמר")]) == [True, False]
@@ -17,17 +17,22 @@ sys.path.insert(0, src_dir)
 # Import after path setup
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
 from werkzeug.utils import secure_filename
-import redis
 import json
 import uuid
 
 # Import services
 from config import config
 from services.file_service import FileService
-from services.generator_service import GeneratorService, Question
-from services.html_renderer import HTMLRenderer
-from services.queue_service import QueueService
+from services.redis_factory import redis_factory
+from services.pipeline import pipeline
+from services.queue_service import queue_service, QueueFullError
+from services.quota_service import QuotaExceededError
+from services.token_budget import token_budget
 from utils.logger import logger
+from utils.lifecycle import lifecycle, install_drain_handler
+from utils.keys import tagged
+from utils import codec
+from utils.progress import format_progress_lines, format_queue_full, format_quota_exceeded
 
 # Global telegram updater for webhook processing
 telegram_updater = None
@@ -138,29 +143,23 @@ app.config['MAX_CONTENT_LENGTH'] = config.MAX_FILE_SIZE_BYTES
 
 # Initialize services
 file_service = FileService()
-generator_service = GeneratorService()
-html_renderer = HTMLRenderer()
 
 # Redis for session management
 try:
-    redis_client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+    # ה-web sessions נשמרים בקידוד של ה-codec - client בלי decode
+    redis_client = redis_factory.client("binary")
     redis_client.ping()
     logger.info("Connected to Redis for web sessions")
 except Exception as e:
     logger.warning(f"Redis not available for web app: {e}")
     redis_client = None
 
-# Initialize queue service
-try:
-    if redis_client:
-        queue_service = QueueService()
-        logger.info("Queue service initialized")
-    else:
-        queue_service = None
-        logger.warning("Queue service not available - Redis required")
-except Exception as e:
-    logger.error(f"Failed to initialize queue service: {e}")
+# Queue service - the same instance the workers run on, so web jobs share the scheduler, quotas and admission control
+if redis_client:
+    logger.info("Queue service initialized")
+else:
     queue_service = None
+    logger.warning("Queue service not available - Redis required")
 
 def allowed_file(filename):
     """Check if file type is allowed"""
@@ -171,14 +170,14 @@ def allowed_file(filename):
 
 def get_session_key(session_id: str) -> str:
     """Get Redis key for session"""
-    return f"web_session:{session_id}"
+    return f"web_session:{tagged(session_id)}"
 
 def save_session_data(session_id: str, data: dict) -> bool:
     """Save data to session"""
     if not redis_client:
         return False
     try:
-        redis_client.setex(get_session_key(session_id), 3600, json.dumps(data))
+        redis_client.setex(get_session_key(session_id), 3600, codec.dumps(data))
         return True
     except Exception as e:
         logger.error(f"Failed to save session data: {e}")
@@ -189,8 +188,7 @@ def get_session_data(session_id: str) -> dict:
     if not redis_client:
         return None
     try:
-        data = redis_client.get(get_session_key(session_id))
-        return json.loads(data) if data else None
+        return codec.loads(redis_client.get(get_session_key(session_id)))
     except Exception as e:
         logger.error(f"Failed to get session data: {e}")
         return None
@@ -313,7 +311,7 @@ def upload_files():
                 }
                 mime_type = mime_type_map.get(ext, 'text/plain')
                 
-                text_result = file_service.extract_text(file_path, mime_type)
+                text_result = pipeline.extract_text(file_path, mime_type)
                 if text_result and text_result.get('text'):
                     text = text_result['text']
                     word_count = text_result.get('word_count', len(text.split()))
@@ -423,7 +421,7 @@ def select_questions():
             </body>
             </html>
             ''', 200
-
+    
     # Handle POST request - question count selection
     try:
         question_count = int(request.form.get('question_count', 0))
@@ -440,14 +438,14 @@ def select_questions():
                 save_session_data(session_id, session_data)
         
         return redirect(url_for('generate_quiz'))
-        
+    
     except ValueError:
         flash('מספר שאלות לא תקין', 'error')
         return redirect(request.url)
 
 @app.route('/generate')  
 def generate_quiz():
-    """Background quiz generation route"""
+    """Queue the quiz generation and show a page that follows the job"""
     session_id = session.get('session_id')
     
     if not session_id:
@@ -459,92 +457,76 @@ def generate_quiz():
         flash('מידע חסר, אנא התחל מחדש', 'error')
         return redirect(url_for('index'))
     
-    # Add generation job to queue OR process directly
-    try:
-        # Try direct processing first (like src/web_app.py)
-        logger.info(f"Web: Generating {session_data['question_count']} questions from {len(session_data['files'])} files")
-        
-        files = session_data['files']
-        question_count = session_data['question_count']
-        
-        # Generate questions directly
-        if len(files) == 1:
-            # Single file
-            questions = generator_service._generate_questions_single(
-                text=files[0]['text'],
-                count=question_count,
-                file_context=files[0]['filename']
+    if not queue_service:
+        flash('שירות התור לא זמין כרגע, נסה שוב מאוחר יותר', 'error')
+        return redirect(url_for('select_questions'))
+    
+    files = session_data['files']
+    question_count = session_data['question_count']
+    metadata = {
+        'filename': ', '.join([f['filename'] for f in files]),
+        'word_count': sum(f.get('word_count', 0) for f in files)
+    }
+    
+    # רענון הדף לא יוצר job נוסף - ה-job של אותה בקשה ממשיך להיות מוצג
+    job_id = session_data.get('job_id') if session_data.get('job_question_count') == question_count else None
+    job = queue_service.get_job_status(job_id) if job_id else None
+    
+    if not job or job['status'] in ('FAILED', 'CANCELLED'):
+        try:
+            # ה-job עובר דרך התור המשותף - תזמון הוגן, מכסה, בקרת כניסה ובקשות כפולות כמו בטלגרם
+            logger.info(f"Web: Queueing {question_count} questions from {len(files)} files")
+            job_id = queue_service.add_job(
+                chat_id="web",
+                text="\n\n".join(f['text'] for f in files),
+                question_count=question_count,
+                metadata=metadata,
+                file_info={'files': files} if len(files) > 1 else None,
+                job_type="html",
+                owner=f"web:{session_id}"
             )
-        else:
-            # Multiple files  
-            questions = generator_service._generate_questions_multi_file(files, question_count)
-        
-        if not questions:
-            flash('שגיאה ביצירת השאלות, אנא נסה שוב', 'error')
+        except QueueFullError as e:
+            flash(format_queue_full(e.retry_after).replace('**', ''), 'error')
+            return redirect(url_for('select_questions'))
+        except QuotaExceededError as e:
+            flash(format_quota_exceeded(e.affordable, e.reset_seconds).replace('**', ''), 'error')
             return redirect(url_for('select_questions'))
         
-        # Generate HTML
-        metadata = {
-            'filename': ', '.join([f['filename'] for f in files]),
-            'total_words': sum(f.get('word_count', 0) for f in files),
-            'question_count': len(questions)
-        }
-        html_content = html_renderer.render_quiz(questions, metadata)
+        if not job_id:
+            flash('שגיאה ביצירת המבחן. נסה שוב או צור מבחן חדש.', 'error')
+            return redirect(url_for('select_questions'))
         
-        # Store in session for display
-        session_data['generated_questions'] = questions
-        session_data['html_content'] = html_content
-        session_data['job_status'] = 'completed'
+        session_data['job_id'] = job_id
+        session_data['job_question_count'] = question_count
         save_session_data(session_id, session_data)
-        
-        logger.info(f"Web: Successfully generated {len(questions)} questions")
-        
-    except Exception as e:
-        logger.error(f"Failed to generate quiz: {e}")
-        flash('שגיאה ביצירת המבחן. נסה שוב או צור מבחן חדש.', 'error')
-        return redirect(url_for('select_questions'))
     
-    # Render result page
+    # Waiting page - polls /job/<id>/status and loads /job/<id>/quiz when the job completes
     try:
-        return render_template('quiz.html', 
-                              session_id=session_id, 
-                              html_content=html_content)
+        return render_template('generating.html',
+                              job_id=job_id,
+                              question_count=question_count,
+                              filename=metadata['filename'])
     except Exception as e:
-        logger.error(f"Failed to render quiz.html: {e}")
-        # Fallback: display quiz directly in simple HTML
+        logger.error(f"Failed to render generating.html: {e}")
+        # Fallback: reload until the quiz is ready
         return f'''
         <!DOCTYPE html>
         <html lang="he" dir="rtl">
         <head>
             <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>המבחן שלך - MCQ Bot</title>
+            <meta http-equiv="refresh" content="5">
+            <title>יוצר את המבחן - MCQ Bot</title>
             <style>
-                body {{ font-family: Arial, sans-serif; padding: 20px; direction: rtl; background: #f5f5f5; }}
-                .container {{ max-width: 900px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 2rem; margin: -30px -30px 30px -30px; text-align: center; }}
-                .btn {{ padding: 15px 30px; margin: 10px; background: #28a745; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 16px; text-decoration: none; display: inline-block; }}
-                .btn-secondary {{ background: #6c757d; }}
-                .actions {{ text-align: center; margin-top: 30px; padding: 20px; background: #f8f9fa; border-radius: 5px; }}
-                @media print {{ .actions {{ display: none; }} }}
+                body {{ font-family: Arial, sans-serif; padding: 20px; direction: rtl; background: #f5f5f5; text-align: center; }}
+                .container {{ max-width: 600px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; }}
+                .btn {{ padding: 15px 30px; margin: 10px; background: #28a745; color: white; border-radius: 5px; text-decoration: none; display: inline-block; }}
             </style>
         </head>
         <body>
             <div class="container">
-                <div class="header">
-                    <h1>🎯 המבחן שלך מוכן!</h1>
-                    <p>המבחן נוצר בהצלחה באמצעות בינה מלאכותית</p>
-                </div>
-                
-                <div class="quiz-content">
-                    {html_content}
-                </div>
-                
-                <div class="actions">
-                    <button onclick="window.print()" class="btn">📄 הדפס מבחן</button>
-                    <a href="/upload" class="btn">🔄 מבחן חדש</a>
-                    <a href="/" class="btn btn-secondary">🏠 דף הבית</a>
-                </div>
+                <h1>⏳ יוצר את המבחן...</h1>
+                <p>הדף מתעדכן אוטומטית. כשהמבחן מוכן אפשר לפתוח אותו כאן:</p>
+                <a href="{url_for('job_quiz', job_id=job_id)}" class="btn">📄 פתח מבחן</a>
             </div>
         </body>
         </html>
@@ -557,27 +539,55 @@ def show_quiz():
 
 @app.route('/status/<session_id>')
 def check_status(session_id):
-    """Check generation status - now for direct processing"""
-    try:
-        session_data = get_session_data(session_id)
-        if not session_data:
-            return jsonify({'status': 'error', 'error': 'Session not found'})
-        
-        # Since we're doing direct processing now, check if completed
-        if session_data.get('job_status') == 'completed':
-            html_content = session_data.get('html_content')
-            if html_content:
-                return jsonify({'status': 'completed', 'questions': html_content})
-        
-        # If not completed, return current status
-        return jsonify({
-            'status': session_data.get('job_status', 'processing'), 
-            'message': session_data.get('status_message', 'מעבד...')
-        })
-        
-    except Exception as e:
-        logger.error(f"Status check error: {e}")
-        return jsonify({'status': 'error', 'error': str(e)})
+    """Status of the session's generation job"""
+    session_data = get_session_data(session_id)
+    if not session_data or not session_data.get('job_id') or not queue_service:
+        return jsonify({'status': 'error', 'error': 'Session not found'})
+    
+    eta = queue_service.get_job_eta(session_data['job_id'])
+    if not eta:
+        return jsonify({'status': 'error', 'error': 'Job not found'})
+    
+    eta['message'] = '\n'.join(format_progress_lines(eta.get('progress')))
+    return jsonify(eta)
+
+
+def get_session_job(job_id: str) -> dict:
+    """Job of the current web session - jobs of other users are not exposed"""
+    session_id = session.get('session_id')
+    if not queue_service or not session_id:
+        return None
+    job = queue_service.get_job_status(job_id)
+    if not job or job.get('owner') != f"web:{session_id}":
+        return None
+    return job
+
+
+@app.route('/job/<job_id>/status')
+def job_status(job_id):
+    """Queue position, ETA and progress for a background job"""
+    if not queue_service:
+        return jsonify({'status': 'error', 'error': 'Queue service not available'}), 503
+    
+    eta = queue_service.get_job_eta(job_id) if get_session_job(job_id) else None
+    if not eta:
+        return jsonify({'status': 'error', 'error': 'Job not found'}), 404
+    
+    eta['message'] = '\n'.join(format_progress_lines(eta.get('progress')))
+    return jsonify(eta), 200
+
+
+@app.route('/job/<job_id>/quiz')
+def job_quiz(job_id):
+    """Quiz HTML for a completed job, rendered on demand from the stored questions"""
+    if not queue_service:
+        return jsonify({'status': 'error', 'error': 'Queue service not available'}), 503
+    
+    html_content = queue_service.get_job_html(job_id) if get_session_job(job_id) else None
+    if not html_content:
+        return jsonify({'status': 'error', 'error': 'Quiz result not found'}), 404
+    
+    return html_content, 200, {'Content-Type': 'text/html; charset=utf-8'}
 
 
 @app.errorhandler(413)
@@ -613,6 +623,15 @@ def server_error(e):
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
+    if lifecycle.draining:
+        # ה-instance בכיבוי - ה-load balancer צריך להעביר תנועה ל-instances אחרים
+        return jsonify({
+            'status': 'draining',
+            'service': 'telegram-mcq-bot-web',
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'drain_started_at': lifecycle.drain_started_at
+        }), 503
+    
     try:
         # Check template system
         template_status = os.path.exists(app.template_folder) if app.template_folder else False
@@ -658,7 +677,7 @@ def health_check():
         
         status_code = 200 if health_data['status'] == 'healthy' else 503
         return jsonify(health_data), status_code
-        
+    
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -667,6 +686,30 @@ def health_check():
             'error': str(e)
         }), 500
 
+@app.route('/metrics')
+def metrics():
+    """Queue and worker metrics for monitoring"""
+    metrics_data = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'autoscaler': None,
+        'pipeline': None,
+        'redis_pools': redis_factory.snapshot(),
+        'token_budget': None
+    }
+    
+    try:
+        if redis_client:
+            autoscaler_json = redis_client.get("metrics:autoscaler")
+            metrics_data['autoscaler'] = json.loads(autoscaler_json) if autoscaler_json else None
+            pipeline_json = redis_client.get("metrics:pipeline")
+            metrics_data['pipeline'] = json.loads(pipeline_json) if pipeline_json else None
+            metrics_data['token_budget'] = token_budget.snapshot()
+    except Exception as e:
+        logger.error(f"Failed to read metrics: {e}")
+        metrics_data['error'] = str(e)
+    
+    return jsonify(metrics_data), 200
+
 @app.route('/debug-paths')
 def debug_paths():
     """Debug endpoint to check file structure"""
@@ -683,7 +726,7 @@ def debug_paths():
         debug_info['root_dir_contents'] = os.listdir('.')
     except:
         debug_info['root_dir_contents'] = 'Error listing'
-        
+    
     try:
         if app.template_folder and os.path.exists(app.template_folder):
             debug_info['template_files'] = os.listdir(app.template_folder)
@@ -704,7 +747,7 @@ def webhook():
         if telegram_updater is None:
             logger.warning("Telegram updater not set")
             return 'Bot not ready', 503
-            
+        
         # Get the JSON data from request
         update_data = request.get_json(force=True)
         
@@ -741,7 +784,7 @@ def run_telegram_bot():
                 print("Telegram bot stopping...")
                 if hasattr(updater, 'stop'):
                     updater.stop()
-        
+    
     except Exception as e:
         print(f"Telegram bot error: {e}")
         import traceback
@@ -758,6 +801,18 @@ if __name__ == '__main__':
         telegram_thread.start()
     else:
         print("Telegram bot disabled")
+        # Without the bot nothing else starts the workers - web jobs still need them
+        if queue_service:
+            queue_service.start_configured_workers()
+    
+    # SIGTERM (deploy / restart) - drain the background workers before exiting
+    def drain_workers():
+        from services.queue_service import queue_service as worker_queue_service
+        requeued = worker_queue_service.drain()
+        redis_factory.close()
+        return requeued
+    
+    install_drain_handler(drain_workers)
     
     # Run Flask app
     port = int(os.environ.get('PORT', 10000))
@@ -10,7 +10,6 @@ from datetime import datetime
 from typing import List, Optional
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
 from werkzeug.utils import secure_filename
-import redis
 import json
 
 # Add src to Python path
@@ -21,9 +20,14 @@ sys.path.insert(0, src_dir)
 # Import existing services
 from config import config
 from services.file_service import FileService
-from services.generator_service import GeneratorService, Question
-from services.html_renderer import HTMLRenderer
+from services.redis_factory import redis_factory
+from services.queue_service import queue_service, QueueFullError
+from services.quota_service import QuotaExceededError
 from utils.logger import logger
+from utils.lifecycle import lifecycle
+from utils.keys import tagged
+from utils import codec
+from utils.progress import format_progress_lines, format_queue_full, format_quota_exceeded
 
 # Get absolute paths for templates and static files - FROM SRC DIRECTORY
 template_dir = os.path.join(src_dir, 'templates')
@@ -71,18 +75,22 @@ app.config['MAX_CONTENT_LENGTH'] = config.MAX_FILE_SIZE_BYTES
 
 # Initialize services
 file_service = FileService()
-generator_service = GeneratorService()
-html_renderer = HTMLRenderer()
 
 # Redis for session management
 try:
-    redis_client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+    # ה-web sessions נשמרים בקידוד של ה-codec - client בלי decode
+    redis_client = redis_factory.client("binary")
     redis_client.ping()
     logger.info("Connected to Redis for web sessions")
 except Exception as e:
     logger.warning(f"Redis not available for web app: {e}")
     redis_client = None
 
+# Queue service - web jobs share the scheduler, quotas and admission control with the bot
+if not redis_client:
+    queue_service = None
+    logger.warning("Queue service not available - Redis required")
+
 def allowed_file(filename):
     """Check if file type is allowed"""
     if '.' not in filename:
@@ -95,8 +103,7 @@ def get_session_data(session_id):
     if not redis_client:
         return None
     try:
-        data = redis_client.get(f"web_session:{session_id}")
-        return json.loads(data) if data else None
+        return codec.loads(redis_client.get(f"web_session:{tagged(session_id)}"))
     except Exception as e:
         logger.error(f"Error getting session data: {e}")
         return None
@@ -106,7 +113,7 @@ def set_session_data(session_id, data):
     if not redis_client:
         return False
     try:
-        redis_client.setex(f"web_session:{session_id}", config.SESSION_TTL, json.dumps(data))
+        redis_client.setex(f"web_session:{tagged(session_id)}", config.SESSION_TTL, codec.dumps(data))
         return True
     except Exception as e:
         logger.error(f"Error setting session data: {e}")
@@ -117,7 +124,7 @@ def clear_session_data(session_id):
     if not redis_client:
         return False
     try:
-        redis_client.delete(f"web_session:{session_id}")
+        redis_client.delete(f"web_session:{tagged(session_id)}")
         return True
     except Exception as e:
         logger.error(f"Error clearing session data: {e}")
@@ -264,36 +271,81 @@ def generate_quiz():
             flash('Session לא נמצא או פג תוקפו', 'error')
             return redirect(url_for('upload_files'))
         
-        # Generate questions using AI
-        text = session_data['text']
+        if not queue_service:
+            flash('שירות התור לא זמין כרגע, נסה שוב מאוחר יותר', 'error')
+            return redirect(url_for('select_questions', session_id=session_id))
         
+        # ה-job עובר דרך התור המשותף - תזמון הוגן, מכסה, בקרת כניסה ובקשות כפולות כמו בטלגרם
         try:
-            questions = generator_service.generate_questions(text, num_questions)
-            
-            if not questions:
-                flash('לא הצלחנו ליצור שאלות מהטקסט', 'error')
-                return redirect(url_for('select_questions', session_id=session_id))
-            
-            # Generate HTML quiz
-            html_content = html_renderer.render_quiz(questions, f"מבחן - {num_questions} שאלות")
-            
-            # Clean up session
-            clear_session_data(session_id)
-            
-            return render_template('quiz.html',
-                                 html_content=html_content,
-                                 num_questions=len(questions))
-                                 
-        except Exception as e:
-            logger.error(f"Error generating questions: {e}")
+            job_id = queue_service.add_job(
+                chat_id="web",
+                text=session_data['text'],
+                question_count=num_questions,
+                metadata={'filename': f"מבחן - {num_questions} שאלות", 'word_count': session_data.get('word_count', 0)},
+                job_type="html",
+                owner=f"web:{session_id}"
+            )
+        except QueueFullError as e:
+            flash(format_queue_full(e.retry_after).replace('**', ''), 'error')
+            return redirect(url_for('select_questions', session_id=session_id))
+        except QuotaExceededError as e:
+            flash(format_quota_exceeded(e.affordable, e.reset_seconds).replace('**', ''), 'error')
+            return redirect(url_for('select_questions', session_id=session_id))
+        
+        if not job_id:
             flash('שגיאה ביצירת השאלות. אנא נסה שוב.', 'error')
             return redirect(url_for('select_questions', session_id=session_id))
+        
+        # The text is already in the job; the job routes only answer for the session that owns it
+        clear_session_data(session_id)
+        session['session_id'] = session_id
+        
+        # Waiting page - polls /job/<id>/status and loads /job/<id>/quiz when the job completes
+        return render_template('generating.html',
+                             job_id=job_id,
+                             question_count=num_questions,
+                             filename=f"{session_data.get('word_count', 0)} מילים")
             
     except Exception as e:
         logger.error(f"Generate quiz error: {e}")
         flash('אירעה שגיאה ביצירת המבחן', 'error')
         return redirect(url_for('upload_files'))
 
+def get_session_job(job_id: str) -> Optional[dict]:
+    """Job of the current web session - jobs of other users are not exposed"""
+    session_id = session.get('session_id')
+    if not queue_service or not session_id:
+        return None
+    job = queue_service.get_job_status(job_id)
+    if not job or job.get('owner') != f"web:{session_id}":
+        return None
+    return job
+
+@app.route('/job/<job_id>/status')
+def job_status(job_id):
+    """Queue position, ETA and progress for a background job"""
+    if not queue_service:
+        return jsonify({'status': 'error', 'error': 'Queue service not available'}), 503
+    
+    eta = queue_service.get_job_eta(job_id) if get_session_job(job_id) else None
+    if not eta:
+        return jsonify({'status': 'error', 'error': 'Job not found'}), 404
+    
+    eta['message'] = '\n'.join(format_progress_lines(eta.get('progress')))
+    return jsonify(eta), 200
+
+@app.route('/job/<job_id>/quiz')
+def job_quiz(job_id):
+    """Quiz HTML for a completed job, rendered on demand from the stored questions"""
+    if not queue_service:
+        return jsonify({'status': 'error', 'error': 'Queue service not available'}), 503
+    
+    html_content = queue_service.get_job_html(job_id) if get_session_job(job_id) else None
+    if not html_content:
+        return jsonify({'status': 'error', 'error': 'Quiz result not found'}), 404
+    
+    return html_content, 200, {'Content-Type': 'text/html; charset=utf-8'}
+
 @app.route('/download/<session_id>')
 def download_quiz(session_id):
     """Download quiz as HTML file"""
@@ -346,6 +398,15 @@ def debug_paths():
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
+    if lifecycle.draining:
+        # ה-instance בכיבוי - ה-load balancer צריך להעביר תנועה ל-instances אחרים
+        return jsonify({
+            'status': 'draining',
+            'service': 'telegram-mcq-bot-web',
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'drain_started_at': lifecycle.drain_started_at
+        }), 503
+    
     return jsonify({
         'status': 'healthy',
         'service': 'telegram-mcq-bot-web',
@@ -391,6 +452,9 @@ def webhook():
         return 'Error', 500
 
 if __name__ == '__main__':
+    # Without the bot nothing else starts the workers - web jobs still need them
+    if not config.RUN_TELEGRAM_BOT and queue_service:
+        queue_service.start_configured_workers()
     port = int(os.environ.get('PORT', 10000))
     print(f"Starting Flask app on port {port}")
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file